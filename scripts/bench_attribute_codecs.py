@@ -0,0 +1,65 @@
+"""
+Compares decoding of stored attribute values one by one by
+Attribute.decode_value with decoding them at once by the codec
+of the attribute.
+
+Usage: python scripts/bench_attribute_codecs.py [--values N]
+"""
+import site
+from os.path import dirname
+site.addsitedir(dirname((dirname(__file__))))
+
+import time
+import random
+import argparse
+from tensorlab.core.attributes import Attribute
+from tensorlab.core.attributeoptions import AttributeType, ChoiceCodes
+
+
+def make_strings(attr, rnd, n):
+    if attr.type == AttributeType.Integer:
+        pool = [str(rnd.randrange(1000)) for _ in range(1000)]
+    elif attr.type == AttributeType.Float:
+        pool = [str(rnd.uniform(0.0001, 0.1)) for _ in range(1000)]
+    else:
+        pool = [str(i) for i in range(len(attr.codes.choices))]
+    pool.append(None)
+    return [rnd.choice(pool) for _ in range(n)]
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument('--values', type=int, default=10000000)
+    p.add_argument('--seed', type=int, default=0)
+    args = p.parse_args()
+    rnd = random.Random(args.seed)
+
+    attrs = [
+        Attribute(name='epochs', type=AttributeType.Integer, runtime=True,
+                  options='positive'),
+        Attribute(name='lr', type=AttributeType.Float, runtime=True),
+        Attribute(name='opt', type=AttributeType.Enum, runtime=True,
+                  options='sgd;adam;adagrad',
+                  codes=ChoiceCodes.from_options('sgd;adam;adagrad')),
+    ]
+    for attr in attrs:
+        strings = make_strings(attr, rnd, args.values)
+
+        started = time.perf_counter()
+        by_attr = [attr.decode_value(s) for s in strings]
+        by_value = time.perf_counter() - started
+
+        started = time.perf_counter()
+        values, present = attr.get_codec().decode_many(strings)
+        at_once = time.perf_counter() - started
+
+        assert [v if p else None for v, p in zip(values.tolist(), present)] \
+            == by_attr
+        print('{:<8} {} values, one by one {:.3f}s, at once {:.3f}s '
+              '({:.1f}x)'.format(attr.type.name, len(strings), by_value,
+                                 at_once, by_value / at_once))
+        del strings, by_attr, values, present
+
+
+if __name__ == '__main__':
+    main()
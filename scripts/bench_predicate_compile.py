@@ -0,0 +1,86 @@
+"""
+Compares filtering of cached attribute dicts by compiled predicates
+with walking the expression tree for each dict, and with evaluating
+predicates on the same values loaded into an AttributeFrame.
+
+Usage: python scripts/bench_predicate_compile.py [--dicts N]
+"""
+import site
+from os.path import dirname
+site.addsitedir(dirname((dirname(__file__))))
+
+import time
+import random
+import argparse
+from tensorlab.core.attributes import Attribute
+from tensorlab.core.attributeoptions import AttributeType
+from tensorlab.core.attribute_predicates import parse_expression
+from tensorlab.core.attribute_frame import AttributeFrame
+from tensorlab.core import predicate_compiler
+
+
+PREDICATES = [
+    'lr < 0.01 and opt == "adam"',
+    'seed in (1, 2, 3, 5, 8, 13, 21) and not lr between 0.001 and 0.002',
+    'opt startswith "ad" or epochs > 50 and (seed == 4 or seed == 6)',
+    'not (epochs <= 10 or lr > 0.05) and arch != "resnet"',
+]
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument('--dicts', type=int, default=1000000)
+    p.add_argument('--seed', type=int, default=0)
+    args = p.parse_args()
+    rnd = random.Random(args.seed)
+
+    dicts = [
+        {
+            'lr': rnd.choice([None, rnd.uniform(0.0001, 0.1)]),
+            'opt': rnd.choice(['sgd', 'adam', 'adagrad']),
+            'seed': rnd.randrange(30),
+            'epochs': rnd.randrange(100),
+            'arch': rnd.choice(['resnet', 'vgg', None]),
+        }
+        for _ in range(args.dicts)
+    ]
+    attrs = [
+        Attribute(name='lr', type=AttributeType.Float, runtime=True),
+        Attribute(name='opt', type=AttributeType.Enum, runtime=True,
+                  options='sgd;adam;adagrad'),
+        Attribute(name='seed', type=AttributeType.Integer, runtime=True),
+        Attribute(name='epochs', type=AttributeType.Integer, runtime=True),
+        Attribute(name='arch', type=AttributeType.String, runtime=True),
+    ]
+    started = time.perf_counter()
+    frame = AttributeFrame.build(
+        list(range(len(dicts))), attrs,
+        {a.name: [d[a.name] for d in dicts] for a in attrs})
+    print('frame built in {:.3f}s'.format(time.perf_counter() - started))
+
+    for string in PREDICATES:
+        expr = parse_expression(string)
+
+        started = time.perf_counter()
+        n_walked = sum(
+            1 for d in dicts if predicate_compiler.evaluate(expr, d))
+        walked = time.perf_counter() - started
+
+        started = time.perf_counter()
+        func = expr.compile()
+        n_compiled = sum(1 for d in dicts if func(d))
+        compiled = time.perf_counter() - started
+
+        started = time.perf_counter()
+        n_masked = int(frame.mask(expr).sum())
+        masked = time.perf_counter() - started
+
+        assert n_walked == n_compiled == n_masked
+        print('{}\n    {} matched, tree walking {:.3f}s, compiled {:.3f}s '
+              '({:.1f}x), frame {:.4f}s'.format(
+                  string, n_compiled, walked, compiled, walked / compiled,
+                  masked))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""
+Compares SQL generated for random filtering predicates with and without
+simplification by tensorlab.core.predicate_optimizer, and listing models
+by predicates of the same shapes with and without the statement cache.
+
+Usage: python scripts/bench_predicates.py [--models N] [--predicates N]
+"""
+import site
+from os.path import dirname
+site.addsitedir(dirname((dirname(__file__))))
+
+import io
+import time
+import random
+import shutil
+import argparse
+import tempfile
+from unittest import mock
+from tensorlab.core.attributes import Attribute
+from tensorlab.core.attributeoptions import AttributeType
+from tensorlab.core.attribute_predicates import (
+    Op, Identifier, Literal, UnaryOperation, BinaryOperation, parse_expression
+)
+from tensorlab.core import cache
+from tensorlab.core.models import Model
+from tensorlab.local_storage import LocalStorage
+from tensorlab.local_storage.db import tables as _t, predicates
+
+
+N_ATTRS = 8
+MAX_VALUE = 20
+
+TEMPLATES = [
+    'a0 < {} and a1 >= {}',
+    'a2 in ({}, {}, {}) or not a3 == {}',
+    'a4 between {} and {} and (a5 > {} or a6 < 5)',
+]
+
+
+def make_predicate(rnd, depth):
+    """
+    Generates predicates looking like ones built by scripts and UIs:
+    with nested negations, repeated conditions, several bounds on the same
+    attribute, chains of equalities and constant parts coming from
+    unset options.
+    """
+    if depth == 0 or rnd.random() < 0.2:
+        if rnd.random() < 0.1:
+            return BinaryOperation(rnd.choice((Op.Eq, Op.Lt)),
+                                   Literal(rnd.randrange(3)),
+                                   Literal(rnd.randrange(3)))
+        op = rnd.choice((Op.Eq, Op.Ne, Op.Gt, Op.Lt, Op.Ge, Op.Le))
+        return BinaryOperation(op,
+                               Identifier('a{}'.format(rnd.randrange(N_ATTRS))),
+                               Literal(rnd.randrange(MAX_VALUE)))
+    if rnd.random() < 0.1:
+        # picking specific values one by one
+        ident = Identifier('a{}'.format(rnd.randrange(N_ATTRS)))
+        expr = BinaryOperation(Op.Eq, ident, Literal(rnd.randrange(MAX_VALUE)))
+        for _ in range(rnd.randrange(1, 6)):
+            expr = BinaryOperation(Op.Or, expr, BinaryOperation(
+                Op.Eq, ident, Literal(rnd.randrange(MAX_VALUE))))
+        return expr
+    if rnd.random() < 0.15:
+        return UnaryOperation(Op.Not, make_predicate(rnd, depth - 1))
+    left = make_predicate(rnd, depth - 1)
+    right = left if rnd.random() < 0.15 else make_predicate(rnd, depth - 1)
+    return BinaryOperation(rnd.choice((Op.And, Op.And, Op.Or)), left, right)
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument('--models', type=int, default=2000)
+    p.add_argument('--predicates', type=int, default=300)
+    p.add_argument('--depth', type=int, default=4)
+    p.add_argument('--seed', type=int, default=0)
+    args = p.parse_args()
+    rnd = random.Random(args.seed)
+
+    root_dir = tempfile.mkdtemp()
+    storage = LocalStorage(root_dir, mock.Mock(), io.StringIO()).Create()
+    try:
+        group = storage.groups.get(None)
+        attrs = []
+        for i in range(N_ATTRS):
+            attr = Attribute(name='a{}'.format(i), runtime=False,
+                             type=AttributeType.Integer)
+            storage.attributes.create(attr, group)
+            attrs.append(attr)
+        for i in range(args.models):
+            storage.models.create(Model(name='m{}'.format(i)), group, {
+                attr.name: rnd.randrange(MAX_VALUE) for attr in attrs})
+
+        db = storage._get_impl().db
+        targets = {attr.name: (attr, _t.Models.c.id) for attr in attrs}
+        exprs = [make_predicate(rnd, args.depth)
+                 for _ in range(args.predicates)]
+        for simplify in (False, True):
+            n_joins = n_queries = n_rows = 0
+            started = time.perf_counter()
+            for expr in exprs:
+                q = predicates.filter_query(
+                    _t.Models.select(), _t.Models, expr, targets, simplify)
+                if q is None:
+                    continue
+                n_joins += str(q).count(' JOIN ')
+                n_queries += 1
+                n_rows += len(db.execute(q).fetchall())
+            print('{:<12} joins: {:6}  queries: {:4}  rows: {:8}  {:.3f}s'.format(
+                'simplified' if simplify else 'as is',
+                n_joins, n_queries, n_rows, time.perf_counter() - started))
+
+        # the same shapes with different values, as issued by a dashboard
+        for size in (0, 256):
+            cache.configure('sql_statements', size)
+            started = time.perf_counter()
+            for _ in range(args.predicates):
+                string = rnd.choice(TEMPLATES).format(
+                    *(rnd.randrange(MAX_VALUE) for _ in range(4)))
+                storage.models.list(group, predicate=parse_expression(string))
+            print('statement cache size {:<4} {} lists  {:.3f}s'.format(
+                size, args.predicates, time.perf_counter() - started))
+        print(cache.get_stats())
+    finally:
+        storage.Close()
+        shutil.rmtree(root_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""
+Compares attribute values of models and runs stored together in
+AttributeValues, keyed by uids of their targets, with values split into
+ModelValues and RunValues keyed by ids: sizes of the tables with their
+indexes and times of joining values of runs to runs.
+
+Sizes are read from the dbstat table of SQLite.
+
+Usage: python scripts/bench_value_tables.py [--models N] [--runs N]
+"""
+import site
+from os.path import dirname
+site.addsitedir(dirname((dirname(__file__))))
+
+import os
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import sqlalchemy as sa
+from tensorlab.local_storage.db import connection, migrations, tables as _t
+
+
+N_MODEL_ATTRS = 6
+N_RUN_ATTRS = 4
+
+
+def make_uid(rnd):
+    return '{:016x}'.format(rnd.getrandbits(64))
+
+
+def populate(db, rnd, n_models, n_runs):
+    av = migrations._AttributeValues
+    db.execute(_t.Groups.insert().values(id=1, uid=make_uid(rnd), name=''))
+    db.execute(_t.Attributes.insert(), [
+        dict(id=i + 1, group_id=1, name='a{}'.format(i),
+             runtime=i >= N_MODEL_ATTRS)
+        for i in range(N_MODEL_ATTRS + N_RUN_ATTRS)
+    ])
+    run_id = 0
+    for model_id in range(1, n_models + 1):
+        with db.begin() as conn:
+            uid = make_uid(rnd)
+            conn.execute(_t.Models.insert().values(
+                id=model_id, uid=uid, group_id=1, name=uid))
+            values = [dict(attr_id=attr_id, value=str(rnd.randrange(100)))
+                      for attr_id in range(1, N_MODEL_ATTRS + 1)]
+            conn.execute(av.insert(), [dict(v, target_uid=uid)
+                                       for v in values])
+            conn.execute(_t.ModelValues.insert(), [dict(v, model_id=model_id)
+                                                   for v in values])
+            runs, legacy_values, run_values = [], [], []
+            for _ in range(n_runs):
+                run_id += 1
+                uid = make_uid(rnd)
+                runs.append(dict(id=run_id, uid=uid, model_id=model_id))
+                for attr_id in range(N_MODEL_ATTRS + 1,
+                                     N_MODEL_ATTRS + N_RUN_ATTRS + 1):
+                    value = str(rnd.random())
+                    legacy_values.append(dict(
+                        target_uid=uid, attr_id=attr_id, value=value))
+                    run_values.append(dict(
+                        run_id=run_id, attr_id=attr_id, value=value))
+            conn.execute(_t.Runs.insert(), runs)
+            conn.execute(av.insert(), legacy_values)
+            conn.execute(_t.RunValues.insert(), run_values)
+    db.execute('ANALYZE')
+
+
+def get_sizes(db, table_names):
+    """:returns dict of table name -> (bytes of rows, bytes of indexes)"""
+    indexes = db.execute(sa.text(
+        "SELECT name, tbl_name FROM sqlite_master WHERE type = 'index'"))
+    table_of_index = dict(indexes.fetchall())
+    sizes = {name: [0, 0] for name in table_names}
+    for name, n_bytes in db.execute(
+            'SELECT name, SUM(pgsize) FROM dbstat GROUP BY name'):
+        if name in sizes:
+            sizes[name][0] += n_bytes
+        elif table_of_index.get(name) in sizes:
+            sizes[table_of_index[name]][1] += n_bytes
+    return sizes
+
+
+def time_joins(db, query, model_ids):
+    started = time.perf_counter()
+    n_rows = 0
+    for model_id in model_ids:
+        for attr_id in range(N_MODEL_ATTRS + 1,
+                             N_MODEL_ATTRS + N_RUN_ATTRS + 1):
+            n_rows += len(db.execute(
+                query, model_id=model_id, attr_id=attr_id).fetchall())
+    return n_rows, time.perf_counter() - started
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument('--models', type=int, default=2000)
+    p.add_argument('--runs', type=int, default=50,
+                   help='number of runs of each model')
+    p.add_argument('--lists', type=int, default=500,
+                   help='number of models whose runs are listed')
+    p.add_argument('--seed', type=int, default=0)
+    args = p.parse_args()
+    rnd = random.Random(args.seed)
+
+    root_dir = tempfile.mkdtemp()
+    db = connection.init_db_engine(os.path.join(root_dir, 'bench.db'))
+    try:
+        _t.initialize_db(db)
+        migrations._AttributeValues.create(db)
+        populate(db, rnd, args.models, args.runs)
+
+        av = migrations._AttributeValues
+        sizes = get_sizes(db, [av.name, _t.ModelValues.name,
+                               _t.RunValues.name])
+        for name, (n_table, n_indexes) in sorted(sizes.items()):
+            print('{:<16} rows {:8.1f} MB  indexes {:8.1f} MB'.format(
+                name, n_table / 2 ** 20, n_indexes / 2 ** 20))
+        split = [sum(x) for x in zip(sizes[_t.ModelValues.name],
+                                     sizes[_t.RunValues.name])]
+        print('split tables take {:.1f}% of rows and {:.1f}% of indexes '
+              'of the original'.format(100.0 * split[0] / sizes[av.name][0],
+                                       100.0 * split[1] / sizes[av.name][1]))
+
+        # values of runtime attributes of runs of a model, as loaded
+        # for frames of runs and joined for filtering them
+        by_uid = sa.select([_t.Runs.c.id, av.c.value]).select_from(
+            _t.Runs.join(av, sa.and_(
+                av.c.target_uid == _t.Runs.c.uid,
+                av.c.attr_id == sa.bindparam('attr_id')))
+        ).where(_t.Runs.c.model_id == sa.bindparam('model_id'))
+        rv = _t.RunValues
+        by_id = sa.select([_t.Runs.c.id, rv.c.value]).select_from(
+            _t.Runs.join(rv, sa.and_(
+                rv.c.run_id == _t.Runs.c.id,
+                rv.c.attr_id == sa.bindparam('attr_id')))
+        ).where(_t.Runs.c.model_id == sa.bindparam('model_id'))
+        model_ids = [rnd.randrange(1, args.models + 1)
+                     for _ in range(args.lists)]
+        for name, query in [('by uid', by_uid), ('by id', by_id)]:
+            n_rows, seconds = time_joins(db, query, model_ids)
+            print('join {:<8} {} rows  {:.3f}s'.format(name, n_rows, seconds))
+    finally:
+        db.dispose()
+        shutil.rmtree(root_dir)
+
+
+if __name__ == '__main__':
+    main()
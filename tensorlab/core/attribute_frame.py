@@ -0,0 +1,247 @@
+"""
+Columnar in-memory representation of attribute values of many objects,
+for filtering them repeatedly by predicates without touching a storage.
+"""
+import collections
+import numpy as np
+from tensorlab import exceptions
+from tensorlab.core.attributeoptions import AttributeType
+from tensorlab.core.attribute_predicates import (
+    Op, Identifier, Literal, UnaryOperation, BinaryOperation
+)
+from tensorlab.core import predicate_optimizer, ordering
+
+
+_DTYPES = {
+    AttributeType.Integer: np.int64,
+    AttributeType.Float: np.float64,
+}
+
+_NUMPY_OPS = {
+    Op.Eq: np.equal, Op.Ne: np.not_equal,
+    Op.Gt: np.greater, Op.Lt: np.less,
+    Op.Ge: np.greater_equal, Op.Le: np.less_equal,
+}
+
+
+# values: numeric array or codes of values in categories for strings
+#         and enums, arbitrary where the value is missing; integers
+#         which do not fit int64 are kept in an array of objects
+# present: boolean mask of objects which have values
+# categories: sorted array of distinct strings or None for numbers
+Column = collections.namedtuple(
+    'Column', ['attr', 'values', 'present', 'categories'])
+
+
+class AttributeFrame:
+    """
+    Holds one array per attribute. Integer and float values are stored
+    with native dtypes, strings and enumerations are dictionary-encoded
+    into sorted categories, so comparisons with them are done on codes.
+
+    Predicates are evaluated as boolean mask operations with the same
+    semantics as storages: comparisons with missing values are
+    not satisfied, as well as their negations.
+    """
+
+    def __init__(self, uids, columns):
+        """
+        :type uids: numpy.ndarray
+        :type columns: typing.Dict[str, Column]
+        """
+        self.uids = uids
+        self.columns = columns
+
+    @classmethod
+    def build(cls, uids, attrs, values):
+        """
+        :param uids: uids of objects
+        :param attrs: list of tensorlab.core.attributes.Attribute
+        :param values: dict of attribute name -> list of decoded values
+                       of the objects, None for missing ones
+        :rtype: AttributeFrame
+        """
+        n = len(uids)
+        columns = {}
+        for attr in attrs:
+            column = values.get(attr.name) or [None] * n
+            present = np.fromiter((v is not None for v in column),
+                                  dtype=bool, count=n)
+            if attr.type in _DTYPES:
+                try:
+                    array = np.fromiter(
+                        (0 if v is None else v for v in column),
+                        dtype=_DTYPES[attr.type], count=n)
+                except OverflowError:
+                    array = np.array([0 if v is None else v for v in column],
+                                     dtype=object)
+                columns[attr.name] = Column(attr, array, present, None)
+            else:
+                categories = sorted({v for v in column if v is not None})
+                codes = {v: i for i, v in enumerate(categories)}
+                array = np.fromiter((codes.get(v, -1) for v in column),
+                                    dtype=np.int32, count=n)
+                columns[attr.name] = Column(
+                    attr, array, present, np.array(categories, dtype=object))
+        return cls(np.array(uids, dtype=object), columns)
+
+    def __len__(self):
+        return len(self.uids)
+
+    def get_values(self, name):
+        """:returns list of decoded values, None for missing ones"""
+        column = self._get_column(name)
+        values = column.values
+        if column.categories is not None:
+            values = column.categories[np.maximum(values, 0)]
+        return [v if p else None
+                for v, p in zip(values.tolist(), column.present.tolist())]
+
+    def mask(self, predicate):
+        """
+        :type predicate: tensorlab.core.attribute_predicates.Expression
+        :returns boolean array, True for objects satisfying the predicate
+        """
+        expr = predicate_optimizer.optimize(predicate)
+        if isinstance(expr, Literal):
+            return np.full(len(self), bool(expr.value))
+        return self._condition(expr)
+
+    def filter(self, predicate):
+        """
+        :returns AttributeFrame of objects satisfying the predicate
+        :rtype: AttributeFrame
+        """
+        return self.take(self.mask(predicate))
+
+    def sort(self, order_by, limit=None):
+        """
+        :param order_by: see tensorlab.core.ordering
+        :param limit: if given, only this many first objects are kept
+                      without sorting all of them
+        :rtype: AttributeFrame
+        """
+        values = {name: self.get_values(name)
+                  for name, _ in ordering.parse_order_by(order_by)}
+
+        def get_value(i, name):
+            return values[name][i]
+
+        if limit is None:
+            indices = ordering.sort(range(len(self)), order_by, get_value)
+        else:
+            indices = ordering.top_k(range(len(self)), limit, order_by,
+                                     get_value)
+        return self.take(np.array(indices, dtype=np.int64))
+
+    def take(self, mask):
+        """:param mask: boolean mask or array of indices of objects"""
+        return AttributeFrame(self.uids[mask], {
+            name: column._replace(values=column.values[mask],
+                                  present=column.present[mask])
+            for name, column in self.columns.items()
+        })
+
+    def _get_column(self, name):
+        try:
+            return self.columns[name]
+        except KeyError:
+            raise exceptions.LookupError(
+                'Attribute "{}" does not exist'.format(name))
+
+    def _condition(self, expr):
+        if isinstance(expr, UnaryOperation):
+            # negations are on comparisons only after optimizing
+            present, result = self._comparison(expr.arg)
+            return present & ~result
+        if isinstance(expr, BinaryOperation) and expr.op == Op.And:
+            return self._condition(expr.left) & self._condition(expr.right)
+        if isinstance(expr, BinaryOperation) and expr.op == Op.Or:
+            return self._condition(expr.left) | self._condition(expr.right)
+        present, result = self._comparison(expr)
+        return present & result
+
+    def _comparison(self, expr):
+        """:returns (mask of objects having values, result of comparison)"""
+        if not (predicate_optimizer.is_comparison(expr)
+                and isinstance(expr.left, Identifier)):
+            raise exceptions.IllegalArgumentError(
+                'Expected a comparison, got {}'.format(expr.serialize()))
+        column = self._get_column(expr.left.name)
+        if isinstance(expr.right, Identifier):
+            other = self._get_column(expr.right.name)
+            return (column.present & other.present,
+                    _NUMPY_OPS[expr.op](_decoded(column), _decoded(other)))
+
+        attr, op, value = column.attr, expr.op, expr.right.value
+        if op == Op.StartsWith:
+            if column.categories is None or not isinstance(value, str):
+                raise exceptions.IllegalArgumentError(
+                    'Only string values can be matched by prefix')
+            return column.present, _code_range(column, value)
+        if op == Op.In:
+            value = [attr.normalize_value(v) for v in value]
+        elif op == Op.Between:
+            value = tuple(attr.normalize_value(v) for v in value)
+        else:
+            value = attr.normalize_value(value)
+        if column.categories is None:
+            return column.present, _compare_numbers(column.values, op, value)
+        return column.present, _compare_codes(column, op, value)
+
+
+def _decoded(column):
+    if column.categories is None:
+        return column.values
+    return column.categories[np.maximum(column.values, 0)]
+
+
+def _compare_numbers(values, op, value):
+    if op == Op.In:
+        return np.isin(values, value)
+    if op == Op.Between:
+        return (values >= value[0]) & (values <= value[1])
+    return _NUMPY_OPS[op](values, value)
+
+
+def _compare_codes(column, op, value):
+    """
+    Categories are sorted, so comparisons of strings are the same
+    as comparisons of their codes with positions in categories.
+    """
+    codes, categories = column.values, column.categories
+    if op == Op.In:
+        found = [_find(categories, v) for v in value]
+        return np.isin(codes, [code for code in found if code is not None])
+    if op == Op.Between:
+        return ((codes >= np.searchsorted(categories, value[0], 'left'))
+                & (codes < np.searchsorted(categories, value[1], 'right')))
+    if op in (Op.Eq, Op.Ne):
+        code = _find(categories, value)
+        result = codes == (-2 if code is None else code)
+        return result if op == Op.Eq else ~result
+    if op == Op.Lt:
+        return codes < np.searchsorted(categories, value, 'left')
+    if op == Op.Le:
+        return codes < np.searchsorted(categories, value, 'right')
+    if op == Op.Gt:
+        return codes >= np.searchsorted(categories, value, 'right')
+    return codes >= np.searchsorted(categories, value, 'left')
+
+
+def _code_range(column, prefix):
+    codes, categories = column.values, column.categories
+    low = np.searchsorted(categories, prefix, 'left')
+    result = codes >= low
+    upper = prefix.rstrip(chr(0x10FFFF))
+    if upper:
+        upper = upper[:-1] + chr(ord(upper[-1]) + 1)
+        result &= codes < np.searchsorted(categories, upper, 'left')
+    return result
+
+
+def _find(categories, value):
+    i = np.searchsorted(categories, value, 'left')
+    if i < len(categories) and categories[i] == value:
+        return i
+    return None
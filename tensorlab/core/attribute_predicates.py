@@ -1,6 +1,10 @@
 """
 Classes for building filtering predicates on attributes.
 """
+from tensorlab.core import cache
+
+
+_parsed = cache.register('parsed_expressions', 512)
 
 
 class Expression:
@@ -19,6 +23,15 @@ class Expression:
     def serialize(self):
         raise NotImplementedError
 
+    def compile(self, attrs=None):
+        """
+        Compiles the predicate into a function filtering dicts of
+        attribute values.
+        :see tensorlab.core.predicate_compiler.compile_predicate
+        """
+        from tensorlab.core.predicate_compiler import compile_predicate
+        return compile_predicate(self, attrs)
+
 
 class Identifier(Expression):
     is_atomic = True
@@ -67,20 +80,29 @@ class Literal(Expression):
                     return cls(eval(string[:i+1])), string[i+1:]
         elif string[0].isdigit() or string[0] == '-':
             value = string
-            has_dot = False
+            has_dot = has_exp = False
             for i, c in enumerate(string[1:], 1):
-                if c == '.' and not has_dot:
+                if c == '.' and not has_dot and not has_exp:
                     has_dot = True
                     continue
+                if c in 'eE' and not has_exp:
+                    has_exp = True
+                    continue
+                if c in '+-' and string[i-1] in 'eE':
+                    continue
                 if not c.isdigit():
                     value = string[:i]
                     break
             least_string = string[len(value):]
-            value = float(value) if has_dot else int(value)
+            value = float(value) if has_dot or has_exp else int(value)
             return cls(value), least_string
+        elif string[0] == '(':
+            return _parse_literal_list(string)
         return None, string
 
     def serialize(self):
+        if isinstance(self.value, tuple):
+            return '({})'.format(', '.join(map(repr, self.value)))
         return repr(self.value)
 
     def __eq__(self, other):
@@ -100,10 +122,16 @@ class Op:
     Lt = '<'
     Ge = '>='
     Le = '<='
+    In = 'in'
+    Between = 'between'
+    StartsWith = 'startswith'
 
-    ALL = (And, Or, Not, Ne, Eq, Gt, Lt, Ge, Le)
+    ALL = (And, Or, Not, Ne, Eq, Gt, Lt, Ge, Le, In, Between, StartsWith)
     UNARIES = (Not,)
-    BINARIES = (And, Or, Ne, Eq, Gt, Lt, Ge, Le)
+    BINARIES = (And, Or, Ne, Eq, Gt, Lt, Ge, Le, In, Between, StartsWith)
+    # operators whose right operand is a tuple of literals:
+    # "x in (1, 2, 3)" and "x between 1 and 3"
+    WITH_LITERALS = (In, Between)
 
     priority = {
         Or: 0,
@@ -114,6 +142,9 @@ class Op:
         Lt: 2,
         Ge: 2,
         Le: 2,
+        In: 2,
+        Between: 2,
+        StartsWith: 2,
         Not: 3
     }
 
@@ -167,7 +198,9 @@ class BinaryOperation(Expression):
         ops = []
         s = string
         while s and s[0] != ')':
-            if s[0] == '(':
+            if ops and ops[-1] in Op.WITH_LITERALS:
+                next_expr, next_s = _parse_literal_operand(ops[-1], s)
+            elif s[0] == '(':
                 next_expr, next_s = _parse_subexpr(s[1:])
                 next_s = next_s.lstrip()
                 if not next_s or not next_s.startswith(')'):
@@ -205,6 +238,9 @@ class BinaryOperation(Expression):
     def serialize(self):
         left = self.left.serialize()
         right = self.right.serialize()
+        if self.op == Op.Between:
+            right = '{!r} {} {!r}'.format(
+                self.right.value[0], Op.And, self.right.value[1])
         if isinstance(self.left, (BinaryOperation, UnaryOperation)):
             if Op.priority[self.op] > Op.priority[self.left.op]:
                 left = '('+left+')'
@@ -228,12 +264,47 @@ def _match_op(string, ops):
     for op in ops:
         if (len(string) > len(op)
                 and string.startswith(op)
-                and not string[len(op)].isalnum()
+                and not (op.isalpha() and string[len(op)].isalnum())
                 and string[len(op)] != '='):
             return op, string[len(op):]
     return None, string
 
 
+def _parse_literal_list(string):
+    """Parses literals in parentheses separated by commas."""
+    if not string.startswith('('):
+        return None, string
+    values = []
+    s = string[1:].lstrip()
+    while True:
+        literal, s = Literal.parse(s)
+        if literal is None or isinstance(literal.value, tuple):
+            return None, string
+        values.append(literal.value)
+        s = s.lstrip()
+        if s.startswith(')'):
+            return Literal(tuple(values)), s[1:]
+        if not s.startswith(','):
+            return None, string
+        s = s[1:].lstrip()
+
+
+def _parse_literal_operand(op, string):
+    if op == Op.In:
+        return _parse_literal_list(string)
+    low, s = Literal.parse(string)
+    if low is None:
+        return None, string
+    and_op, s = _match_op(s.lstrip(), (Op.And,))
+    if and_op is None:
+        return None, string
+    high, s = Literal.parse(s.lstrip())
+    if high is None or isinstance(low.value, tuple) \
+            or isinstance(high.value, tuple):
+        return None, string
+    return Literal((low.value, high.value)), s
+
+
 _ALL_EXPR_TYPES = (BinaryOperation, UnaryOperation, Identifier, Literal, )
 
 
@@ -252,11 +323,42 @@ def _parse_subexpr(string, expr_types=None):
 
 
 def parse_expression(string):
+    """
+    :returns Expression or None if the string cannot be parsed;
+             results are cached per text with whitespace normalized
+    """
+    return _parsed.get_or_create(_normalize(string), _parse_expression)
+
+
+def _parse_expression(string):
     try:
-        e, s = _parse_subexpr(string.strip())
+        e, s = _parse_subexpr(string)
         if len(s.strip()) > 0:
             return None
         return e
     except:
         return None
 
+
+def _normalize(string):
+    """Collapses whitespace outside of string literals."""
+    chars = []
+    quoted = escaped = space = False
+    for c in string.strip():
+        if quoted:
+            chars.append(c)
+            if escaped:
+                escaped = False
+            elif c == '\\':
+                escaped = True
+            elif c in '"\'':
+                quoted = False
+        elif c.isspace():
+            space = True
+        else:
+            if space:
+                chars.append(' ')
+                space = False
+            quoted = c in '"\''
+            chars.append(c)
+    return ''.join(chars)
@@ -0,0 +1,275 @@
+"""
+Statistics of attribute values and estimation of selectivity
+of filtering predicates from them.
+"""
+import math
+import bisect
+import hashlib
+import collections
+from tensorlab import exceptions
+from tensorlab.core.attributeoptions import AttributeType
+from tensorlab.core.attribute_predicates import (
+    Op, Identifier, Literal, UnaryOperation, BinaryOperation
+)
+from tensorlab.core import predicate_optimizer
+
+
+N_BUCKETS = 32
+N_FREQUENT = 16
+
+# selectivity of comparisons of attributes without statistics
+UNKNOWN_SELECTIVITY = 0.5
+
+
+# n_values: number of stored values, n_nulls: how many of them are null
+# min_value, max_value: decoded bounds of values, None if there are none
+# n_distinct: estimated number of distinct non-null values
+# histogram: sorted decoded bounds of N_BUCKETS buckets holding equal
+#            numbers of values, empty until values are analyzed
+# frequencies: dict of decoded value -> count of the most frequent values,
+#              of all choices for enumerations
+# n_changed: number of values inserted or deleted since the last analysis
+AttributeStats = collections.namedtuple(
+    'AttributeStats', ['attr', 'n_values', 'n_nulls', 'min_value',
+                       'max_value', 'n_distinct', 'histogram', 'frequencies',
+                       'n_changed'])
+
+
+class HyperLogLog:
+    """
+    Sketch estimating the number of distinct strings
+    with relative error of about 1.04 / sqrt(2 ** P).
+    """
+
+    P = 10
+
+    def __init__(self, registers=None):
+        self.registers = bytearray(registers or bytes(1 << self.P))
+
+    def add(self, string):
+        """:returns whether the estimate could change"""
+        digest = hashlib.sha1(string.encode('utf-8')).digest()
+        h = int.from_bytes(digest[:8], 'big')
+        n_bits = 64 - self.P
+        rest = h & ((1 << n_bits) - 1)
+        rank = n_bits - rest.bit_length() + 1
+        index = h >> n_bits
+        if rank <= self.registers[index]:
+            return False
+        self.registers[index] = rank
+        return True
+
+    def estimate(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        n_zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and n_zeros:
+            # linear counting is more precise for small cardinalities
+            estimate = m * math.log(m / n_zeros)
+        return int(round(estimate))
+
+    def to_bytes(self):
+        return bytes(self.registers)
+
+
+def compute(attr, encoded_values):
+    """
+    :type attr: tensorlab.core.attributes.Attribute
+    :param encoded_values: all stored values of the attribute
+    :returns (AttributeStats, HyperLogLog of the values)
+    """
+    hll = HyperLogLog()
+    counts = collections.Counter()
+    n_nulls = 0
+    for value in encoded_values:
+        if value is None:
+            n_nulls += 1
+        else:
+            hll.add(value)
+            counts[value] += 1
+    decoded = {value: attr.decode_value(value) for value in counts}
+    values = sorted(decoded[v] for v, n in counts.items() for _ in range(n))
+    frequencies = get_tracked_frequencies(attr, {
+        decoded[v]: n for v, n in counts.most_common(N_FREQUENT)})
+    stats = AttributeStats(
+        attr, n_nulls + len(values), n_nulls,
+        values[0] if values else None, values[-1] if values else None,
+        hll.estimate(), build_histogram(values), frequencies, 0)
+    return stats, hll
+
+
+def get_tracked_frequencies(attr, frequencies):
+    """
+    Frequencies of all choices of enumerations are tracked,
+    including the ones which are not used.
+    """
+    if attr.type == AttributeType.Enum:
+        for choice in (attr.options or '').split(';'):
+            if choice:
+                frequencies.setdefault(choice, 0)
+    return frequencies
+
+
+def build_histogram(sorted_values, n_buckets=N_BUCKETS):
+    """:returns bounds of equi-depth buckets"""
+    n = len(sorted_values)
+    if n == 0:
+        return []
+    n_buckets = min(n_buckets, n)
+    return [sorted_values[min(i * n // n_buckets, n - 1)]
+            for i in range(n_buckets)] + [sorted_values[-1]]
+
+
+def estimate_selectivity(stats, op, value):
+    """
+    :type stats: AttributeStats
+    :param value: decoded value the attribute is compared with,
+                  tuple for "in" and "between"
+    :returns estimated fraction of non-null values of the attribute
+             satisfying the comparison
+    """
+    n = stats.n_values - stats.n_nulls
+    if n <= 0:
+        return 0.0
+    if op == Op.Eq:
+        return _equal(stats, value, n)
+    if op == Op.Ne:
+        return 1.0 - _equal(stats, value, n)
+    if op == Op.In:
+        return min(1.0, sum(_equal(stats, v, n) for v in set(value)))
+    if op == Op.Lt:
+        return _below(stats, value, False)
+    if op == Op.Le:
+        return _below(stats, value, True)
+    if op == Op.Gt:
+        return 1.0 - _below(stats, value, True)
+    if op == Op.Ge:
+        return 1.0 - _below(stats, value, False)
+    if op == Op.Between:
+        low, high = value
+        return max(0.0, _below(stats, high, True) - _below(stats, low, False))
+    if op == Op.StartsWith:
+        upper = value.rstrip(chr(0x10FFFF))
+        if not upper:
+            return 1.0 - _below(stats, value, False)
+        upper = upper[:-1] + chr(ord(upper[-1]) + 1)
+        return max(0.0, _below(stats, upper, False)
+                   - _below(stats, value, False))
+    raise exceptions.IllegalArgumentError(
+        'Cannot estimate operation {}'.format(op))
+
+
+def estimate_clause(expr, get_stats):
+    """
+    :param expr: comparison of an attribute with a literal
+                 or negation of it, as left by predicate_optimizer
+    :param get_stats: function of attribute name returning AttributeStats
+                      or None
+    :returns estimated selectivity or None if it is unknown
+    """
+    negated = isinstance(expr, UnaryOperation)
+    if negated:
+        expr = expr.arg
+    if not (predicate_optimizer.is_comparison(expr)
+            and isinstance(expr.left, Identifier)
+            and isinstance(expr.right, Literal)):
+        return None
+    stats = get_stats(expr.left.name)
+    if stats is None:
+        return None
+    value = expr.right.value
+    try:
+        if expr.op in (Op.In, Op.Between):
+            value = tuple(stats.attr.normalize_value(v) for v in value)
+        elif expr.op != Op.StartsWith:
+            value = stats.attr.normalize_value(value)
+        selectivity = estimate_selectivity(stats, expr.op, value)
+    except (exceptions.IllegalArgumentError, TypeError, AttributeError):
+        return None
+    return 1.0 - selectivity if negated else selectivity
+
+
+def order_by_selectivity(expr, get_stats):
+    """
+    Reorders operands of "and" so the most selective ones go first,
+    and of "or" so the least selective ones go first, so the evaluation
+    of the predicate is cut short as early as possible.
+    :param get_stats: see estimate_clause
+    """
+    return _order(expr, get_stats)[0]
+
+
+def _order(expr, get_stats):
+    """:returns (reordered expression, its estimated selectivity)"""
+    if isinstance(expr, BinaryOperation) and expr.op in (Op.And, Op.Or):
+        operands = [_order(e, get_stats)
+                    for e in _flatten(expr, expr.op)]
+        if expr.op == Op.And:
+            operands.sort(key=lambda pair: pair[1])
+            selectivity = _product(s for _, s in operands)
+        else:
+            operands.sort(key=lambda pair: -pair[1])
+            selectivity = 1.0 - _product(1.0 - s for _, s in operands)
+        result = operands[0][0]
+        for operand, _ in operands[1:]:
+            result = BinaryOperation(expr.op, result, operand)
+        return result, selectivity
+    selectivity = estimate_clause(expr, get_stats)
+    if selectivity is None:
+        selectivity = UNKNOWN_SELECTIVITY
+    return expr, selectivity
+
+
+def _product(values):
+    result = 1.0
+    for value in values:
+        result *= value
+    return result
+
+
+def _flatten(expr, op):
+    if isinstance(expr, BinaryOperation) and expr.op == op:
+        return _flatten(expr.left, op) + _flatten(expr.right, op)
+    return [expr]
+
+
+def _equal(stats, value, n):
+    if value in stats.frequencies:
+        return stats.frequencies[value] / n
+    if stats.min_value is not None and not (
+            stats.min_value <= value <= stats.max_value):
+        return 0.0
+    if stats.attr.type == AttributeType.Enum:
+        return 0.0
+    n_rest = max(n - sum(stats.frequencies.values()), 0)
+    n_other = max(stats.n_distinct - len(stats.frequencies), 1)
+    return n_rest / n_other / n
+
+
+def _below(stats, value, inclusive):
+    """:returns estimated fraction of values less than (or equal to) value"""
+    bounds = stats.histogram
+    if not bounds:
+        return _interpolate(stats.min_value, stats.max_value, value)
+    i = (bisect.bisect_right if inclusive else bisect.bisect_left)(
+        bounds, value)
+    if i == 0:
+        return 0.0
+    if i >= len(bounds):
+        return 1.0
+    n_buckets = len(bounds) - 1
+    within = _interpolate(bounds[i - 1], bounds[i], value)
+    return (i - 1 + within) / n_buckets
+
+
+def _interpolate(low, high, value):
+    if low is None:
+        return UNKNOWN_SELECTIVITY
+    if value < low:
+        return 0.0
+    if value > high:
+        return 1.0
+    if isinstance(value, str) or high == low:
+        return 0.5
+    return (value - low) / (high - low)
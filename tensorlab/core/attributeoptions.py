@@ -1,4 +1,6 @@
 import enum
+import functools
+import numpy as np
 from tensorlab import exceptions
 
 
@@ -25,55 +27,294 @@ class AttributeType(enum.Enum):
     def encode(self, value, options):
         if value is None:
             return None
-        encoder_name = '_encode_'+self.name.lower()
-        encoder = getattr(self, encoder_name)
-        return encoder(value, options)
+        return self.get_codec(options).encode(value)
 
     def decode(self, string, options):
         if string is None:
             return None
-        decoder_name = '_decode_'+self.name.lower()
-        decoder = getattr(self, decoder_name)
-        return decoder(string, options)
+        return self.get_codec(options).decode(string)
 
-    def _encode_integer(self, value, options):
+    def get_codec(self, options, codes=None):
+        """
+        :param codes: ChoiceCodes values of an enumeration are stored as
+        :returns Codec of values of the type with the options, shared
+                 by all attributes with the same ones unless they have codes
+        :rtype: Codec
+        """
+        if codes is not None:
+            return Codec(self, options, codes)
+        return _get_shared_codec(self, options)
+
+
+class Codec:
+    """
+    Encoder and decoder of values of a type with options. Options are
+    parsed once, so encoding and decoding of each value is a call of
+    a function chosen for them in advance. Columns of values are encoded
+    and decoded at once with encode_many and decode_many.
+    """
+
+    def __init__(self, attr_type, options, codes=None):
+        """
+        :type attr_type: AttributeType
+        :type codes: ChoiceCodes
+        """
+        self.type = attr_type
+        self.options = options
+        self.codes = codes
+        self._encode, self._decode = _CODERS[attr_type](options)
+        self._dtype = _DTYPES.get(attr_type)
+        self._choices = None
+        if codes is not None:
+            self._choices = np.array([c or None for c in codes.choices],
+                                     dtype=object)
+
+    def encode(self, value):
+        """:returns the value as it is stored"""
+        if value is None:
+            return None
+        if self.codes is not None:
+            return self.codes.encode(self._encode(value))
+        return self._encode(value)
+
+    def decode(self, string):
+        if string is None:
+            return None
+        if self.codes is not None:
+            string = self.codes.decode(string)
+        return self._decode(string)
+
+    def normalize(self, value):
+        """
+        Validates the value and converts it to the type,
+        see tensorlab.core.attributes.Attribute.normalize_value
+        """
+        if value is None:
+            return None
+        return self._decode(self._encode(value))
+
+    def encode_many(self, values, present=None):
+        """
+        :param values: list of values, None for missing ones,
+                       or numpy array of them
+        :param present: boolean mask of values which are not missing,
+                        as returned by decode_many
+        :returns list of values as they are stored, None for missing ones
+        """
+        if isinstance(values, np.ndarray) and \
+                values.dtype.kind in _NATIVE_KINDS.get(self.type, ''):
+            _check_range(self.type, self.options,
+                         values if present is None else values[present])
+            strings = list(map(str, values.astype(self._dtype).tolist()))
+        else:
+            # other arrays are encoded value by value, the same as encode
+            if isinstance(values, np.ndarray):
+                values = values.tolist()
+            strings = [None if v is None else self._encode(v) for v in values]
+        if present is not None:
+            strings = [s if p else None for s, p in zip(strings, present)]
+        if self.codes is not None:
+            encode = self.codes.encode
+            strings = [None if s is None else encode(s) for s in strings]
+        return strings
+
+    def decode_many(self, strings):
+        """
+        :param strings: list or numpy array of stored values,
+                        None for missing ones
+        :returns (numpy array of decoded values, boolean mask of values
+                 which are not missing); numbers have native dtypes and
+                 are 0 where missing, except for integers which do not fit
+                 int64, which are objects; other values are objects or None
+        """
+        strings = np.asarray(strings, dtype=object)
+        present = np.not_equal(strings, None)
+        if self._dtype is not None:
+            values = np.zeros(len(strings), dtype=self._dtype)
+            try:
+                values[present] = strings[present].astype(self._dtype)
+            except OverflowError:
+                values = np.zeros(len(strings), dtype=object)
+                values[present] = [self._decode(string)
+                                   for string in strings[present]]
+            except (ValueError, TypeError) as exc:
+                raise exceptions.IllegalArgumentError(str(exc))
+            return values, present
+        if self._choices is None:
+            return strings.copy(), present
+        return self._decode_codes(strings[present], present), present
+
+    def _decode_codes(self, codes, present):
+        try:
+            codes = codes.astype(np.int64)
+        except (ValueError, TypeError):
+            codes = None
+        if codes is not None and len(codes) and (
+                codes.min() < 0 or codes.max() >= len(self._choices)):
+            codes = None
+        values = np.full(len(present), None, dtype=object)
+        if codes is not None:
+            values[present] = self._choices[codes]
+        if codes is None or np.equal(values[present], None).any():
+            raise exceptions.IllegalArgumentError(
+                'Unknown codes of choices of {}'.format(self.options))
+        return values
+
+
+@functools.lru_cache(maxsize=256)
+def _get_shared_codec(attr_type, options):
+    # not a registered cache: it is looked up for every encoded
+    # and decoded value, so it must cost no locking
+    return Codec(attr_type, options)
+
+
+_DTYPES = {
+    AttributeType.Integer: np.int64,
+    AttributeType.Float: np.float64,
+}
+
+# kinds of numpy arrays encoded at once, as they are converted
+# to the dtype of the type without changing values
+_NATIVE_KINDS = {
+    AttributeType.Integer: 'i',
+    AttributeType.Float: 'if',
+}
+
+
+def _integer_coders(options):
+    if options == 'positive':
+        def check(int_value):
+            return int_value >= 0
+        message = 'Expected positive integer, got {!r}'
+    elif options == 'negative':
+        def check(int_value):
+            return int_value <= 0
+        message = 'Expected negative integer, got {!r}'
+    else:
+        check = message = None
+
+    def encode(value):
         int_value = _cast(value, int)
-        if options == 'positive':
-            if int_value < 0:
-                raise exceptions.IllegalArgumentError(
-                    'Expected positive integer, got {!r}'.format(value))
-        elif options == 'negative':
-            if int_value > 0:
-                raise exceptions.IllegalArgumentError(
-                    'Expected negative integer, got {!r}'.format(value))
+        if check is not None and not check(int_value):
+            raise exceptions.IllegalArgumentError(message.format(value))
         return str(value)
 
-    def _encode_float(self, value, options):
-        float_value = _cast(value, float)
-        return str(float_value)
+    def decode(string):
+        return _cast(string, int)
+    return encode, decode
 
-    def _encode_string(self, value, options):
-        return str(value)
 
-    def _encode_enum(self, value, options):
-        options = options.split(';')
-        if value not in options:
+def _float_coders(options):
+    def encode(value):
+        return str(_cast(value, float))
+
+    def decode(string):
+        return _cast(string, float)
+    return encode, decode
+
+
+def _string_coders(options):
+    return str, _identity
+
+
+def _enum_coders(options):
+    choices = options.split(';')
+    allowed = set(choices)
+
+    def encode(value):
+        if value not in allowed:
             raise exceptions.IllegalArgumentError(
                     "Expected one of {}, got {!r}"
-                    .format(', '.join(options), value))
+                    .format(', '.join(choices), value))
         return str(value)
+    return encode, _identity
 
-    def _decode_integer(self, string, options):
-        return _cast(string, int)
 
-    def _decode_float(self, string, options):
-        return _cast(string, float)
+_CODERS = {
+    AttributeType.Integer: _integer_coders,
+    AttributeType.Float: _float_coders,
+    AttributeType.String: _string_coders,
+    AttributeType.Enum: _enum_coders,
+}
+
+
+def _check_range(attr_type, options, values):
+    """Validates numeric values of an array at once."""
+    if attr_type != AttributeType.Integer or not len(values):
+        return
+    if options == 'positive' and values.min() < 0:
+        raise exceptions.IllegalArgumentError(
+            'Expected positive integer, got {!r}'.format(values.min()))
+    if options == 'negative' and values.max() > 0:
+        raise exceptions.IllegalArgumentError(
+            'Expected negative integer, got {!r}'.format(values.max()))
+
+
+def _identity(value):
+    return value
+
+
+class ChoiceCodes:
+    """
+    Dictionary of choices of an enumeration whose values are stored
+    as small integer codes, the positions of the choices in it.
+    Codes never change, so choices are renamed and added without
+    touching stored values. Codes of removed choices are not reused.
+    """
+
+    def __init__(self, choices):
+        """:param choices: list of choices by code, '' for removed ones"""
+        self.choices = list(choices)
+        self._codes = {choice: str(code)
+                       for code, choice in enumerate(self.choices) if choice}
+
+    @classmethod
+    def from_options(cls, options):
+        return cls(choice for choice in options.split(';') if choice)
+
+    @classmethod
+    def parse(cls, string):
+        """:returns ChoiceCodes or None if there is no dictionary"""
+        if string is None:
+            return None
+        return cls(string.split(';') if string else [])
+
+    def serialize(self):
+        return ';'.join(self.choices)
+
+    def encode(self, choice):
+        try:
+            return self._codes[choice]
+        except KeyError:
+            raise exceptions.IllegalArgumentError(
+                'Choice {!r} has no code'.format(choice))
+
+    def decode(self, code):
+        if not self.has_code(code):
+            raise exceptions.IllegalArgumentError(
+                'Unknown code of choice {!r}'.format(code))
+        return self.choices[int(code)]
+
+    def has_code(self, code):
+        try:
+            code = int(code)
+        except (ValueError, TypeError):
+            return False
+        return 0 <= code < len(self.choices) and bool(self.choices[code])
 
-    def _decode_string(self, string, options):
-        return string
+    def update(self, options):
+        """
+        :returns dictionary of the choices of the options: choices which
+                 are not among them are removed, new ones get new codes
+        """
+        choices = [choice for choice in options.split(';') if choice]
+        kept = [c if c in choices else '' for c in self.choices]
+        return ChoiceCodes(kept + [c for c in choices if c not in kept])
 
-    def _decode_enum(self, string, options):
-        return string
+    def rename(self, old, new):
+        """:returns dictionary where the choice has the new name"""
+        self.encode(old)
+        return ChoiceCodes(new if c == old else c for c in self.choices)
 
 
 def _cast(value, type):
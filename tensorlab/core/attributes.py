@@ -40,7 +40,7 @@ class Attribute:
 
     def __init__(self, key=None, storage: 'AttributeStorage'=None, *,
                  name, type, runtime, options='',
-                 default=None, nullable=False):
+                 default=None, nullable=False, codes=None):
         """
         :type storage: AttributeStorage
         :type name: str
@@ -49,6 +49,9 @@ class Attribute:
         :type options: str
         :type default: <not specified>
         :type nullable: bool
+        :param codes: dictionary of codes values of the enumeration
+                      are stored as, None if they are stored as strings
+        :type codes: tensorlab.core.attributeoptions.ChoiceCodes
         """
         self.key = key
         self.storage = storage  # type: AttributeStorage
@@ -58,6 +61,8 @@ class Attribute:
         self.options = options
         self.default = default
         self.nullable = nullable
+        self.codes = codes
+        self._codec = None
 
     def derive(self, **changes):
         kwargs = self.get_fields()
@@ -67,10 +72,34 @@ class Attribute:
 
     def get_default(self):
         if self.default is not None:
-            return self.decode_value(self.default)
+            return self.type.decode(self.default, self.options)
+
+    def get_codec(self):
+        """
+        :returns codec of values of the attribute, built again only
+                 when its type, options or codes change
+        :rtype: tensorlab.core.attributeoptions.Codec
+        """
+        codec = self._codec
+        if codec is None or codec.type != self.type \
+                or codec.options != self.options \
+                or codec.codes is not self.codes:
+            codec = self._codec = self.type.get_codec(self.options, self.codes)
+        return codec
+
+    def encode_value(self, value):
+        """:returns the value as it is stored"""
+        return self.get_codec().encode(value)
 
     def decode_value(self, value_str):
-        return self.type.decode(value_str, self.options)
+        return self.get_codec().decode(value_str)
+
+    def normalize_value(self, value):
+        """
+        Validates the value and converts it to the type of the attribute.
+        :raises tensorlab.exceptions.IllegalArgumentError
+        """
+        return self.get_codec().normalize(value)
 
     def __repr__(self):
         return 'Attribute(name={!r}, type={}, runtime={}{}{}{})'\
@@ -145,6 +174,18 @@ class AttributeStorage(StorageBase):
         """
         raise NotImplementedError
 
+    def rename_choice(self, attribute, old_choice, new_choice):
+        """
+        Renames the choice of the enumeration attribute in its options,
+        its default and all its values.
+
+        :type attribute: Attribute
+        :type old_choice: str
+        :type new_choice: str
+        :return: None
+        """
+        raise NotImplementedError
+
     def get_defining_group(self, attribute):
         """
         :returns group that defines given attribute
@@ -153,18 +194,20 @@ class AttributeStorage(StorageBase):
         """
         raise NotImplementedError
 
-    def get_attr_values_for_model(self, model):
+    def get_attr_values_for_model(self, model, attrs=None):
         """
         :returns values of all attributes for given model, including defaults
         :type model: tensorboard.core.models.Model
+        :param attrs: names of the only attributes to return
         :rtype: dict
         """
         raise NotImplementedError
 
-    def get_attr_values_for_run(self, run):
+    def get_attr_values_for_run(self, run, attrs=None):
         """
         :returns values of all attributes for given run, including defaults
         :type run: tensorboard.core.runs.Run
+        :param attrs: names of the only attributes to return
         :rtype: dict
         """
         raise NotImplementedError
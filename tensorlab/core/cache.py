@@ -0,0 +1,118 @@
+"""
+Bounded in-process caches with hit and miss counters.
+
+Caches are registered by name, so their sizes can be configured and
+their statistics collected in one place:
+
+    >>> cache.configure('parsed_expressions', 1024)
+    >>> cache.get_stats()['parsed_expressions'].hits
+"""
+import threading
+import collections
+
+
+CacheStats = collections.namedtuple(
+    'CacheStats', ['hits', 'misses', 'size', 'maxsize'])
+
+_registry = collections.OrderedDict()
+_registry_lock = threading.Lock()
+
+
+class LRUCache:
+    """Thread-safe mapping which evicts the least recently used items."""
+
+    def __init__(self, maxsize):
+        self._maxsize = maxsize
+        self._items = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._items[key]
+            except KeyError:
+                self._misses += 1
+                return default
+            self._items.move_to_end(key)
+            self._hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            self._evict()
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._items.pop(key, default)
+
+    def get_or_create(self, key, factory):
+        """
+        Returns the cached value or calls factory(key) and caches the result.
+        Exceptions raised by the factory are not cached.
+        """
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = factory(key)
+            self.put(key, value)
+        return value
+
+    def resize(self, maxsize):
+        with self._lock:
+            self._maxsize = maxsize
+            self._evict()
+
+    def clear(self, reset_stats=True):
+        with self._lock:
+            self._items.clear()
+            if reset_stats:
+                self._hits = self._misses = 0
+
+    def stats(self):
+        """:rtype: CacheStats"""
+        with self._lock:
+            return CacheStats(self._hits, self._misses,
+                              len(self._items), self._maxsize)
+
+    def __len__(self):
+        return len(self._items)
+
+    def _evict(self):
+        while len(self._items) > self._maxsize:
+            self._items.popitem(last=False)
+
+
+def register(name, maxsize):
+    """
+    :returns the cache registered under the name, creating it if needed
+    :rtype: LRUCache
+    """
+    with _registry_lock:
+        if name not in _registry:
+            _registry[name] = LRUCache(maxsize)
+        return _registry[name]
+
+
+def configure(name, maxsize):
+    """Changes the size of the registered cache, 0 disables it."""
+    with _registry_lock:
+        _registry[name].resize(maxsize)
+
+
+def get_stats():
+    """:returns OrderedDict of cache name -> CacheStats"""
+    with _registry_lock:
+        caches = list(_registry.items())
+    return collections.OrderedDict(
+        (name, c.stats()) for name, c in caches)
+
+
+def clear_all():
+    with _registry_lock:
+        caches = list(_registry.values())
+    for c in caches:
+        c.clear()
@@ -59,6 +59,14 @@ class GroupsStorage(base.StorageBase):
         """
         raise NotImplementedError
 
+    def get_path(self, group):
+        """
+        :returns fully qualified name of the group, accepted by get(),
+                 an empty string for the root group
+        :rtype: str
+        """
+        raise NotImplementedError
+
     def list(self, parent_group, name_pattern=None):
         """
         :param parent_group: if None, lists top level groups
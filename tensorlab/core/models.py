@@ -36,7 +36,32 @@ class ModelsStorage(base.StorageBase):
         """:rtype: Model"""
         raise NotImplementedError
 
-    def list(self, group, name_pattern=None, predicate=None):
+    def list(self, group, name_pattern=None, predicate=None,
+             order_by=None, limit=None, select_related=False):
+        """
+        :param predicate: tensorlab.core.attribute_predicates.Expression
+        :param order_by: attributes to order models by,
+                         see tensorlab.core.ordering
+        :param limit: maximal number of returned models
+        :param select_related: whether to load groups of the models too
+        """
+        raise NotImplementedError
+
+    def get_frame(self, group, attrs=None):
+        """
+        Loads attribute values of all models of the group (non-recursive)
+        for filtering them in memory.
+        :param attrs: names of the only attributes to load
+        :rtype: tensorlab.core.attribute_frame.AttributeFrame
+        """
+        raise NotImplementedError
+
+    def update_attrs_where(self, group, predicate, values):
+        """
+        Sets attributes of all models of the group matching the predicate.
+        :param values: dict of attribute name -> new value
+        :returns number of updated models
+        """
         raise NotImplementedError
 
     def create(self, model, group, attrs):
@@ -57,7 +82,7 @@ class ModelsStorage(base.StorageBase):
     def count_runs(self, model):
         return len(self.list_runs(model))
 
-    def get_attrs(self, model):
+    def get_attrs(self, model, attrs=None):
         raise NotImplementedError
 
     def delete_with_content(self, model):
@@ -0,0 +1,89 @@
+"""
+Ordering of models and runs by attribute values.
+
+Orders are lists of (attribute name, ASC or DESC), a bare name means
+ascending order. Missing values go last in both directions, the same way
+storages order them.
+"""
+import heapq
+import functools
+from tensorlab import exceptions
+
+
+ASC = 'asc'
+DESC = 'desc'
+
+
+def parse_order_by(order_by):
+    """
+    :param order_by: list of attribute names or (name, direction) pairs
+    :returns list of (name, whether the order is descending)
+    """
+    result = []
+    for item in order_by or ():
+        if isinstance(item, str):
+            name, direction = item, ASC
+        else:
+            name, direction = item
+        direction = direction.lower()
+        if direction not in (ASC, DESC):
+            raise exceptions.IllegalArgumentError(
+                'Unknown direction of ordering by "{}": {}'
+                .format(name, direction))
+        result.append((name, direction == DESC))
+    return result
+
+
+def make_key(order_by, get_value):
+    """
+    :param get_value: function of an item and an attribute name
+                      returning the value of the attribute or None
+    :returns function of an item returning its sorting key
+    """
+    order = parse_order_by(order_by)
+
+    def key(item):
+        return _SortKey(tuple(get_value(item, name) for name, _ in order),
+                        order)
+    return key
+
+
+def sort(items, order_by, get_value):
+    """:returns list of items sorted by values of attributes, stably"""
+    return sorted(items, key=make_key(order_by, get_value))
+
+
+def top_k(items, k, order_by, get_value):
+    """
+    Selects the first k items in the order without sorting all of them:
+    items are consumed one by one and only a heap of k best ones is kept,
+    so any iterable can be passed.
+    :returns list of at most k items in the order, stable for equal keys
+    """
+    if k < 0:
+        raise exceptions.IllegalArgumentError(
+            'Number of items cannot be negative')
+    return heapq.nsmallest(k, items, key=make_key(order_by, get_value))
+
+
+@functools.total_ordering
+class _SortKey:
+
+    __slots__ = ('values', 'order')
+
+    def __init__(self, values, order):
+        self.values = values
+        self.order = order
+
+    def __eq__(self, other):
+        return self.values == other.values
+
+    def __lt__(self, other):
+        for a, b, (_, descending) in zip(self.values, other.values,
+                                         self.order):
+            if a == b:
+                continue
+            if a is None or b is None:
+                return b is None
+            return a > b if descending else a < b
+        return False
@@ -0,0 +1,175 @@
+"""
+Compilation of filtering predicates into Python functions for filtering
+attribute values which are already loaded, e.g. cached in
+model.key['cached_attrs'].
+
+The generated function takes a dict of attribute name -> decoded value
+and has the same semantics as storages: a comparison with a missing
+(None) value is not satisfied, and neither is its negation.
+"""
+import collections
+from tensorlab import exceptions
+from tensorlab.core.attributeoptions import AttributeType
+from tensorlab.core.attribute_predicates import (
+    Op, Identifier, Literal, UnaryOperation, BinaryOperation
+)
+from tensorlab.core import predicate_optimizer, cache
+
+
+_functions = cache.register('compiled_predicates', 256)
+
+_PYTHON_OPS = {
+    Op.Eq: '==', Op.Ne: '!=',
+    Op.Gt: '>', Op.Lt: '<',
+    Op.Ge: '>=', Op.Le: '<=',
+    Op.And: 'and', Op.Or: 'or',
+}
+
+
+def compile_predicate(expr, attrs=None):
+    """
+    :type expr: tensorlab.core.attribute_predicates.Expression
+    :param attrs: optional dict of attribute name ->
+                  tensorlab.core.attributes.Attribute; if given, literals
+                  are validated and converted to types of the attributes,
+                  and unknown identifiers are reported
+    :returns function of a dict of attribute values returning bool;
+             functions are cached per canonical form of the expression
+    """
+    expr = predicate_optimizer.optimize(expr)
+    typeinfo = None
+    if attrs is not None:
+        typeinfo = tuple(sorted(
+            (name, attrs[name].type, attrs[name].options)
+            for name in predicate_optimizer.get_identifiers(expr)
+            if name in attrs
+        ))
+    return _functions.get_or_create(
+        (expr.serialize(), typeinfo),
+        lambda key: _Generator(attrs).generate(expr))
+
+
+def evaluate(expr, values):
+    """
+    Evaluates the expression on the dict of attribute values
+    by walking the tree.
+    :returns True, False or None if the result is unknown
+    """
+    if isinstance(expr, Literal):
+        return expr.value
+    if isinstance(expr, Identifier):
+        return values.get(expr.name)
+    if isinstance(expr, UnaryOperation):
+        arg = evaluate(expr.arg, values)
+        return None if arg is None else not arg
+    left = evaluate(expr.left, values)
+    if expr.op == Op.And:
+        if left is False:
+            return False
+        right = evaluate(expr.right, values)
+        if right is False:
+            return False
+        return None if left is None or right is None else True
+    if expr.op == Op.Or:
+        if left is True:
+            return True
+        right = evaluate(expr.right, values)
+        if right is True:
+            return True
+        return None if left is None or right is None else False
+    right = evaluate(expr.right, values)
+    if left is None or right is None:
+        return None
+    return predicate_optimizer.FUNCTIONS[expr.op](left, right)
+
+
+class _Generator:
+
+    def __init__(self, attrs):
+        self._attrs = attrs
+        self._variables = collections.OrderedDict()
+        self._constants = {}
+
+    def generate(self, expr):
+        if isinstance(expr, Literal):
+            result = bool(expr.value)
+            return lambda values: result
+        body = self._condition(expr)
+        lines = ['def _predicate(values):']
+        for name, var in self._variables.items():
+            lines.append('    {} = values.get({!r})'.format(var, name))
+        lines.append('    return {}'.format(body))
+        namespace = dict(self._constants)
+        exec(compile('\n'.join(lines), '<predicate {}>'.format(
+            expr.serialize()), 'exec'), namespace)
+        return namespace['_predicate']
+
+    def _condition(self, expr):
+        if isinstance(expr, UnaryOperation):
+            # negations are on comparisons only after optimizing
+            guard, comparison = self._comparison(expr.arg)
+            return '({} and not {})'.format(guard, comparison)
+        if isinstance(expr, BinaryOperation) and expr.op in (Op.And, Op.Or):
+            return '({} {} {})'.format(self._condition(expr.left),
+                                       _PYTHON_OPS[expr.op],
+                                       self._condition(expr.right))
+        if isinstance(expr, Literal):
+            return repr(bool(expr.value))
+        guard, comparison = self._comparison(expr)
+        return '({} and {})'.format(guard, comparison)
+
+    def _comparison(self, expr):
+        """:returns (code checking values are not None, code comparing)"""
+        if not predicate_optimizer.is_comparison(expr):
+            raise exceptions.IllegalArgumentError(
+                'Expected a comparison, got {}'.format(expr.serialize()))
+        left, op, right = expr.left, expr.op, expr.right
+        if not isinstance(left, Identifier):
+            raise exceptions.IllegalArgumentError(
+                'Cannot compare {}'.format(expr.serialize()))
+        var = self._variable(left.name)
+        if isinstance(right, Identifier):
+            other = self._variable(right.name)
+            return ('{} is not None and {} is not None'.format(var, other),
+                    '{} {} {}'.format(var, _PYTHON_OPS[op], other))
+
+        attr = self._attrs.get(left.name) if self._attrs else None
+        guard = '{} is not None'.format(var)
+        if op == Op.In:
+            values = frozenset(_convert(attr, v) for v in right.value)
+            return guard, '{} in {}'.format(var, self._constant(values))
+        if op == Op.Between:
+            low, high = (_convert(attr, v) for v in right.value)
+            return guard, '{} <= {} <= {}'.format(
+                self._constant(low), var, self._constant(high))
+        if op == Op.StartsWith:
+            if not isinstance(right.value, str) or (
+                    attr is not None and not _is_string(attr)):
+                raise exceptions.IllegalArgumentError(
+                    'Only string values can be matched by prefix')
+            return ('isinstance({}, str)'.format(var),
+                    '{}.startswith({})'.format(
+                        var, self._constant(right.value)))
+        return guard, '{} {} {}'.format(
+            var, _PYTHON_OPS[op], self._constant(_convert(attr, right.value)))
+
+    def _variable(self, name):
+        if name not in self._variables:
+            if self._attrs is not None and name not in self._attrs:
+                raise exceptions.LookupError(
+                    'Attribute "{}" does not exist'.format(name))
+            self._variables[name] = 'v{}'.format(len(self._variables))
+        return self._variables[name]
+
+    def _constant(self, value):
+        name = 'c{}'.format(len(self._constants))
+        self._constants[name] = value
+        return name
+
+
+def _convert(attr, value):
+    return value if attr is None else attr.normalize_value(value)
+
+
+def _is_string(attr):
+    return attr.type in (AttributeType.String, AttributeType.Enum)
@@ -0,0 +1,443 @@
+"""
+Simplification of filtering predicates before they are given to storages.
+
+Predicates are evaluated in three-valued logic: a comparison with
+a missing (null) value is "unknown", and objects are selected only if
+the predicate is true. All rewritings below preserve this semantics,
+e.g. "not x < 5" becomes "x >= 5", which is unknown for null x as well.
+Since negations end up only on leafs, an unknown subexpression can be
+replaced with false without changing the selection: so contradictions
+and comparisons with null literals become Literal(False), and storages
+can return empty results without querying anything.
+"""
+import hashlib
+import operator
+from tensorlab.core.attribute_predicates import (
+    Op, Identifier, Literal, UnaryOperation, BinaryOperation
+)
+from tensorlab.core import cache
+
+
+COMPARISONS = (Op.Eq, Op.Ne, Op.Gt, Op.Lt, Op.Ge, Op.Le,
+               Op.In, Op.Between, Op.StartsWith)
+
+NEGATED = {
+    Op.Eq: Op.Ne, Op.Ne: Op.Eq,
+    Op.Gt: Op.Le, Op.Le: Op.Gt,
+    Op.Lt: Op.Ge, Op.Ge: Op.Lt,
+}
+
+# operator to use when the operands are swapped;
+# "in", "between" and "startswith" have neither negated nor mirrored ones
+MIRRORED = {
+    Op.Eq: Op.Eq, Op.Ne: Op.Ne,
+    Op.Gt: Op.Lt, Op.Lt: Op.Gt,
+    Op.Ge: Op.Le, Op.Le: Op.Ge,
+}
+
+FUNCTIONS = {
+    Op.Eq: operator.eq, Op.Ne: operator.ne,
+    Op.Gt: operator.gt, Op.Lt: operator.lt,
+    Op.Ge: operator.ge, Op.Le: operator.le,
+    Op.In: lambda value, values: value in values,
+    Op.Between: lambda value, bounds: bounds[0] <= value <= bounds[1],
+    Op.StartsWith: lambda value, prefix: value.startswith(prefix),
+}
+
+_optimized = cache.register('optimized_expressions', 512)
+
+TRUE = Literal(True)
+FALSE = Literal(False)
+
+
+def optimize(expr):
+    """
+    Returns the simplified canonical form of the expression:
+    negations are pushed down to comparisons, comparisons of literals
+    are evaluated, comparisons of one identifier with literals are
+    merged into intervals, duplicated subtrees are removed and operands
+    of "and" and "or" are sorted.
+    :type expr: tensorlab.core.attribute_predicates.Expression
+    :returns Literal(True), Literal(False) or an expression
+             without constants; results are cached per serialized form
+    """
+    return _optimized.get_or_create(
+        expr.serialize(), lambda key: _build(_simplify(_push_not(expr, False))))
+
+
+def canonical_hash(expr):
+    """
+    :returns hex digest which is the same for expressions having
+             the same canonical form
+    """
+    key = _key(optimize(expr))
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def is_comparison(expr):
+    return isinstance(expr, BinaryOperation) and expr.op in COMPARISONS
+
+
+def get_identifiers(expr):
+    """:returns set of names of identifiers used in the expression"""
+    if isinstance(expr, Identifier):
+        return {expr.name}
+    if isinstance(expr, UnaryOperation):
+        return get_identifiers(expr.arg)
+    if isinstance(expr, BinaryOperation):
+        return get_identifiers(expr.left) | get_identifiers(expr.right)
+    return set()
+
+
+def count_nodes(expr):
+    if isinstance(expr, UnaryOperation):
+        return 1 + count_nodes(expr.arg)
+    if isinstance(expr, BinaryOperation):
+        return 1 + count_nodes(expr.left) + count_nodes(expr.right)
+    return 1
+
+
+# Simplification works on a normalized tree where "and" and "or" are
+# n-ary nodes: (op, [operands]); other nodes are kept as Expressions.
+
+def _push_not(expr, negate):
+    if isinstance(expr, UnaryOperation) and expr.op == Op.Not:
+        return _push_not(expr.arg, not negate)
+    if isinstance(expr, BinaryOperation) and expr.op in (Op.And, Op.Or):
+        op = expr.op
+        if negate:
+            op = Op.Or if op == Op.And else Op.And
+        return op, [_push_not(expr.left, negate),
+                    _push_not(expr.right, negate)]
+    if isinstance(expr, BinaryOperation):
+        return _comparison(expr.op, expr.left, expr.right, negate)
+    if isinstance(expr, Literal):
+        if expr.value is None:
+            return FALSE
+        return Literal(bool(expr.value) != negate)
+    if negate:
+        return UnaryOperation(Op.Not, expr)
+    return expr
+
+
+def _comparison(op, left, right, negate=False):
+    """:param negate: whether to return the negation of the comparison"""
+    if isinstance(left, Literal) and isinstance(right, Literal):
+        if left.value is None or right.value is None:
+            # unknown, and so is its negation
+            return FALSE
+        try:
+            return Literal(FUNCTIONS[op](left.value, right.value) != negate)
+        except (TypeError, AttributeError):
+            # incomparable types are reported by storages
+            pass
+    if (isinstance(left, Literal) and isinstance(right, Identifier)
+            and op in MIRRORED):
+        op, left, right = MIRRORED[op], right, left
+    result = BinaryOperation(op, left, right)
+    if isinstance(right, Literal) and op in Op.WITH_LITERALS:
+        reduced = _list_comparison(op, left, right.value)
+        if not (negate and isinstance(reduced, Literal)):
+            result = reduced
+        # else an empty "in" or "between" is kept as is: its negation
+        # is true for values, but unknown for nulls
+    if not negate or isinstance(result, Literal):
+        return result
+    if result.op in NEGATED:
+        return BinaryOperation(NEGATED[result.op], result.left, result.right)
+    return UnaryOperation(Op.Not, result)
+
+
+def _list_comparison(op, left, values):
+    """Reduces "in" and "between" to simpler comparisons if possible."""
+    if op == Op.In:
+        values = _sorted(set(values))
+        if not values:
+            return FALSE
+        if len(values) == 1:
+            return BinaryOperation(Op.Eq, left, Literal(values[0]))
+    else:
+        low, high = values
+        try:
+            if low > high:
+                return FALSE
+        except TypeError:
+            pass
+        if low == high:
+            return BinaryOperation(Op.Eq, left, Literal(low))
+    return BinaryOperation(op, left, Literal(tuple(values)))
+
+
+def _sorted(values):
+    try:
+        return sorted(values)
+    except TypeError:
+        return sorted(values, key=repr)
+
+
+def _simplify(node):
+    if not isinstance(node, tuple):
+        return node
+    op, operands = node
+    absorbing, neutral = (FALSE, TRUE) if op == Op.And else (TRUE, FALSE)
+
+    flat = []
+    for child in map(_simplify, operands):
+        if isinstance(child, tuple) and child[0] == op:
+            flat.extend(child[1])
+        else:
+            flat.append(child)
+
+    unique = {}
+    for child in flat:
+        if _is_const(child, absorbing.value):
+            return absorbing
+        if not _is_const(child, neutral.value):
+            unique.setdefault(_key(child), child)
+    children = _merge_ranges(op, list(unique.values()))
+    if children is None:
+        return absorbing
+    children = _absorb(op, children)
+
+    if not children:
+        return neutral
+    if len(children) == 1:
+        return children[0]
+    return op, sorted(children, key=_key)
+
+
+def _absorb(op, children):
+    """a and (a or b) -> a; a or (a and b) -> a"""
+    keys = {_key(c) for c in children}
+    dual = Op.Or if op == Op.And else Op.And
+    return [
+        c for c in children
+        if not (isinstance(c, tuple) and c[0] == dual
+                and any(_key(sub) in keys for sub in c[1]))
+    ]
+
+
+class _Range:
+    """Set of values of one identifier allowed by a conjunction."""
+
+    def __init__(self):
+        self.lower = None  # (value, inclusive)
+        self.upper = None
+        self.equal = []
+        self.not_equal = set()
+        self.one_of = None
+
+    def add(self, op, value):
+        if op == Op.In:
+            self.one_of = set(value) if self.one_of is None \
+                else self.one_of.intersection(value)
+        elif op == Op.Between:
+            self.add(Op.Ge, value[0])
+            self.add(Op.Le, value[1])
+        elif op == Op.Eq:
+            self.equal.append(value)
+        elif op == Op.Ne:
+            self.not_equal.add(value)
+        elif op in (Op.Gt, Op.Ge):
+            bound = (value, op == Op.Ge)
+            if self.lower is None or _tighter_lower(bound, self.lower):
+                self.lower = bound
+        else:
+            bound = (value, op == Op.Le)
+            if self.upper is None or _tighter_upper(bound, self.upper):
+                self.upper = bound
+
+    def contains(self, value):
+        if self.lower is not None:
+            bound, inclusive = self.lower
+            if value < bound or (value == bound and not inclusive):
+                return False
+        if self.upper is not None:
+            bound, inclusive = self.upper
+            if value > bound or (value == bound and not inclusive):
+                return False
+        return value not in self.not_equal
+
+    def to_comparisons(self, ident):
+        """:returns list of comparisons or None if the range is empty"""
+        if self.equal:
+            value = self.equal[0]
+            if any(v != value for v in self.equal) or not self.contains(value):
+                return None
+            if self.one_of is not None and value not in self.one_of:
+                return None
+            return [BinaryOperation(Op.Eq, ident, Literal(value))]
+        if self.one_of is not None:
+            values = [v for v in self.one_of if self.contains(v)]
+            if not values:
+                return None
+            return [_list_comparison(Op.In, ident, values)]
+        if self.lower is not None and self.upper is not None:
+            (lo, lo_incl), (hi, hi_incl) = self.lower, self.upper
+            if lo > hi or (lo == hi and not (lo_incl and hi_incl)):
+                return None
+            if lo == hi:
+                if lo in self.not_equal:
+                    return None
+                return [BinaryOperation(Op.Eq, ident, Literal(lo))]
+        if (self.lower is not None and self.upper is not None
+                and self.lower[1] and self.upper[1]):
+            result = [BinaryOperation(
+                Op.Between, ident, Literal((self.lower[0], self.upper[0])))]
+        else:
+            result = []
+            if self.lower is not None:
+                op = Op.Ge if self.lower[1] else Op.Gt
+                result.append(
+                    BinaryOperation(op, ident, Literal(self.lower[0])))
+            if self.upper is not None:
+                op = Op.Le if self.upper[1] else Op.Lt
+                result.append(
+                    BinaryOperation(op, ident, Literal(self.upper[0])))
+        # values outside of the bounds are excluded anyway
+        for value in sorted(self.not_equal):
+            if self._within_bounds(value):
+                result.append(BinaryOperation(Op.Ne, ident, Literal(value)))
+        return result
+
+    def _within_bounds(self, value):
+        not_equal, self.not_equal = self.not_equal, set()
+        try:
+            return self.contains(value)
+        finally:
+            self.not_equal = not_equal
+
+
+def _tighter_lower(a, b):
+    return a[0] > b[0] or (a[0] == b[0] and not a[1])
+
+
+def _tighter_upper(a, b):
+    return a[0] < b[0] or (a[0] == b[0] and not a[1])
+
+
+def _merge_ranges(op, children):
+    """
+    Merges comparisons of the same identifier with literals.
+    :returns new list of operands or None if the conjunction
+             is a contradiction
+    """
+    groups = {}
+    rest = []
+    for child in children:
+        group_key = _range_key(child)
+        if group_key is None:
+            rest.append(child)
+        else:
+            groups.setdefault(group_key, []).append(child)
+
+    merged = []
+    for (name, _), comparisons in groups.items():
+        if len(comparisons) == 1:
+            merged.extend(comparisons)
+            continue
+        if op == Op.And:
+            rng = _Range()
+            for c in comparisons:
+                rng.add(c.op, c.right.value)
+            result = rng.to_comparisons(Identifier(name))
+            if result is None:
+                return None
+            merged.extend(result)
+        else:
+            merged.extend(_merge_disjunction(name, comparisons))
+    return rest + merged
+
+
+def _merge_disjunction(name, comparisons):
+    """
+    Keeps only the weakest lower and upper bounds, drops equalities
+    implied by them and joins the rest of equalities into one "in".
+    Bounds covering all values are left as is: they are still unknown
+    for null values.
+    """
+    lower = upper = None
+    values = set()
+    others = []
+    for c in comparisons:
+        value = c.right.value
+        if c.op == Op.Eq:
+            values.add(value)
+        elif c.op == Op.In:
+            values.update(value)
+        elif c.op in (Op.Gt, Op.Ge):
+            bound = (value, c.op == Op.Ge)
+            if lower is None or _tighter_lower(lower, bound):
+                lower = bound
+        elif c.op in (Op.Lt, Op.Le):
+            bound = (value, c.op == Op.Le)
+            if upper is None or _tighter_upper(upper, bound):
+                upper = bound
+        else:
+            others.append(c)
+
+    result = []
+    ident = Identifier(name)
+    if lower is not None:
+        result.append(BinaryOperation(Op.Ge if lower[1] else Op.Gt,
+                                      ident, Literal(lower[0])))
+    if upper is not None:
+        result.append(BinaryOperation(Op.Le if upper[1] else Op.Lt,
+                                      ident, Literal(upper[0])))
+    values = [
+        value for value in values
+        if not (_satisfies(value, lower, Op.Gt, Op.Ge)
+                or _satisfies(value, upper, Op.Lt, Op.Le))
+    ]
+    if values:
+        result.append(_list_comparison(Op.In, ident, values))
+    return result + others
+
+
+def _satisfies(value, bound, strict_op, op):
+    if bound is None:
+        return False
+    return FUNCTIONS[op if bound[1] else strict_op](value, bound[0])
+
+
+def _range_key(node):
+    """
+    :returns (identifier name, kind of literal) for comparisons which
+             can be merged or None
+    """
+    if not (is_comparison(node)
+            and isinstance(node.left, Identifier)
+            and isinstance(node.right, Literal)):
+        return None
+    if node.op == Op.StartsWith:
+        return None
+    values = node.right.value
+    if not isinstance(values, tuple):
+        values = (values,)
+    if all(isinstance(v, (int, float)) and not isinstance(v, bool)
+           for v in values):
+        return node.left.name, 'number'
+    if all(isinstance(v, str) for v in values):
+        return node.left.name, 'string'
+    return None
+
+
+def _is_const(node, value):
+    return isinstance(node, Literal) and node.value is value
+
+
+def _key(node):
+    if isinstance(node, tuple):
+        op, children = node
+        return '{}({})'.format(op, ', '.join(sorted(map(_key, children))))
+    return node.serialize()
+
+
+def _build(node):
+    if not isinstance(node, tuple):
+        return node
+    op, children = node
+    result = _build(children[0])
+    for child in children[1:]:
+        result = BinaryOperation(op, result, _build(child))
+    return result
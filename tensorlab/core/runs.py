@@ -26,7 +26,32 @@ class RunsStorage(base.StorageBase):
         """:rtype: Run"""
         raise NotImplementedError
 
-    def list(self, model, predicate=None):
+    def list(self, model, predicate=None, order_by=None, limit=None,
+             select_related=False):
+        """
+        :param order_by: attributes to order runs by,
+                         see tensorlab.core.ordering
+        :param limit: maximal number of returned runs
+        :param select_related: whether to load models of the runs
+                               and groups of the models too
+        """
+        raise NotImplementedError
+
+    def list_in_group(self, group, predicate=None, recursive=True,
+                      order_by=None, limit=None, select_related=False):
+        """
+        Lists runs of models of the group filtered by a predicate
+        on attributes of both the models and the runs.
+        """
+        raise NotImplementedError
+
+    def get_frame(self, model, attrs=None):
+        """
+        Loads attribute values of all runs of the model for filtering
+        them in memory.
+        :param attrs: names of the only attributes to load
+        :rtype: tensorlab.core.attribute_frame.AttributeFrame
+        """
         raise NotImplementedError
 
     def create(self, model, run, attrs):
@@ -46,3 +71,11 @@ class RunsStorage(base.StorageBase):
 
     def delete(self, run):
         raise NotImplementedError
+
+    def delete_where(self, scope, predicate):
+        """
+        Deletes all runs of a model, or of models of a group and its
+        subgroups, which match the predicate.
+        :returns number of deleted runs
+        """
+        raise NotImplementedError
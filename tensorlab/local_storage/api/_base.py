@@ -1,22 +1,54 @@
+import numpy as np
 import sqlalchemy as sa
-from tensorlab.core import groups, models, runs, attributes
+from tensorlab import exceptions
+from tensorlab.core import (
+    groups, models, runs, attributes, attribute_frame, attributeoptions
+)
 from tensorlab.local_storage.db import utils, tables as _t
+from tensorlab.local_storage import files, gc, dedup, stats, identity
+
+
+# targets of filtering by predicates
+MODELS = 'models'
+RUNS = 'runs'
+
+# columns of related models and groups selected together with runs
+# or models, labeled with these prefixes
+_RELATED_MODEL = 'model__', [_t.Models.c.id, _t.Models.c.uid,
+                             _t.Models.c.group_id, _t.Models.c.name]
+_RELATED_GROUP = 'group__', [_t.Groups.c.id, _t.Groups.c.uid,
+                             _t.Groups.c.parent_id, _t.Groups.c.name]
 
 
 class LocalStorageBase:
     
     def _get_group_by_id(self, db, group_id):
+        group = self._storage.identity.get(identity.GROUPS, group_id)
+        if group is not None:
+            return group
         row = utils.read_one(db, _t.Groups, id=group_id)
         return self._row_to_group(row)
 
     def _get_model_by_id(self, db, model_id):
+        model = self._storage.identity.get(identity.MODELS, model_id)
+        if model is not None:
+            return model
         row = utils.read_one(db, _t.Models, id=model_id)
         return self._row_to_model(row)
 
+    def _identify(self, kind, obj):
+        """
+        :param kind: kind of the object, see tensorlab.local_storage.identity
+        :returns the instance of the object held by the storage
+        """
+        obj.storage = getattr(self._storage, kind)
+        return self._storage.identity.get_or_add(kind, obj)
+
     def _row_to_group(self, row):
         key = self._make_group_key(
             row['id'], row['uid'], row['parent_id'], row['name'])
-        return groups.Group(key, self, **key['orig_fields'])
+        return self._identify(
+            identity.GROUPS, groups.Group(key, self, **key['orig_fields']))
 
     def _make_group_key(self, id, uid, parent_id, name):
         return {'id': id, 'uid': uid, 'parent_id': parent_id,
@@ -32,14 +64,18 @@ class LocalStorageBase:
             'nullable': row['nullable'],
         }
         key = self._make_attribute_key(row['id'], row['group_id'], fields)
-        return attributes.Attribute(key=key, storage=self, **fields)
+        return attributes.Attribute(
+            key=key, storage=self,
+            codes=attributeoptions.ChoiceCodes.parse(row['codes']), **fields)
 
     def _make_attribute_key(self, id, group_id, fields):
         return {'id': id, 'group_id': group_id, 'orig_fields': fields}
 
     def _row_to_model(self, row):
-        key = self._make_model_key(**row)
-        return models.Model(key, self, name=row['name'])
+        key = self._make_model_key(
+            row['id'], row['uid'], row['group_id'], row['name'])
+        return self._identify(
+            identity.MODELS, models.Model(key, self, name=row['name']))
 
     def _make_model_key(self, id, uid, group_id, name):
         return {
@@ -56,25 +92,220 @@ class LocalStorageBase:
         }
 
     def _row_to_run(self, row):
-        key = self._make_run_key(**row)
-        return runs.Run(key, self, **key['orig_fields'])
-
-    def _fetch_attr_values(self, db, uids, attr_defs, runtime):
-        q = _t.AttributeValues.select().where(
-            _t.AttributeValues.c.target_uid.in_(uids)
-        ).where(
-            _t.AttributeValues.c.runtime == sa.true() if runtime else sa.false()
-        )
-        result = {uid: {} for uid in uids}
+        key = self._make_run_key(
+            row['id'], row['uid'], row['model_id'],
+            row['started_at'], row['finished_at'])
+        return self._identify(
+            identity.RUNS, runs.Run(key, self, **key['orig_fields']))
+
+    def _get_data_dir(self, kind, table, obj):
+        """
+        :returns data directory of the model or run on its storage tier
+        :param kind: files.MODELS or files.RUNS
+        """
+        key = utils.get_key(obj)
+        tier = self._db.execute(
+            sa.select([table.c.tier]).where(table.c.id == key['id'])
+        ).scalar()
+        if tier is None:
+            raise exceptions.InvalidStateError('Object is deleted', obj)
+        return files.get_data_dir(
+            self._storage.get_tier_root(tier), kind, key['uid'])
+
+    def _delete_runs(self, conn, condition):
+        """
+        Deletes matching runs with their attribute values and tombstones
+        their data directories. Set-based, so it costs the same number of
+        statements for any amount of runs.
+        """
+        uids = sa.select([_t.Runs.c.uid]).where(condition)
+        run_ids = sa.select([_t.Runs.c.id]).where(condition)
+        values = _t.RunValues.c.run_id.in_(run_ids)
+        stats.remove_values(conn, _t.RunValues, values)
+        conn.execute(_t.RunValues.delete().where(values))
+        conn.execute(_t.DiskUsage.delete().where(sa.and_(
+            _t.DiskUsage.c.kind == files.RUNS,
+            _t.DiskUsage.c.uid.in_(uids))))
+        conn.execute(_t.RunSeeds.delete().where(
+            _t.RunSeeds.c.run_id.in_(run_ids)))
+        gc.bury(conn, files.ARCHIVES, _t.Runs, sa.and_(
+            condition,
+            _t.Runs.c.id.in_(sa.select([_t.RunArchives.c.run_id]))),
+            tier=files.DEFAULT_TIER)
+        conn.execute(_t.RunArchives.delete().where(
+            _t.RunArchives.c.run_id.in_(run_ids)))
+        dedup.release(conn, files.RUNS, uids)
+        gc.bury(conn, files.RUNS, _t.Runs, condition)
+        conn.execute(_t.Runs.delete().where(condition))
+
+    def _delete_models(self, conn, condition):
+        """
+        Deletes matching models with their runs and attribute values
+        and tombstones their data directories.
+        """
+        ids = sa.select([_t.Models.c.id]).where(condition)
+        self._delete_runs(conn, _t.Runs.c.model_id.in_(ids))
+        uids = sa.select([_t.Models.c.uid]).where(condition)
+        values = _t.ModelValues.c.model_id.in_(ids)
+        stats.remove_values(conn, _t.ModelValues, values)
+        conn.execute(_t.ModelValues.delete().where(values))
+        conn.execute(_t.DiskUsage.delete().where(sa.and_(
+            _t.DiskUsage.c.kind == files.MODELS,
+            _t.DiskUsage.c.uid.in_(uids))))
+        dedup.release(conn, files.MODELS, uids)
+        gc.bury(conn, files.MODELS, _t.Models, condition)
+        conn.execute(_t.Models.delete().where(condition))
+
+    def _get_filter_source(self, target, scope):
+        """
+        :param target: MODELS or RUNS
+        :param scope: group of filtered models or its name, the root group
+                      by default; model of filtered runs
+        :rtype: tensorlab.local_storage.db.predicates.FilterSource
+        """
+        if target == MODELS:
+            if scope is None or isinstance(scope, str):
+                scope = self._storage.groups.get(scope)
+            return self._storage.models.get_filter_source(scope)
+        if target == RUNS:
+            if scope is None:
+                raise exceptions.IllegalArgumentError(
+                    'Filtering runs requires a model')
+            return self._storage.runs.get_filter_source(scope)
+        raise exceptions.IllegalArgumentError(
+            'Unknown target of filtering: {}'.format(target))
+
+    def _select_related(self, source, table, with_models):
+        """
+        :param table: join of the table of the source with the tables
+                      of related objects
+        :param with_models: whether runs are selected, with their models
+        :returns FilterSource whose rows also contain columns of related
+                 models and groups, see _attach_related
+        """
+        related = [_RELATED_MODEL, _RELATED_GROUP] if with_models \
+            else [_RELATED_GROUP]
+
+        def make_query():
+            query = source.make_query().select_from(table)
+            for prefix, columns in related:
+                for column in columns:
+                    query = query.column(column.label(prefix + column.name))
+            return query
+
+        return source._replace(name=(source.name, 'related'), table=table,
+                               make_query=make_query)
+
+    def _attach_related(self, objects, rows, with_models):
+        """
+        Sets models of runs or groups of models, shared by objects related
+        to the same ones, and paths of the groups, so they are not queried
+        again, see tensorlab.local_storage.api.runs.LocalRunsStorage.get_model
+        and tensorlab.local_storage.api.models.LocalModelsStorage.get_group
+        :param rows: rows of the source built by _select_related
+        """
+        paths = self._storage.groups.get_paths(
+            {row['group__id'] for row in rows})
+        related = {}
+
+        def get(row, prefix_columns, make):
+            prefix, columns = prefix_columns
+            key = prefix, row[prefix + 'id']
+            if key not in related:
+                related[key] = make({
+                    column.name: row[prefix + column.name]
+                    for column in columns})
+            return related[key]
+
+        for obj, row in zip(objects, rows):
+            group = get(row, _RELATED_GROUP, self._row_to_group)
+            group.key['path'] = paths[group.key['id']]
+            if with_models:
+                model = get(row, _RELATED_MODEL, self._row_to_model)
+                model.key['group'] = group
+                obj.key['model'] = model
+            else:
+                obj.key['group'] = group
+
+    def _get_target_stats(self, targets, names):
+        """
+        :param targets: see tensorlab.local_storage.db.predicates.filter_query
+        :returns dict of attribute name -> AttributeStats
+        """
+        attrs = {name: targets[name][0] for name in names if name in targets}
+        stats = self._storage.stats.get_estimates(attrs.values())
+        return {
+            name: stats[attr.key['id']]
+            for name, attr in attrs.items() if attr.key['id'] in stats
+        }
+
+    def _project_attrs(self, attr_defs, names):
+        """
+        :param names: names of attributes to keep, None to keep all
+        :returns the definitions of the attributes in the order of names
+        """
+        if names is None:
+            return list(attr_defs)
+        by_name = {a.name: a for a in attr_defs}
+        for name in names:
+            if name not in by_name:
+                raise exceptions.LookupError(
+                    'Attribute "{}" does not exist'.format(name))
+        return [by_name[name] for name in names]
+
+    def _fetch_attr_values(self, db, ids, attr_defs, runtime):
+        """
+        :param ids: ids of models, or of runs if runtime is true
+        :returns dict of id -> dict of attribute name -> value
+        """
+        values = _t.get_values(runtime)
+        target_id = _t.get_target_id(values)
         attr_defs = {utils.get_key(a)['id']: a for a in attr_defs}
-        for row in db.execute(q):
-            attr_def = attr_defs.get(row['attr_id'])
-            if attr_def is None:
-                continue
-            value = attr_def.decode_value(row['value'])
-            result[row['uid']][attr_def.name] = value
+        q = sa.select([target_id, values.c.attr_id, values.c.value]).where(
+            sa.and_(target_id.in_(ids),
+                    values.c.attr_id.in_(list(attr_defs))))
+        result = {id: {} for id in ids}
+        for id, attr_id, value in db.execute(q):
+            attr_def = attr_defs[attr_id]
+            result[id][attr_def.name] = attr_def.decode_value(value)
         for attrs in result.values():
             for attr_def in attr_defs.values():
                 if attr_def.name not in attrs:
                     attrs[attr_def.name] = attr_def.get_default()
         return result
+
+    def _load_frame(self, table, condition, attr_defs, constants=()):
+        """
+        Reads values of the attributes for all objects matching
+        the condition at once.
+        :param table: Models or Runs
+        :param attr_defs: attributes of the level of the objects
+        :param constants: list of (attribute, value) for attributes whose
+                          values are the same for all the objects
+        :rtype: tensorlab.core.attribute_frame.AttributeFrame
+        """
+        targets = self._db.execute(sa.select(
+            [table.c.id, table.c.uid]).where(condition)).fetchall()
+        uids = [uid for _, uid in targets]
+        index = {id: i for i, (id, _) in enumerate(targets)}
+        attr_defs = {utils.get_key(a)['id']: a for a in attr_defs}
+        encoded = {a.name: [None] * len(uids) for a in attr_defs.values()}
+        values = _t.get_values(table is _t.Runs)
+        target_id = _t.get_target_id(values)
+        q = sa.select([target_id, values.c.attr_id, values.c.value]).where(
+            sa.and_(target_id.in_(sa.select([table.c.id]).where(condition)),
+                    values.c.attr_id.in_(list(attr_defs))))
+        for id, attr_id, value in self._db.execute(q):
+            encoded[attr_defs[attr_id].name][index[id]] = value
+        values = {}
+        for attr in attr_defs.values():
+            # decoded at once per attribute
+            column, present = attr.get_codec().decode_many(
+                encoded[attr.name])
+            default = attr.get_default()
+            values[attr.name] = np.where(
+                present, column, default).tolist()
+        for attr, value in constants:
+            values[attr.name] = [value] * len(uids)
+        attrs = list(attr_defs.values()) + [attr for attr, _ in constants]
+        return attribute_frame.AttributeFrame.build(uids, attrs, values)
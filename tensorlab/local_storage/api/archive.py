@@ -0,0 +1,172 @@
+import os
+import time
+import errno
+import shutil
+import threading
+import collections
+from concurrent import futures
+import sqlalchemy as sa
+from tensorlab.local_storage.db import utils, tables as _t
+from tensorlab.local_storage import files, dedup
+from . import _base
+
+
+ArchiveReport = collections.namedtuple(
+    'ArchiveReport', ['n_runs', 'n_files', 'n_bytes', 'bundle_bytes'])
+
+
+class LocalRunArchive(_base.LocalStorageBase):
+    """
+    Packs data directories of cold runs into compressed single-file
+    bundles and restores them back on demand.
+
+    A run is marked archived in the same transaction that drops its
+    disk usage and deduplication records; the data directory is removed
+    only after that. So after a crash a run may have both the bundle and
+    the directory, in which case the directory is used.
+    """
+
+    def __init__(self, db, storage, n_workers=4, compresslevel=6):
+        """
+        :type storage: tensorlab.local_storage.api.facade.LocalStorage
+        """
+        self._db = db
+        self._storage = storage
+        self._n_workers = n_workers
+        self._compresslevel = compresslevel
+        self._restore_lock = threading.Lock()
+
+    def select(self, older_than=None, model=None):
+        """
+        :param older_than: number of seconds since the run was finished
+        :returns runs which are not archived yet
+        """
+        q = _t.Runs.select().where(~_t.Runs.c.id.in_(
+            sa.select([_t.RunArchives.c.run_id])))
+        if older_than is not None:
+            q = q.where(_t.Runs.c.finished_at < time.time() - older_than)
+        if model is not None:
+            q = q.where(_t.Runs.c.model_id == utils.get_key(model)['id'])
+        return utils.read_many(self._db, q, self._row_to_run)
+
+    def is_archived(self, run):
+        return self._get_record(run) is not None
+
+    def archive(self, runs):
+        """
+        Packs data directories of given runs into bundles and removes
+        the directories. Runs without data directories are skipped.
+        :rtype: ArchiveReport
+        """
+        targets = [(run, self._get_dir(run)) for run in runs]
+        with futures.ThreadPoolExecutor(self._n_workers) as pool:
+            packed = [
+                item for item in pool.map(lambda t: self._pack(*t), targets)
+                if item is not None
+            ]
+            if not packed:
+                return ArchiveReport(0, 0, 0, 0)
+            uids = [uid for uid, _ in packed]
+            with self._db.begin() as conn:
+                conn.execute(
+                    _t.RunArchives.insert().prefix_with('OR REPLACE'),
+                    [record for _, record in packed])
+                conn.execute(_t.DiskUsage.delete().where(sa.and_(
+                    _t.DiskUsage.c.kind == files.RUNS,
+                    _t.DiskUsage.c.uid.in_(uids))))
+                dedup.release(conn, files.RUNS, uids)
+            archived = set(uids)
+            list(pool.map(self._remove_dir, [
+                path for run, path in targets
+                if utils.get_key(run)['uid'] in archived
+            ]))
+
+        return ArchiveReport(
+            len(packed),
+            sum(record['n_files'] for _, record in packed),
+            sum(record['n_bytes'] for _, record in packed),
+            sum(record['bundle_bytes'] for _, record in packed),
+        )
+
+    def restore(self, run):
+        """
+        Extracts the bundle of the archived run back into its data directory.
+        :return: False if the run is not archived
+        """
+        with self._restore_lock:
+            record = self._get_record(run)
+            if record is None:
+                return False
+            uid = utils.get_key(run)['uid']
+            path = self._get_dir(run)
+            bundle_path = files.get_bundle_path(self._storage.root_dir, uid)
+            if not os.path.isdir(path):
+                tmp_path = '{}.{}.restoring'.format(path, os.getpid())
+                shutil.rmtree(tmp_path, ignore_errors=True)
+                files.unpack_bundle(bundle_path, tmp_path)
+                try:
+                    os.rename(tmp_path, path)
+                except OSError as exc:
+                    # restored concurrently by another process
+                    if exc.errno not in (errno.EEXIST, errno.ENOTEMPTY):
+                        raise
+                    shutil.rmtree(tmp_path)
+            self._db.execute(_t.RunArchives.delete().where(
+                _t.RunArchives.c.id == record['id']))
+            try:
+                os.unlink(bundle_path)
+            except FileNotFoundError:
+                pass
+            return True
+
+    def open_file(self, run, rel_path):
+        """
+        Opens a file of the run data directory for reading. Files of
+        archived runs are read straight from their bundles.
+        :returns binary file-like object
+        """
+        uid = utils.get_key(run)['uid']
+        try:
+            return open(os.path.join(self._get_dir(run), rel_path), 'rb')
+        except FileNotFoundError:
+            if not self.is_archived(run):
+                raise
+        return files.open_bundle_member(
+            files.get_bundle_path(self._storage.root_dir, uid), rel_path)
+
+    def list_files(self, run):
+        """
+        :returns list of (path, size) of files packed into the bundle
+                 of the archived run
+        """
+        uid = utils.get_key(run)['uid']
+        return files.list_bundle(
+            files.get_bundle_path(self._storage.root_dir, uid))
+
+    def _get_record(self, run):
+        return utils.read_one(self._db, _t.RunArchives,
+                              run_id=utils.get_key(run)['id'])
+
+    def _get_dir(self, run):
+        return self._get_data_dir(files.RUNS, _t.Runs, run)
+
+    def _pack(self, run, path):
+        key = utils.get_key(run)
+        if not os.path.isdir(path):
+            return None
+        bundle_path = files.get_bundle_path(self._storage.root_dir, key['uid'])
+        n_files, n_bytes = files.pack_bundle(
+            path, bundle_path, self._compresslevel)
+        return key['uid'], {
+            'run_id': key['id'],
+            'n_files': n_files,
+            'n_bytes': n_bytes,
+            'bundle_bytes': os.path.getsize(bundle_path),
+            'archived_at': time.time(),
+        }
+
+    def _remove_dir(self, path):
+        # rename first, so readers never see a partially removed directory
+        tmp_path = '{}.{}.archived'.format(path, os.getpid())
+        os.rename(path, tmp_path)
+        shutil.rmtree(tmp_path)
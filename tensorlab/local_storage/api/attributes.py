@@ -1,9 +1,11 @@
+import collections
 import sqlalchemy as sa
 from sqlalchemy import func as sa_func, exc as sa_exc
 from tensorlab import exceptions
 from tensorlab.core.attributes import AttributeStorage, Attribute
-from tensorlab.core.attributeoptions import AttributeType
+from tensorlab.core.attributeoptions import AttributeType, ChoiceCodes
 from tensorlab.local_storage.db import utils, tables as _t
+from tensorlab.local_storage import stats, identity
 from . import _base
 
 
@@ -36,6 +38,9 @@ class LocalAttributeStorage(AttributeStorage, _base.LocalStorageBase):
                     'Cannot override non-nullable attribute as nullable '
                     'as it violates integrity rules', attribute, overridden
                 )
+        codes = None
+        if attribute.type == AttributeType.Enum:
+            codes = ChoiceCodes.from_options(attribute.options)
         ins_q = _t.Attributes.insert().values(
             group_id=group_id,
             name=attribute.name,
@@ -44,6 +49,7 @@ class LocalAttributeStorage(AttributeStorage, _base.LocalStorageBase):
             default=attribute.type.encode(attribute.default, attribute.options),
             nullable=attribute.nullable,
             runtime=attribute.runtime,
+            codes=codes and codes.serialize(),
         )
         try:
             ret = self._db.execute(ins_q)
@@ -55,6 +61,9 @@ class LocalAttributeStorage(AttributeStorage, _base.LocalStorageBase):
             ret.inserted_primary_key[0], group_id, attribute.get_fields(),
         )
         attribute.storage = self
+        attribute.codes = codes
+        stats.create(self._db, attribute)
+        self._forget_attr_values()
 
     def update(self, attribute):
         dirty = utils.get_dirty_fields(attribute)
@@ -62,33 +71,76 @@ class LocalAttributeStorage(AttributeStorage, _base.LocalStorageBase):
             raise exceptions.IllegalArgumentError(
                 'Fields "name", "type", and "runtime" cannot be updated',
                 attribute)
+        codes = attribute.codes
         if attribute.type == AttributeType.Enum and 'options' in dirty:
             prev_choices = set(dirty['options'].split(';'))
             next_choices = set(attribute.options.split(';'))
             removed = list(prev_choices - next_choices)
-            usages_found = utils.aggregate(
-                self._db, _t.AttributeValues, sa_func.exists(),
-                _t.AttributeValues.c.value.in_(removed),
-                attr_id=attribute.key['id'],
-            )
+            if codes is not None:
+                # including values kept by migrations which are not
+                # among the previous choices
+                removed = [codes.encode(c) for c in codes.choices
+                           if c and c not in next_choices]
+            values = _t.get_values(attribute.runtime)
+            usages_found = self._db.execute(sa.select([
+                sa.exists().where(sa.and_(
+                    values.c.attr_id == attribute.key['id'],
+                    values.c.value.in_(removed),
+                ))
+            ])).scalar()
             if usages_found:
                 raise exceptions.IllegalArgumentError(
                     'Cannot drop enum choices when used',
                     attribute, removed)
+            if codes is not None:
+                codes = codes.update(attribute.options)
         if 'nullable' in dirty and not attribute.nullable:
-            target_table = _t.Runs if attribute.runtime else _t.Models
-            q = sa.select([sa_func.exists()]).select_from(
-                target_table.join(
-                    _t.AttributeValues,
-                    target_table.c.uid == _t.AttributeValues.c.target_uid
-                ).join(
-                    _t.Attributes,
-                    _t.AttributeValues.c.attr_id == _t.Attributes.c.id
-                )
-            )
-            ret = self._db.execute(q)
-            import pdb; pdb.set_trace()
+            n_defined, n_targets = self.usage_stats(attribute)
+            if n_defined < n_targets:
+                raise exceptions.InvalidStateError(
+                    'Cannot make attribute non-nullable while {} objects '
+                    'have no value for it'.format(n_targets - n_defined),
+                    attribute)
         utils.update_obj(self._db, attribute, _t.Attributes, dirty)
+        if codes is not attribute.codes:
+            self._save_codes(attribute, codes)
+        self._forget_attr_values()
+
+    def rename_choice(self, attribute, old_choice, new_choice):
+        """
+        Renames the choice of the enumeration. Only the definition
+        of the attribute changes, its values are stored as codes.
+        """
+        if attribute.codes is None:
+            raise exceptions.IllegalArgumentError(
+                'Choices of attribute "{}" cannot be renamed'
+                .format(attribute.name), attribute)
+        choices = attribute.options.split(';')
+        if old_choice not in choices or new_choice in choices:
+            raise exceptions.IllegalArgumentError(
+                'Cannot rename choice {!r} to {!r}'
+                .format(old_choice, new_choice), attribute)
+        options = ';'.join(new_choice if c == old_choice else c
+                           for c in choices)
+        if not attribute.type.validate_options(options):
+            raise exceptions.IllegalArgumentError(
+                'Invalid choice {!r}'.format(new_choice), attribute)
+        codes = attribute.codes.rename(old_choice, new_choice)
+        fields = {'options': options}
+        if attribute.default == old_choice:
+            fields['default'] = new_choice
+        self._db.execute(_t.Attributes.update()
+                         .where(_t.Attributes.c.id == attribute.key['id'])
+                         .values(codes=codes.serialize(), **fields))
+        utils.fill_from_dict(attribute, fields)
+        attribute.codes = codes
+        self._forget_attr_values()
+
+    def _save_codes(self, attribute, codes):
+        self._db.execute(_t.Attributes.update()
+                         .where(_t.Attributes.c.id == attribute.key['id'])
+                         .values(codes=codes.serialize()))
+        attribute.codes = codes
 
     def list(self, group):
         if group is None:
@@ -100,6 +152,28 @@ class LocalAttributeStorage(AttributeStorage, _base.LocalStorageBase):
             group = self._storage.groups.get(None)
         return self._list_effective_by_id(utils.get_key(group)['id'])
 
+    def list_in_subgroups(self, group, recursive=True):
+        """
+        Collects attributes of models and runs of the group and,
+        if recursive, of all its subgroups, which may define more
+        attributes or override the inherited ones.
+        :returns OrderedDict of attribute name -> list of its definitions,
+                 the one effective in the group goes first
+        """
+        if group is None:
+            group = self._storage.groups.get(None)
+        result = collections.OrderedDict(
+            (attr.name, [attr]) for attr in self.list_effective(group))
+        if recursive:
+            q = _t.Attributes.select().where(_t.Attributes.c.group_id.in_(
+                utils.select_subgroup_ids(utils.get_key(group)['id'])
+            )).order_by(_t.Attributes.c.id)
+            for attr in utils.read_many(self._db, q, self._row_to_attribute):
+                definitions = result.setdefault(attr.name, [])
+                if all(a.key['id'] != attr.key['id'] for a in definitions):
+                    definitions.append(attr)
+        return result
+
     def _list_by_id(self, group_id, name=None):
         filters = {'group_id': group_id}
         if name is not None:
@@ -130,34 +204,49 @@ class LocalAttributeStorage(AttributeStorage, _base.LocalStorageBase):
             if result:
                 return result[0]
 
-    def get_attr_values_for_model(self, model):
+    def get_attr_values_for_model(self, model, attrs=None):
+        """
+        :param attrs: names of attributes to read, all by default;
+                      only the requested values are read and decoded
+                      unless all of them are already cached
+        """
         utils.get_key(model)
-        if 'cached_attrs' not in model.key:
-            attr_defs = self._list_effective_by_id(model.key['group_id'])
-            attr_defs = [a for a in attr_defs if not a.runtime]
-            attrs = self._fetch_attr_values(
-                self._db,
-                [model.key['uid']],
-                attr_defs,
-                runtime=False
-            )
-            model.key['cached_attrs'] = attrs[model.key['uid']]
-        return model.key['cached_attrs'].copy()
-
-    def get_attr_values_for_run(self, run):
+        return self._get_attr_values(
+            model, model.key['group_id'], False, attrs)
+
+    def get_attr_values_for_run(self, run, attrs=None):
+        """:param attrs: see get_attr_values_for_model"""
         utils.get_key(run)
-        if 'cached_attrs' not in run.key:
-            model = self._storage.runs.get_model(run)
-            attr_defs = self._list_effective_by_id(model.key['group_id'])
-            attr_defs = [a for a in attr_defs if a.runtime]
-            attrs = self._fetch_attr_values(
-                self._db,
-                [run.key['uid']],
-                attr_defs,
-                runtime=True
-            )
-            run.key['cached_attrs'] = attrs[run.key['uid']]
-        return run.key['cached_attrs'].copy()
+        if 'cached_attrs' in run.key:
+            group_id = None
+        else:
+            group_id = self._storage.runs.get_model(run).key['group_id']
+        return self._get_attr_values(run, group_id, True, attrs)
+
+    def _get_attr_values(self, obj, group_id, runtime, names):
+        """
+        Values of all attributes are cached in the key of the object,
+        values of a part of them are read each time.
+        """
+        if 'cached_attrs' in obj.key:
+            cached = obj.key['cached_attrs']
+            if names is None:
+                return cached.copy()
+            for name in names:
+                if name not in cached:
+                    raise exceptions.LookupError(
+                        'Attribute "{}" does not exist'.format(name))
+            return {name: cached[name] for name in names}
+        attr_defs = [a for a in self._list_effective_by_id(group_id)
+                     if a.runtime == runtime]
+        attr_defs = self._project_attrs(attr_defs, names)
+        obj_id = obj.key['id']
+        values = self._fetch_attr_values(
+            self._db, [obj_id], attr_defs, runtime)[obj_id]
+        if names is None:
+            obj.key['cached_attrs'] = values
+            return values.copy()
+        return values
 
     def get_defining_group(self, attribute):
         grp_id = utils.get_key(attribute)['group_id']
@@ -165,14 +254,62 @@ class LocalAttributeStorage(AttributeStorage, _base.LocalStorageBase):
 
     def usage_stats(self, attribute):
         attr_id = utils.get_key(attribute)['id']
+        target_ids = self._select_target_ids(attribute)
+        values = _t.get_values(attribute.runtime)
+        n_defined = self._db.execute(
+            sa.select([sa_func.count()]).where(sa.and_(
+                values.c.attr_id == attr_id,
+                values.c.value.isnot(None),
+                _t.get_target_id(values).in_(target_ids),
+            ))
+        ).scalar()
+        n_targets = self._db.execute(
+            sa.select([sa_func.count()]).select_from(target_ids.alias())
+        ).scalar()
+        return n_defined, n_targets
 
-        q = _t.AttributeValues.select([sa_func.count()]).where(
-            _t.AttributeValues.c.attr_id == attr_id
-        )
-        ret = self._db.execute(q)
-        import pdb; pdb.set_trace()
+    def _select_target_ids(self, attribute):
+        """
+        :returns query of ids of models, or of runs for runtime attributes,
+                 of the defining group and of its subgroups which do not
+                 override the attribute
+        """
+        group_id = attribute.key['group_id']
+        subgroups = sa.select([_t.Groups.c.id, _t.Groups.c.parent_id]).where(
+            _t.Groups.c.id.in_(utils.select_subgroup_ids(group_id)))
+        children = collections.defaultdict(list)
+        for id, parent_id in self._db.execute(subgroups):
+            if id != parent_id:
+                children[parent_id].append(id)
+        overriding = sa.select([_t.Attributes.c.group_id]).where(sa.and_(
+            _t.Attributes.c.name == attribute.name,
+            _t.Attributes.c.id != attribute.key['id'],
+        ))
+        overriding = {row[0] for row in self._db.execute(overriding)}
+        group_ids = []
+        pending = [group_id]
+        while pending:
+            group_id = pending.pop()
+            group_ids.append(group_id)
+            pending.extend(id for id in children[group_id]
+                           if id not in overriding)
+        model_ids = sa.select([_t.Models.c.id]).where(
+            _t.Models.c.group_id.in_(group_ids))
+        if not attribute.runtime:
+            return model_ids
+        return sa.select([_t.Runs.c.id]).where(
+            _t.Runs.c.model_id.in_(model_ids))
 
     def delete_with_values(self, attribute):
-        q = _t.Attributes.delete().where(
-            _t.Attributes.c.id == utils.get_key(attribute)['id'])
-        self._db.execute(q)
+        attr_id = utils.get_key(attribute)['id']
+        with self._db.begin() as conn:
+            stats.drop(conn, [attr_id])
+            conn.execute(_t.FilterLog.delete().where(
+                _t.FilterLog.c.attr_id == attr_id))
+            conn.execute(_t.Attributes.delete().where(
+                _t.Attributes.c.id == attr_id))
+        self._forget_attr_values()
+
+    def _forget_attr_values(self):
+        """Discards models and runs holding values of changed attributes."""
+        self._storage.identity.clear(identity.MODELS, identity.RUNS)
@@ -1,6 +1,8 @@
+import collections
 from tensorlab import exceptions
 from tensorlab.core.facade import TensorLabStorage
 from .. import files
+from ..files.config import Config
 
 
 class LocalStorage(TensorLabStorage):
@@ -14,6 +16,7 @@ class LocalStorage(TensorLabStorage):
         self._project = user_project
         self._is_open = False
         self._impl = None
+        self._config = None
         self.log_stream = log_stream
 
     @property
@@ -31,6 +34,35 @@ class LocalStorage(TensorLabStorage):
         """
         return self._project
 
+    @property
+    def config(self):
+        """
+        :rtype: tensorlab.local_storage.files.config.Config
+        """
+        if self._config is None:
+            config = Config(files.get_config_path(self._root))
+            config.load()
+            self._config = config
+        return self._config
+
+    def get_tier_roots(self):
+        """
+        :returns OrderedDict of storage tier name -> root directory
+                 of the tier, the default tier goes first
+        """
+        roots = collections.OrderedDict([(files.DEFAULT_TIER, self._root)])
+        roots.update(sorted((self.config['tiers'] or {}).items()))
+        return roots
+
+    def get_tier_root(self, tier):
+        if tier == files.DEFAULT_TIER:
+            return self._root
+        roots = self.config['tiers'] or {}
+        if tier not in roots:
+            raise exceptions.IllegalArgumentError(
+                'Unknown storage tier: {}'.format(tier))
+        return roots[tier]
+
     def Open(self):
         if self.is_opened:
             _error("Storage is already opened")
@@ -50,6 +82,82 @@ class LocalStorage(TensorLabStorage):
         self._get_impl()
         return self
 
+    @property
+    def gc(self):
+        """
+        :rtype: tensorlab.local_storage.gc.GarbageCollector
+        """
+        return self._get_impl().gc
+
+    @property
+    def usage(self):
+        """
+        :rtype: tensorlab.local_storage.api.usage.LocalDiskUsage
+        """
+        return self._get_impl().usage
+
+    @property
+    def dedup(self):
+        """
+        :rtype: tensorlab.local_storage.dedup.Deduplicator
+        """
+        return self._get_impl().dedup
+
+    @property
+    def archive(self):
+        """
+        :rtype: tensorlab.local_storage.api.archive.LocalRunArchive
+        """
+        return self._get_impl().archive
+
+    @property
+    def tiers(self):
+        """
+        :rtype: tensorlab.local_storage.api.tiers.LocalTiers
+        """
+        return self._get_impl().tiers
+
+    @property
+    def fsck(self):
+        """
+        :rtype: tensorlab.local_storage.api.fsck.LocalFsck
+        """
+        return self._get_impl().fsck
+
+    @property
+    def planner(self):
+        """
+        :rtype: tensorlab.local_storage.api.planner.LocalQueryPlanner
+        """
+        return self._get_impl().planner
+
+    @property
+    def facets(self):
+        """
+        :rtype: tensorlab.local_storage.api.facets.LocalFacets
+        """
+        return self._get_impl().facets
+
+    @property
+    def stats(self):
+        """
+        :rtype: tensorlab.local_storage.stats.AttributeStatistics
+        """
+        return self._get_impl().stats
+
+    @property
+    def identity(self):
+        """
+        :rtype: tensorlab.local_storage.identity.IdentityMap
+        """
+        return self._get_impl().identity
+
+    def Close(self):
+        if self._impl is not None:
+            self._impl.close()
+            self._impl = None
+        self._is_open = False
+
     def _get_impl(self):
         if self._impl is None:
             if not self._is_open:
@@ -64,14 +172,39 @@ class LocalStorage(TensorLabStorage):
 class DefaultImplementation:
 
     def __init__(self, storage, root_dir):
-        from .. import db, files
-        from . import groups, models, runs, attributes
+        from .. import db, files, gc, dedup, stats, identity
+        from . import groups, models, runs, attributes, usage, archive, tiers, fsck, planner, facets
         self.db = db.connection.init_db_engine(files.get_db_path(root_dir))
-        db.tables.initialize_db(self.db)
+        db.migrations.upgrade(
+            self.db, progress=lambda step, n_done, n_total: print(
+                '[migrations] {}: {} of {} rows'.format(
+                    step.description, n_done, n_total),
+                file=storage.log_stream),
+            log=lambda step, message: print(
+                '[migrations] {}: {}'.format(step.description, message),
+                file=storage.log_stream))
+        self.gc = gc.GarbageCollector(self.db, root_dir,
+                                      log_stream=storage.log_stream,
+                                      tier_roots=storage.get_tier_roots())
+        self.dedup = dedup.Deduplicator(self.db, root_dir)
+        self.stats = stats.AttributeStatistics(self.db)
+        self.identity = identity.IdentityMap()
         self.groups = groups.LocalGroupsStorage(self.db, storage)
+        self.identity.add(identity.GROUPS, self.groups.get(None))
         self.models = models.LocalModelsStorage(self.db, storage, storage.log_stream)
         self.runs = runs.LocalRunsStorage(self.db, storage, storage.log_stream)
         self.attributes = attributes.LocalAttributeStorage(self.db, storage)
+        self.usage = usage.LocalDiskUsage(self.db, storage)
+        self.archive = archive.LocalRunArchive(self.db, storage)
+        self.tiers = tiers.LocalTiers(self.db, storage, storage.log_stream)
+        self.fsck = fsck.LocalFsck(self.db, storage)
+        self.planner = planner.LocalQueryPlanner(self.db, storage)
+        self.facets = facets.LocalFacets(self.db, storage)
+
+    def close(self):
+        self.planner.flush()
+        self.gc.close()
+        self.db.dispose()
 
 
 def _error(msg, *args, **kwargs):
@@ -0,0 +1,169 @@
+import collections
+import sqlalchemy as sa
+from tensorlab import exceptions
+from tensorlab.core.attributeoptions import AttributeType
+from tensorlab.local_storage.db import utils, predicates, tables as _t
+from . import _base
+
+
+# number of equal-width bins numeric attributes are bucketed into
+DEFAULT_BINS = 10
+
+# Bucket of numeric values, low <= value < high, the last bucket between
+# edges includes its high edge too. low is None for values below
+# the first edge and high is None for values above the last one.
+Bin = collections.namedtuple('Bin', ['low', 'high'])
+
+_NUMERIC = (AttributeType.Integer, AttributeType.Float)
+
+
+class LocalFacets(_base.LocalStorageBase):
+    """
+    Counts models or runs per value of attributes, for example to show
+    how many of the filtered runs use each choice of an enumeration.
+    """
+
+    def __init__(self, db, storage):
+        """
+        :type storage: tensorlab.local_storage.api.facade.LocalStorage
+        """
+        self._db = db
+        self._storage = storage
+
+    def facets(self, target, scope, predicate, attributes, bins=None):
+        """
+        Counts models or runs matching the predicate per value of each of
+        the attributes, with one grouping query per attribute.
+        Missing values are counted under None, all choices of enumerations
+        are present even if they are not used.
+        :param target: MODELS or RUNS
+        :param scope: see planner.LocalQueryPlanner.explain
+        :param predicate: tensorlab.core.attribute_predicates.Expression
+                          or None to count all models or runs
+        :param attributes: list of names of attributes
+        :param bins: dict of attribute name -> number of equal-width bins
+                     between bounds of values of the attribute, or sorted
+                     list of edges of bins, or 0 to count distinct values;
+                     numeric attributes are split into DEFAULT_BINS
+                     bins by default
+        :returns OrderedDict of attribute name -> OrderedDict of value
+                 or Bin -> count, bins are in order of their edges,
+                 values are ordered from the most frequent ones
+        """
+        bins = bins or {}
+        source = self._get_filter_source(target, scope)
+        targets = source.get_targets()
+        for name in attributes:
+            if name not in targets:
+                raise exceptions.LookupError(
+                    'Attribute "{}" does not exist'.format(name))
+        if predicate is not None:
+            self._storage.planner.record(target, predicate, targets)
+        query = predicates.build_filtered(source, predicate)
+
+        result = collections.OrderedDict()
+        for name in attributes:
+            attr = targets[name][0]
+            edges = None
+            if attr.type in _NUMERIC:
+                edges = self._get_edges(attr, bins.get(name, DEFAULT_BINS))
+            if query is None:
+                counts = []
+            else:
+                counts = self._count(query, source.params, targets[name],
+                                     edges)
+            result[name] = _make_facet(attr, counts, edges)
+        return result
+
+    def distinct_values(self, attr):
+        """
+        Reads distinct stored values of the attribute from the index
+        on attribute values, without scanning the values.
+        :returns sorted list of decoded values, without None
+        """
+        av = _t.get_values(attr.runtime)
+        q = sa.select([av.c.value]).distinct().where(sa.and_(
+            av.c.attr_id == utils.get_key(attr)['id'],
+            av.c.value.isnot(None)))
+        values, _ = attr.get_codec().decode_many(
+            utils.read_many(self._db, q, lambda row: row[0]))
+        return sorted(values.tolist())
+
+    def _get_edges(self, attr, bins):
+        """:returns list of edges of bins or None to count values"""
+        if not isinstance(bins, int):
+            edges = [attr.normalize_value(edge) for edge in bins]
+            if not edges or edges != sorted(set(edges)):
+                raise exceptions.IllegalArgumentError(
+                    'Edges of bins of "{}" must be distinct and sorted'
+                    .format(attr.name))
+            return edges
+        if bins < 0:
+            raise exceptions.IllegalArgumentError(
+                'Number of bins cannot be negative')
+        if bins == 0:
+            return None
+        stats = self._storage.stats.get(attr)
+        if stats is None or stats.min_value is None:
+            # no values to split, only the default one if any
+            return None
+        low, high = stats.min_value, stats.max_value
+        if low == high:
+            return [low, high]
+        step = (high - low) / bins
+        return [low + i * step for i in range(bins)] + [high]
+
+    def _count(self, query, params, target, edges):
+        attr, target_id = target[:2]
+        filtered = query.alias('filtered')
+        if isinstance(target_id, sa.sql.ColumnElement):
+            target_id = filtered.corresponding_column(target_id)
+        values = _t.get_values(attr.runtime).alias('facet')
+        value = values.c.value
+        if attr.default is not None:
+            default = attr.default
+            if attr.codes is not None:
+                default = attr.codes.encode(default)
+            value = sa.func.coalesce(value, default)
+        if attr.type in predicates.SQL_TYPES:
+            value = sa.cast(value, predicates.SQL_TYPES[attr.type])
+        if edges is not None:
+            # index of the bin, the first and the last ones are for values
+            # beyond the edges
+            whens = [(value.is_(None), sa.null())]
+            whens.extend((value < edge, i) for i, edge in enumerate(edges))
+            whens.append((value <= edges[-1], len(edges) - 1))
+            value = sa.case(whens, else_=len(edges))
+        q = sa.select([value, sa.func.count()]).select_from(
+            filtered.outerjoin(values, sa.and_(
+                _t.get_target_id(values) == target_id,
+                values.c.attr_id.in_(predicates.get_attr_ids(target)),
+            ))
+        ).group_by(value)
+        return self._db.execute(q, params).fetchall()
+
+
+def _make_facet(attr, counts, edges):
+    """:param counts: list of (grouped value, count)"""
+    if edges is not None:
+        facet = collections.OrderedDict()
+        n_bins = {i: n for i, n in counts}
+        if n_bins.get(0):
+            facet[Bin(None, edges[0])] = n_bins[0]
+        for i in range(1, len(edges)):
+            facet[Bin(edges[i - 1], edges[i])] = n_bins.get(i, 0)
+        if n_bins.get(len(edges)):
+            facet[Bin(edges[-1], None)] = n_bins[len(edges)]
+        if n_bins.get(None):
+            facet[None] = n_bins[None]
+        return facet
+
+    if attr.type not in predicates.SQL_TYPES:
+        counts = [(None if value is None else attr.decode_value(value), n)
+                  for value, n in counts]
+    if attr.type == AttributeType.Enum:
+        used = {value for value, _ in counts}
+        counts.extend((choice, 0) for choice in attr.options.split(';')
+                      if choice and choice not in used)
+    counts.sort(key=lambda item: (-item[1], item[0] is None, item[0]))
+    return collections.OrderedDict(counts)
@@ -0,0 +1,384 @@
+import os
+import time
+import collections
+from concurrent import futures
+import sqlalchemy as sa
+from tensorlab import exceptions
+from tensorlab.core.attributeoptions import ChoiceCodes
+from tensorlab.local_storage.db import utils, tables as _t
+from tensorlab.local_storage import files, stats
+from . import _base
+
+
+Issue = collections.namedtuple(
+    'Issue', ['check', 'table', 'row_id', 'message'])
+
+FsckReport = collections.namedtuple('FsckReport', ['issues', 'n_repaired'])
+
+
+# kinds of checked problems
+BROKEN_REFERENCE = 'broken-reference'
+WRONG_REFCOUNT = 'wrong-refcount'
+INVALID_VALUE = 'invalid-value'
+MISSING_VALUE = 'missing-value'
+MISSING_DIRECTORY = 'missing-directory'
+MISSING_BUNDLE = 'missing-bundle'
+ORPHANED_DIRECTORY = 'orphaned-directory'
+ORPHANED_BUNDLE = 'orphaned-bundle'
+
+
+class LocalFsck(_base.LocalStorageBase):
+    """
+    Verifies that the DB and data directories of the storage agree.
+
+    All tables are streamed in chunks ordered by primary key, so memory
+    usage does not depend on the size of the storage; data directories
+    of each chunk are checked by a pool of threads.
+
+    Repairing deletes what cannot be trusted anymore: rows referring to
+    nothing, invalid attribute values, and models and runs without data,
+    which are mostly leftovers of crashes during their creation. Groups
+    whose parent is missing are moved into the root group instead.
+    Missing values of required attributes are only reported.
+    The storage should not be used by others while it is repaired.
+    """
+
+    def __init__(self, db, storage, n_workers=16, chunk_size=5000):
+        """
+        :type storage: tensorlab.local_storage.api.facade.LocalStorage
+        """
+        self._db = db
+        self._storage = storage
+        self._n_workers = n_workers
+        self._chunk_size = chunk_size
+
+    def check(self, repair=False):
+        """
+        :param repair: fix found problems where possible
+        :rtype: FsckReport
+        """
+        findings = _Findings(repair)
+        self._check_group_parents(findings)
+        self._check_references(findings)
+        self._check_refcounts(findings)
+        self._check_values(findings)
+        self._check_required_values(findings)
+        with futures.ThreadPoolExecutor(self._n_workers) as pool:
+            self._check_data_dirs(findings, pool, files.MODELS, _t.Models)
+            self._check_data_dirs(findings, pool, files.RUNS, _t.Runs)
+        self._check_orphaned_dirs(findings)
+        self._check_orphaned_bundles(findings)
+        if findings.n_repaired:
+            self._storage.gc.notify()
+        return FsckReport(findings.issues, findings.n_repaired)
+
+    def _iter_chunks(self, table, columns, condition=None, select_from=None):
+        """
+        Reads rows matching the condition chunk by chunk.
+        The primary key of the table must go first among the columns.
+        """
+        last_id = 0
+        while True:
+            q = sa.select(columns).where(table.c.id > last_id)
+            if select_from is not None:
+                q = q.select_from(select_from)
+            if condition is not None:
+                q = q.where(condition)
+            q = q.order_by(table.c.id).limit(self._chunk_size)
+            rows = utils.read_many(self._db, q)
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            yield rows
+
+    def _check_group_parents(self, findings):
+        parents = _t.Groups.alias('parents')
+        broken = ~sa.exists().where(parents.c.id == _t.Groups.c.parent_id)
+        columns = [_t.Groups.c.id, _t.Groups.c.parent_id]
+        for rows in self._iter_chunks(_t.Groups, columns, broken):
+            for group_id, parent_id in rows:
+                findings.add(BROKEN_REFERENCE, _t.Groups, group_id,
+                             'parent group {} does not exist'.format(parent_id))
+            if findings.repair:
+                root_id = self._storage.groups.get(None).key['id']
+                ret = self._db.execute(
+                    _t.Groups.update().prefix_with('OR IGNORE')
+                    .where(_t.Groups.c.id.in_([row[0] for row in rows]))
+                    .values(parent_id=root_id))
+                findings.n_repaired += ret.rowcount
+
+    def _check_references(self, findings):
+        for table, column, target, broken in _references():
+            for rows in self._iter_chunks(table, [table.c.id, column], broken):
+                for row_id, value in rows:
+                    findings.add(BROKEN_REFERENCE, table, row_id,
+                                 '{} {} refers to no {}'
+                                 .format(column.name, value, target))
+                if findings.repair:
+                    self._delete(table, [row[0] for row in rows])
+                    findings.n_repaired += len(rows)
+
+    def _delete(self, table, ids):
+        condition = table.c.id.in_(ids)
+        with self._db.begin() as conn:
+            if table is _t.Models:
+                self._delete_models(conn, condition)
+            elif table is _t.Runs:
+                self._delete_runs(conn, condition)
+            else:
+                if table is _t.Attributes:
+                    for values in _t.VALUE_TABLES:
+                        conn.execute(values.delete().where(
+                            values.c.attr_id.in_(ids)))
+                    stats.drop(conn, ids)
+                    conn.execute(_t.FilterLog.delete().where(
+                        _t.FilterLog.c.attr_id.in_(ids)))
+                elif table in _t.VALUE_TABLES:
+                    stats.remove_values(conn, table, condition)
+                # blob refcounts are fixed by the next check
+                conn.execute(table.delete().where(condition))
+
+    def _check_refcounts(self, findings):
+        n_refs = sa.select([sa.func.count()]) \
+            .where(_t.BlobFiles.c.blob_id == _t.Blobs.c.id) \
+            .as_scalar()
+        columns = [_t.Blobs.c.id, _t.Blobs.c.refcount, n_refs]
+        wrong = _t.Blobs.c.refcount != n_refs
+        for rows in self._iter_chunks(_t.Blobs, columns, wrong):
+            for blob_id, refcount, actual in rows:
+                findings.add(WRONG_REFCOUNT, _t.Blobs, blob_id,
+                             'refcount is {}, but blob is referenced {} times'
+                             .format(refcount, actual))
+            if findings.repair:
+                self._db.execute(
+                    _t.Blobs.update()
+                    .where(_t.Blobs.c.id.in_([row[0] for row in rows]))
+                    .values(refcount=n_refs))
+                findings.n_repaired += len(rows)
+
+    def _check_values(self, findings):
+        for values in _t.VALUE_TABLES:
+            self._check_values_of(findings, values)
+
+    def _check_values_of(self, findings, av):
+        attrs = _t.Attributes
+        columns = [av.c.id, av.c.value, attrs.c.name,
+                   attrs.c.type, attrs.c.options, attrs.c.codes]
+        joined = av.join(attrs, attrs.c.id == av.c.attr_id)
+        for rows in self._iter_chunks(av, columns, av.c.value.isnot(None),
+                                      select_from=joined):
+            invalid = []
+            for value_id, value, name, attr_type, options, codes in rows:
+                try:
+                    if codes is not None:
+                        value = ChoiceCodes.parse(codes).decode(value)
+                    attr_type.encode(attr_type.decode(value, options), options)
+                except exceptions.IllegalArgumentError as exc:
+                    findings.add(INVALID_VALUE, av, value_id,
+                                 'value {!r} of attribute "{}" is invalid: {}'
+                                 .format(value, name, exc))
+                    invalid.append(value_id)
+            if invalid and findings.repair:
+                self._delete(av, invalid)
+                findings.n_repaired += len(invalid)
+
+    def _check_required_values(self, findings):
+        required = _RequiredAttributes(self._db)
+        targets = (
+            (_t.Models, False, _t.Models,
+             [_t.Models.c.id, _t.Models.c.group_id]),
+            (_t.Runs, True,
+             _t.Runs.join(_t.Models, _t.Models.c.id == _t.Runs.c.model_id),
+             [_t.Runs.c.id, _t.Models.c.group_id]),
+        )
+        for table, runtime, joined, columns in targets:
+            for rows in self._iter_chunks(table, columns,
+                                          select_from=joined):
+                values = _t.get_values(runtime)
+                target_id = _t.get_target_id(values)
+                present = {
+                    (row_id, attr_id) for row_id, attr_id in self._db.execute(
+                        sa.select([target_id, values.c.attr_id])
+                        .where(sa.and_(
+                            target_id.in_([row[0] for row in rows]),
+                            values.c.value.isnot(None))))
+                }
+                for row_id, group_id in rows:
+                    for attr_id, name in required.get(group_id, runtime):
+                        if (row_id, attr_id) not in present:
+                            findings.add(MISSING_VALUE, table, row_id,
+                                         'required attribute "{}" has no value'
+                                         .format(name))
+
+    def _check_data_dirs(self, findings, pool, kind, table):
+        columns = [table.c.id, table.c.uid, table.c.tier]
+        select_from = None
+        if table is _t.Runs:
+            columns.append(_t.RunArchives.c.id)
+            select_from = _t.Runs.outerjoin(
+                _t.RunArchives, _t.RunArchives.c.run_id == _t.Runs.c.id)
+        tier_roots = self._storage.get_tier_roots()
+        for rows in self._iter_chunks(table, columns, select_from=select_from):
+            def check(row):
+                row_id, uid, tier = row[:3]
+                if len(row) > 3 and row[3] is not None:
+                    path = files.get_bundle_path(self._storage.root_dir, uid)
+                    if not os.path.isfile(path):
+                        return MISSING_BUNDLE, path
+                    return None
+                if tier not in tier_roots:
+                    return MISSING_DIRECTORY, 'unknown tier {!r}'.format(tier)
+                path = files.get_data_dir(tier_roots[tier], kind, uid)
+                if not os.path.isdir(path):
+                    return MISSING_DIRECTORY, path
+                return None
+
+            broken = []
+            for row, problem in zip(rows, pool.map(check, rows)):
+                if problem is None:
+                    continue
+                check_name, path = problem
+                findings.add(check_name, table, row[0],
+                             '{} does not exist'.format(path))
+                broken.append(row[0])
+            if broken and findings.repair:
+                self._delete(table, broken)
+                findings.n_repaired += len(broken)
+
+    def _check_orphaned_dirs(self, findings):
+        orphans = self._storage.gc.reconcile(dry_run=not findings.repair)
+        tier_roots = self._storage.get_tier_roots()
+        for kind, uid, tier in orphans:
+            path = files.get_data_dir(tier_roots[tier], kind, uid)
+            findings.add(ORPHANED_DIRECTORY, None, None,
+                         '{} belongs to nothing'.format(path))
+        if findings.repair:
+            findings.n_repaired += len(orphans)
+
+    def _check_orphaned_bundles(self, findings):
+        archives_dir = files.get_archives_dir(self._storage.root_dir)
+        try:
+            names = os.listdir(archives_dir)
+        except FileNotFoundError:
+            return
+        uids = {name[:-len('.zip')] for name in names if name.endswith('.zip')}
+        if not uids:
+            return
+        archived = {
+            row[0] for row in self._db.execute(
+                sa.select([_t.Runs.c.uid]).select_from(_t.Runs.join(
+                    _t.RunArchives, _t.RunArchives.c.run_id == _t.Runs.c.id)))
+        }
+        buried = {
+            row[0] for row in self._db.execute(
+                sa.select([_t.Tombstones.c.uid])
+                .where(_t.Tombstones.c.kind == files.ARCHIVES))
+        }
+        orphans = sorted(uids - archived - buried)
+        for uid in orphans:
+            findings.add(ORPHANED_BUNDLE, None, None, '{} belongs to nothing'
+                         .format(files.get_bundle_path(
+                             self._storage.root_dir, uid)))
+        if orphans and findings.repair:
+            self._db.execute(
+                _t.Tombstones.insert().prefix_with('OR IGNORE'),
+                [{'kind': files.ARCHIVES, 'uid': uid,
+                  'tier': files.DEFAULT_TIER, 'created_at': time.time()}
+                 for uid in orphans])
+            findings.n_repaired += len(orphans)
+
+
+class _Findings:
+
+    def __init__(self, repair):
+        self.repair = repair
+        self.issues = []
+        self.n_repaired = 0
+
+    def add(self, check, table, row_id, message):
+        name = table.name if table is not None else None
+        self.issues.append(Issue(check, name, row_id, message))
+
+
+class _RequiredAttributes:
+    """
+    Effective required attributes of all groups, taking into account
+    that subgroups override attributes of their ancestors by name.
+    """
+
+    def __init__(self, db):
+        self._parents = {
+            row[0]: row[1] for row in db.execute(
+                sa.select([_t.Groups.c.id, _t.Groups.c.parent_id]))
+        }
+        self._attrs = collections.defaultdict(list)
+        for row in db.execute(_t.Attributes.select()):
+            self._attrs[row['group_id']].append(row)
+        self._cache = {}
+
+    def get(self, group_id, runtime):
+        """:returns list of (attribute id, name)"""
+        key = (group_id, runtime)
+        if key not in self._cache:
+            effective = {}
+            seen = set()
+            while group_id is not None and group_id not in seen:
+                seen.add(group_id)
+                for row in self._attrs[group_id]:
+                    effective.setdefault(row['name'], row)
+                group_id = self._parents.get(group_id)
+            self._cache[key] = [
+                (row['id'], row['name']) for row in effective.values()
+                if bool(row['runtime']) == runtime
+                and not row['nullable'] and row['default'] is None
+            ]
+        return self._cache[key]
+
+
+def _references():
+    """
+    :returns list of (table, column, description of referenced object,
+             condition which is true for rows with broken references)
+    """
+    def missing(column, target_column):
+        return ~sa.exists().where(target_column == column)
+
+    def missing_object(table):
+        return sa.or_(
+            sa.and_(table.c.kind == files.MODELS,
+                    missing(table.c.uid, _t.Models.c.uid)),
+            sa.and_(table.c.kind == files.RUNS,
+                    missing(table.c.uid, _t.Runs.c.uid)),
+        )
+
+    mv, rv = _t.ModelValues, _t.RunValues
+    return [
+        (_t.Attributes, _t.Attributes.c.group_id, 'group',
+         missing(_t.Attributes.c.group_id, _t.Groups.c.id)),
+        (_t.Models, _t.Models.c.group_id, 'group',
+         missing(_t.Models.c.group_id, _t.Groups.c.id)),
+        (_t.Runs, _t.Runs.c.model_id, 'model',
+         missing(_t.Runs.c.model_id, _t.Models.c.id)),
+        (mv, mv.c.attr_id, 'attribute',
+         missing(mv.c.attr_id, _t.Attributes.c.id)),
+        (mv, mv.c.model_id, 'model',
+         missing(mv.c.model_id, _t.Models.c.id)),
+        (rv, rv.c.attr_id, 'attribute',
+         missing(rv.c.attr_id, _t.Attributes.c.id)),
+        (rv, rv.c.run_id, 'run',
+         missing(rv.c.run_id, _t.Runs.c.id)),
+        (_t.RunSeeds, _t.RunSeeds.c.run_id, 'run',
+         missing(_t.RunSeeds.c.run_id, _t.Runs.c.id)),
+        (_t.RunArchives, _t.RunArchives.c.run_id, 'run',
+         missing(_t.RunArchives.c.run_id, _t.Runs.c.id)),
+        (_t.BlobFiles, _t.BlobFiles.c.blob_id, 'blob',
+         missing(_t.BlobFiles.c.blob_id, _t.Blobs.c.id)),
+        (_t.BlobFiles, _t.BlobFiles.c.uid, 'model or run',
+         missing_object(_t.BlobFiles)),
+        (_t.DiskUsage, _t.DiskUsage.c.uid, 'model or run',
+         missing_object(_t.DiskUsage)),
+        (_t.FilterLog, _t.FilterLog.c.attr_id, 'attribute',
+         missing(_t.FilterLog.c.attr_id, _t.Attributes.c.id)),
+        (_t.AttributeStats, _t.AttributeStats.c.attr_id, 'attribute',
+         missing(_t.AttributeStats.c.attr_id, _t.Attributes.c.id)),
+    ]
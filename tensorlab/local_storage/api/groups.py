@@ -4,6 +4,7 @@ from tensorlab import exceptions
 from tensorlab.core.attributeoptions import AttributeType
 from tensorlab.core import groups
 from tensorlab.local_storage.db import tables as _t, utils
+from tensorlab.local_storage import stats, identity
 from . import _base
 
 
@@ -21,7 +22,11 @@ class LocalGroupsStorage(groups.GroupsStorage, _base.LocalStorageBase):
         if _root is None:
             self._create_root()
         else:
-            self._root = self._row_to_group(_root)
+            # not through the identity map which is not created yet,
+            # the root is added to it by the storage
+            key = self._make_group_key(
+                _root['id'], _root['uid'], _root['parent_id'], _root['name'])
+            self._root = groups.Group(key, self, **key['orig_fields'])
 
     def _create_root(self):
         uid = utils.make_uid()
@@ -98,11 +103,60 @@ class LocalGroupsStorage(groups.GroupsStorage, _base.LocalStorageBase):
         )
         return row
 
+    def get_path(self, group):
+        """
+        Paths of groups listed with related objects are kept
+        as of listing them.
+        """
+        key = utils.get_key(group)
+        if 'path' in key:
+            return key['path']
+        return self.get_paths([key['id']])[key['id']]
+
+    def get_paths(self, group_ids):
+        """
+        Reads the groups with all their ancestors in one query.
+        :returns dict of group id -> path
+        """
+        group_ids = list(group_ids)
+        if not group_ids:
+            return {}
+        ancestors = sa.select([
+            _t.Groups.c.id, _t.Groups.c.parent_id, _t.Groups.c.name,
+        ]).where(_t.Groups.c.id.in_(group_ids)).cte('ancestors', recursive=True)
+        parents = sa.select([
+            _t.Groups.c.id, _t.Groups.c.parent_id, _t.Groups.c.name,
+        ]).where(sa.and_(
+            _t.Groups.c.id == ancestors.c.parent_id,
+            ancestors.c.id != ancestors.c.parent_id,
+        ))
+        ancestors = ancestors.union(parents)
+        rows = {row[0]: row for row in utils.read_many(
+            self._db, sa.select([ancestors]))}
+
+        paths = {}
+
+        def get_path(group_id):
+            if group_id not in paths:
+                _, parent_id, name = rows[group_id]
+                if parent_id == group_id:
+                    paths[group_id] = ''
+                else:
+                    parent_path = get_path(parent_id)
+                    paths[group_id] = parent_path + '/' + name \
+                        if parent_path else name
+            return paths[group_id]
+
+        return {group_id: get_path(group_id) for group_id in group_ids}
+
     def rename(self, group):
         if utils.get_key(group)['id'] == self._root.key['id']:
             raise exceptions.IllegalArgumentError("Cannot rename root group")
         dirty = utils.get_dirty_fields(group)
         utils.update_obj(self._db, group, _t.Groups, dirty)
+        # paths of models and groups below it are changed too
+        self._forget_all()
+        self._storage.identity.add(identity.GROUPS, group)
 
     def add_or_update_attrs(self, group, attribute, *more_attributes):
         if not group.key:
@@ -165,6 +219,8 @@ class LocalGroupsStorage(groups.GroupsStorage, _base.LocalStorageBase):
                 'group_id': group.key['id'],
                 'orig_fields': _attr_args_from_row(data)
             }
+        # attribute values cached by models and runs are changed
+        self._storage.identity.clear(identity.MODELS, identity.RUNS)
 
     def delete_attrs(self, group, attribute, *more_attributes, ok_if_not_exist=False):
         attrs = [attribute, *more_attributes]
@@ -174,6 +230,8 @@ class LocalGroupsStorage(groups.GroupsStorage, _base.LocalStorageBase):
         self._db.execute(_t.Attributes.delete().where(_t.Attributes.c.id.in_(ids)))
         for a in attrs:
             a.key = None
+        # attribute values cached by models and runs are changed
+        self._storage.identity.clear(identity.MODELS, identity.RUNS)
 
     def get_group(self, attribute):
         if not attribute.key:
@@ -202,7 +260,26 @@ class LocalGroupsStorage(groups.GroupsStorage, _base.LocalStorageBase):
     def delete_with_content(self, group):
         if not group.key:
             raise exceptions.InvalidStateError("Group is not saved")
-        self._db.execute(_t.Groups.delete().where(_t.Groups.c.id == group.key['id']))
+        if group.key['id'] == self._root.key['id']:
+            raise exceptions.IllegalArgumentError("Cannot delete root group")
+        subgroup_ids = utils.select_subgroup_ids(group.key['id'])
+        attr_ids = sa.select([_t.Attributes.c.id]) \
+            .where(_t.Attributes.c.group_id.in_(subgroup_ids))
+        with self._db.begin() as conn:
+            self._delete_models(
+                conn, _t.Models.c.group_id.in_(subgroup_ids))
+            for values in _t.VALUE_TABLES:
+                conn.execute(values.delete().where(
+                    values.c.attr_id.in_(attr_ids)))
+            stats.drop(conn, attr_ids)
+            conn.execute(_t.FilterLog.delete().where(
+                _t.FilterLog.c.attr_id.in_(attr_ids)))
+            conn.execute(_t.Attributes.delete().where(
+                _t.Attributes.c.group_id.in_(subgroup_ids)))
+            conn.execute(_t.Groups.delete().where(
+                _t.Groups.c.id.in_(subgroup_ids)))
+        self._forget_all()
+        self._storage.gc.notify()
 
     def n_attribute_usages(self, group, attribute, *more_attributes, ok_if_not_exist=False):
         attrs = [attribute, *more_attributes]
@@ -210,18 +287,15 @@ class LocalGroupsStorage(groups.GroupsStorage, _base.LocalStorageBase):
         if not ok_if_not_exist and len(existing_attrs) != len(attrs):
             raise exceptions.IllegalArgumentError("Some attributes are not exist")
         ids = [a.key['id'] for a in existing_attrs]
-        query = sa.select([
-            _t.Attributes.c.id,
-            sa.func.count(_t.Attributes.c.id)
-        ]).select_from(
-            _t.Attributes.join(
-                _t.AttributeValues,
-                _t.AttributeValues.c.attr_id == _t.Attributes.c.id
-            )
-        )\
-            .where(_t.Attributes.c.id.in_(ids))\
-            .group_by(_t.Attributes.c.id)
-        counts_by_id = dict(list(self._db.execute(query)))
+        counts_by_id = {}
+        for values in _t.VALUE_TABLES:
+            query = sa.select([
+                values.c.attr_id,
+                sa.func.count(values.c.attr_id)
+            ])\
+                .where(values.c.attr_id.in_(ids))\
+                .group_by(values.c.attr_id)
+            counts_by_id.update(self._db.execute(query).fetchall())
         results = []
         for attr in attrs:
             if attr.key:
@@ -230,6 +304,11 @@ class LocalGroupsStorage(groups.GroupsStorage, _base.LocalStorageBase):
                 results.append(0)
         return results
 
+    def _forget_all(self):
+        """Discards all cached objects but the root group."""
+        self._storage.identity.clear()
+        self._storage.identity.add(identity.GROUPS, self._root)
+
     def _row_to_attr(self, row):
         key = _attr_key_from_row(row)
         return groups.Attribute(key, self, **key['orig_fields'])
@@ -1,8 +1,9 @@
+import functools
 import sqlalchemy as sa
 from tensorlab import exceptions
 from tensorlab.core import models, groups
-from tensorlab.local_storage.db import tables as _t, utils
-from tensorlab.local_storage import files
+from tensorlab.local_storage.db import tables as _t, utils, predicates
+from tensorlab.local_storage import files, stats, identity
 from . import _base
 
 
@@ -56,52 +57,154 @@ class LocalModelsStorage(models.ModelsStorage, _base.LocalStorageBase):
         model_path = files.get_model_data_dir(self._storage.root_dir, model)
         files.make_dir_writable(model_path)
         self._storage.project.build(attrs, model_path, self._log_stream)
+        return model_path
 
     def get_data_path(self, model):
-        utils.get_key(model)
-        return files.get_model_data_dir(self._storage.root_dir, model)
+        return self._get_data_dir(files.MODELS, _t.Models, model)
 
-    def list(self, group, name_pattern=None, predicate=None):
-        if group is None:
-            group = self._storage.groups.get(None)
-        query = _select_by_group(_t.Models.select(), group)
+    def list(self, group, name_pattern=None, predicate=None,
+             order_by=None, limit=None, select_related=False):
+        """
+        :param select_related: if true, groups of the models are read
+                               by the same query, see get_group
+        """
+        if group is None or isinstance(group, str):
+            group = self._storage.groups.get(group)
+        source = self.get_filter_source(group, name_pattern)
+        if predicate is not None:
+            self._storage.planner.record(
+                'models', predicate, source.get_targets())
+        if select_related:
+            source = self._select_related(source, _t.Models.join(
+                _t.Groups, _t.Groups.c.id == _t.Models.c.group_id), False)
+        rows = predicates.select_filtered(self._db, source, predicate,
+                                          order_by, limit)
+        models = [self._row_to_model(row) for row in rows]
+        if select_related:
+            self._attach_related(models, rows, False)
+        return models
+
+    def update_attrs_where(self, group, predicate, values):
+        """
+        Sets attributes of all models of the group matching the predicate
+        by a fixed number of statements per attribute in one transaction,
+        however many models match. Each value is validated once.
+        :param predicate: tensorlab.core.attribute_predicates.Expression
+                          or None to update all models of the group
+        :param values: dict of attribute name -> new value
+        :returns number of updated models
+        """
+        if group is None or isinstance(group, str):
+            group = self._storage.groups.get(group)
+        source = self.get_filter_source(group)
+        targets = source.get_targets()
+        encoded = []
+        for name, value in sorted(values.items()):
+            if name not in targets:
+                raise exceptions.LookupError(
+                    'Attribute "{}" does not exist'.format(name))
+            attr = targets[name][0]
+            if value is None and not attr.nullable and attr.default is None:
+                raise exceptions.IllegalArgumentError(
+                    'Attribute "{}" is required'.format(name))
+            encoded.append((attr.key['id'], attr.encode_value(value)))
+        if predicate is not None:
+            self._storage.planner.record('models', predicate, targets)
+
+        mv = _t.ModelValues
+        with self._db.begin() as conn:
+            ids, n_models = predicates.save_filtered(
+                conn, source, predicate, _t.Models.c.id)
+            for attr_id, value in encoded if n_models else ():
+                current = sa.and_(mv.c.attr_id == attr_id,
+                                  mv.c.model_id.in_(ids))
+                stats.remove_values(conn, mv, current)
+                conn.execute(mv.update().where(current).values(value=value))
+                conn.execute(mv.insert().from_select(
+                    ['model_id', 'attr_id', 'value'],
+                    sa.select([
+                        _t.Models.c.id, sa.literal(attr_id),
+                        sa.literal(value, mv.c.value.type),
+                    ]).where(sa.and_(
+                        _t.Models.c.id.in_(ids),
+                        _t.Models.c.id.notin_(sa.select([mv.c.model_id])
+                                              .where(mv.c.attr_id == attr_id)),
+                    ))
+                ))
+                stats.add_value_counts(conn, {attr_id: [(value, n_models)]})
+        if n_models:
+            # attribute values cached by the models are outdated
+            self._storage.identity.clear(identity.MODELS)
+        return n_models
+
+    def get_filter_source(self, group, name_pattern=None):
+        """
+        :returns models of the group for filtering by predicates
+        :rtype: tensorlab.local_storage.db.predicates.FilterSource
+        """
+        params = {'group_id': utils.get_key(group)['id']}
         if name_pattern is not None:
-            name_pattern = name_pattern.replace('*', '%').replace('?', '_')
-            query = query.where(_t.Models.c.name.like(name_pattern))
-        if False:
-            existing_attrs = group.get_attrs()
-            attr_pairs = []
-            for key, val in attrs.items():
-                if key not in existing_attrs:
-                    raise exceptions.LookupError('Attribute "{}" does not exist'.format(key))
-                attr_pairs.append((existing_attrs[key], val))
-            predicate, has_targets = utils.build_attr_predicate(attr_pairs)
-            if (has_targets[groups.AttributeTarget.Instance]
-                    or has_targets[groups.AttributeTarget.Run]):
-                raise exceptions.IllegalArgumentError("Only model attributes are allowed")
-            query = query.where(predicate)
-
-        return utils.read_many(self._db, query, self._row_to_model)
+            params['name_pattern'] = \
+                name_pattern.replace('*', '%').replace('?', '_')
+
+        def make_query():
+            query = _t.Models.select().where(
+                _t.Models.c.group_id == sa.bindparam('group_id'))
+            if name_pattern is not None:
+                query = query.where(
+                    _t.Models.c.name.like(sa.bindparam('name_pattern')))
+            return query
+
+        @functools.lru_cache(maxsize=None)
+        def get_targets():
+            return {
+                attr.name: (attr, _t.Models.c.id)
+                for attr in self._storage.attributes.list_effective(group)
+                if not attr.runtime
+            }
+
+        return predicates.FilterSource(
+            ('models', name_pattern is not None), _t.Models,
+            make_query, params, get_targets,
+            lambda names: self._get_target_stats(get_targets(), names),
+            [_t.Models.c.id])
+
+    def get_frame(self, group, attrs=None):
+        if group is None or isinstance(group, str):
+            group = self._storage.groups.get(group)
+        attr_defs = [a for a in self._storage.attributes.list_effective(group)
+                     if not a.runtime]
+        return self._load_frame(
+            _t.Models, _t.Models.c.group_id == utils.get_key(group)['id'],
+            self._project_attrs(attr_defs, attrs))
 
     def rename(self, model):
         utils.get_key(model)
         dirty = utils.get_dirty_fields(model)
         utils.update_obj(self._db, model, _t.Models, dirty)
+        self._storage.identity.add(identity.MODELS, model)
 
-    def get_attrs(self, model):
-        return self._storage.attributes.get_attr_values_for_model(model)
+    def get_attrs(self, model, attrs=None):
+        return self._storage.attributes.get_attr_values_for_model(
+            model, attrs)
 
     def get_group(self, model):
         _check_key(model)
-        return self._row_to_group(
-            utils.read_one(self._db, _t.Groups.select(), id=model.key['group_id'])
-        )
+        if 'group' in model.key:
+            return model.key['group']
+        return self._get_group_by_id(self._db, model.key['group_id'])
 
     def list_runs(self, model, predicate=None):
         return self._storage.runs.list(model, predicate)
 
     def delete_with_content(self, model):
-        pass
+        model_id = utils.get_key(model)['id']
+        with self._db.begin() as conn:
+            self._delete_models(conn, _t.Models.c.id == model_id)
+        model.key = None
+        self._storage.identity.discard(identity.MODELS, model_id)
+        self._storage.identity.clear(identity.RUNS)
+        self._storage.gc.notify()
 
     def _prepare_attrs(self, model, attrs, group=None):
         group = group or self.get_group(model)
@@ -111,37 +214,26 @@ class LocalModelsStorage(models.ModelsStorage, _base.LocalStorageBase):
 
         return [
             {
-                'value': attrdef.type.encode(attrs[name], attrdef.options),
+                'value': attrdef.encode_value(attrs[name]),
                 'attr_id': attrdef.key['id']
             }
             for name, attrdef in attr_defs.items()
         ]
 
     def _save_attrs(self, model, attr_data):
+        if not attr_data:
+            return
         for item in attr_data:
-            item['target_uid'] = model.key['uid']
-        self._db.execute(_t.AttributeValues.insert().values(attr_data))
-
-    def _row_to_model(self, row):
-        key = _model_key(row)
-        model = self.new(**key['orig_fields'])
-        model.key = key
-        return model
+            item['model_id'] = model.key['id']
+        with self._db.begin() as conn:
+            conn.execute(_t.ModelValues.insert().values(attr_data))
+            stats.add_values(conn, attr_data)
 
     def _row_to_attr(self, row):
         key = _attr_key_from_row(row)
         return groups.Attribute(key, self, **key['orig_fields'])
 
 
-def _model_key(row):
-    return {
-        'id': row['id'],
-        'uid': row['uid'],
-        'group_id': row['group_id'],
-        'orig_fields': _model_args(row),
-    }
-
-
 _UPDATE_ALLOWED = ()
 
 
@@ -196,5 +288,5 @@ def _select_by_group(query, group, do_join=True):
         query = query.where(_t.Groups.c.name == group)
     else:
         _check_key(group)
-        query = query.where(_t.Groups.c.name == group.key['id'])
+        query = query.where(_t.Models.c.group_id == group.key['id'])
     return query
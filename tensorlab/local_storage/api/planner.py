@@ -0,0 +1,221 @@
+import re
+import time
+import threading
+import collections
+import sqlalchemy as sa
+from tensorlab.core import predicate_optimizer, attribute_stats
+from tensorlab.core.attributeoptions import AttributeType
+from tensorlab.core.attribute_predicates import Literal, BinaryOperation, Op
+from tensorlab.local_storage.db import utils, predicates, tables as _t
+from . import _base
+
+
+MODELS = _base.MODELS
+RUNS = _base.RUNS
+
+# clause: serialized comparison from the simplified predicate
+# n_matched: number of models or runs satisfying the clause alone
+# selectivity: fraction of all filtered models or runs satisfying it
+# estimated: fraction of all values of the attribute satisfying it
+#            estimated from statistics, None without statistics
+ClauseEstimate = collections.namedtuple(
+    'ClauseEstimate', ['clause', 'n_matched', 'selectivity', 'estimated'])
+
+# predicate: simplified predicate
+# sql, params: executed statement and values of its parameters,
+#              None if the predicate is never true
+# steps: lines of EXPLAIN QUERY PLAN indented by nesting
+QueryPlan = collections.namedtuple(
+    'QueryPlan', ['predicate', 'sql', 'params', 'steps', 'clauses',
+                  'used_indexes', 'unused_indexes'])
+
+# attrs: names of attributes the index is proposed for
+# n_filters: number of logged predicates which used these attributes
+IndexProposal = collections.namedtuple(
+    'IndexProposal', ['name', 'sql', 'attrs', 'n_filters'])
+
+
+_INDEX_PATTERN = re.compile(r'USING (?:COVERING )?INDEX (\w+)')
+
+# Values of integer and float attributes are compared after casting them,
+# so only expression indexes on the same casts can be searched.
+# Strings are searched with ix_ModelValues_attr_id_value
+# and ix_RunValues_attr_id_value.
+# Indexes are named ix_<table>_attr_id_<suffix>.
+_VALUE_INDEXES = {
+    AttributeType.Integer: ('integer', 'CAST(value AS INTEGER)'),
+    AttributeType.Float: ('float', 'CAST(value AS FLOAT)'),
+    AttributeType.String: ('value', 'value'),
+    AttributeType.Enum: ('value', 'value'),
+}
+
+
+class LocalQueryPlanner(_base.LocalStorageBase):
+    """
+    Explains how predicates filtering models and runs are executed
+    and advises indexes for attributes which are filtered often.
+
+    Attributes used by predicates of models.list() and runs.list()
+    are counted in memory and written to FilterLog on flush(),
+    which is called when the storage is closed.
+    """
+
+    def __init__(self, db, storage):
+        """
+        :type storage: tensorlab.local_storage.api.facade.LocalStorage
+        """
+        self._db = db
+        self._storage = storage
+        self._log = collections.Counter()
+        self._lock = threading.Lock()
+
+    def record(self, target, predicate, targets):
+        """
+        Logs attributes used by the predicate.
+        :param target: MODELS or RUNS
+        :param targets: see tensorlab.local_storage.db.predicates.filter_query
+        """
+        names = predicate_optimizer.get_identifiers(
+            predicate_optimizer.optimize(predicate))
+        with self._lock:
+            for name in names:
+                if name in targets:
+                    attr = targets[name][0]
+                    self._log[target, attr.key['id']] += 1
+
+    def flush(self):
+        with self._lock:
+            log, self._log = self._log, collections.Counter()
+        if not log:
+            return
+        now = time.time()
+        with self._db.begin() as conn:
+            for (target, attr_id), n_filters in sorted(log.items()):
+                condition = sa.and_(_t.FilterLog.c.target == target,
+                                    _t.FilterLog.c.attr_id == attr_id)
+                updated = conn.execute(
+                    _t.FilterLog.update().where(condition).values(
+                        n_filters=_t.FilterLog.c.n_filters + n_filters,
+                        last_filtered_at=now)
+                ).rowcount
+                if not updated:
+                    conn.execute(_t.FilterLog.insert().values(
+                        target=target, attr_id=attr_id,
+                        n_filters=n_filters, last_filtered_at=now))
+
+    def explain(self, predicate, target=RUNS, scope=None):
+        """
+        :param target: MODELS or RUNS
+        :param scope: group of filtered models or its name, the root group
+                      by default; model of filtered runs
+        :rtype: QueryPlan
+        """
+        source = self._get_filter_source(target, scope)
+        optimized = predicate_optimizer.optimize(predicate)
+        n_total = predicates.count_filtered(self._db, source, None)
+        stats = source.get_stats(
+            predicate_optimizer.get_identifiers(optimized))
+        clauses = []
+        for clause in _get_clauses(optimized):
+            n_matched = predicates.count_filtered(self._db, source, clause)
+            clauses.append(ClauseEstimate(
+                clause.serialize(), n_matched,
+                n_matched / n_total if n_total else 0.0,
+                attribute_stats.estimate_clause(clause, stats.get)))
+        indexes = self._list_indexes(source.table)
+        if clauses:
+            indexes += self._list_indexes(_t.ModelValues)
+            if target == RUNS:
+                indexes += self._list_indexes(_t.RunValues)
+
+        compiled = predicates.compile_filtered(self._db, source, predicate)
+        if compiled is None:
+            return QueryPlan(optimized, None, None, [], clauses, [], indexes)
+        statement, params = compiled
+        values = statement.construct_params(params)
+        rows = self._db.execute(
+            'EXPLAIN QUERY PLAN ' + statement.string,
+            tuple(values[name] for name in statement.positiontup)
+        ).fetchall()
+        depths = {0: -1}
+        steps = []
+        used = []
+        for step_id, parent_id, _, detail in rows:
+            depths[step_id] = depths.get(parent_id, -1) + 1
+            steps.append('  ' * depths[step_id] + detail)
+            used.extend(name for name in _INDEX_PATTERN.findall(detail)
+                        if name not in used)
+        return QueryPlan(optimized, statement.string, params, steps, clauses,
+                         used, [name for name in indexes if name not in used])
+
+    def advise(self, min_filters=10):
+        """
+        Proposes indexes on attribute values for attributes used by
+        at least min_filters logged predicates. Attributes with defaults
+        are compared with coalesced values, so they cannot be helped.
+        :returns list of IndexProposal for missing indexes,
+                 the most used ones first
+        """
+        self.flush()
+        existing = set()
+        for values in _t.VALUE_TABLES:
+            existing.update(self._list_indexes(values))
+        n_filters = sa.func.sum(_t.FilterLog.c.n_filters)
+        q = sa.select([
+            _t.Attributes.c.name, _t.Attributes.c.type,
+            _t.Attributes.c.runtime, n_filters,
+        ]).select_from(_t.FilterLog.join(
+            _t.Attributes, _t.Attributes.c.id == _t.FilterLog.c.attr_id
+        )).where(
+            _t.Attributes.c.default.is_(None)
+        ).group_by(_t.Attributes.c.id).having(n_filters >= min_filters)
+
+        proposals = collections.OrderedDict()
+        statements = {}
+        for name, type, runtime, n in utils.read_many(self._db, q):
+            if type not in _VALUE_INDEXES:
+                continue
+            table = _t.get_values(runtime).name
+            suffix, expression = _VALUE_INDEXES[type]
+            index_name = 'ix_{}_attr_id_{}'.format(table, suffix)
+            if index_name in existing:
+                continue
+            statements[index_name] = \
+                'CREATE INDEX "{}" ON "{}" (attr_id, {})'.format(
+                    index_name, table, expression)
+            attrs, total = proposals.get(index_name, ([], 0))
+            proposals[index_name] = attrs + [name], total + n
+        return sorted([
+            IndexProposal(index_name, statements[index_name], sorted(attrs), n)
+            for index_name, (attrs, n) in proposals.items()
+        ], key=lambda p: (-p.n_filters, p.name))
+
+    def create_indexes(self, proposals):
+        """
+        Creates proposed indexes and collects statistics of the table
+        for choosing them.
+        :param proposals: list of IndexProposal
+        """
+        with self._db.begin() as conn:
+            for proposal in proposals:
+                conn.execute(proposal.sql)
+            for values in _t.VALUE_TABLES:
+                conn.execute('ANALYZE "{}"'.format(values.name))
+
+    def _list_indexes(self, table):
+        q = sa.text(
+            "SELECT name FROM sqlite_master "
+            "WHERE type = 'index' AND tbl_name = :table ORDER BY name")
+        return [row[0] for row in self._db.execute(q, table=table.name)]
+
+
+def _get_clauses(expr):
+    """:returns distinct comparisons of the simplified predicate"""
+    if isinstance(expr, Literal):
+        return []
+    if isinstance(expr, BinaryOperation) and expr.op in (Op.And, Op.Or):
+        clauses = _get_clauses(expr.left)
+        seen = {c.serialize() for c in clauses}
+        return clauses + [c for c in _get_clauses(expr.right)
+                          if c.serialize() not in seen]
+    return [expr]
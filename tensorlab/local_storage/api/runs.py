@@ -1,12 +1,20 @@
+import os
 import time
+import functools
 import sqlalchemy as sa
 from tensorlab.core.runs import RunsStorage, Run
+from tensorlab.core import ordering, predicate_optimizer, groups
 from tensorlab import exceptions
-from tensorlab.local_storage.db import tables as _t, utils
-from tensorlab.local_storage import files
+from tensorlab.local_storage.db import tables as _t, utils, predicates
+from tensorlab.local_storage import files, identity
 from . import _base
 
 
+# cloning methods used for seeding by default: hardlinks are not
+# copy-on-write, so they have to be requested explicitly
+SEED_METHODS = (files.REFLINK, files.COPY)
+
+
 class LocalRunsStorage(RunsStorage, _base.LocalStorageBase):
 
     def __init__(self, db, storage, log_stream):
@@ -26,12 +34,22 @@ class LocalRunsStorage(RunsStorage, _base.LocalStorageBase):
     def reset(self, obj):
         utils.reset_fields(obj)
 
-    def create(self, model, run, attrs):
+    def create(self, model, run, attrs, seed=False):
+        """
+        :param seed: if true, the run data directory is pre-populated with
+                     clones of files of the model data directory before
+                     the run starts; may be a tuple of cloning methods to
+                     try (see tensorlab.local_storage.files.copying),
+                     SEED_METHODS are used otherwise
+        """
         model_id = utils.get_key(model)['id']
+        if run.started_at is None:
+            raise exceptions.IllegalArgumentError(
+                'Run must have start time', run)
         uid = utils.make_uid()
-        run.started_at = time.time()
         q = _t.Runs.insert().values(
             uid=uid,
+            model_id=model_id,
             started_at=run.started_at,
             finished_at=run.finished_at,
         )
@@ -45,16 +63,50 @@ class LocalRunsStorage(RunsStorage, _base.LocalStorageBase):
         run.key = key
         run.storage = self
 
-        run_data_dir = self.get_data_path(run)
+        run_data_dir = files.get_run_data_dir(self._storage.root_dir, run)
         files.make_dir_writable(run_data_dir)
+        model_data_dir = self._storage.models.get_data_path(model)
+        if seed:
+            methods = SEED_METHODS if seed is True else tuple(seed)
+            self._seed(run, model_data_dir, run_data_dir, methods)
 
         self._storage.project.run(
-            attributes=attrs,
-            model_data=self._storage.models.get_data_path(model),
-            run_data=run_data_dir,
-            stream=self._log_stream
+            attrs,
+            model_data_dir,
+            run_data_dir,
+            self._log_stream
         )
         self.set_time(run, finished_at=time.time())
+        return run_data_dir
+
+    def _seed(self, run, model_data_dir, run_data_dir, methods):
+        stats = files.clone_tree(model_data_dir, run_data_dir, methods)
+        if not stats:
+            return
+        run_id = utils.get_key(run)['id']
+        self._db.execute(_t.RunSeeds.insert(), [
+            dict(run_id=run_id, **s._asdict()) for s in stats
+        ])
+
+    def get_seed_costs(self, run=None, model=None):
+        """
+        Sums up costs of seeding of the run, of all runs of the model
+        or of all runs in the storage.
+        :returns list of files.CloneStats, one item per used method
+        """
+        q = sa.select([
+            _t.RunSeeds.c.method,
+            sa.func.sum(_t.RunSeeds.c.n_files),
+            sa.func.sum(_t.RunSeeds.c.n_bytes),
+            sa.func.sum(_t.RunSeeds.c.seconds),
+        ]).group_by(_t.RunSeeds.c.method).order_by(_t.RunSeeds.c.method)
+        if run is not None:
+            q = q.where(_t.RunSeeds.c.run_id == utils.get_key(run)['id'])
+        elif model is not None:
+            q = q.where(_t.RunSeeds.c.run_id.in_(
+                sa.select([_t.Runs.c.id])
+                .where(_t.Runs.c.model_id == utils.get_key(model)['id'])))
+        return [files.CloneStats(*row) for row in self._db.execute(q)]
 
     def get(self, model, run_index):
         model_id = utils.get_key(model)['id']
@@ -65,13 +117,141 @@ class LocalRunsStorage(RunsStorage, _base.LocalStorageBase):
         row = utils.read_one(self._db, q, self._row_to_run)
         return self._row_to_run(row)
 
-    def list(self, model, predicate=None):
+    def list(self, model, predicate=None, order_by=None, limit=None,
+             select_related=False):
+        """
+        :param predicate: may refer both to runtime attributes of the runs
+                          and to attributes of the model
+        :param order_by: attributes to order runs by before their start
+                         time, see tensorlab.core.ordering
+        :param select_related: if true, models of the runs and their groups
+                               are read by the same query, see get_model
+        """
+        source = self.get_filter_source(model)
+        if predicate is not None:
+            self._storage.planner.record(
+                'runs', predicate, source.get_targets())
+        return self._select(source, _t.Runs.join(
+            _t.Models, _t.Models.c.id == _t.Runs.c.model_id
+        ), predicate, order_by, limit, select_related)
+
+    def _select(self, source, runs_of_models, predicate, order_by, limit,
+                select_related):
+        if select_related:
+            source = self._select_related(source, runs_of_models.join(
+                _t.Groups, _t.Groups.c.id == _t.Models.c.group_id), True)
+        rows = predicates.select_filtered(self._db, source, predicate,
+                                          order_by, limit)
+        runs = [self._row_to_run(row) for row in rows]
+        if select_related:
+            self._attach_related(runs, rows, True)
+        return runs
+
+    def get_filter_source(self, model):
+        """
+        :returns runs of the model for filtering by predicates
+        :rtype: tensorlab.local_storage.db.predicates.FilterSource
+        """
+        key = utils.get_key(model)
+
+        def make_query():
+            return _t.Runs.select().where(
+                _t.Runs.c.model_id == sa.bindparam('model_id'))
+
+        @functools.lru_cache(maxsize=None)
+        def get_targets():
+            attrs = self._storage.attributes.list_effective(
+                self._storage.models.get_group(model))
+            return {
+                attr.name: (attr, _t.Runs.c.id if attr.runtime
+                            else key['id'])
+                for attr in attrs
+            }
+
+        return predicates.FilterSource(
+            'runs', _t.Runs, make_query, {'model_id': key['id']}, get_targets,
+            lambda names: self._get_target_stats(get_targets(), names),
+            [_t.Runs.c.started_at])
+
+    def list_in_group(self, group, predicate=None, recursive=True,
+                      order_by=None, limit=None, select_related=False):
+        """
+        Lists runs of all models of the group and its subgroups with one
+        query. The predicate and ordering may mix attributes of models
+        and runtime attributes of runs; each attribute is resolved by name
+        to its definitions in the subgroups, which must agree on the type,
+        options, level and default of the attribute.
+        :param recursive: whether to include runs of models of subgroups
+        :param select_related: see list
+        """
+        if group is None or isinstance(group, str):
+            group = self._storage.groups.get(group)
+        source, inconsistent = self._get_group_filter_source(group, recursive)
+        _check_consistent(inconsistent, predicate, order_by)
+        if predicate is not None:
+            self._storage.planner.record(
+                'runs', predicate, source.get_targets())
+        return self._select(source, source.table, predicate, order_by, limit,
+                            select_related)
+
+    def _get_group_filter_source(self, group, recursive):
+        """
+        :returns (runs of models of the group for filtering by predicates,
+                  set of names of attributes defined inconsistently
+                  in subgroups, which cannot be filtered by)
+        """
+        runs_of_models = _t.Runs.join(
+            _t.Models, _t.Models.c.id == _t.Runs.c.model_id)
+
+        def make_query():
+            group_id = sa.bindparam('group_id')
+            if recursive:
+                condition = _t.Models.c.group_id.in_(
+                    utils.select_subgroup_ids(group_id))
+            else:
+                condition = _t.Models.c.group_id == group_id
+            return sa.select([_t.Runs]).select_from(runs_of_models) \
+                .where(condition)
+
+        targets = {}
+        inconsistent = set()
+        definitions = self._storage.attributes.list_in_subgroups(
+            group, recursive)
+        for name, attrs in definitions.items():
+            attr = attrs[0]
+            if len({(a.type, a.options, a.runtime, a.default)
+                    for a in attrs}) > 1:
+                inconsistent.add(name)
+                continue
+            target_id = _t.Runs.c.id if attr.runtime else _t.Models.c.id
+            targets[name] = predicates.Target(
+                attr, target_id, [a.key['id'] for a in attrs])
+
+        source = predicates.FilterSource(
+            ('runs_in_group', recursive), runs_of_models, make_query,
+            {'group_id': utils.get_key(group)['id']}, lambda: targets,
+            lambda names: self._get_target_stats(targets, names),
+            [_t.Runs.c.started_at, _t.Runs.c.id])
+        return source, inconsistent
+
+    def get_frame(self, model, attrs=None):
+        """
+        Values of attributes of the model are repeated for each run.
+        :param attrs: names of attributes of the runs or of the model
+                      to load, all by default
+        """
         model_id = utils.get_key(model)['id']
-        q = _t.Runs.select().where(
-            _t.Runs.c.model_id == model_id
-        ).order_by(_t.Runs.c.started_at)
-        result = utils.read_many(self._db, q, self._row_to_run)
-        return result
+        attr_defs = self._project_attrs(
+            self._storage.attributes.list_effective(
+                self._storage.models.get_group(model)), attrs)
+        model_defs = [a for a in attr_defs if not a.runtime]
+        model_values = self._storage.attributes.get_attr_values_for_model(
+            model, [a.name for a in model_defs])
+        return self._load_frame(
+            _t.Runs, _t.Runs.c.model_id == model_id,
+            [a for a in attr_defs if a.runtime],
+            [(a, model_values[a.name]) for a in model_defs],
+        )
 
     def __list(self, group=None, model=None, attrdict=None, fetch_models=False):
         outer_predicates = []
@@ -113,13 +293,13 @@ class LocalRunsStorage(RunsStorage, _base.LocalStorageBase):
                 if isinstance(value, (tuple, list, set)):
                     inner_predicate = sa.or_(
                         _t.AttributeValues.c.value ==
-                            attr.type.encode(v, attr.options)
+                            attr.encode_value(v)
                         for v in value
                     )
                 else:
                     inner_predicate = (
                         _t.AttributeValues.c.value ==
-                            attr.type.encode(value, attr.options)
+                            attr.encode_value(value)
                     )
                 inner_predicates.append(sa.and_(
                     inner_predicate,
@@ -160,31 +340,86 @@ class LocalRunsStorage(RunsStorage, _base.LocalStorageBase):
             run.finished_at = finished_at
         fields = utils.get_dirty_fields(run)
         utils.update_obj(self._db, run, _t.Runs, fields)
+        self._storage.identity.add(identity.RUNS, run)
 
     def get_data_path(self, run):
-        return files.get_run_data_dir(self._storage.root_dir, run)
+        """
+        Archived runs are restored from their bundles on first access.
+        """
+        path = self._get_data_dir(files.RUNS, _t.Runs, run)
+        if not os.path.isdir(path):
+            self._storage.archive.restore(run)
+        return path
+
+    def open_data_file(self, run, rel_path):
+        """
+        Opens a file of the run data directory for reading
+        without restoring the run if it is archived.
+        :returns binary file-like object
+        """
+        return self._storage.archive.open_file(run, rel_path)
 
     def get_group(self, run):
         model = self.get_model(run)
         return self._storage.models.get_group(model)
 
     def get_model(self, run):
+        if 'model' in utils.get_key(run):
+            return run.key['model']
         return self._get_model_by_id(self._db, utils.get_key(run)['model_id'])
 
+    def delete_where(self, scope, predicate):
+        """
+        Deletes all runs in the scope matching the predicate with their
+        attribute values by a fixed number of statements in one
+        transaction, however many runs match.
+        :param scope: model whose runs are deleted, or group or its name
+                      to delete runs of models of the group and its
+                      subgroups, see list_in_group
+        :param predicate: tensorlab.core.attribute_predicates.Expression
+                          or None to delete all runs in the scope
+        :returns number of deleted runs
+        """
+        if scope is None or isinstance(scope, str):
+            scope = self._storage.groups.get(scope)
+        if isinstance(scope, groups.Group):
+            source, inconsistent = self._get_group_filter_source(scope, True)
+            _check_consistent(inconsistent, predicate)
+        else:
+            source = self.get_filter_source(scope)
+        if predicate is not None:
+            self._storage.planner.record(
+                'runs', predicate, source.get_targets())
+        with self._db.begin() as conn:
+            ids, n_runs = predicates.save_filtered(
+                conn, source, predicate, _t.Runs.c.id)
+            if n_runs:
+                self._delete_runs(conn, _t.Runs.c.id.in_(ids))
+        if n_runs:
+            self._storage.identity.clear(identity.RUNS)
+            self._storage.gc.notify()
+        return n_runs
+
     def delete(self, run):
-        utils.get_key(run)
-        q = _t.AttributeValues.delete().where(_t.AttributeValues.c.id.in_(
-            _t.AttributeValues.select([_t.AttributeValues.c.id]).join(
-                _t.AttributeValues.join(_t.Attributes)
-            ).where(
-                _t.AttributeValues.c.target_uid == run.key['uid']
-            ).where(
-                _t.Attributes.c.runtime == sa.true()
-            )
-        ))
-        self._db.execute(q)
+        run_id = utils.get_key(run)['id']
+        with self._db.begin() as conn:
+            self._delete_runs(conn, _t.Runs.c.id == run_id)
+        run.key = None
+        self._storage.identity.discard(identity.RUNS, run_id)
+        self._storage.gc.notify()
 
-        q = _t.Runs.delete().where(id=run.key['id'])
-        self._db.execute(q)
 
-        run.key = None
+def _check_consistent(inconsistent, predicate, order_by=None):
+    """
+    :param inconsistent: names of attributes defined differently
+                         in subgroups, see _get_group_filter_source
+    :raises tensorlab.exceptions.IllegalArgumentError if the predicate
+            or the ordering refers to any of them
+    """
+    names = {name for name, _ in ordering.parse_order_by(order_by)}
+    if predicate is not None:
+        names.update(predicate_optimizer.get_identifiers(predicate))
+    for name in sorted(names & inconsistent):
+        raise exceptions.IllegalArgumentError(
+            'Attribute "{}" is defined differently in subgroups'
+            .format(name))
@@ -0,0 +1,164 @@
+import os
+import shutil
+import collections
+from concurrent import futures
+import sqlalchemy as sa
+from tensorlab import exceptions
+from tensorlab.local_storage.db import utils, tables as _t
+from tensorlab.local_storage import files, gc, dedup
+from . import _base
+
+
+MoveReport = collections.namedtuple(
+    'MoveReport', ['n_moved', 'n_files', 'n_bytes', 'n_failed'])
+
+
+class LocalTiers(_base.LocalStorageBase):
+    """
+    Storage tiers are root directories, usually on different volumes,
+    each with its own "models" and "runs" directories. New models and
+    runs are created on the default tier, which is the storage root;
+    other tiers are configured in the "tiers" field of the config.
+
+    Moving copies a data directory to the target tier, verifies the copy
+    and switches the tier of the object in the DB. The source directory
+    is tombstoned in the same transaction and removed by the garbage
+    collector, so a crash at any moment leaves a complete directory.
+    """
+
+    def __init__(self, db, storage, log_stream, n_workers=8):
+        """
+        :type storage: tensorlab.local_storage.api.facade.LocalStorage
+        """
+        self._db = db
+        self._storage = storage
+        self._log_stream = log_stream
+        self._n_workers = n_workers
+
+    def list(self):
+        """:returns OrderedDict of tier name -> root directory of the tier"""
+        return self._storage.get_tier_roots()
+
+    def add(self, tier, root_dir):
+        """Adds a tier to the config of the storage."""
+        tiers = dict(self._storage.config['tiers'] or {})
+        if tier == files.DEFAULT_TIER or tier in tiers:
+            raise exceptions.IllegalArgumentError(
+                'Storage tier already exists: {}'.format(tier))
+        tiers[tier] = os.path.abspath(root_dir)
+        self._storage.config['tiers'] = tiers
+        self._storage.config.save()
+
+    def get_model_tier(self, model):
+        return self._get_tier(_t.Models, model)
+
+    def get_run_tier(self, run):
+        return self._get_tier(_t.Runs, run)
+
+    def move_models(self, models, tier):
+        """
+        Moves data directories of the models (not of their runs)
+        to the tier. Models which are already there are skipped.
+        :rtype: MoveReport
+        """
+        return self._move(files.MODELS, _t.Models, models, tier)
+
+    def move_runs(self, runs, tier):
+        """
+        Moves data directories of the runs to the tier. Runs which are
+        already there or have no data directories are skipped.
+        :rtype: MoveReport
+        """
+        return self._move(files.RUNS, _t.Runs, runs, tier)
+
+    def _get_tier(self, table, obj):
+        key = utils.get_key(obj)
+        return self._db.execute(
+            sa.select([table.c.tier]).where(table.c.id == key['id'])
+        ).scalar()
+
+    def _move(self, kind, table, objs, tier):
+        dst_root = self._storage.get_tier_root(tier)
+        targets = []
+        n_failed = 0
+        for obj in objs:
+            key = utils.get_key(obj)
+            src_tier = self._get_tier(table, obj)
+            if src_tier == tier:
+                continue
+            src = files.get_data_dir(
+                self._storage.get_tier_root(src_tier), kind, key['uid'])
+            if not os.path.isdir(src):
+                continue
+            dst = files.get_data_dir(dst_root, kind, key['uid'])
+            if self._is_buried(kind, key['uid'], tier):
+                # the collector could remove the directory after the move
+                self._log('cannot move {} to {}: previous copy is waiting '
+                          'for the garbage collector'.format(src, dst))
+                n_failed += 1
+                continue
+            targets.append((key, src_tier, src, dst))
+
+        with futures.ThreadPoolExecutor(self._n_workers) as pool:
+            results = list(pool.map(lambda t: self._copy(t[2], t[3]), targets))
+        moved = [
+            (key, src_tier, stats)
+            for (key, src_tier, _, _), stats in zip(targets, results)
+            if stats is not None
+        ]
+
+        if moved:
+            ids = [key['id'] for key, _, _ in moved]
+            uids = [key['uid'] for key, _, _ in moved]
+            with self._db.begin() as conn:
+                for src_tier in {src_tier for _, src_tier, _ in moved}:
+                    gc.bury(conn, kind, table, sa.and_(
+                        table.c.id.in_(ids), table.c.tier == src_tier))
+                conn.execute(table.update()
+                             .where(table.c.id.in_(ids))
+                             .values(tier=tier))
+                conn.execute(_t.DiskUsage.delete().where(sa.and_(
+                    _t.DiskUsage.c.kind == kind,
+                    _t.DiskUsage.c.uid.in_(uids))))
+                dedup.release(conn, kind, uids)
+            self._storage.gc.notify()
+
+        return MoveReport(
+            len(moved),
+            sum(stats[0] for _, _, stats in moved),
+            sum(stats[1] for _, _, stats in moved),
+            n_failed + len(targets) - len(moved),
+        )
+
+    def _is_buried(self, kind, uid, tier):
+        row = utils.read_one(self._db, _t.Tombstones,
+                             kind=kind, uid=uid, tier=tier)
+        return row is not None
+
+    def _copy(self, src, dst):
+        """
+        Copies the directory next to dst, verifies the copy and
+        renames it into dst.
+        :returns (n_files, n_bytes) or None if failed
+        """
+        tmp_path = '{}.{}.moving'.format(dst, os.getpid())
+        try:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            os.makedirs(tmp_path)
+            stats = files.clone_tree(src, tmp_path, (files.REFLINK, files.COPY))
+            mismatched = files.compare_trees(src, tmp_path)
+            if mismatched:
+                raise OSError('copy differs from the source: {}'
+                              .format(', '.join(mismatched[:10])))
+            # leftover of a move which crashed before it was committed
+            shutil.rmtree(dst, ignore_errors=True)
+            os.rename(tmp_path, dst)
+        except OSError as exc:
+            self._log('cannot move {} to {}: {}'.format(src, dst, exc))
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            return None
+        return (sum(s.n_files for s in stats),
+                sum(s.n_bytes for s in stats))
+
+    def _log(self, message):
+        print('[tiers]', message, file=self._log_stream)
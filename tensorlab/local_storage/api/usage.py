@@ -0,0 +1,161 @@
+import time
+import collections
+from concurrent import futures
+import sqlalchemy as sa
+from tensorlab.local_storage.db import utils, tables as _t
+from tensorlab.local_storage import files
+from . import _base
+
+
+Usage = collections.namedtuple('Usage', ['n_bytes', 'n_files'])
+
+
+class LocalDiskUsage(_base.LocalStorageBase):
+    """
+    Index of disk space used by data directories of models and runs.
+    All getters answer from the index only; use `refresh` to update it.
+    """
+
+    def __init__(self, db, storage, n_workers=8, chunk_size=500):
+        """
+        :type storage: tensorlab.local_storage.api.facade.LocalStorage
+        """
+        self._db = db
+        self._storage = storage
+        self._n_workers = n_workers
+        self._chunk_size = chunk_size
+
+    def get_for_model(self, model):
+        """
+        :returns usage of the model's data directory, runs are not included
+        :rtype: Usage
+        """
+        return self._get(files.MODELS, utils.get_key(model)['uid'])
+
+    def get_for_run(self, run):
+        """:rtype: Usage"""
+        return self._get(files.RUNS, utils.get_key(run)['uid'])
+
+    def get_for_group(self, group, recursive=True):
+        """
+        :returns total usage of all models and runs within the group
+        :type group: typing.Optional[tensorlab.core.groups.Group]
+        :param recursive: whether to include subgroups
+        :rtype: Usage
+        """
+        group_ids = self._select_group_ids(group, recursive)
+        totals = [
+            sa.func.coalesce(sa.func.sum(_t.DiskUsage.c.n_bytes), 0),
+            sa.func.coalesce(sa.func.sum(_t.DiskUsage.c.n_files), 0),
+        ]
+        models_q = sa.select(totals).select_from(
+            _t.Models.join(_t.DiskUsage, sa.and_(
+                _t.DiskUsage.c.kind == files.MODELS,
+                _t.DiskUsage.c.uid == _t.Models.c.uid,
+            ))
+        ).where(_t.Models.c.group_id.in_(group_ids))
+        runs_q = sa.select(totals).select_from(
+            _t.Models.join(
+                _t.Runs, _t.Runs.c.model_id == _t.Models.c.id
+            ).join(_t.DiskUsage, sa.and_(
+                _t.DiskUsage.c.kind == files.RUNS,
+                _t.DiskUsage.c.uid == _t.Runs.c.uid,
+            ))
+        ).where(_t.Models.c.group_id.in_(group_ids))
+
+        n_bytes = n_files = 0
+        for q in (models_q, runs_q):
+            row = utils.read_one(self._db, q)
+            n_bytes += row[0]
+            n_files += row[1]
+        return Usage(n_bytes, n_files)
+
+    def refresh(self, group=None, full=False):
+        """
+        Rescans data directories which were modified since the last scan.
+        A directory is considered modified if modification time of
+        the directory or any of its subdirectories has changed.
+        :param group: if given, only models and runs within this group
+                      and its subgroups are refreshed
+        :param full: rescan all directories regardless modification times
+        :return: number of rescanned directories
+        """
+        group_ids = None
+        if group is not None:
+            group_ids = self._select_group_ids(group, recursive=True)
+
+        # read everything before writing, open cursors would block writers
+        targets = []
+        for kind, table, condition in self._list_targets(group_ids):
+            q = sa.select([
+                table.c.uid, table.c.tier, _t.DiskUsage.c.dirs_mtime
+            ]).select_from(
+                table.outerjoin(_t.DiskUsage, sa.and_(
+                    _t.DiskUsage.c.kind == kind,
+                    _t.DiskUsage.c.uid == table.c.uid,
+                ))
+            )
+            if condition is not None:
+                q = q.where(condition)
+            targets.extend(
+                (kind, uid, self._storage.get_tier_root(tier), dirs_mtime)
+                for uid, tier, dirs_mtime in utils.read_many(self._db, q))
+
+        n_scanned = 0
+        with futures.ThreadPoolExecutor(self._n_workers) as pool:
+            for start in range(0, len(targets), self._chunk_size):
+                chunk = targets[start:start+self._chunk_size]
+                scanned = [
+                    item for item in pool.map(
+                        lambda target: self._scan(*target, full=full), chunk)
+                    if item is not None
+                ]
+                if scanned:
+                    self._db.execute(
+                        _t.DiskUsage.insert().prefix_with('OR REPLACE'),
+                        scanned)
+                n_scanned += len(scanned)
+        return n_scanned
+
+    def _get(self, kind, uid):
+        row = utils.read_one(self._db, _t.DiskUsage, kind=kind, uid=uid)
+        if row is None:
+            return None
+        return Usage(row['n_bytes'], row['n_files'])
+
+    def _select_group_ids(self, group, recursive):
+        if group is None:
+            group = self._storage.groups.get(None)
+        group_id = utils.get_key(group)['id']
+        if recursive:
+            return utils.select_subgroup_ids(group_id)
+        return [group_id]
+
+    def _list_targets(self, group_ids):
+        if group_ids is None:
+            return [
+                (files.MODELS, _t.Models, None),
+                (files.RUNS, _t.Runs, None),
+            ]
+        model_ids = sa.select([_t.Models.c.id]) \
+            .where(_t.Models.c.group_id.in_(group_ids))
+        return [
+            (files.MODELS, _t.Models, _t.Models.c.group_id.in_(group_ids)),
+            (files.RUNS, _t.Runs, _t.Runs.c.model_id.in_(model_ids)),
+        ]
+
+    def _scan(self, kind, uid, tier_root, known_mtime, full):
+        path = files.get_data_dir(tier_root, kind, uid)
+        if not full and known_mtime is not None:
+            dirs_mtime = files.get_dirs_mtime(path)
+            if dirs_mtime is not None and dirs_mtime <= known_mtime:
+                return None
+        n_bytes, n_files, dirs_mtime = files.scan_usage(path)
+        return {
+            'kind': kind,
+            'uid': uid,
+            'n_bytes': n_bytes or 0,
+            'n_files': n_files or 0,
+            'dirs_mtime': dirs_mtime,
+            'scanned_at': time.time(),
+        }
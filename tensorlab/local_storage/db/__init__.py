@@ -1 +1 @@
-from . import tables, connection
+from . import tables, connection, migrations
@@ -0,0 +1,519 @@
+"""
+Versioned migrations of the schema of local storages.
+
+Steps of migrations started on a store are recorded in the
+SchemaMigrations table. New stores are created with the latest schema
+and only recorded as up to date. Stores created before the table existed
+start from version 0 and go through all steps, so each step checks what
+is done already before doing it.
+
+Steps which change many rows do it in bounded chunks, each in its own
+short transaction which also records the progress of the step, so other
+connections are never locked out for long and an interrupted upgrade
+resumes where it stopped. Tables which SQLite cannot alter are rebuilt
+as shadow tables, kept in sync with the originals by triggers while rows
+are copied, and swapped in at the end, so readers go on reading
+the original tables until then. Tables split into other tables are
+copied the same way and dropped at the end.
+"""
+import time
+import contextlib
+import collections
+import sqlalchemy as sa
+from tensorlab import exceptions
+from tensorlab.core.attributeoptions import AttributeType, ChoiceCodes
+from tensorlab.local_storage.db import tables as _t
+
+
+# number of rows changed or copied by one transaction
+DEFAULT_CHUNK_SIZE = 10000
+
+_SHADOW_PREFIX = '_shadow_'
+
+_TRIGGER_EVENTS = ('INSERT', 'UPDATE', 'DELETE')
+
+_legacy_metadata = sa.MetaData()
+
+# Values of attributes of both models and runs, keyed by uids of their
+# targets, before they were split into ModelValues and RunValues.
+_AttributeValues = sa.Table(
+    'AttributeValues', _legacy_metadata,
+
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('target_uid', sa.String(16)),
+    sa.Column('attr_id', sa.Integer),
+    sa.Column('value', sa.String(60)),
+
+    sa.UniqueConstraint('target_uid', 'attr_id'),
+    sa.Index('ix_AttributeValues_attr_id_value', 'attr_id', 'value'),
+)
+
+
+# Step of an upgrade of the schema.
+# version: version of the schema after the step,
+#          steps are applied in order of their versions
+# description: what the step does, for progress reports
+# apply: function of a Migrator which applies the step
+Step = collections.namedtuple('Step', ['version', 'description', 'apply'])
+
+
+def upgrade(db, progress=None, chunk_size=DEFAULT_CHUNK_SIZE, log=None):
+    """
+    Creates tables of a new store, or creates missing tables of an existing
+    store and applies all steps which were not finished on it.
+    :param progress: function of (Step, number of rows done, number of rows
+                     to do) called after each chunk of rows
+    :param log: function of (Step, message) called with problems of data
+                found by steps, which fsck reports afterwards
+    :returns list of applied steps
+    """
+    table_names = _get_table_names(db)
+    is_new = _t.Groups.name not in table_names
+    is_versioned = _t.SchemaMigrations.name in table_names
+    _t.initialize_db(db)
+    if is_new:
+        now = time.time()
+        db.execute(_t.SchemaMigrations.insert(), [
+            dict(version=step.version, description=step.description,
+                 started_at=now, finished_at=now)
+            for step in STEPS
+        ])
+        return []
+
+    version = get_version(db) if is_versioned else 0
+    applied = []
+    for step in STEPS:
+        if step.version <= version:
+            continue
+        _start(db, step)
+        step.apply(Migrator(db, step, progress, chunk_size, log))
+        db.execute(_t.SchemaMigrations.update().where(
+            _t.SchemaMigrations.c.version == step.version
+        ).values(finished_at=time.time()))
+        applied.append(step)
+    return applied
+
+
+def get_version(db):
+    """:returns version of the schema of the store, 0 if it is unknown"""
+    q = sa.select([sa.func.max(_t.SchemaMigrations.c.version)]).where(
+        _t.SchemaMigrations.c.finished_at.isnot(None))
+    return db.execute(q).scalar() or 0
+
+
+class Migrator:
+    """
+    Changes of the schema a step is applied by. Each step may change rows
+    in chunks by at most one of update_in_chunks, rebuild_table
+    and split_table, whose progress is recorded for the step.
+    """
+
+    def __init__(self, db, step, progress=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                 log=None):
+        self.db = db
+        self._step = step
+        self._progress = progress
+        self._chunk_size = chunk_size
+        self._log = log
+
+    def log(self, message):
+        """Reports a problem of data found by the step."""
+        if self._log is not None:
+            self._log(self._step, message)
+
+    def get_columns(self, table_name):
+        """:returns names of columns of the table, empty if there is none"""
+        rows = self.db.execute('PRAGMA table_info("{}")'.format(table_name))
+        return [row[1] for row in rows]
+
+    def add_column(self, column):
+        """Adds the column of one of tables to its table unless it has it."""
+        table_name = column.table.name
+        if column.name in self.get_columns(table_name):
+            return
+        spec = sa.schema.CreateColumn(column).compile(dialect=self.db.dialect)
+        self.db.execute('ALTER TABLE "{}" ADD COLUMN {}'.format(
+            table_name, spec))
+
+    def create_index(self, index):
+        """Creates the index of one of tables unless it exists."""
+        if not _has_index(self.db, index.name):
+            index.create(self.db)
+
+    def update_in_chunks(self, table, values, condition=None):
+        """
+        Updates rows of the table which match the condition, in chunks
+        of rows in order of their ids.
+        :param values: dict of column name -> value or SQL expression
+        """
+        def update(conn, chunk):
+            return conn.execute(table.update().where(
+                sa.and_(chunk, condition) if condition is not None else chunk
+            ).values(values)).rowcount
+
+        self._run_in_chunks(table, condition, update)
+
+    def rebuild_table(self, table, columns=None, after_swap=None):
+        """
+        Rebuilds the table as it is defined in tables, for changes SQLite
+        cannot make by altering the table. Rows are copied into a shadow
+        table in chunks, while triggers copy rows changed in the original
+        table meanwhile. The shadow table replaces the original one in one
+        transaction, which also creates indexes of the table.
+        :param table: one of tables
+        :param columns: dict of column name -> function of the original
+                        table returning SQL expression of the new value;
+                        other columns are copied by name or get their
+                        defaults if the original table does not have them
+        :param after_swap: function of the connection called within
+                           the transaction of the swap
+        """
+        shadow = _make_shadow(table)
+        source = self._get_source(table.name)
+        values = collections.OrderedDict()
+        for column in table.c:
+            if columns and column.name in columns:
+                values[column.name] = columns[column.name](source)
+            elif column.name in source.c:
+                values[column.name] = source.c[column.name]
+        self._copy_rows(source, [(shadow, values, None)])
+
+        with _begin_ddl(self.db) as conn:
+            self._drop_triggers(conn, source)
+            conn.execute('DROP TABLE "{}"'.format(table.name))
+            conn.execute('ALTER TABLE "{}" RENAME TO "{}"'.format(
+                shadow.name, table.name))
+            for index in table.indexes:
+                index.create(conn)
+            if after_swap is not None:
+                after_swap(conn)
+
+    def split_table(self, table_name, targets):
+        """
+        Moves rows of the table into other tables, for tables replaced
+        by several ones. Rows are copied in chunks, while triggers copy
+        rows changed in the original table meanwhile, and the original
+        table is dropped at the end. Rows keep their ids.
+        :param targets: list of (one of tables, dict of column name ->
+                        function of the original table returning SQL
+                        expression of the value, function of the original
+                        table returning condition on rows copied into it);
+                        rows matching none of the conditions are dropped
+        """
+        source = self._get_source(table_name)
+        copies = []
+        for table, columns, condition in targets:
+            values = collections.OrderedDict([('id', source.c.id)])
+            for name, value in columns.items():
+                values[name] = value(source)
+            copies.append((table, values, condition(source)))
+        self._copy_rows(source, copies)
+
+        with _begin_ddl(self.db) as conn:
+            self._drop_triggers(conn, source)
+            conn.execute('DROP TABLE "{}"'.format(table_name))
+
+    def _get_source(self, table_name):
+        """:returns table with the columns the table has in the store"""
+        return sa.table(table_name, *(
+            sa.column(name) for name in self.get_columns(table_name)))
+
+    def _copy_rows(self, source, copies):
+        """
+        Creates the tables rows are copied into with triggers copying rows
+        changed in the source table, unless it was done before, and copies
+        rows of the source table in chunks.
+        :param copies: list of (table, dict of column name -> SQL expression
+                       of the value, condition on copied rows or None)
+        """
+        def copy(table, values, condition, rows):
+            if condition is not None:
+                rows = sa.and_(rows, condition)
+            return table.insert().prefix_with('OR REPLACE').from_select(
+                list(values), sa.select(list(values.values())).where(rows))
+
+        if not _has_trigger(self.db, _get_trigger_name(source, 'INSERT')):
+            with _begin_ddl(self.db) as conn:
+                changed_rows, deleted_rows = [], []
+                for table, values, condition in copies:
+                    table.create(conn, checkfirst=True)
+                    changed_rows.append(_compile(conn, copy(
+                        table, values, condition,
+                        source.c.id == sa.literal_column('NEW.id'))))
+                    deleted_rows.append(
+                        'DELETE FROM "{}" WHERE id = OLD.id'.format(
+                            table.name))
+                bodies = {
+                    'INSERT': changed_rows,
+                    'UPDATE': deleted_rows + changed_rows,
+                    'DELETE': deleted_rows,
+                }
+                for event in _TRIGGER_EVENTS:
+                    conn.execute('CREATE TRIGGER "{}" AFTER {} ON "{}" '
+                                 'BEGIN {}; END'.format(
+                                     _get_trigger_name(source, event), event,
+                                     source.name, '; '.join(bodies[event])))
+                _set_progress(conn, self._step, 0, 0)
+
+        self._run_in_chunks(source, None, lambda conn, chunk: sum(
+            conn.execute(copy(table, values, condition, chunk)).rowcount
+            for table, values, condition in copies))
+
+    def _drop_triggers(self, conn, source):
+        for event in _TRIGGER_EVENTS:
+            conn.execute('DROP TRIGGER "{}"'.format(
+                _get_trigger_name(source, event)))
+
+    def _run_in_chunks(self, table, condition, apply):
+        """
+        Applies a change to chunks of rows of the table matching
+        the condition, recording the progress with each chunk.
+        :param apply: function of (connection, condition on ids of rows
+                      of the chunk) returning number of changed rows
+        """
+        ids = sa.select([table.c.id])
+        if condition is not None:
+            ids = ids.where(condition)
+        last_id, n_done = _get_progress(self.db, self._step)
+        n_total = n_done + self.db.execute(
+            sa.select([sa.func.count()]).select_from(
+                ids.where(table.c.id > last_id).alias())).scalar()
+        while True:
+            with self.db.begin() as conn:
+                chunk = ids.where(table.c.id > last_id) \
+                    .order_by(table.c.id).limit(self._chunk_size).alias()
+                high = conn.execute(
+                    sa.select([sa.func.max(chunk.c.id)])).scalar()
+                if high is None:
+                    break
+                n_done += apply(conn, sa.and_(table.c.id > last_id,
+                                              table.c.id <= high))
+                last_id = high
+                _set_progress(conn, self._step, last_id, n_done)
+            if self._progress is not None:
+                self._progress(self._step, n_done, max(n_total, n_done))
+
+
+@contextlib.contextmanager
+def _begin_ddl(db):
+    """
+    Begins a transaction which changes the schema too, the sqlite3 module
+    begins transactions only before changes of rows by itself.
+    """
+    with db.begin() as conn:
+        conn.execute('BEGIN')
+        yield conn
+
+
+def _get_table_names(db):
+    q = "SELECT name FROM sqlite_master WHERE type = 'table'"
+    return {row[0] for row in db.execute(q)}
+
+
+def _has_index(db, name):
+    q = sa.text("SELECT 1 FROM sqlite_master "
+                "WHERE type = 'index' AND name = :name")
+    return db.execute(q, name=name).scalar() is not None
+
+
+def _has_trigger(db, name):
+    q = sa.text("SELECT 1 FROM sqlite_master "
+                "WHERE type = 'trigger' AND name = :name")
+    return db.execute(q, name=name).scalar() is not None
+
+
+def _start(db, step):
+    """Records the start of the step unless it was started before."""
+    q = sa.select([_t.SchemaMigrations.c.version]).where(
+        _t.SchemaMigrations.c.version == step.version)
+    if db.execute(q).scalar() is None:
+        db.execute(_t.SchemaMigrations.insert().values(
+            version=step.version, description=step.description,
+            last_id=0, n_done=0, started_at=time.time()))
+
+
+def _get_progress(db, step):
+    """:returns (id of the last changed row, number of changed rows)"""
+    q = sa.select([_t.SchemaMigrations.c.last_id,
+                   _t.SchemaMigrations.c.n_done]).where(
+        _t.SchemaMigrations.c.version == step.version)
+    last_id, n_done = db.execute(q).fetchone()
+    return last_id or 0, n_done or 0
+
+
+def _set_progress(conn, step, last_id, n_done):
+    conn.execute(_t.SchemaMigrations.update().where(
+        _t.SchemaMigrations.c.version == step.version
+    ).values(last_id=last_id, n_done=n_done))
+
+
+def _make_shadow(table):
+    """
+    :returns copy of the table named as its shadow, without indexes
+             and client-side defaults
+    """
+    metadata = sa.MetaData()
+    for other in table.metadata.sorted_tables:
+        if other is not table:
+            # referenced by foreign keys
+            other.tometadata(metadata)
+    shadow = table.tometadata(metadata, name=_SHADOW_PREFIX + table.name)
+    shadow.indexes.clear()
+    for column in shadow.c:
+        # columns which are not copied get their server defaults,
+        # which triggers can use too
+        column.default = None
+    return shadow
+
+
+def _get_trigger_name(table, event):
+    return '{}{}_{}'.format(_SHADOW_PREFIX, table.name, event.lower())
+
+
+def _compile(conn, statement):
+    """:returns SQL of the statement with values of parameters inlined"""
+    return str(statement.compile(dialect=conn.dialect,
+                                 compile_kwargs={'literal_binds': True}))
+
+
+def _convert_run_times(migrator):
+    # times were stored as DATETIME strings, which are taken as UTC
+    runs = _t.Runs.c
+
+    def seconds(column):
+        return sa.case([(
+            sa.func.typeof(column) == 'text',
+            (sa.func.julianday(column) - 2440587.5) * 86400.0
+        )], else_=column)
+
+    migrator.update_in_chunks(_t.Runs, {
+        'started_at': seconds(runs.started_at),
+        'finished_at': seconds(runs.finished_at),
+    }, sa.or_(sa.func.typeof(runs.started_at) == 'text',
+              sa.func.typeof(runs.finished_at) == 'text'))
+
+
+def _add_tiers(migrator):
+    migrator.add_column(_t.Models.c.tier)
+    migrator.add_column(_t.Runs.c.tier)
+
+
+def _index_runs_by_models(migrator):
+    for index in _t.Runs.indexes:
+        migrator.create_index(index)
+
+
+def _rebuild_tombstones(migrator):
+    # tombstones were unique per kind and uid before they got tiers
+    if 'tier' not in migrator.get_columns(_t.Tombstones.name):
+        migrator.rebuild_table(_t.Tombstones)
+
+
+def _index_attribute_values(migrator):
+    for index in _AttributeValues.indexes:
+        migrator.create_index(index)
+
+
+def _encode_choices(migrator):
+    migrator.add_column(_t.Attributes.c.codes)
+    q = _t.Attributes.select().where(sa.and_(
+        _t.Attributes.c.type == AttributeType.Enum,
+        _t.Attributes.c.codes.is_(None)))
+    codes = collections.OrderedDict(
+        (row['id'], ChoiceCodes.from_options(row['options']))
+        for row in migrator.db.execute(q).fetchall())
+    if not codes:
+        return
+
+    # values which are not choices of their enumerations are kept
+    # as extra choices, which fsck reports as invalid values
+    av = _AttributeValues
+    q = sa.select([av.c.attr_id, av.c.value]).where(sa.and_(
+        av.c.attr_id.in_(list(codes)), av.c.value.isnot(None),
+    )).group_by(av.c.attr_id, av.c.value).order_by(sa.func.min(av.c.id))
+    unknown = collections.OrderedDict()
+    for attr_id, value in migrator.db.execute(q).fetchall():
+        if value not in codes[attr_id].choices:
+            unknown.setdefault(attr_id, []).append(value)
+    unusable = [(attr_id, value) for attr_id, values in unknown.items()
+                for value in values if not value or ';' in value]
+    if unusable:
+        raise exceptions.InvalidStateError(
+            'Values of enumerations cannot be encoded, fix or delete them '
+            'first: {}'.format(', '.join(
+                'attr_id {} value {!r}'.format(*pair) for pair in unusable)))
+    for attr_id, values in unknown.items():
+        codes[attr_id] = ChoiceCodes(codes[attr_id].choices + values)
+        migrator.log('values {} of attribute {} are not among choices {}, '
+                     'they are kept until fixed'.format(
+                         ', '.join(map(repr, values)), attr_id,
+                         ';'.join(choice for choice in codes[attr_id].choices
+                                  if choice not in values)))
+
+    def encode(values):
+        whens = [
+            (sa.and_(values.c.attr_id == attr_id, values.c.value == choice),
+             attr_codes.encode(choice))
+            for attr_id, attr_codes in codes.items()
+            for choice in attr_codes.choices if choice
+        ]
+        return sa.case(whens, else_=values.c.value)
+
+    def save_codes(conn):
+        for attr_id, attr_codes in codes.items():
+            conn.execute(_t.Attributes.update().where(
+                _t.Attributes.c.id == attr_id
+            ).values(codes=attr_codes.serialize()))
+        # statistics of the values as they were stored before
+        conn.execute(_t.AttributeStats.delete().where(
+            _t.AttributeStats.c.attr_id.in_(list(codes))))
+
+    migrator.rebuild_table(_AttributeValues, {'value': encode}, save_codes)
+
+
+def _analyze_attribute_values(migrator):
+    from tensorlab.local_storage import stats
+    if _AttributeValues.name in _get_table_names(migrator.db):
+        # values are analyzed once they are split
+        return
+    q = sa.select([_t.Attributes.c.id]).where(
+        _t.Attributes.c.id.notin_(sa.select([_t.AttributeStats.c.attr_id])))
+    if migrator.db.execute(q).first() is not None:
+        stats.AttributeStatistics(migrator.db).analyze()
+
+
+def _split_attribute_values(migrator):
+    if not migrator.get_columns(_AttributeValues.name):
+        return
+
+    def copy_into(values, table):
+        # values of deleted models and runs left behind are dropped
+        return values, {
+            _t.get_target_id(values).name: lambda source: sa.select(
+                [table.c.id]).where(
+                table.c.uid == source.c.target_uid).as_scalar(),
+            'attr_id': lambda source: source.c.attr_id,
+            'value': lambda source: source.c.value,
+        }, lambda source: source.c.target_uid.in_(sa.select([table.c.uid]))
+
+    migrator.split_table(_AttributeValues.name, [
+        copy_into(_t.ModelValues, _t.Models),
+        copy_into(_t.RunValues, _t.Runs),
+    ])
+
+STEPS = [
+    Step(1, 'Store times of runs as seconds', _convert_run_times),
+    Step(2, 'Add storage tiers of models and runs', _add_tiers),
+    Step(3, 'Index runs by their models', _index_runs_by_models),
+    Step(4, 'Rebuild tombstones with tiers', _rebuild_tombstones),
+    Step(5, 'Index attribute values', _index_attribute_values),
+    Step(6, 'Store choices of enumerations as codes', _encode_choices),
+    Step(7, 'Compute statistics of attribute values',
+         _analyze_attribute_values),
+    Step(8, 'Split attribute values of models and runs',
+         _split_attribute_values),
+    Step(9, 'Compute statistics of split attribute values',
+         _analyze_attribute_values),
+]
+
+VERSION = STEPS[-1].version
@@ -0,0 +1,444 @@
+"""
+Compilation of filtering predicates on attributes into SQL.
+
+Each attribute used by a predicate is joined to the filtered table once,
+as an outer join of ModelValues or RunValues, so missing values are NULL
+and comparisons with them follow the three-valued logic expected by
+tensorlab.core.predicate_optimizer.
+
+Values of literals, ids of attributes and ids of targets are bound
+as parameters, so the compiled statement depends only on the shape
+of the predicate and is cached for predicates differing in values.
+"""
+import operator
+import collections
+import sqlalchemy as sa
+from tensorlab import exceptions
+from tensorlab.core.attributeoptions import AttributeType
+from tensorlab.core.attribute_predicates import (
+    Op, Identifier, Literal, UnaryOperation, BinaryOperation
+)
+from tensorlab.core import (
+    predicate_optimizer, attribute_stats, cache, ordering
+)
+from tensorlab.local_storage.db import tables as _t
+
+
+_statements = cache.register('sql_statements', 256)
+
+# temporary table of ids of rows matched by a predicate, see save_filtered
+_Matched = sa.Table('Matched', sa.MetaData(),
+                    sa.Column('id', sa.Integer, primary_key=True),
+                    prefixes=['TEMPORARY'])
+
+
+_OPERATORS = {
+    Op.Eq: operator.eq, Op.Ne: operator.ne,
+    Op.Gt: operator.gt, Op.Lt: operator.lt,
+    Op.Ge: operator.ge, Op.Le: operator.le,
+    Op.In: lambda left, right: left.in_(right),
+    Op.Between: lambda left, right: left.between(*right),
+    Op.StartsWith: lambda left, right: left.startswith(right),
+}
+
+_LITERAL_OPERATORS = (Op.In, Op.Between, Op.StartsWith)
+
+# comparisons of choices of enumerations whose values are stored as codes,
+# which are matched against all choices
+_CHOICE_OPERATORS = {
+    Op.Gt: operator.gt, Op.Lt: operator.lt,
+    Op.Ge: operator.ge, Op.Le: operator.le,
+    Op.Between: lambda choice, bounds: bounds[0] <= choice <= bounds[1],
+    Op.StartsWith: lambda choice, prefix: choice.startswith(prefix),
+}
+
+# values of attributes of these types are compared after casting
+SQL_TYPES = {
+    AttributeType.Integer: sa.Integer,
+    AttributeType.Float: sa.Float,
+}
+
+
+# Target of an attribute in filtered queries.
+# attr: tensorlab.core.attributes.Attribute
+# target_id: column or value to match model_id of ModelValues
+#            or run_id of RunValues with, depending on attr.runtime
+# attr_ids: ids of all definitions of the attribute whose values are
+#           matched, only the id of attr if None; definitions overriding
+#           each other in subgroups have different ids
+Target = collections.namedtuple('Target', ['attr', 'target_id', 'attr_ids'])
+Target.__new__.__defaults__ = (None,)
+
+
+def get_attr_ids(target):
+    """:returns ids of definitions of the attribute of the target"""
+    attr_ids = target[2] if len(target) > 2 else None
+    return attr_ids or [target[0].key['id']]
+
+
+# Select query of a storage which can be filtered by predicates.
+# name: hashable key identifying the query built by make_query
+# make_query: function returning sqlalchemy.sql.Select on the table
+#             whose varying values are bound parameters
+# params: dict of values of these parameters
+# get_targets: function returning targets of attributes, see filter_query
+# get_stats: function of a list of attribute names returning dict
+#            of name -> tensorlab.core.attribute_stats.AttributeStats,
+#            which reads no statistics while they do not change
+# order_by: list of columns of the table rows are ordered by by default
+#           and after ordering by attributes
+FilterSource = collections.namedtuple(
+    'FilterSource', ['name', 'table', 'make_query', 'params', 'get_targets',
+                     'get_stats', 'order_by'])
+
+
+def compile_filtered(db, source, predicate, order_by=None, limit=None):
+    """
+    Compiles the query of the source restricted by the predicate.
+    Conditions on several attributes are ordered by their selectivity
+    estimated from statistics, so the most selective attributes are joined
+    first. Statements are cached per name of the query, shape of the
+    simplified predicate, ordering and kinds of attributes they use.
+    :type source: FilterSource
+    :type predicate: tensorlab.core.attribute_predicates.Expression
+    :param order_by: attributes to order rows by before the default order
+                     of the source, see tensorlab.core.ordering
+    :param limit: maximal number of returned rows
+    :returns (compiled statement, dict of values of its parameters)
+             or None if the predicate is never true
+    """
+    order = ordering.parse_order_by(order_by)
+    if limit is not None and limit < 0:
+        raise exceptions.IllegalArgumentError(
+            'Limit cannot be negative: {}'.format(limit))
+    if predicate is not None:
+        predicate = predicate_optimizer.optimize(predicate)
+        if predicate == predicate_optimizer.FALSE:
+            return None
+        if predicate == predicate_optimizer.TRUE:
+            predicate = None
+    compiler = _Compiler(
+        source.get_targets() if predicate is not None or order else {})
+    condition = None
+    if predicate is not None:
+        names = predicate_optimizer.get_identifiers(predicate)
+        if len(names) > 1:
+            stats = source.get_stats(names)
+            predicate = attribute_stats.order_by_selectivity(
+                predicate, stats.get)
+        condition = compiler.compile(predicate)
+    order_clauses = compiler.order(order)
+    params = dict(source.params, **compiler.params)
+    if limit is not None:
+        params['limit'] = limit
+    key = (db.dialect.name, source.name, _shape(predicate), tuple(order),
+           tuple(compiler.shape), limit is not None)
+
+    def make_statement(key):
+        query = _filter(source.make_query(), source.table,
+                        compiler, condition)
+        query = query.order_by(*(order_clauses + list(source.order_by)))
+        if limit is not None:
+            query = query.limit(sa.bindparam('limit'))
+        return query.compile(dialect=db.dialect)
+
+    return _statements.get_or_create(key, make_statement), params
+
+
+def select_filtered(db, source, predicate, order_by=None, limit=None):
+    """
+    :returns list of rows of the source matching the predicate,
+             see compile_filtered
+    """
+    compiled = compile_filtered(db, source, predicate, order_by, limit)
+    if compiled is None:
+        return []
+    cursor = db.execute(*compiled)
+    rows = cursor.fetchall()
+    cursor.close()
+    return rows
+
+
+def count_filtered(db, source, predicate):
+    """
+    Counts rows of the source matching the predicate.
+    The statement is not cached.
+    """
+    query = build_filtered(source, predicate)
+    if query is None:
+        return 0
+    count = sa.select([sa.func.count()]).select_from(query.alias())
+    return db.execute(count, source.params).scalar()
+
+
+def save_filtered(conn, source, predicate, id_column):
+    """
+    Saves ids of rows of the source matching the predicate into
+    a temporary table of the connection, so statements which change
+    attribute values go on acting on the rows matched before them.
+    Must be called within their transaction.
+    :param id_column: integer column of the table of the source
+    :returns (sqlalchemy.sql.Select of the saved ids, number of them)
+    """
+    _Matched.create(conn, checkfirst=True)
+    conn.execute(_Matched.delete())
+    saved = sa.select([_Matched.c.id])
+    query = build_filtered(source, predicate)
+    if query is None:
+        return saved, 0
+    filtered = query.alias('filtered')
+    conn.execute(_Matched.insert().from_select(
+        ['id'], sa.select([filtered.corresponding_column(id_column)])
+    ), source.params)
+    # rowcount is not reported for inserts from queries with a WITH clause
+    n_saved = conn.execute(
+        sa.select([sa.func.count()]).select_from(_Matched)).scalar()
+    return saved, n_saved
+
+
+def build_filtered(source, predicate):
+    """
+    Builds the query of the source restricted by the predicate
+    for embedding it into other queries, which are executed
+    with parameters of the source.
+    :returns sqlalchemy.sql.Select or None if the predicate is never true
+    """
+    query = source.make_query()
+    if predicate is None:
+        return query
+    return filter_query(query, source.table, predicate, source.get_targets())
+
+
+def filter_query(query, table, predicate, targets, simplify=True):
+    """
+    Restricts the select query on the table by the predicate.
+    The predicate is simplified first, so for predicates which are never
+    true no query has to be executed at all.
+    :type query: sqlalchemy.sql.Select
+    :type predicate: tensorlab.core.attribute_predicates.Expression
+    :param targets: dict of attribute name -> Target
+                    or (tensorlab.core.attributes.Attribute, column or value
+                    to match model_id or run_id of values with)
+    :param simplify: if false, the predicate is compiled as is
+    :returns filtered query or None if the predicate is a contradiction
+    """
+    if simplify:
+        predicate = predicate_optimizer.optimize(predicate)
+        if predicate == predicate_optimizer.FALSE:
+            return None
+        if predicate == predicate_optimizer.TRUE:
+            return query
+    compiler = _Compiler(targets)
+    return _filter(query, table, compiler, compiler.compile(predicate))
+
+
+def _filter(query, table, compiler, condition):
+    if compiler.joins:
+        from_obj = table
+        for alias, onclause in compiler.joins:
+            from_obj = from_obj.outerjoin(alias, onclause)
+        query = query.select_from(from_obj)
+    if condition is not None:
+        query = query.where(condition)
+    return query
+
+
+def _shape(expr):
+    """:returns serialized expression with placeholders for values"""
+    if expr is None:
+        return ''
+    if isinstance(expr, Literal):
+        if isinstance(expr.value, tuple):
+            return '({})'.format(', '.join('?' for _ in expr.value))
+        if expr.value is None or isinstance(expr.value, bool):
+            return repr(expr.value)
+        return '?'
+    if isinstance(expr, Identifier):
+        return expr.name
+    if isinstance(expr, UnaryOperation):
+        return 'not {}'.format(_shape(expr.arg))
+    return '({} {} {})'.format(_shape(expr.left), expr.op, _shape(expr.right))
+
+
+class _Compiler:
+
+    def __init__(self, targets):
+        self._targets = targets
+        self._columns = {}
+        self.joins = []
+        # values of bound parameters and everything else
+        # the compiled statement depends on
+        self.params = {}
+        self.shape = []
+
+    def compile(self, expr):
+        if isinstance(expr, UnaryOperation):
+            return sa.not_(self._as_condition(expr.arg))
+        if isinstance(expr, BinaryOperation):
+            if expr.op == Op.And:
+                return sa.and_(self.compile(expr.left),
+                               self.compile(expr.right))
+            if expr.op == Op.Or:
+                return sa.or_(self.compile(expr.left),
+                              self.compile(expr.right))
+            return self._compile_comparison(expr)
+        return self._as_condition(expr)
+
+    def order(self, order):
+        """
+        :param order: list of (attribute name, whether it is descending)
+        :returns list of clauses ordering by typed values of attributes
+                 with defaults, missing values go last
+        """
+        clauses = []
+        for name, descending in order:
+            attr, column = self._get_column(name)
+            clauses.append(column.is_(None))
+            if attr.codes is not None:
+                column = self._rank_choices(attr, column)
+            clauses.append(column.desc() if descending else column)
+        return clauses
+
+    def _as_condition(self, expr):
+        if isinstance(expr, Literal):
+            return sa.true() if expr.value else sa.false()
+        if isinstance(expr, Identifier):
+            raise exceptions.IllegalArgumentError(
+                'Attribute "{}" is not a condition, compare it with a value'
+                .format(expr.name))
+        return self.compile(expr)
+
+    def _compile_comparison(self, expr):
+        left, right = expr.left, expr.right
+        if isinstance(left, Literal) and isinstance(right, Literal):
+            # not folded only if the predicate was not simplified
+            return _OPERATORS[expr.op](sa.literal(left.value), right.value)
+        op = expr.op
+        if isinstance(left, Literal) and op in predicate_optimizer.MIRRORED:
+            left, right = right, left
+            op = predicate_optimizer.MIRRORED[op]
+        if not isinstance(left, Identifier) or (
+                op in _LITERAL_OPERATORS and not isinstance(right, Literal)):
+            raise exceptions.IllegalArgumentError(
+                'Cannot compare {}'.format(expr.serialize()))
+
+        attr, column = self._get_column(left.name)
+        if isinstance(right, Identifier):
+            return _OPERATORS[op](column, self._get_column(right.name)[1])
+        if right.value is None:
+            return sa.null()
+        if attr.codes is not None and op in _CHOICE_OPERATORS:
+            return self._match_choices(attr, column, op, right.value)
+        if op == Op.In:
+            return column.in_([self._bind(_encode(attr, v))
+                               for v in right.value])
+        if op == Op.Between:
+            low, high = right.value
+            return column.between(self._bind(attr.normalize_value(low)),
+                                  self._bind(attr.normalize_value(high)))
+        if op == Op.StartsWith:
+            return self._starts_with(attr, column, right.value)
+        return _OPERATORS[op](
+            column, self._bind(_encode(attr, right.value)))
+
+    def _bind(self, value, prefix='p'):
+        name = '{}{}'.format(prefix, len(self.params))
+        self.params[name] = value
+        # untyped, so the type of the compared column is used
+        return sa.bindparam(name, value, type_=sa.types.NullType())
+
+    def _get_column(self, name):
+        if name not in self._columns:
+            if name not in self._targets:
+                raise exceptions.LookupError(
+                    'Attribute "{}" does not exist'.format(name))
+            target = self._targets[name]
+            attr, target_id = target[:2]
+            attr_ids = get_attr_ids(target)
+            is_column = isinstance(target_id, sa.sql.ColumnElement)
+            if not is_column:
+                target_id = self._bind(target_id, 't')
+            alias = _t.get_values(attr.runtime).alias(
+                'attr{}'.format(len(self.joins)))
+            if len(attr_ids) == 1:
+                condition = alias.c.attr_id == self._bind(attr_ids[0], 'a')
+            else:
+                condition = alias.c.attr_id.in_(
+                    [self._bind(attr_id, 'a') for attr_id in attr_ids])
+            self.joins.append((alias, sa.and_(
+                _t.get_target_id(alias) == target_id, condition)))
+            column = alias.c.value
+            if attr.default is not None:
+                default = attr.default
+                if attr.codes is not None:
+                    default = attr.codes.encode(default)
+                column = sa.func.coalesce(column, self._bind(default, 'd'))
+            if attr.type in SQL_TYPES:
+                column = sa.cast(column, SQL_TYPES[attr.type])
+            self.shape.append((name, is_column, attr.runtime, len(attr_ids),
+                               attr.default is None, SQL_TYPES.get(attr.type)))
+            self._columns[name] = attr, column
+        return self._columns[name]
+
+    def _match_choices(self, attr, column, op, value):
+        """
+        Compiles the comparison of an enumeration stored as codes into
+        a match of codes of the choices satisfying it.
+        """
+        if op == Op.StartsWith:
+            if not isinstance(value, str):
+                raise exceptions.IllegalArgumentError(
+                    'Only string values can be matched by prefix')
+        elif op == Op.Between:
+            value = tuple(attr.normalize_value(v) for v in value)
+        else:
+            value = attr.normalize_value(value)
+        compare = _CHOICE_OPERATORS[op]
+        codes = [attr.codes.encode(choice) for choice in _get_choices(attr)
+                 if compare(choice, value)]
+        self.shape.append(len(codes))
+        # no code is empty, so an empty match is false for any value
+        # but is unknown for missing ones, as comparisons are
+        return column.in_([self._bind(code) for code in codes or ['']])
+
+    def _rank_choices(self, attr, column):
+        """
+        :returns expression of positions of choices of an enumeration
+                 stored as codes in the order of choices, not of codes
+        """
+        choices = sorted(_get_choices(attr))
+        self.shape.append(len(choices))
+        if not choices:
+            return column
+        return sa.case([
+            (column == self._bind(attr.codes.encode(choice)), i)
+            for i, choice in enumerate(choices)
+        ])
+
+    def _starts_with(self, attr, column, prefix):
+        """
+        Compiles the prefix match into a range of strings,
+        so an index on values can be used instead of LIKE.
+        """
+        if attr.type in SQL_TYPES or not isinstance(prefix, str):
+            raise exceptions.IllegalArgumentError(
+                'Only string values can be matched by prefix')
+        condition = column >= self._bind(prefix)
+        upper = prefix.rstrip(chr(0x10FFFF))
+        self.shape.append(bool(upper))
+        if upper:
+            upper = upper[:-1] + chr(ord(upper[-1]) + 1)
+            condition = sa.and_(condition, column < self._bind(upper))
+        return condition
+
+
+def _encode(attr, value):
+    """:returns the value as it is compared with stored values"""
+    value = attr.normalize_value(value)
+    if attr.codes is not None:
+        return attr.codes.encode(value)
+    return value
+
+
+def _get_choices(attr):
+    return [choice for choice in attr.options.split(';') if choice]
@@ -1,5 +1,6 @@
 import sqlalchemy as sa
 from tensorlab.core.attributeoptions import AttributeType
+from tensorlab.local_storage.files import DEFAULT_TIER
 
 
 _metadata = sa.MetaData()
@@ -24,6 +25,8 @@ Models = sa.Table(
     sa.Column('uid', sa.String(16), unique=True),
     sa.Column('group_id', sa.ForeignKey('Groups.id')),
     sa.Column('name', sa.String(60)),
+    sa.Column('tier', sa.String(30), nullable=False,
+              default=DEFAULT_TIER, server_default=DEFAULT_TIER),
 
     sa.UniqueConstraint('group_id', 'name'),
 )
@@ -34,9 +37,11 @@ Runs = sa.Table(
 
     sa.Column('id', sa.Integer, primary_key=True),
     sa.Column('uid', sa.String(16), unique=True),
-    sa.Column('model_id', sa.ForeignKey('Models.id')),
-    sa.Column('started_at', sa.DateTime),
-    sa.Column('finished_at', sa.DateTime),
+    sa.Column('model_id', sa.ForeignKey('Models.id'), index=True),
+    sa.Column('started_at', sa.Float),
+    sa.Column('finished_at', sa.Float),
+    sa.Column('tier', sa.String(30), nullable=False,
+              default=DEFAULT_TIER, server_default=DEFAULT_TIER),
 )
 
 
@@ -51,22 +56,213 @@ Attributes = sa.Table(
     sa.Column('default', sa.String(100)),
     sa.Column('nullable', sa.Boolean),
     sa.Column('runtime', sa.Boolean),
+    # dictionary of codes values of enumerations are stored as,
+    # see tensorlab.core.attributeoptions.ChoiceCodes
+    sa.Column('codes', sa.Text),
 
     sa.UniqueConstraint('group_id', 'name'),
 )
 
 
-AttributeValues = sa.Table(
-    'AttributeValues', _metadata,
+# Values of attributes of models, encoded as by
+# tensorlab.core.attributes.Attribute.encode_value.
+ModelValues = sa.Table(
+    'ModelValues', _metadata,
+
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('model_id', sa.ForeignKey('Models.id')),
+    sa.Column('attr_id', sa.ForeignKey('Attributes.id')),
+    sa.Column('value', sa.String(60)),
+
+    sa.UniqueConstraint('model_id', 'attr_id'),
+    # range scans for filtering by predicates
+    sa.Index('ix_ModelValues_attr_id_value', 'attr_id', 'value'),
+)
+
+
+# Values of runtime attributes of runs, see ModelValues.
+RunValues = sa.Table(
+    'RunValues', _metadata,
 
     sa.Column('id', sa.Integer, primary_key=True),
-    sa.Column('target_uid', sa.String(16)),
+    sa.Column('run_id', sa.ForeignKey('Runs.id')),
     sa.Column('attr_id', sa.ForeignKey('Attributes.id')),
     sa.Column('value', sa.String(60)),
 
-    sa.UniqueConstraint('target_uid', 'attr_id'),
+    sa.UniqueConstraint('run_id', 'attr_id'),
+    sa.Index('ix_RunValues_attr_id_value', 'attr_id', 'value'),
+)
+
+VALUE_TABLES = (ModelValues, RunValues)
+
+
+# Data directories of deleted models and runs which are still waiting
+# to be removed from disk by the garbage collector.
+# tier is the storage tier the directory is located on.
+Tombstones = sa.Table(
+    'Tombstones', _metadata,
+
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('kind', sa.String(10)),
+    sa.Column('uid', sa.String(16)),
+    sa.Column('tier', sa.String(30), nullable=False,
+              default=DEFAULT_TIER, server_default=DEFAULT_TIER),
+    sa.Column('created_at', sa.Float),
+
+    sa.UniqueConstraint('kind', 'uid', 'tier'),
+)
+
+
+# Cached sizes of data directories of models and runs.
+# dirs_mtime is the latest modification time among the data directory
+# and its subdirectories at the moment of scanning.
+DiskUsage = sa.Table(
+    'DiskUsage', _metadata,
+
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('kind', sa.String(10)),
+    sa.Column('uid', sa.String(16)),
+    sa.Column('n_bytes', sa.Integer),
+    sa.Column('n_files', sa.Integer),
+    sa.Column('dirs_mtime', sa.Float),
+    sa.Column('scanned_at', sa.Float),
+
+    sa.UniqueConstraint('kind', 'uid'),
+)
+
+
+# Content-addressed store of deduplicated files.
+# refcount is the number of BlobFiles rows referencing the blob,
+# unreferenced blobs are removed by the garbage collector.
+Blobs = sa.Table(
+    'Blobs', _metadata,
+
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('digest', sa.String(64), unique=True),
+    sa.Column('size', sa.Integer),
+    sa.Column('refcount', sa.Integer),
+)
+
+
+# Files within data directories that were deduplicated.
+# size, mtime_ns and inode are taken after linking the file to its blob,
+# so unchanged files are recognized without hashing them again.
+BlobFiles = sa.Table(
+    'BlobFiles', _metadata,
+
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('kind', sa.String(10)),
+    sa.Column('uid', sa.String(16)),
+    sa.Column('path', sa.String(255)),
+    sa.Column('blob_id', sa.ForeignKey('Blobs.id'), index=True),
+    sa.Column('size', sa.Integer),
+    sa.Column('mtime_ns', sa.Integer),
+    sa.Column('inode', sa.Integer),
+
+    sa.UniqueConstraint('kind', 'uid', 'path'),
+)
+
+
+# Costs of seeding run data directories from data directories of models,
+# one row per cloning method used for the run.
+# seconds is the time spent by all copying threads together.
+RunSeeds = sa.Table(
+    'RunSeeds', _metadata,
+
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('run_id', sa.ForeignKey('Runs.id'), index=True),
+    sa.Column('method', sa.String(10)),
+    sa.Column('n_files', sa.Integer),
+    sa.Column('n_bytes', sa.Integer),
+    sa.Column('seconds', sa.Float),
+)
+
+
+# Runs whose data directories were packed into bundles (see files.bundles).
+# n_files and n_bytes describe the packed directory,
+# bundle_bytes is the size of the compressed bundle.
+RunArchives = sa.Table(
+    'RunArchives', _metadata,
+
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('run_id', sa.ForeignKey('Runs.id'), unique=True),
+    sa.Column('n_files', sa.Integer),
+    sa.Column('n_bytes', sa.Integer),
+    sa.Column('bundle_bytes', sa.Integer),
+    sa.Column('archived_at', sa.Float),
+)
+
+
+# How many times attributes were used by predicates filtering
+# models or runs, for advising indexes.
+# target is "models" or "runs".
+FilterLog = sa.Table(
+    'FilterLog', _metadata,
+
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('target', sa.String(10)),
+    sa.Column('attr_id', sa.ForeignKey('Attributes.id')),
+    sa.Column('n_filters', sa.Integer),
+    sa.Column('last_filtered_at', sa.Float),
+
+    sa.UniqueConstraint('target', 'attr_id'),
+)
+
+
+# Statistics of values of attributes, see tensorlab.local_storage.stats.
+# Values are encoded the same way as in ModelValues and RunValues.
+# hll: registers of the HyperLogLog sketch of distinct values,
+#      n_distinct: its estimate
+# histogram: JSON list of bounds of equi-depth buckets
+# frequencies: JSON object of value -> count of tracked values
+# n_changed: number of values inserted and deleted since analyzed_at
+AttributeStats = sa.Table(
+    'AttributeStats', _metadata,
+
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('attr_id', sa.ForeignKey('Attributes.id'), unique=True),
+    sa.Column('n_values', sa.Integer),
+    sa.Column('n_nulls', sa.Integer),
+    sa.Column('min_value', sa.String(60)),
+    sa.Column('max_value', sa.String(60)),
+    sa.Column('hll', sa.LargeBinary),
+    sa.Column('n_distinct', sa.Integer),
+    sa.Column('histogram', sa.Text),
+    sa.Column('frequencies', sa.Text),
+    sa.Column('n_changed', sa.Integer),
+    sa.Column('analyzed_at', sa.Float),
 )
 
 
+# Steps of migrations of the schema started on the store,
+# see tensorlab.local_storage.db.migrations.
+# last_id and n_done: progress of the step changing rows in chunks,
+# the id of the last changed row and the number of changed rows
+# finished_at: NULL while the step is not finished
+SchemaMigrations = sa.Table(
+    'SchemaMigrations', _metadata,
+
+    sa.Column('version', sa.Integer, primary_key=True, autoincrement=False),
+    sa.Column('description', sa.String(100)),
+    sa.Column('last_id', sa.Integer),
+    sa.Column('n_done', sa.Integer),
+    sa.Column('started_at', sa.Float),
+    sa.Column('finished_at', sa.Float),
+)
+
+
+def get_values(runtime):
+    """:returns table of values of runtime attributes or of other ones"""
+    return RunValues if runtime else ModelValues
+
+
+def get_target_id(values):
+    """
+    :param values: ModelValues, RunValues or their alias
+    :returns column of the id of the model or run the values belong to
+    """
+    return values.c.run_id if 'run_id' in values.c else values.c.model_id
+
+
 def initialize_db(connection):
     _metadata.create_all(bind=connection)
@@ -36,6 +36,21 @@ def conjunction(table, *filters, **kwfilters):
     )
 
 
+def select_subgroup_ids(group_id):
+    """
+    :returns query of ids of the group and all its descendants
+    """
+    tree = sa.select([_t.Groups.c.id]) \
+        .where(_t.Groups.c.id == group_id) \
+        .cte('subgroups', recursive=True)
+    children = sa.select([_t.Groups.c.id]).where(sa.and_(
+        _t.Groups.c.parent_id == tree.c.id,
+        _t.Groups.c.id != _t.Groups.c.parent_id,
+    ))
+    tree = tree.union_all(children)
+    return sa.select([tree.c.id])
+
+
 def aggregate(db, table, func, *filters, **kwfilters):
     q = table.select([func])
     if filters or kwfilters:
@@ -87,13 +102,13 @@ def build_attr_predicate(attr_pairs):
         if isinstance(value, (tuple, list, set)):
             inner_predicate = sa.or_(
                 _t.AttributeValues.c.value ==
-                attr.type.encode(v, attr.options)
+                attr.encode_value(v)
                 for v in value
             )
         else:
             inner_predicate = (
                 _t.AttributeValues.c.value ==
-                attr.type.encode(value, attr.options)
+                attr.encode_value(value)
             )
         value_predicate.append(sa.and_(
             inner_predicate,
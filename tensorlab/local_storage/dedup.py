@@ -0,0 +1,232 @@
+"""
+Content-addressed deduplication of files within data directories.
+
+Identical files of different models and runs are replaced by clones
+of a single blob kept under the "blobs" directory of the storage.
+Each deduplicated file is recorded in the DB with its size, mtime and
+inode, so subsequent passes hash only new or modified files.
+
+Blobs can only be linked within a filesystem, so only data directories
+on the default storage tier are deduplicated.
+
+Reflinks are preferred since they are copy-on-write. Hardlinked blobs
+share their metadata with all deduplicated files, so they are made
+read-only: in-place writes to such files fail instead of silently
+changing all other copies.
+"""
+import os
+import stat
+import collections
+from concurrent import futures
+import sqlalchemy as sa
+from tensorlab.local_storage.db import utils, tables as _t
+from tensorlab.local_storage import files
+
+
+_KINDS = (
+    (files.MODELS, _t.Models),
+    (files.RUNS, _t.Runs),
+)
+
+
+DedupReport = collections.namedtuple(
+    'DedupReport', ['n_files', 'n_hashed', 'n_linked', 'reclaimed_bytes'])
+
+
+def release(conn, kind, uids):
+    """
+    Drops blob references of data directories whose objects are deleted.
+    Must be called within the transaction which deletes the objects.
+    :param kind: files.MODELS or files.RUNS
+    :param uids: query of uids of deleted objects
+    """
+    refs = sa.and_(
+        _t.BlobFiles.c.kind == kind,
+        _t.BlobFiles.c.uid.in_(uids),
+    )
+    n_refs = sa.select([sa.func.count()]).where(sa.and_(
+        refs, _t.BlobFiles.c.blob_id == _t.Blobs.c.id,
+    )).as_scalar()
+    conn.execute(
+        _t.Blobs.update()
+        .where(_t.Blobs.c.id.in_(
+            sa.select([_t.BlobFiles.c.blob_id]).where(refs)))
+        .values(refcount=_t.Blobs.c.refcount - n_refs)
+    )
+    conn.execute(_t.BlobFiles.delete().where(refs))
+
+
+class Deduplicator:
+    """
+    :param methods: cloning methods to try, in order of preference;
+                    see tensorlab.local_storage.files.copying
+    :param n_workers: number of threads which walk directories and hash files
+    :param chunk_size: number of data directories processed at once
+    """
+
+    def __init__(self, db, root_dir,
+                 methods=(files.REFLINK, files.HARDLINK),
+                 n_workers=8, chunk_size=100):
+        self._db = db
+        self._root = root_dir
+        self.set_methods(methods)
+        self._n_workers = n_workers
+        self._chunk_size = chunk_size
+
+    def set_methods(self, methods):
+        if files.COPY in methods:
+            raise ValueError('Copying files does not deduplicate them')
+        self._methods = tuple(methods)
+
+    def run(self, kinds=(files.MODELS, files.RUNS)):
+        """
+        Makes a deduplication pass over data directories of given kinds.
+        :rtype: DedupReport
+        """
+        totals = [0, 0, 0, 0]
+        with futures.ThreadPoolExecutor(self._n_workers) as pool:
+            for kind, table in _KINDS:
+                if kind not in kinds:
+                    continue
+                q = sa.select([table.c.uid]) \
+                    .where(table.c.tier == files.DEFAULT_TIER)
+                uids = [row[0] for row in utils.read_many(self._db, q)]
+                for start in range(0, len(uids), self._chunk_size):
+                    report = self._process(
+                        pool, kind, uids[start:start+self._chunk_size])
+                    totals = [a + b for a, b in zip(totals, report)]
+        return DedupReport(*totals)
+
+    def count_unreferenced(self):
+        """:returns number of blobs waiting for the garbage collector"""
+        q = sa.select([sa.func.count()]).where(_t.Blobs.c.refcount <= 0)
+        return self._db.execute(q).scalar()
+
+    def _process(self, pool, kind, uids):
+        known = {
+            (row['uid'], row['path']): row
+            for row in utils.read_many(self._db, _t.BlobFiles.select().where(
+                sa.and_(_t.BlobFiles.c.kind == kind,
+                        _t.BlobFiles.c.uid.in_(uids))))
+        }
+
+        listings = pool.map(
+            lambda uid: (uid, list(files.iter_files(self._data_dir(kind, uid)))),
+            uids)
+        candidates = []
+        n_files = 0
+        for uid, listing in listings:
+            for rel_path, st in listing:
+                n_files += 1
+                record = known.pop((uid, rel_path), None)
+                if record is not None and _is_unchanged(record, st):
+                    continue
+                candidates.append((uid, rel_path, st, record))
+        # whatever left in "known" was removed from the data directories
+        vanished = list(known.values())
+
+        def hash_candidate(candidate):
+            uid, rel_path = candidate[:2]
+            try:
+                return files.hash_file(
+                    os.path.join(self._data_dir(kind, uid), rel_path))
+            except FileNotFoundError:
+                # removed since it was listed
+                return None
+
+        digests = pool.map(hash_candidate, candidates)
+
+        n_linked = 0
+        reclaimed = 0
+        with self._db.begin() as conn:
+            for record in vanished:
+                self._unref(conn, record['blob_id'])
+                conn.execute(_t.BlobFiles.delete()
+                             .where(_t.BlobFiles.c.id == record['id']))
+            for (uid, rel_path, st, record), digest in zip(candidates, digests):
+                if digest is None:
+                    continue
+                path = os.path.join(self._data_dir(kind, uid), rel_path)
+                blob_id, n_bytes = self._link(conn, path, st, digest)
+                if n_bytes is not None:
+                    n_linked += 1
+                    reclaimed += n_bytes
+                self._save_ref(conn, kind, uid, rel_path, path,
+                               blob_id, record)
+        return n_files, len(candidates), n_linked, reclaimed
+
+    def _link(self, conn, path, st, digest):
+        """
+        Makes the file a clone of the blob with given digest,
+        creating the blob from the file if there is no such blob yet.
+        :returns (blob id, reclaimed bytes or None if file was not relinked)
+        """
+        blob_path = files.get_blob_path(self._root, digest)
+        row = utils.read_one(conn, _t.Blobs, digest=digest)
+        try:
+            blob_stat = os.stat(blob_path)
+        except FileNotFoundError:
+            blob_stat = None
+
+        if row is None or blob_stat is None:
+            # adopt the file as the blob
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            if blob_stat is not None:
+                os.unlink(blob_path)
+            method = files.clone_file(path, blob_path, self._methods)
+            if method == files.HARDLINK:
+                _make_readonly(blob_path)
+            if row is None:
+                ret = conn.execute(_t.Blobs.insert().values(
+                    digest=digest, size=st.st_size, refcount=0))
+                return ret.inserted_primary_key[0], None
+            return row['id'], None
+
+        if (blob_stat.st_dev, blob_stat.st_ino) == (st.st_dev, st.st_ino):
+            return row['id'], None
+        method = files.replace_with_clone(blob_path, path, self._methods)
+        if method == files.HARDLINK:
+            _make_readonly(blob_path)
+        reclaimed = st.st_size if st.st_nlink == 1 else 0
+        return row['id'], reclaimed
+
+    def _save_ref(self, conn, kind, uid, rel_path, path, blob_id, record):
+        st = os.stat(path)
+        values = dict(
+            blob_id=blob_id,
+            size=st.st_size,
+            mtime_ns=st.st_mtime_ns,
+            inode=st.st_ino,
+        )
+        if record is None:
+            conn.execute(_t.BlobFiles.insert().values(
+                kind=kind, uid=uid, path=rel_path, **values))
+        else:
+            conn.execute(_t.BlobFiles.update()
+                         .where(_t.BlobFiles.c.id == record['id'])
+                         .values(**values))
+            if record['blob_id'] == blob_id:
+                return
+            self._unref(conn, record['blob_id'])
+        conn.execute(_t.Blobs.update()
+                     .where(_t.Blobs.c.id == blob_id)
+                     .values(refcount=_t.Blobs.c.refcount + 1))
+
+    def _unref(self, conn, blob_id):
+        conn.execute(_t.Blobs.update()
+                     .where(_t.Blobs.c.id == blob_id)
+                     .values(refcount=_t.Blobs.c.refcount - 1))
+
+    def _data_dir(self, kind, uid):
+        return files.get_data_dir(self._root, kind, uid)
+
+
+def _is_unchanged(record, st):
+    return (record['size'] == st.st_size
+            and record['mtime_ns'] == st.st_mtime_ns
+            and record['inode'] == st.st_ino)
+
+
+def _make_readonly(path):
+    mode = os.stat(path).st_mode
+    os.chmod(path, mode & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
@@ -1 +1,4 @@
 from .paths import *
+from .usage import *
+from .copying import *
+from .bundles import *
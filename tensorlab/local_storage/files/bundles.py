@@ -0,0 +1,137 @@
+import os
+import stat
+import time
+import shutil
+import zipfile
+
+
+__all__ = ['pack_bundle', 'unpack_bundle', 'open_bundle_member',
+           'list_bundle']
+
+
+_IO_BUFFER = 1024*1024
+
+# zip archives cannot store earlier modification times
+_MIN_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+
+def pack_bundle(src_dir, bundle_path, compresslevel=6):
+    """
+    Packs the directory into a compressed zip bundle. Files are streamed
+    into the bundle, so memory usage does not depend on their sizes.
+    The central directory of the bundle serves as an index of its members.
+    The bundle appears at bundle_path only when it is complete.
+    :returns tuple (n_files, n_bytes) of packed regular files
+    """
+    os.makedirs(os.path.dirname(bundle_path), exist_ok=True)
+    tmp_path = '{}.{}.tmp'.format(bundle_path, os.getpid())
+    n_files = n_bytes = 0
+    try:
+        with zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_DEFLATED) as bundle:
+            for dir_path, dir_names, file_names in os.walk(src_dir):
+                rel_dir = os.path.relpath(dir_path, src_dir)
+                if rel_dir != '.' and not dir_names and not file_names:
+                    info = _make_info(rel_dir + '/', os.stat(dir_path),
+                                      compresslevel)
+                    info.compress_type = zipfile.ZIP_STORED
+                    info.external_attr |= 0x10  # MS-DOS directory flag
+                    bundle.writestr(info, b'')
+                for name in dir_names + file_names:
+                    path = os.path.join(dir_path, name)
+                    arc_name = os.path.normpath(os.path.join(rel_dir, name))
+                    st = os.lstat(path)
+                    info = _make_info(arc_name, st, compresslevel)
+                    if stat.S_ISLNK(st.st_mode):
+                        bundle.writestr(info, os.readlink(path))
+                    elif stat.S_ISREG(st.st_mode):
+                        with open(path, 'rb') as src, \
+                                bundle.open(info, 'w') as dst:
+                            shutil.copyfileobj(src, dst, _IO_BUFFER)
+                        n_files += 1
+                        n_bytes += st.st_size
+        os.replace(tmp_path, bundle_path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+    return n_files, n_bytes
+
+
+def unpack_bundle(bundle_path, dst_dir):
+    """
+    Extracts the bundle made by `pack_bundle` into dst_dir, restoring
+    symbolic links, permissions and modification times of files.
+    """
+    os.makedirs(dst_dir, exist_ok=True)
+    with zipfile.ZipFile(bundle_path) as bundle:
+        for info in bundle.infolist():
+            path = _member_path(dst_dir, info.filename)
+            if info.is_dir():
+                os.makedirs(path, exist_ok=True)
+                continue
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            mode = info.external_attr >> 16
+            if stat.S_ISLNK(mode):
+                os.symlink(bundle.read(info).decode(), path)
+                continue
+            with bundle.open(info) as src, open(path, 'xb') as dst:
+                shutil.copyfileobj(src, dst, _IO_BUFFER)
+            if mode:
+                os.chmod(path, stat.S_IMODE(mode))
+            mtime = time.mktime(info.date_time + (0, 0, -1))
+            os.utime(path, (mtime, mtime))
+
+
+def open_bundle_member(bundle_path, rel_path):
+    """
+    Opens a file packed into the bundle for reading without extracting it.
+    :returns binary file-like object
+    :raises FileNotFoundError if there is no such file in the bundle
+    """
+    name = os.path.normpath(rel_path).replace(os.sep, '/')
+    with zipfile.ZipFile(bundle_path) as bundle:
+        try:
+            info = bundle.getinfo(name)
+        except KeyError:
+            raise FileNotFoundError(
+                'No such file in bundle {}: {}'.format(bundle_path, rel_path))
+        # the member keeps the bundle file open until the member is closed
+        return bundle.open(info)
+
+
+def list_bundle(bundle_path):
+    """:returns list of (path, size) of regular files packed into the bundle"""
+    with zipfile.ZipFile(bundle_path) as bundle:
+        return [
+            (info.filename, info.file_size)
+            for info in bundle.infolist()
+            if not info.is_dir()
+            and not stat.S_ISLNK(info.external_attr >> 16)
+        ]
+
+
+def _make_info(arc_name, st, compresslevel):
+    """
+    :param st: os.stat_result of the packed file
+    :rtype: zipfile.ZipInfo
+    """
+    date_time = max(tuple(time.localtime(st.st_mtime)[:6]), _MIN_DATE_TIME)
+    info = zipfile.ZipInfo(arc_name, date_time)
+    info.external_attr = (st.st_mode & 0xFFFF) << 16
+    info.compress_type = zipfile.ZIP_DEFLATED
+    try:
+        # read by Python 3.7 and newer, older ones compress
+        # with the default level of zlib
+        info._compresslevel = compresslevel
+    except AttributeError:
+        pass
+    return info
+
+
+def _member_path(dst_dir, name):
+    path = os.path.normpath(os.path.join(dst_dir, name))
+    if os.path.commonpath([dst_dir, path]) != os.path.normpath(dst_dir):
+        raise ValueError('Bundle member is outside of directory: ' + name)
+    return path
@@ -8,6 +8,7 @@ class Config:
 
     _FIELDS = (
         'projecthook',
+        'tiers',
     )
 
     def __init__(self, config_path):
@@ -0,0 +1,248 @@
+import os
+import time
+import errno
+import hashlib
+import collections
+from concurrent import futures
+from .usage import iter_files
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+
+__all__ = ['REFLINK', 'HARDLINK', 'COPY', 'CloneStats',
+           'reflink', 'hardlink', 'clone_file', 'replace_with_clone',
+           'clone_tree', 'hash_file', 'compare_trees']
+
+
+# methods of cloning files, from the cheapest to the most expensive one
+REFLINK = 'reflink'
+HARDLINK = 'hardlink'
+COPY = 'copy'
+
+_COPY_CHUNK = 64*1024*1024
+_IO_BUFFER = 1024*1024
+
+# ioctl request which clones file extents on Linux (btrfs, xfs, ...)
+_FICLONE = 0x40049409
+
+# errors that mean the method is not supported for given pair of files
+_UNSUPPORTED = {
+    errno.EXDEV, errno.EPERM, errno.EINVAL, errno.ENOTTY,
+    errno.EOPNOTSUPP, errno.ENOTSUP, errno.EMLINK, errno.EBADF,
+}
+
+
+def reflink(src, dst):
+    """
+    Creates dst as a copy-on-write clone of src. Data blocks are shared
+    until one of the files is modified.
+    :raises OSError if the filesystem does not support reflinks
+    """
+    if fcntl is None:
+        raise OSError(errno.EOPNOTSUPP, 'Reflinks are not supported', dst)
+    with open(src, 'rb') as src_file:
+        with open(dst, 'xb') as dst_file:
+            try:
+                fcntl.ioctl(dst_file.fileno(), _FICLONE, src_file.fileno())
+            except OSError:
+                os.unlink(dst)
+                raise
+
+
+def hardlink(src, dst):
+    """
+    Creates dst as another name of src. Note that the files share not only
+    data but also metadata, so any in-place modification affects both.
+    """
+    os.link(src, dst)
+
+
+def _copy(src, dst):
+    with open(src, 'rb') as src_file, open(dst, 'xb') as dst_file:
+        while True:
+            chunk = src_file.read(_IO_BUFFER)
+            if not chunk:
+                break
+            dst_file.write(chunk)
+
+
+_CLONERS = {
+    REFLINK: reflink,
+    HARDLINK: hardlink,
+    COPY: _copy,
+}
+
+
+def clone_file(src, dst, methods=(REFLINK, HARDLINK, COPY)):
+    """
+    Creates dst with the same contents as src using the first method
+    that works for these files.
+    :returns name of used method
+    :raises OSError if no one method works
+    """
+    error = None
+    for method in methods:
+        try:
+            _CLONERS[method](src, dst)
+        except OSError as exc:
+            if exc.errno not in _UNSUPPORTED:
+                raise
+            error = exc
+        else:
+            return method
+    if error is None:
+        raise ValueError('No cloning methods given')
+    raise error
+
+
+def replace_with_clone(src, dst, methods=(REFLINK, HARDLINK, COPY)):
+    """
+    Atomically replaces existing dst with a clone of src.
+    :returns name of used method
+    """
+    tmp_path = '{}.{}.tmp'.format(dst, os.getpid())
+    method = clone_file(src, tmp_path, methods)
+    try:
+        os.replace(tmp_path, dst)
+    except OSError:
+        os.unlink(tmp_path)
+        raise
+    return method
+
+
+CloneStats = collections.namedtuple(
+    'CloneStats', ['method', 'n_files', 'n_bytes', 'seconds'])
+
+
+def clone_tree(src_dir, dst_dir, methods=(REFLINK, COPY),
+               n_workers=8, chunk_size=_COPY_CHUNK):
+    """
+    Clones all files of src_dir into existing dst_dir, recreating
+    the structure of subdirectories and symbolic links.
+    Every file is cloned by the first method that works for it.
+    Files which have to be copied are split into chunks and copied
+    by all workers in parallel.
+    :returns list of CloneStats, one item per used method;
+             "seconds" is the time spent by workers, not the wall time
+    """
+    clone_methods = tuple(m for m in methods if m != COPY)
+    can_copy = COPY in methods
+
+    targets = []
+    for dir_path, dir_names, file_names in os.walk(src_dir):
+        rel_dir = os.path.relpath(dir_path, src_dir)
+        for name in dir_names:
+            src = os.path.join(dir_path, name)
+            dst = os.path.normpath(os.path.join(dst_dir, rel_dir, name))
+            if os.path.islink(src):
+                os.symlink(os.readlink(src), dst)
+            else:
+                os.makedirs(dst, exist_ok=True)
+        for name in file_names:
+            src = os.path.join(dir_path, name)
+            dst = os.path.normpath(os.path.join(dst_dir, rel_dir, name))
+            if os.path.islink(src):
+                os.symlink(os.readlink(src), dst)
+            else:
+                targets.append((src, dst, os.stat(src).st_size))
+
+    stats = collections.OrderedDict(
+        (m, [0, 0, 0.0]) for m in methods)
+
+    def try_clone(target):
+        src, dst, size = target
+        started = time.perf_counter()
+        try:
+            method = clone_file(src, dst, clone_methods)
+        except (OSError, ValueError):
+            if not can_copy:
+                raise
+            return None
+        return method, time.perf_counter() - started
+
+    with futures.ThreadPoolExecutor(n_workers) as pool:
+        to_copy = []
+        for target, result in zip(targets, pool.map(try_clone, targets)):
+            if result is None:
+                to_copy.append(target)
+                continue
+            method, seconds = result
+            _add_stats(stats[method], 1, target[2], seconds)
+
+        chunks = []
+        for src, dst, size in to_copy:
+            with open(dst, 'xb') as dst_file:
+                dst_file.truncate(size)
+            chunks.extend(
+                (src, dst, offset, min(chunk_size, size - offset))
+                for offset in range(0, size, chunk_size))
+        copy_seconds = sum(pool.map(lambda c: _copy_chunk(*c), chunks))
+        if to_copy:
+            _add_stats(stats[COPY], len(to_copy),
+                       sum(size for _, _, size in to_copy), copy_seconds)
+
+    return [
+        CloneStats(method, *values)
+        for method, values in stats.items()
+        if values[0] > 0
+    ]
+
+
+def hash_file(path):
+    """:returns hex SHA-256 digest of the file contents"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(_IO_BUFFER)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def compare_trees(src_dir, dst_dir, n_workers=8):
+    """
+    Verifies that dst_dir holds the same regular files as src_dir
+    by comparing their sizes and SHA-256 digests.
+    :returns sorted list of relative paths of missing, unexpected
+             or different files; empty if the trees are equal
+    """
+    src_files = {path: st.st_size for path, st in iter_files(src_dir)}
+    dst_files = {path: st.st_size for path, st in iter_files(dst_dir)}
+    mismatched = set(src_files).symmetric_difference(dst_files)
+    mismatched.update(
+        path for path, size in src_files.items()
+        if path in dst_files and dst_files[path] != size)
+    to_hash = sorted(set(src_files) - mismatched)
+
+    def is_equal(path):
+        return (hash_file(os.path.join(src_dir, path))
+                == hash_file(os.path.join(dst_dir, path)))
+
+    with futures.ThreadPoolExecutor(n_workers) as pool:
+        mismatched.update(
+            path for path, equal in zip(to_hash, pool.map(is_equal, to_hash))
+            if not equal)
+    return sorted(mismatched)
+
+
+def _add_stats(values, n_files, n_bytes, seconds):
+    values[0] += n_files
+    values[1] += n_bytes
+    values[2] += seconds
+
+
+def _copy_chunk(src, dst, offset, length):
+    started = time.perf_counter()
+    with open(src, 'rb') as src_file, open(dst, 'r+b') as dst_file:
+        src_file.seek(offset)
+        dst_file.seek(offset)
+        while length > 0:
+            data = src_file.read(min(_IO_BUFFER, length))
+            if not data:
+                break
+            dst_file.write(data)
+            length -= len(data)
+    return time.perf_counter() - started
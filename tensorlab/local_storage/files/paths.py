@@ -1,30 +1,67 @@
 import os
 
 
-__all__ = ['get_db_path', 'get_models_dir', 'get_runs_dir',
-           'get_model_data_dir', 'get_run_data_dir',
+__all__ = ['MODELS', 'RUNS', 'ARCHIVES', 'DEFAULT_TIER',
+           'get_db_path', 'get_config_path', 'get_models_dir', 'get_runs_dir',
+           'get_model_data_dir', 'get_run_data_dir', 'get_data_dir',
+           'get_blobs_dir', 'get_blob_path',
+           'get_archives_dir', 'get_bundle_path',
            'make_dir_writable', 'is_storage_exist', 'create_storage_directory']
 
 
+# kinds of data directories, named after their parent directories
+MODELS = 'models'
+RUNS = 'runs'
+# bundles of archived run data directories
+ARCHIVES = 'archive'
+
+# storage tier located at the storage root,
+# other tiers are configured in the "tiers" field of the config
+DEFAULT_TIER = 'default'
+
+
 def get_db_path(root):
     return os.path.join(root, 'db.sqlite3')
 
 
+def get_config_path(root):
+    return os.path.join(root, 'config.json')
+
+
 def get_models_dir(root):
-    return os.path.join(root, 'models')
+    return os.path.join(root, MODELS)
 
 
 def get_runs_dir(root):
-    return os.path.join(root, 'runs')
+    return os.path.join(root, RUNS)
 
 
 def get_model_data_dir(root, model):
-    return os.path.join(get_models_dir(root), model.key['uid'])
+    return get_data_dir(root, MODELS, model.key['uid'])
 
 
 def get_run_data_dir(root, run):
-    runs_dir = get_runs_dir(root)
-    return os.path.join(runs_dir, run.key['uid'])
+    return get_data_dir(root, RUNS, run.key['uid'])
+
+
+def get_data_dir(root, kind, uid):
+    return os.path.join(root, kind, uid)
+
+
+def get_blobs_dir(root):
+    return os.path.join(root, 'blobs')
+
+
+def get_blob_path(root, digest):
+    return os.path.join(get_blobs_dir(root), digest[:2], digest)
+
+
+def get_archives_dir(root):
+    return os.path.join(root, ARCHIVES)
+
+
+def get_bundle_path(root, uid):
+    return os.path.join(get_archives_dir(root), uid + '.zip')
 
 
 def make_dir_writable(dir_path):
@@ -0,0 +1,102 @@
+import os
+
+
+__all__ = ['get_dirs_mtime', 'scan_usage', 'iter_files']
+
+
+def get_dirs_mtime(path):
+    """
+    :returns the latest modification time among the directory and all its
+             subdirectories, or None if the directory does not exist.
+    Only directories are stat'ed, so this is much cheaper than
+    a full scan. Note that modifying contents of an existing file
+    does not change modification time of its directory.
+    """
+    try:
+        latest = os.stat(path).st_mtime
+    except FileNotFoundError:
+        return None
+    stack = [path]
+    while stack:
+        try:
+            entries = list(os.scandir(stack.pop()))
+        except FileNotFoundError:
+            continue
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                try:
+                    latest = max(latest,
+                                 entry.stat(follow_symlinks=False).st_mtime)
+                except FileNotFoundError:
+                    continue
+                stack.append(entry.path)
+    return latest
+
+
+def scan_usage(path):
+    """
+    Walks the directory and counts space allocated for its files.
+    Files hardlinked several times within the directory are counted once.
+    :returns tuple (n_bytes, n_files, dirs_mtime);
+             all items are None if the directory does not exist.
+    """
+    try:
+        dirs_mtime = os.stat(path).st_mtime
+    except FileNotFoundError:
+        return None, None, None
+    n_bytes = 0
+    n_files = 0
+    seen_inodes = set()
+    stack = [path]
+    while stack:
+        try:
+            entries = list(os.scandir(stack.pop()))
+        except FileNotFoundError:
+            continue
+        for entry in entries:
+            try:
+                stat = entry.stat(follow_symlinks=False)
+            except FileNotFoundError:
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                dirs_mtime = max(dirs_mtime, stat.st_mtime)
+                stack.append(entry.path)
+                continue
+            n_files += 1
+            if stat.st_nlink > 1:
+                if (stat.st_dev, stat.st_ino) in seen_inodes:
+                    continue
+                seen_inodes.add((stat.st_dev, stat.st_ino))
+            n_bytes += _allocated_size(stat)
+    return n_bytes, n_files, dirs_mtime
+
+
+def _allocated_size(stat):
+    blocks = getattr(stat, 'st_blocks', None)
+    if blocks is None:
+        return stat.st_size
+    return blocks * 512
+
+
+def iter_files(path):
+    """
+    Recursively lists regular files within the directory.
+    Symbolic links are not followed and not listed.
+    :returns iterator of (path relative to the directory, os.stat_result)
+    """
+    stack = ['']
+    while stack:
+        rel_dir = stack.pop()
+        try:
+            entries = list(os.scandir(os.path.join(path, rel_dir)))
+        except FileNotFoundError:
+            continue
+        for entry in entries:
+            rel_path = os.path.join(rel_dir, entry.name)
+            if entry.is_dir(follow_symlinks=False):
+                stack.append(rel_path)
+            elif entry.is_file(follow_symlinks=False):
+                try:
+                    yield rel_path, entry.stat(follow_symlinks=False)
+                except FileNotFoundError:
+                    continue
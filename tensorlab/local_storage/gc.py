@@ -0,0 +1,316 @@
+"""
+Garbage collection of data directories of deleted models and runs.
+
+Storages never touch the disk while deleting rows. Instead they record
+a tombstone for each data directory in the same transaction that deletes
+the rows (see `bury`), so deletions of any size are cheap and atomic.
+Bundles of archived runs (see tensorlab.local_storage.api.archive) are
+tombstoned the same way. Tombstoned directories are removed later
+by `GarbageCollector`, either in background or synchronously
+(e.g. by "tflab gc").
+"""
+import os
+import sys
+import time
+import threading
+from concurrent import futures
+import sqlalchemy as sa
+from tensorlab.local_storage.db import utils, tables as _t
+from tensorlab.local_storage import files
+
+
+_KINDS = (
+    (files.MODELS, _t.Models),
+    (files.RUNS, _t.Runs),
+)
+
+
+def bury(conn, kind, table, condition, tier=None):
+    """
+    Records tombstones for data directories of all rows of given table
+    which match the condition. Must be called within the transaction
+    which deletes the rows, before the rows are actually deleted.
+    :param kind: files.MODELS or files.RUNS
+    :type table: sqlalchemy.Table
+    :param tier: storage tier of the directories;
+                 by default the tier of each row is used
+    """
+    q = sa.select([
+        sa.literal(kind),
+        table.c.uid,
+        table.c.tier if tier is None else sa.literal(tier),
+        sa.literal(time.time()),
+    ]).where(condition)
+    conn.execute(
+        _t.Tombstones.insert()
+        .prefix_with('OR IGNORE')
+        .from_select(['kind', 'uid', 'tier', 'created_at'], q)
+    )
+
+
+class GarbageCollector:
+    """
+    Removes tombstoned data directories in batches using a pool of threads.
+
+    :param n_workers: number of threads that remove directories concurrently
+    :param batch_size: number of tombstones read from the DB at once
+    :param max_ops_per_second: limits rate of unlink/rmdir calls
+                               of all workers together; None means no limit
+    :param tier_roots: dict of storage tier name -> root directory
+                       of the tier; the default tier is root_dir
+    """
+
+    def __init__(self, db, root_dir, n_workers=4, batch_size=100,
+                 max_ops_per_second=None, log_stream=None, tier_roots=None):
+        self._db = db
+        self._root = root_dir
+        self._tier_roots = dict(tier_roots or {})
+        self._tier_roots[files.DEFAULT_TIER] = root_dir
+        self._n_workers = n_workers
+        self._batch_size = batch_size
+        self._limiter = _RateLimiter(max_ops_per_second)
+        self._log_stream = log_stream or sys.stderr
+
+        self._collect_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._state = threading.Condition()
+        self._pending = False
+        self._stopped = False
+        self._thread = None
+
+    def notify(self):
+        """
+        Tells the background collector that new tombstones were recorded.
+        Starts the background thread on first call.
+        """
+        with self._state:
+            if self._stopped:
+                return
+            self._pending = True
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name='tensorlab-gc', daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+    def join(self, timeout=None):
+        """
+        Waits until the background collector processes all tombstones
+        that were recorded before the last call of `notify`.
+        :return: False if timeout expired, True otherwise
+        """
+        with self._state:
+            return self._state.wait_for(lambda: not self._pending, timeout)
+
+    def close(self):
+        """
+        Stops the background collector. Directories which were not removed
+        yet stay tombstoned and will be collected next time.
+        """
+        with self._state:
+            self._stopped = True
+            thread = self._thread
+        self._wakeup.set()
+        if thread is not None:
+            thread.join()
+        with self._state:
+            self._pending = False
+            self._state.notify_all()
+
+    def set_rate_limit(self, max_ops_per_second):
+        """:param max_ops_per_second: None means no limit"""
+        self._limiter = _RateLimiter(max_ops_per_second)
+
+    def count_pending(self):
+        """:returns number of data directories waiting for removal"""
+        q = sa.select([sa.func.count()]).select_from(_t.Tombstones)
+        return self._db.execute(q).scalar()
+
+    def collect(self, limit=None):
+        """
+        Synchronously removes tombstoned directories and unreferenced blobs
+        of deduplicated files (see tensorlab.local_storage.dedup).
+        Tombstones of directories that could not be removed are kept.
+        :param limit: maximal number of directories to remove
+        :return: number of removed directories and blobs
+        """
+        n_done = 0
+        last_id = 0
+        with self._collect_lock, \
+                futures.ThreadPoolExecutor(self._n_workers) as pool:
+            while not self._stopped:
+                batch_size = self._batch_size
+                if limit is not None:
+                    batch_size = min(batch_size, limit - n_done)
+                    if batch_size <= 0:
+                        break
+                q = _t.Tombstones.select() \
+                    .where(_t.Tombstones.c.id > last_id) \
+                    .order_by(_t.Tombstones.c.id) \
+                    .limit(batch_size)
+                batch = self._db.execute(q).fetchall()
+                if not batch:
+                    break
+                last_id = batch[-1]['id']
+
+                removed = [
+                    tomb_id
+                    for tomb_id in pool.map(self._remove, batch)
+                    if tomb_id is not None
+                ]
+                if removed:
+                    self._db.execute(_t.Tombstones.delete().where(
+                        _t.Tombstones.c.id.in_(removed)))
+                n_done += len(removed)
+            if not self._stopped:
+                n_done += self._collect_blobs()
+        return n_done
+
+    def reconcile(self, dry_run=False):
+        """
+        Finds data directories which belong to no model or run and
+        tombstones them, e.g. leftovers of crashes or of deletions made
+        by old versions.
+        :return: list of (kind, uid, tier) of found orphaned directories
+        """
+        orphans = []
+        for tier, root in sorted(self._tier_roots.items()):
+            for kind, table in _KINDS:
+                # list directories before reading the rows: objects are
+                # inserted before their directories are created, so
+                # a directory that appears concurrently is never taken
+                # as an orphan
+                names = _list_subdirs(os.path.join(root, kind))
+                if not names:
+                    continue
+                known = {
+                    row[0] for row in self._db.execute(
+                        sa.select([table.c.uid])
+                        .where(table.c.tier == tier))
+                }
+                known.update(
+                    row[0] for row in self._db.execute(
+                        sa.select([_t.Tombstones.c.uid])
+                        .where(sa.and_(_t.Tombstones.c.kind == kind,
+                                       _t.Tombstones.c.tier == tier)))
+                )
+                orphans.extend(
+                    (kind, name, tier) for name in names if name not in known)
+
+        if orphans and not dry_run:
+            now = time.time()
+            self._db.execute(
+                _t.Tombstones.insert().prefix_with('OR IGNORE'),
+                [{'kind': kind, 'uid': uid, 'tier': tier, 'created_at': now}
+                 for kind, uid, tier in orphans]
+            )
+        return orphans
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            if self._stopped:
+                break
+            try:
+                self.collect()
+            except Exception as exc:
+                self._log('garbage collection failed: {!r}'.format(exc))
+            with self._state:
+                if not self._wakeup.is_set():
+                    self._pending = False
+                    self._state.notify_all()
+
+    def _collect_blobs(self):
+        q = sa.select([_t.Blobs.c.id, _t.Blobs.c.digest]) \
+            .where(_t.Blobs.c.refcount <= 0)
+        n_removed = 0
+        for blob_id, digest in utils.read_many(self._db, q):
+            # the blob may be referenced again since it was selected
+            ret = self._db.execute(_t.Blobs.delete().where(sa.and_(
+                _t.Blobs.c.id == blob_id,
+                _t.Blobs.c.refcount <= 0,
+            )))
+            if ret.rowcount != 1:
+                continue
+            self._limiter.acquire()
+            try:
+                os.unlink(files.get_blob_path(self._root, digest))
+            except FileNotFoundError:
+                pass
+            n_removed += 1
+        return n_removed
+
+    def _remove(self, tombstone):
+        kind, uid, tier = tombstone['kind'], tombstone['uid'], tombstone['tier']
+        root = self._tier_roots.get(tier)
+        if root is None:
+            self._log('cannot remove {}/{}: unknown storage tier {!r}'
+                      .format(kind, uid, tier))
+            return None
+        try:
+            if kind == files.ARCHIVES:
+                path = files.get_bundle_path(root, uid)
+                self._limiter.acquire()
+                _unlink(path)
+            else:
+                path = files.get_data_dir(root, kind, uid)
+                _remove_tree(path, self._limiter)
+        except OSError as exc:
+            self._log('cannot remove {}: {}'.format(path, exc))
+            return None
+        return tombstone['id']
+
+    def _log(self, message):
+        print('[gc]', message, file=self._log_stream)
+
+
+def _list_subdirs(path):
+    try:
+        return [entry.name for entry in os.scandir(path)
+                if entry.is_dir(follow_symlinks=False)]
+    except FileNotFoundError:
+        return []
+
+
+def _remove_tree(path, limiter):
+    try:
+        entries = list(os.scandir(path))
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            _remove_tree(entry.path, limiter)
+        else:
+            limiter.acquire()
+            _unlink(entry.path)
+    limiter.acquire()
+    try:
+        os.rmdir(path)
+    except FileNotFoundError:
+        pass
+
+
+def _unlink(path):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+class _RateLimiter:
+
+    def __init__(self, rate):
+        self._interval = 1.0 / rate if rate else 0
+        self._next_time = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self._interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait_until = max(now, self._next_time)
+            self._next_time = wait_until + self._interval
+        if wait_until > now:
+            time.sleep(wait_until - now)
@@ -0,0 +1,73 @@
+"""
+Identity map of groups, models and runs of a storage.
+
+Reading a row of an object which was read before returns the same
+instance, and objects looked up by id, as parents of groups when walking
+their ancestors, are not queried again. The least recently used objects
+are evicted, objects are discarded when they are deleted or when their
+rows change.
+
+Unsaved changes are never overwritten: a cached object whose row was
+changed elsewhere is refreshed only if it has no dirty fields.
+"""
+import collections
+from tensorlab.core import cache
+from tensorlab.local_storage.db import utils
+
+
+# kinds of objects, named as their storages
+GROUPS = 'groups'
+MODELS = 'models'
+RUNS = 'runs'
+
+# maximal number of cached objects of each kind
+DEFAULT_SIZE = 10000
+
+
+class IdentityMap:
+
+    def __init__(self, maxsize=DEFAULT_SIZE):
+        self._objects = collections.OrderedDict(
+            (kind, cache.LRUCache(maxsize)) for kind in (GROUPS, MODELS, RUNS))
+
+    def get(self, kind, obj_id):
+        """:returns the cached object of the kind or None"""
+        obj = self._objects[kind].get(obj_id)
+        if obj is None or obj.key is None:
+            # deleted through the instance
+            return None
+        return obj
+
+    def get_or_add(self, kind, obj):
+        """
+        :param obj: object just built from its row
+        :returns the cached object with the same id, refreshed from
+                 the row if it has no unsaved changes, or obj which is
+                 cached from now on
+        """
+        cached = self.get(kind, obj.key['id'])
+        if cached is None:
+            self.add(kind, obj)
+            return obj
+        fields = obj.key['orig_fields']
+        if cached.key['orig_fields'] != fields \
+                and not utils.get_dirty_fields(cached):
+            utils.fill_from_dict(cached, dict(fields))
+        return cached
+
+    def add(self, kind, obj):
+        """Caches the saved object instead of any other one with its id."""
+        self._objects[kind].put(obj.key['id'], obj)
+
+    def discard(self, kind, obj_id):
+        self._objects[kind].pop(obj_id)
+
+    def clear(self, *kinds):
+        """Discards all objects of the kinds, of all kinds by default."""
+        for kind in kinds or list(self._objects):
+            self._objects[kind].clear(reset_stats=False)
+
+    def stats(self):
+        """:returns OrderedDict of kind -> tensorlab.core.cache.CacheStats"""
+        return collections.OrderedDict(
+            (kind, objects.stats()) for kind, objects in self._objects.items())
@@ -0,0 +1,295 @@
+"""
+Statistics of attribute values kept in the AttributeStats table,
+see tensorlab.core.attribute_stats.
+
+Counts of values, bounds, distinct estimates and frequencies of enumeration
+choices are maintained as values are inserted and deleted, within the same
+transactions. Histograms and frequencies of other values change only when
+values are analyzed. Deleting values shrinks neither bounds nor distinct
+estimates, so n_changed tells how outdated statistics are.
+
+Statistics used for estimates are cached until this process changes
+any of them, see AttributeStatistics.get_estimates.
+"""
+import json
+import time
+import collections
+import sqlalchemy as sa
+from tensorlab.core import attribute_stats, cache
+from tensorlab.core.attributes import Attribute
+from tensorlab.core.attributeoptions import AttributeType, ChoiceCodes
+from tensorlab.local_storage.db import utils, tables as _t
+
+
+# number of changes of statistics made by this process
+_version = [0]
+
+
+def get_version():
+    """:returns number which changes whenever statistics are changed"""
+    return _version[0]
+
+
+def _changed():
+    _version[0] += 1
+
+
+class AttributeStatistics:
+
+    def __init__(self, db):
+        self._db = db
+        self._estimates = cache.LRUCache(256)
+
+    def analyze(self, attrs=None):
+        """
+        Recomputes statistics of values of the attributes, all by default,
+        and statistics of indexes used by the SQLite query planner.
+        :returns list of AttributeStats
+        """
+        if attrs is None:
+            attrs = utils.read_many(
+                self._db, _t.Attributes.select().order_by(_t.Attributes.c.id),
+                _row_to_attr)
+        result = []
+        for attr in attrs:
+            attr_id = utils.get_key(attr)['id']
+            table = _t.get_values(attr.runtime)
+            q = sa.select([table.c.value]).where(table.c.attr_id == attr_id)
+            values = utils.read_many(self._db, q, lambda row: row[0])
+            stats, hll = attribute_stats.compute(attr, values)
+            with self._db.begin() as conn:
+                _save(conn, attr_id, stats, hll)
+            result.append(stats)
+        self._db.execute('ANALYZE')
+        return result
+
+    def get(self, attr):
+        """
+        :returns AttributeStats or None if there are no statistics
+                 for the attribute
+        """
+        return self.get_many([attr]).get(utils.get_key(attr)['id'])
+
+    def get_many(self, attrs):
+        """:returns dict of attribute id -> AttributeStats"""
+        attrs = {utils.get_key(a)['id']: a for a in attrs}
+        if not attrs:
+            return {}
+        q = _t.AttributeStats.select().where(
+            _t.AttributeStats.c.attr_id.in_(list(attrs)))
+        return {
+            row['attr_id']: _load(attrs[row['attr_id']], row)
+            for row in utils.read_many(self._db, q)
+        }
+
+    def get_estimates(self, attrs):
+        """
+        Statistics for ordering conditions by their selectivity, read
+        again only after statistics were changed. Changes made by other
+        processes are seen after the next change made by this one.
+        :returns dict of attribute id -> AttributeStats
+        """
+        attrs = list(attrs)
+        # values are decoded as by the attributes, whose options change
+        key = get_version(), tuple(sorted(
+            (utils.get_key(a)['id'], a.options) for a in attrs))
+        return self._estimates.get_or_create(
+            key, lambda key: self.get_many(attrs))
+
+
+def create(conn, attr):
+    """Starts exact statistics of a new attribute, which has no values."""
+    stats, hll = attribute_stats.compute(attr, [])
+    _save(conn, utils.get_key(attr)['id'], stats, hll)
+
+
+def add_values(conn, rows):
+    """
+    Accounts values inserted into ModelValues or RunValues.
+    Must be called within the transaction which inserts them.
+    :param rows: list of dicts with attr_id and encoded value
+    """
+    added = collections.defaultdict(collections.Counter)
+    for row in rows:
+        added[row['attr_id']][row['value']] += 1
+    add_value_counts(conn, {attr_id: list(counts.items())
+                            for attr_id, counts in added.items()})
+
+
+def add_value_counts(conn, added):
+    """
+    Accounts values inserted into ModelValues or RunValues, each distinct
+    value once however many rows it is inserted into.
+    Must be called within the transaction which inserts them.
+    :param added: dict of attr_id -> list of (encoded value, number of rows)
+    """
+    updates = []
+    for row, attr in _read_stats(conn, list(added)):
+        hll = attribute_stats.HyperLogLog(row['hll'])
+        is_hll_changed = False
+        frequencies = json.loads(row['frequencies'])
+        n_added = n_nulls = 0
+        low, high = (None if _is_removed(attr, v) else v
+                     for v in (row['min_value'], row['max_value']))
+        for value, n in added[row['attr_id']]:
+            n_added += n
+            if value is None:
+                n_nulls += n
+                continue
+            is_hll_changed |= hll.add(value)
+            if value in frequencies or attr.type == AttributeType.Enum:
+                frequencies[value] = frequencies.get(value, 0) + n
+            decoded = attr.decode_value(value)
+            if low is None or decoded < attr.decode_value(low):
+                low = value
+            if high is None or decoded > attr.decode_value(high):
+                high = value
+        updates.append(dict(
+            _id=row['id'],
+            n_values=row['n_values'] + n_added,
+            n_nulls=row['n_nulls'] + n_nulls,
+            min_value=low, max_value=high,
+            hll=hll.to_bytes(),
+            n_distinct=(hll.estimate() if is_hll_changed
+                        else row['n_distinct']),
+            frequencies=json.dumps(frequencies, sort_keys=True),
+            n_changed=row['n_changed'] + n_added,
+        ))
+    if updates:
+        conn.execute(_update_by_id(updates[0]), updates)
+        _changed()
+
+
+def remove_values(conn, values, condition):
+    """
+    Accounts values which are going to be deleted.
+    Must be called within the transaction which deletes them.
+    :param values: ModelValues or RunValues
+    :param condition: condition on the table matching deleted rows
+    """
+    q = sa.select([values.c.attr_id, values.c.value, sa.func.count()]) \
+        .where(condition).group_by(values.c.attr_id, values.c.value)
+    removed = collections.defaultdict(list)
+    for attr_id, value, n in conn.execute(q).fetchall():
+        removed[attr_id].append((value, n))
+    updates = []
+    for row, _ in _read_stats(conn, list(removed)):
+        frequencies = json.loads(row['frequencies'])
+        n_removed = n_nulls = 0
+        for value, n in removed[row['attr_id']]:
+            n_removed += n
+            if value is None:
+                n_nulls += n
+            elif value in frequencies:
+                frequencies[value] = max(frequencies[value] - n, 0)
+        updates.append(dict(
+            _id=row['id'],
+            n_values=max(row['n_values'] - n_removed, 0),
+            n_nulls=max(row['n_nulls'] - n_nulls, 0),
+            frequencies=json.dumps(frequencies, sort_keys=True),
+            n_changed=row['n_changed'] + n_removed,
+        ))
+    if updates:
+        conn.execute(_update_by_id(updates[0]), updates)
+        _changed()
+
+
+def drop(conn, attr_ids):
+    """
+    Deletes statistics of deleted attributes.
+    :param attr_ids: list or query of ids of the attributes
+    """
+    conn.execute(_t.AttributeStats.delete().where(
+        _t.AttributeStats.c.attr_id.in_(attr_ids)))
+    _changed()
+
+
+def _update_by_id(values):
+    """:returns statement updating columns given in values by "_id" """
+    return _t.AttributeStats.update().where(
+        _t.AttributeStats.c.id == sa.bindparam('_id')
+    ).values({name: sa.bindparam(name) for name in values if name != '_id'})
+
+
+def _read_stats(conn, attr_ids):
+    """:returns list of (AttributeStats row, Attribute)"""
+    if not attr_ids:
+        return []
+    q = sa.select([_t.AttributeStats, _t.Attributes]).select_from(
+        _t.AttributeStats.join(
+            _t.Attributes, _t.Attributes.c.id == _t.AttributeStats.c.attr_id)
+    ).where(_t.AttributeStats.c.attr_id.in_(attr_ids)).apply_labels()
+    result = []
+    for row in conn.execute(q).fetchall():
+        stats_row = {c.name: row[c] for c in _t.AttributeStats.c}
+        attr_row = {c.name: row[c] for c in _t.Attributes.c}
+        result.append((stats_row, _row_to_attr(attr_row)))
+    return result
+
+
+def _save(conn, attr_id, stats, hll):
+    attr = stats.attr
+
+    def encode(value):
+        # not validated again, values reported by fsck are counted too
+        if value is None:
+            return None
+        if attr.codes is not None:
+            return attr.codes.encode(str(value))
+        return str(value)
+
+    values = dict(
+        n_values=stats.n_values,
+        n_nulls=stats.n_nulls,
+        min_value=encode(stats.min_value),
+        max_value=encode(stats.max_value),
+        hll=hll.to_bytes(),
+        n_distinct=stats.n_distinct,
+        histogram=json.dumps([encode(v) for v in stats.histogram]),
+        frequencies=json.dumps(
+            {encode(v): n for v, n in stats.frequencies.items()},
+            sort_keys=True),
+        n_changed=stats.n_changed,
+        analyzed_at=time.time(),
+    )
+    updated = conn.execute(_t.AttributeStats.update().where(
+        _t.AttributeStats.c.attr_id == attr_id
+    ).values(**values)).rowcount
+    if not updated:
+        conn.execute(_t.AttributeStats.insert().values(
+            attr_id=attr_id, **values))
+    _changed()
+
+
+def _load(attr, row):
+    def decode(value):
+        return None if _is_removed(attr, value) else attr.decode_value(value)
+
+    return attribute_stats.AttributeStats(
+        attr, row['n_values'], row['n_nulls'],
+        decode(row['min_value']), decode(row['max_value']),
+        row['n_distinct'],
+        [attr.decode_value(v) for v in json.loads(row['histogram'])
+         if not _is_removed(attr, v)],
+        {attr.decode_value(v): n
+         for v, n in json.loads(row['frequencies']).items()
+         if not _is_removed(attr, v)},
+        row['n_changed'],
+    )
+
+
+def _is_removed(attr, value):
+    """
+    :returns whether the value is a code of a removed choice, which
+             statistics keep until the values are analyzed again
+    """
+    return (attr.codes is not None and value is not None
+            and not attr.codes.has_code(value))
+
+
+def _row_to_attr(row):
+    return Attribute(
+        key={'id': row['id'], 'group_id': row['group_id']},
+        name=row['name'], type=row['type'], runtime=row['runtime'],
+        options=row['options'], default=row['default'],
+        nullable=row['nullable'], codes=ChoiceCodes.parse(row['codes']))
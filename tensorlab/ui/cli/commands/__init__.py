@@ -1,6 +1,8 @@
 import argparse
 from tensorlab import config, exceptions
-from . import root, groups, attrs, models, instances, views
+from . import (
+    root, groups, attrs, models, instances, views, maintenance, queries
+)
 
 SECTIONS = [
     root,
@@ -9,6 +11,8 @@ SECTIONS = [
     models,
     instances,
     views,
+    maintenance,
+    queries,
 ]
 
 
@@ -1,4 +1,5 @@
 import re
+import sys
 
 
 def make_registry():
@@ -14,6 +15,26 @@ def make_registry():
     return command_dict, register_subcommand
 
 
+def open_storage(args, user_project=None):
+    """
+    Opens local storage at the root given in command line.
+    Commands that neither build models nor run them do not need a project.
+    """
+    from tensorlab.local_storage import LocalStorage
+    return LocalStorage(args.root, user_project, sys.stdout).Open()
+
+
+def format_size(n_bytes):
+    size = float(n_bytes)
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if size < 1024:
+            break
+        size /= 1024
+    else:
+        unit = 'TiB'
+    return '{:.1f} {}'.format(size, unit)
+
+
 def attr_type(s):
     key_value = s.split('=')
     if len(key_value) != 2:
@@ -21,6 +42,22 @@ def attr_type(s):
     return key_value
 
 
+def predicate_type(s):
+    from tensorlab.core.attribute_predicates import parse_expression
+    expression = parse_expression(s)
+    if expression is None:
+        raise ValueError('Cannot parse predicate: {!r}'.format(s))
+    return expression
+
+
+def order_type(s):
+    from tensorlab.core import ordering
+    name, _, direction = s.partition(':')
+    if direction not in ('', ordering.ASC, ordering.DESC):
+        raise ValueError('Expected format: "name" or "name:desc"')
+    return name, direction or ordering.ASC
+
+
 def comma_separated_list_type(s):
     return s.split(',')
 
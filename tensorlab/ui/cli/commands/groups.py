@@ -1,6 +1,5 @@
 from tensorlab import exceptions
-from tensorlab.storage import TensorLabStorage
-from . import attrs
+from . import attrs, _tools
 
 
 def setup(commands):
@@ -12,6 +11,11 @@ def setup(commands):
 
     show_parser = subcommands.add_parser('show')
     show_parser.add_argument('name', nargs='?')
+    show_parser.add_argument('--usage', action='store_true', default=False,
+                             help='show disk usage of models and runs')
+    show_parser.add_argument('--refresh', action='store_true', default=False,
+                             help='rescan modified data directories '
+                                  'before showing disk usage')
 
     rename_parser = subcommands.add_parser('rename')
     rename_parser.add_argument('old_name')
@@ -40,20 +44,22 @@ def setup(commands):
 
 
 def create_group(args):
-    storage = TensorLabStorage(args.root).Open()
+    storage = _tools.open_storage(args)
     group = storage.groups.new(args.name)
     group.save()
     print('Group {!r} was created'.format(group.name))
 
 
 def show_groups(args):
-    storage = TensorLabStorage(args.root).Open()
+    storage = _tools.open_storage(args)
     if args.name:
         group = storage.groups.get(args.name)
         print('Group "{}":'.format(group.name))
         print('   Contains {} models with {} instances'
               .format(storage.groups.count_models(group),
                       storage.groups.count_instances(group)))
+        if args.usage:
+            print_usage(storage, group, args.refresh, 3)
         for idx, attr in enumerate(storage.groups.list_attrs(group), 1):
             print('   Attribute #{}'.format(idx))
             attrs.print_attribute(attr, 6)
@@ -62,19 +68,30 @@ def show_groups(args):
         if groups_list:
             for group in groups_list:
                 print(group.name, '({})'.format(storage.groups.count_models(group)))
+                if args.usage:
+                    print_usage(storage, group, args.refresh, 3)
         else:
             print('Storage is empty')
 
 
+def print_usage(storage, group, refresh=False, indent=0):
+    tab = ' '*indent
+    if refresh:
+        storage.usage.refresh(group)
+    usage = storage.usage.get_for_group(group)
+    print(tab, 'disk usage: {} in {} files'.format(
+        _tools.format_size(usage.n_bytes), usage.n_files))
+
+
 def delete_group(args):
-    storage = TensorLabStorage(args.root).Open()
+    storage = _tools.open_storage(args)
     group = storage.groups.get(args.name)
     group.delete(args.force)
     print('Group "{}" was deleted'.format(group.name))
 
 
 def rename_group(args):
-    storage = TensorLabStorage(args.root).Open()
+    storage = _tools.open_storage(args)
     group = storage.groups.get(args.old_name)
     group.name = args.new_name
     group.save()
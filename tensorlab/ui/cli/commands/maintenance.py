@@ -0,0 +1,207 @@
+from tensorlab import exceptions
+from tensorlab.local_storage import files
+from . import _tools
+
+
+def setup(commands):
+    gc_parser = commands.add_parser('gc')
+    gc_parser.add_argument('--no-reconcile', dest='reconcile',
+                           action='store_false', default=True,
+                           help='do not scan data directories for orphans')
+    gc_parser.add_argument('--dry-run', action='store_true', default=False,
+                           help='only report orphaned directories')
+    gc_parser.add_argument('--rate', type=float, default=None,
+                           help='maximal number of removed files per second')
+
+    dedup_parser = commands.add_parser('dedup')
+    dedup_parser.add_argument('--hardlinks-only', action='store_true',
+                              default=False,
+                              help='do not try copy-on-write reflinks')
+
+    archive_parser = commands.add_parser('archive')
+    archive_parser.add_argument('model_spec', nargs='?',
+                                type=_tools.spec('{group}/{model}'),
+                                help='archive only runs of this model')
+    archive_parser.add_argument('--older-than', type=float, metavar='DAYS',
+                                help='archive runs finished at least '
+                                     'this many days ago')
+    archive_parser.add_argument('--where', type=_tools.predicate_type,
+                                help='archive runs matching the predicate '
+                                     'on attributes; requires a model')
+    archive_parser.add_argument('--dry-run', action='store_true',
+                                default=False,
+                                help='only report the number of runs')
+
+    tier_parser = commands.add_parser('tier')
+    tier_commands = tier_parser.add_subparsers(dest='tier_command',
+                                               title='Commands')
+    tier_commands.add_parser('list')
+    add_tier_parser = tier_commands.add_parser('add')
+    add_tier_parser.add_argument('name')
+    add_tier_parser.add_argument('path')
+    move_parser = tier_commands.add_parser('move')
+    move_parser.add_argument('tier')
+    move_parser.add_argument('model_spec', nargs='?',
+                             type=_tools.spec('{group}/{model}'),
+                             help='move only runs of this model')
+    move_parser.add_argument('--older-than', type=float, metavar='DAYS',
+                             help='move runs finished at least '
+                                  'this many days ago')
+    move_parser.add_argument('--with-model', action='store_true',
+                             default=False,
+                             help='move the model data directory as well')
+
+    fsck_parser = commands.add_parser('fsck')
+    fsck_parser.add_argument('--repair', action='store_true', default=False,
+                             help='fix found problems where possible')
+
+    tier_cmds = {
+        'list': list_tiers,
+        'add': add_tier,
+        'move': move_to_tier,
+    }
+
+    return {
+        'gc': collect_garbage,
+        'dedup': deduplicate,
+        'archive': archive_runs,
+        'tier': lambda args: tier_cmds[args.tier_command](args),
+        'fsck': check_storage,
+    }
+
+
+def collect_garbage(args):
+    storage = _tools.open_storage(args)
+    try:
+        gc = storage.gc
+        if args.reconcile:
+            orphans = gc.reconcile(dry_run=args.dry_run)
+            for kind, uid, tier in orphans:
+                print('Orphaned directory: {}/{} on tier "{}"'
+                      .format(kind, uid, tier))
+        if args.dry_run:
+            print('{} directories are waiting for removal'
+                  .format(gc.count_pending()))
+            return
+        if args.rate is not None:
+            gc.set_rate_limit(args.rate)
+        n_removed = gc.collect()
+        print('Removed {} data directories'.format(n_removed))
+    finally:
+        storage.Close()
+
+
+def deduplicate(args):
+    storage = _tools.open_storage(args)
+    try:
+        if args.hardlinks_only:
+            storage.dedup.set_methods((files.HARDLINK,))
+        report = storage.dedup.run()
+        print('Checked {} files, hashed {} new or modified ones'
+              .format(report.n_files, report.n_hashed))
+        print('Linked {} duplicates, reclaimed {}'.format(
+            report.n_linked, _tools.format_size(report.reclaimed_bytes)))
+    finally:
+        storage.Close()
+
+
+def archive_runs(args):
+    if args.older_than is None and args.where is None:
+        raise exceptions.IllegalArgumentError(
+            'Select runs either by age (--older-than) '
+            'or by predicate (--where)')
+    if args.where is not None and args.model_spec is None:
+        raise exceptions.IllegalArgumentError(
+            'Filtering runs by predicate requires a model')
+    storage = _tools.open_storage(args)
+    try:
+        model = _get_model(storage, args.model_spec)
+        runs = storage.archive.select(_days(args.older_than), model)
+        if args.where is not None:
+            matching = {
+                run.key['id'] for run in storage.runs.list(model, args.where)
+            }
+            runs = [run for run in runs if run.key['id'] in matching]
+        if args.dry_run:
+            print('{} runs would be archived'.format(len(runs)))
+            return
+        report = storage.archive.archive(runs)
+        print('Archived {} runs with {} files'
+              .format(report.n_runs, report.n_files))
+        print('Packed {} into {}'.format(
+            _tools.format_size(report.n_bytes),
+            _tools.format_size(report.bundle_bytes)))
+    finally:
+        storage.Close()
+
+
+def list_tiers(args):
+    storage = _tools.open_storage(args)
+    try:
+        for tier, root in storage.tiers.list().items():
+            print('{}: {}'.format(tier, root))
+    finally:
+        storage.Close()
+
+
+def add_tier(args):
+    storage = _tools.open_storage(args)
+    try:
+        storage.tiers.add(args.name, args.path)
+        print('Tier "{}" was added'.format(args.name))
+    finally:
+        storage.Close()
+
+
+def move_to_tier(args):
+    if args.with_model and args.model_spec is None:
+        raise exceptions.IllegalArgumentError(
+            'Moving a model requires its name')
+    storage = _tools.open_storage(args)
+    try:
+        model = _get_model(storage, args.model_spec)
+        runs = storage.archive.select(_days(args.older_than), model)
+        reports = [storage.tiers.move_runs(runs, args.tier)]
+        if args.with_model:
+            reports.append(storage.tiers.move_models([model], args.tier))
+        print('Moved {} data directories with {} files ({})'.format(
+            sum(r.n_moved for r in reports),
+            sum(r.n_files for r in reports),
+            _tools.format_size(sum(r.n_bytes for r in reports))))
+        n_failed = sum(r.n_failed for r in reports)
+        if n_failed:
+            print('Failed to move {} data directories'.format(n_failed))
+    finally:
+        storage.Close()
+
+
+def check_storage(args):
+    storage = _tools.open_storage(args)
+    try:
+        report = storage.fsck.check(repair=args.repair)
+        for issue in report.issues:
+            where = ''
+            if issue.table is not None:
+                where = '{} #{}: '.format(issue.table, issue.row_id)
+            print('[{}] {}{}'.format(issue.check, where, issue.message))
+        if not report.issues:
+            print('No problems found')
+        else:
+            print('Found {} problems'.format(len(report.issues)))
+        if args.repair:
+            print('Repaired {} problems'.format(report.n_repaired))
+    finally:
+        storage.Close()
+
+
+def _get_model(storage, model_spec):
+    if model_spec is None:
+        return None
+    group = storage.groups.get(model_spec.group)
+    return storage.models.get(group, model_spec.model)
+
+
+def _days(n_days):
+    if n_days is None:
+        return None
+    return n_days * 24 * 3600
@@ -0,0 +1,170 @@
+from tensorlab import exceptions
+from tensorlab.local_storage.api import planner, facets as facets_api
+from . import _tools
+
+
+def setup(commands):
+    query_parser = commands.add_parser('query')
+    query_parser.add_argument('predicate', type=_tools.predicate_type)
+    query_parser.add_argument('--model', dest='model_spec',
+                              type=_tools.spec('{group}/{model}'),
+                              help='filter runs of this model')
+    query_parser.add_argument('--group', '-g',
+                              help='filter models of this group '
+                                   'instead of the root one')
+    query_parser.add_argument('--runs', action='store_true', default=False,
+                              help='filter runs of all models of the group '
+                                   'and its subgroups by attributes '
+                                   'of both models and runs')
+    query_parser.add_argument('--explain', action='store_true',
+                              default=False,
+                              help='show how the query is executed '
+                                   'instead of its results')
+    query_parser.add_argument('--order-by', action='append',
+                              type=_tools.order_type, metavar='ATTR[:desc]',
+                              help='order results by the attribute, '
+                                   'may be repeated')
+    query_parser.add_argument('--limit', type=int,
+                              help='show only this many first results')
+
+    index_parser = commands.add_parser('index')
+    index_parser.add_argument('--min-filters', type=int, default=10,
+                              help='advise indexes only for attributes '
+                                   'used by this many predicates')
+    index_parser.add_argument('--create', action='store_true',
+                              default=False,
+                              help='create advised indexes')
+
+    commands.add_parser('analyze')
+
+    facets_parser = commands.add_parser('facets')
+    facets_parser.add_argument('attrs', nargs='+', metavar='attr')
+    facets_parser.add_argument('--where', dest='predicate',
+                               type=_tools.predicate_type,
+                               help='count only matching models or runs')
+    facets_parser.add_argument('--model', dest='model_spec',
+                               type=_tools.spec('{group}/{model}'),
+                               help='count runs of this model')
+    facets_parser.add_argument('--group', '-g',
+                               help='count models of this group '
+                                    'instead of the root one')
+    facets_parser.add_argument('--bins', type=int,
+                               help='number of bins numeric values '
+                                    'are split into, 0 to count values')
+
+    return {
+        'query': run_query,
+        'index': advise_indexes,
+        'analyze': analyze_values,
+        'facets': count_facets,
+    }
+
+
+def run_query(args):
+    if args.runs and args.explain:
+        raise exceptions.IllegalArgumentError(
+            'Only filtering models of a group (--group) or runs of a model '
+            '(--model) can be explained, not runs of a group (--runs)')
+    storage = _tools.open_storage(args)
+    try:
+        target, scope = _get_scope(storage, args)
+        if args.explain:
+            _print_plan(storage.planner.explain(args.predicate, target, scope))
+        elif args.runs:
+            for run in storage.runs.list_in_group(
+                    args.group, args.predicate,
+                    order_by=args.order_by, limit=args.limit):
+                print(run.key['uid'])
+        elif target == planner.RUNS:
+            for run in storage.runs.list(scope, args.predicate,
+                                         args.order_by, args.limit):
+                print(run.key['uid'])
+        else:
+            for model in storage.models.list(
+                    scope, predicate=args.predicate,
+                    order_by=args.order_by, limit=args.limit):
+                print(model.name)
+    finally:
+        storage.Close()
+
+
+def advise_indexes(args):
+    storage = _tools.open_storage(args)
+    try:
+        proposals = storage.planner.advise(args.min_filters)
+        for proposal in proposals:
+            print('{}  -- used by {} filters on {}'.format(
+                proposal.sql, proposal.n_filters, ', '.join(proposal.attrs)))
+        if not proposals:
+            print('No indexes to advise')
+        elif args.create:
+            storage.planner.create_indexes(proposals)
+            print('Created {} indexes'.format(len(proposals)))
+    finally:
+        storage.Close()
+
+
+def analyze_values(args):
+    storage = _tools.open_storage(args)
+    try:
+        for stats in storage.stats.analyze():
+            bounds = ''
+            if stats.min_value is not None:
+                bounds = ', {!r}..{!r}'.format(stats.min_value,
+                                               stats.max_value)
+            print('{}: {} values, {} nulls, ~{} distinct{}'.format(
+                stats.attr.name, stats.n_values, stats.n_nulls,
+                stats.n_distinct, bounds))
+    finally:
+        storage.Close()
+
+
+def count_facets(args):
+    storage = _tools.open_storage(args)
+    try:
+        target, scope = _get_scope(storage, args)
+        bins = {}
+        if args.bins is not None:
+            bins = {name: args.bins for name in args.attrs}
+        facets = storage.facets.facets(target, scope, args.predicate,
+                                       args.attrs, bins)
+        for name, counts in facets.items():
+            print('{}:'.format(name))
+            for value, n in counts.items():
+                if isinstance(value, facets_api.Bin):
+                    value = '[{}, {})'.format(
+                        '' if value.low is None else value.low,
+                        '' if value.high is None else value.high)
+                print('  {}: {}'.format(value, n))
+    finally:
+        storage.Close()
+
+
+def _get_scope(storage, args):
+    """:returns (target, scope) of filtering selected by arguments"""
+    if args.model_spec is not None:
+        group = storage.groups.get(args.model_spec.group)
+        return planner.RUNS, storage.models.get(group, args.model_spec.model)
+    return planner.MODELS, storage.groups.get(args.group)
+
+
+def _print_plan(plan):
+    print('Predicate: {}'.format(plan.predicate.serialize()))
+    if plan.sql is None:
+        print('The predicate is never true, nothing is queried')
+    else:
+        print('SQL:\n  {}'.format(plan.sql.replace('\n', '\n  ')))
+        print('Parameters: {}'.format(plan.params))
+        print('Plan:')
+        for step in plan.steps:
+            print('  ' + step)
+    if plan.clauses:
+        print('Clauses:')
+    for clause in plan.clauses:
+        estimated = ''
+        if clause.estimated is not None:
+            estimated = ', estimated {:.1%}'.format(clause.estimated)
+        print('  {}: {} matched ({:.1%}{})'.format(
+            clause.clause, clause.n_matched, clause.selectivity, estimated))
+    print('Used indexes: {}'.format(', '.join(plan.used_indexes) or '-'))
+    print('Unused indexes: {}'.format(', '.join(plan.unused_indexes) or '-'))
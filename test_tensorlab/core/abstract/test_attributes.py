@@ -140,6 +140,22 @@ class AttributesStorageTests(StorageTestCase):
         self.assertEqual(self.storage.attributes.get_attr_values_for_model(m),
                          {a.name: 'somestring'})
 
+    def test_projection_of_attribute_values(self):
+        a = self._fixture_attr(None, name='a')
+        m = self._fixture_model(None, 'mdl', {a.name: 'somestring'})
+        b = self._fixture_attr(None, name='b', default='defaultvalue')
+
+        self.assertEqual(
+            self.storage.attributes.get_attr_values_for_model(m, [b.name]),
+            {b.name: 'defaultvalue'})
+        with self.assertRaises(exceptions.LookupError):
+            self.storage.attributes.get_attr_values_for_model(m, ['c'])
+        self.assertEqual(self.storage.attributes.get_attr_values_for_model(m),
+                         {a.name: 'somestring', b.name: 'defaultvalue'})
+        self.assertEqual(
+            self.storage.attributes.get_attr_values_for_model(m, [a.name]),
+            {a.name: 'somestring'})
+
     def test_apply_runtime_attribute_to_run(self):
         a = self._fixture_attr(None, runtime=True)
         m = self._fixture_model(None, 'mdl', {})
@@ -271,6 +287,21 @@ class AttributesStorageTests(StorageTestCase):
         self.assertEqual(self.storage.attributes.get_attr_values_for_model(m),
                          {a.name: 'asd'})
 
+    def test_renaming_enum_choice(self):
+        a = self._fixture_attr(None, type=AttributeType.Enum,
+                               options='qwe;asd', default='qwe')
+        m = self._fixture_model(None, 'm', {a.name: 'asd'})
+        self.storage.attributes.rename_choice(a, 'asd', 'zxc')
+        self.storage.attributes.rename_choice(a, 'qwe', 'ert')
+        self.assertEqual(a.options, 'ert;zxc')
+        self.assertEqual(a.default, 'ert')
+        self.assertEqual(self.storage.attributes.get_attr_values_for_model(m),
+                         {a.name: 'zxc'})
+        with self.assertRaises(exceptions.IllegalArgumentError):
+            self.storage.attributes.rename_choice(a, 'asd', 'fgh')
+        with self.assertRaises(exceptions.IllegalArgumentError):
+            self.storage.attributes.rename_choice(a, 'zxc', 'ert')
+
     def test_usage_stats(self):
         a = self._fixture_attr(None, nullable=True)
         g = self._fixture_group('g')
@@ -0,0 +1,76 @@
+import random
+from test_tensorlab.lib import TestCase
+from tensorlab.core.attributes import Attribute
+from tensorlab.core.attributeoptions import AttributeType as T
+from tensorlab.core.attribute_predicates import parse_expression
+from tensorlab.core.attribute_frame import AttributeFrame
+from tensorlab.core.predicate_compiler import evaluate
+from tensorlab import exceptions
+
+
+class TestAttributeFrame(TestCase):
+
+    def setUp(self):
+        rnd = random.Random(0)
+        self.attrs = [
+            Attribute(name='i', type=T.Integer, runtime=True),
+            Attribute(name='f', type=T.Float, runtime=True),
+            Attribute(name='s', type=T.String, runtime=True),
+            Attribute(name='e', type=T.Enum, runtime=True, options='a;b;c'),
+        ]
+        self.dicts = [
+            {'i': rnd.choice([None, 1, 2, 3]),
+             'f': rnd.choice([None, 0.5, 1.0, 2.5]),
+             's': rnd.choice([None, 'qwe', 'qwr', 'asd', 'q']),
+             'e': rnd.choice([None, 'a', 'c'])}
+            for _ in range(300)
+        ]
+        self.frame = AttributeFrame.build(
+            list(range(len(self.dicts))), self.attrs,
+            {a.name: [d[a.name] for d in self.dicts] for a in self.attrs})
+
+    def test_same_results_as_evaluation(self):
+        for string in ['i < 3 and f == 1',
+                       'not (i < 3 or e != "a")',
+                       'not i in (1, 2) or s startswith "qw"',
+                       'f between 0.6 and 2.5 and not s == "asd"',
+                       's < "qwe" or s >= "qwr" and e == "b"',
+                       's in ("q", "zzz") or e between "b" and "c"',
+                       'i == f or 1 == 1 and s != "qwe"',
+                       'i > 1 and i < 1',
+                       'not s startswith "q" and not s > "a"',
+                       'not (i between 3 and 1)',
+                       'not (e between "c" and "a") or f == 1',
+                       'not (f > 2 and f < 1)']:
+            expr = parse_expression(string)
+            expected = [n for n, d in enumerate(self.dicts)
+                        if evaluate(expr, d)]
+            self.assertEqual(list(self.frame.filter(expr).uids), expected,
+                             string)
+
+    def test_values(self):
+        frame = self.frame.filter(parse_expression('i == 2 and e == "c"'))
+        self.assertEqual(set(frame.get_values('i')), {2})
+        self.assertEqual(set(frame.get_values('e')), {'c'})
+        self.assertEqual(frame.get_values('s'), [
+            self.dicts[n]['s'] for n in frame.uids])
+
+    def test_integers_beyond_int64(self):
+        values = [10 ** 20, None, 5, -10 ** 19]
+        frame = AttributeFrame.build(
+            list(range(4)), self.attrs[:1], {'i': values})
+        self.assertEqual(frame.get_values('i'), values)
+        for string, expected in [('i > 5', [0]), ('i <= 5', [2, 3]),
+                                 ('i in (5, 100000000000000000000)', [0, 2]),
+                                 ('not i == 5', [0, 3])]:
+            self.assertEqual(
+                list(frame.filter(parse_expression(string)).uids), expected,
+                string)
+
+    def test_invalid_predicates(self):
+        with self.assertRaises(exceptions.LookupError):
+            self.frame.mask(parse_expression('x == 1'))
+        with self.assertRaises(exceptions.IllegalArgumentError):
+            self.frame.mask(parse_expression('e == "d"'))
+        with self.assertRaises(exceptions.IllegalArgumentError):
+            self.frame.mask(parse_expression('f startswith "1"'))
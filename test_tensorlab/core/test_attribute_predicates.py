@@ -70,3 +70,29 @@ class TestPredicatesParsing(TestCase):
                                                          Identifier('Y'),
                                                          Literal(20.0))))
 
+
+    def test_list_operations(self):
+        self.assertEqual(parse_expression('seed in (1, 2,3)'),
+                         BinaryOperation(Op.In, Identifier('seed'),
+                                         Literal((1, 2, 3))))
+        self.assertEqual(
+            parse_expression('lr between 0.001 and 1e-2 and x==1'),
+            BinaryOperation(Op.And,
+                            BinaryOperation(Op.Between, Identifier('lr'),
+                                            Literal((0.001, 0.01))),
+                            BinaryOperation(Op.Eq, Identifier('x'),
+                                            Literal(1))))
+        self.assertEqual(parse_expression('name startswith "resnet"'),
+                         BinaryOperation(Op.StartsWith, Identifier('name'),
+                                         Literal('resnet')))
+        self.assertEqual(parse_expression('index in (1'), None)
+        self.assertEqual(parse_expression('x between 1 or 2'), None)
+
+    def test_serialization_round_trip(self):
+        for string in ['a1 == 10',
+                       'seed in (1, 2, 3) or not (x in (\'a\', -1.5))',
+                       'lr between 0.001 and 0.01 and x <= 2',
+                       'name startswith \'resnet\' and (a > 1 or b != 2)']:
+            expr = parse_expression(string)
+            self.assertEqual(expr.serialize(), string)
+            self.assertEqual(parse_expression(expr.serialize()), expr)
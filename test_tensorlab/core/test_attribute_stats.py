@@ -0,0 +1,72 @@
+import random
+from test_tensorlab.lib import TestCase
+from tensorlab.core.attributes import Attribute
+from tensorlab.core.attributeoptions import AttributeType as T
+from tensorlab.core.attribute_predicates import parse_expression
+from tensorlab.core.attribute_stats import (
+    HyperLogLog, compute, build_histogram, estimate_clause,
+    order_by_selectivity
+)
+
+
+class TestAttributeStats(TestCase):
+
+    def test_distinct_values_are_estimated(self):
+        for n in (10, 1000, 50000):
+            hll = HyperLogLog()
+            for i in range(n):
+                hll.add(str(i))
+                hll.add(str(i))
+            self.assertLess(abs(hll.estimate() - n), n * 0.1 + 1)
+            self.assertEqual(HyperLogLog(hll.to_bytes()).estimate(),
+                             hll.estimate())
+
+    def test_histogram(self):
+        self.assertEqual(build_histogram([]), [])
+        self.assertEqual(build_histogram([1, 2, 3], 4), [1, 2, 3, 3])
+        self.assertEqual(build_histogram(list(range(100)), 4),
+                         [0, 25, 50, 75, 99])
+
+    def test_selectivity_is_estimated(self):
+        rnd = random.Random(0)
+        attrs = {
+            'x': Attribute(name='x', type=T.Integer, runtime=False),
+            'opt': Attribute(name='opt', type=T.Enum, runtime=False,
+                             options='sgd;adam;rmsprop'),
+        }
+        values = {
+            'x': [str(int(rnd.expovariate(0.01))) for _ in range(5000)]
+                 + [None] * 100,
+            'opt': ['sgd'] * 300 + ['adam'] * 100,
+        }
+        stats = {name: compute(attrs[name], values[name])[0]
+                 for name in attrs}
+        self.assertEqual(stats['x'].n_nulls, 100)
+        self.assertEqual(stats['opt'].frequencies,
+                         {'sgd': 300, 'adam': 100, 'rmsprop': 0})
+
+        decoded = [int(v) for v in values['x'] if v is not None]
+        for string, actual in [
+                ('x < 50', sum(v < 50 for v in decoded)),
+                ('x between 100 and 300',
+                 sum(100 <= v <= 300 for v in decoded)),
+                ('not x >= 10', sum(v < 10 for v in decoded)),
+                ('x in (1, 2, 3)', sum(v in (1, 2, 3) for v in decoded))]:
+            estimated = estimate_clause(parse_expression(string), stats.get)
+            self.assertAlmostEqual(estimated, actual / len(decoded),
+                                   delta=0.03, msg=string)
+        self.assertEqual(estimate_clause(
+            parse_expression('opt == "adam"'), stats.get), 0.25)
+        self.assertEqual(estimate_clause(
+            parse_expression('opt == "rmsprop"'), stats.get), 0.0)
+        self.assertIsNone(estimate_clause(
+            parse_expression('y == 1'), stats.get))
+
+        ordered = order_by_selectivity(parse_expression(
+            'x > 10 and opt == "adam" and x < 2'), stats.get)
+        self.assertEqual(ordered.serialize(),
+                         "x < 2 and opt == 'adam' and x > 10")
+        ordered = order_by_selectivity(parse_expression(
+            'x < 2 or y == 1 or opt == "sgd"'), stats.get)
+        self.assertEqual(ordered.serialize(),
+                         "opt == 'sgd' or y == 1 or x < 2")
@@ -1,6 +1,8 @@
+import numpy as np
 from test_tensorlab import TestCase
 
-from tensorlab.core.attributeoptions import AttributeType
+from tensorlab.core.attributeoptions import AttributeType, ChoiceCodes
+from tensorlab.core.attributes import Attribute
 from tensorlab import exceptions
 
 
@@ -147,3 +149,83 @@ class AttributeTypeDecodingTests(TestCase):
 
     def test_decode_string(self):
         self._test_decode_enum_or_string(AttributeType.String)
+
+
+class ChoiceCodesTests(TestCase):
+
+    def test_codes(self):
+        codes = ChoiceCodes.from_options('sgd;adam')
+        self.assertEqual(codes.encode('adam'), '1')
+        self.assertEqual(codes.decode('0'), 'sgd')
+        self.assertRaises(exceptions.IllegalArgumentError,
+                          codes.encode, 'rmsprop')
+        self.assertRaises(exceptions.IllegalArgumentError, codes.decode, '2')
+
+        codes = codes.update('adam;rmsprop').rename('adam', 'adamw')
+        self.assertEqual(codes.serialize(), ';adamw;rmsprop')
+        self.assertEqual(ChoiceCodes.parse(codes.serialize()).choices,
+                         ['', 'adamw', 'rmsprop'])
+        self.assertFalse(codes.has_code('0'))
+        self.assertEqual(codes.encode('rmsprop'), '2')
+        self.assertIsNone(ChoiceCodes.parse(None))
+
+
+class CodecTests(TestCase):
+
+    def test_codecs_are_shared(self):
+        codec = AttributeType.Integer.get_codec('positive')
+        self.assertIs(AttributeType.Integer.get_codec('positive'), codec)
+        self.assertIsNot(AttributeType.Integer.get_codec(''), codec)
+        self.assertEqual(codec.encode(5), '5')
+        self.assertEqual(codec.decode('5'), 5)
+        self.assertRaises(exceptions.IllegalArgumentError, codec.encode, -5)
+
+    def test_many_values(self):
+        codec = AttributeType.Integer.get_codec('negative')
+        values, present = codec.decode_many(['-1', None, '0'])
+        self.assertEqual(values.dtype, np.int64)
+        self.assertEqual(values.tolist(), [-1, 0, 0])
+        self.assertEqual(present.tolist(), [True, False, True])
+        self.assertEqual(codec.encode_many(values, present),
+                         ['-1', None, '0'])
+        self.assertEqual(codec.encode_many([-3, None]), ['-3', None])
+        self.assertRaises(exceptions.IllegalArgumentError,
+                          codec.encode_many, np.array([-1, 2]))
+        self.assertRaises(exceptions.IllegalArgumentError,
+                          codec.decode_many, ['1.5'])
+
+        codec = AttributeType.Integer.get_codec('')
+        values, present = codec.decode_many(['-1', None, str(10 ** 20)])
+        self.assertEqual(values.tolist(), [-1, 0, 10 ** 20])
+        self.assertEqual(codec.encode_many(values, present),
+                         ['-1', None, str(10 ** 20)])
+        # floats are not truncated, as by encode
+        self.assertEqual(codec.encode_many(np.array([1.5, 2.0])),
+                         [codec.encode(1.5), codec.encode(2.0)])
+
+        codec = AttributeType.Float.get_codec('')
+        self.assertEqual(codec.encode_many(np.array([0.5, 12e-10])),
+                         ['0.5', '1.2e-09'])
+        self.assertEqual(codec.encode_many(np.array([3])),
+                         [codec.encode(3)])
+
+        codec = AttributeType.Enum.get_codec(
+            'sgd;adamw', ChoiceCodes(['sgd', '', 'adamw']))
+        values, present = codec.decode_many(np.array(['2', None, '0'],
+                                                     dtype=object))
+        self.assertEqual(values.tolist(), ['adamw', None, 'sgd'])
+        self.assertEqual(codec.encode_many(values.tolist()),
+                         ['2', None, '0'])
+        self.assertRaises(exceptions.IllegalArgumentError,
+                          codec.decode_many, ['1'])
+        self.assertRaises(exceptions.IllegalArgumentError,
+                          codec.encode_many, ['adam'])
+
+    def test_codec_of_attribute(self):
+        attr = Attribute(name='opt', type=AttributeType.Enum,
+                         runtime=False, options='a;b')
+        codec = attr.get_codec()
+        self.assertIs(attr.get_codec(), codec)
+        attr.options = 'a;b;c'
+        self.assertEqual(attr.normalize_value('c'), 'c')
+        self.assertIsNot(attr.get_codec(), codec)
@@ -0,0 +1,40 @@
+from test_tensorlab.lib import TestCase
+from tensorlab.core import cache
+from tensorlab.core.attribute_predicates import parse_expression
+
+
+class TestCache(TestCase):
+
+    def test_least_recently_used_are_evicted(self):
+        c = cache.LRUCache(2)
+        c.put('a', 1)
+        c.put('b', 2)
+        self.assertEqual(c.get('a'), 1)
+        c.put('c', 3)
+        self.assertIsNone(c.get('b'))
+        self.assertEqual(c.get_or_create('c', lambda key: 4), 3)
+        self.assertEqual(c.get_or_create('d', lambda key: key * 2), 'dd')
+        self.assertEqual(c.stats(), cache.CacheStats(2, 2, 2, 2))
+        c.resize(1)
+        self.assertEqual(len(c), 1)
+        self.assertEqual(c.get('d'), 'dd')
+        c.resize(0)
+        self.assertEqual(c.get_or_create('e', lambda key: 5), 5)
+        self.assertEqual(len(c), 0)
+
+    def test_registry(self):
+        c = cache.register('test_registry', 10)
+        self.assertIs(cache.register('test_registry', 20), c)
+        cache.configure('test_registry', 5)
+        c.put('a', 1)
+        self.assertEqual(cache.get_stats()['test_registry'],
+                         cache.CacheStats(0, 0, 1, 5))
+        cache.clear_all()
+        self.assertEqual(len(c), 0)
+
+    def test_parsed_expressions_are_cached(self):
+        e = parse_expression('a  ==\t"x  y" and b < 1')
+        self.assertIs(parse_expression(' a == "x  y"  and\n b < 1 '), e)
+        self.assertIsNot(parse_expression('a == "x y" and b < 1'), e)
+        self.assertEqual(e.serialize(), 'a == \'x  y\' and b < 1')
+        self.assertIsNone(parse_expression('a == '))
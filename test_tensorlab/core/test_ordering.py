@@ -0,0 +1,56 @@
+from test_tensorlab.lib import TestCase
+from tensorlab.core import ordering
+from tensorlab.core.attributes import Attribute
+from tensorlab.core.attribute_frame import AttributeFrame
+from tensorlab.core.attributeoptions import AttributeType as T
+from tensorlab import exceptions
+
+
+class OrderingTests(TestCase):
+
+    ITEMS = [
+        {'acc': 0.5, 'opt': 'sgd'},
+        {'acc': None, 'opt': 'adam'},
+        {'acc': 0.9, 'opt': 'sgd'},
+        {'acc': 0.7, 'opt': 'adam'},
+        {'acc': 0.9, 'opt': 'adam'},
+    ]
+
+    @staticmethod
+    def _get_value(item, name):
+        return item[name]
+
+    def test_sort(self):
+        items = ordering.sort(self.ITEMS, [('acc', 'desc'), 'opt'],
+                              self._get_value)
+        self.assertEqual([(i['acc'], i['opt']) for i in items], [
+            (0.9, 'adam'), (0.9, 'sgd'), (0.7, 'adam'), (0.5, 'sgd'),
+            (None, 'adam')])
+        items = ordering.sort(self.ITEMS, ['acc'], self._get_value)
+        self.assertEqual([i['acc'] for i in items],
+                         [0.5, 0.7, 0.9, 0.9, None])
+        with self.assertRaises(exceptions.IllegalArgumentError):
+            ordering.sort(self.ITEMS, [('acc', 'up')], self._get_value)
+
+    def test_top_k(self):
+        order = [('acc', 'DESC')]
+        self.assertEqual(
+            ordering.top_k(iter(self.ITEMS), 2, order, self._get_value),
+            [self.ITEMS[2], self.ITEMS[4]])
+        self.assertEqual(
+            ordering.top_k(self.ITEMS, 10, order, self._get_value),
+            ordering.sort(self.ITEMS, order, self._get_value))
+        self.assertEqual(
+            ordering.top_k(self.ITEMS, 0, order, self._get_value), [])
+
+    def test_frame(self):
+        attrs = [Attribute(name='acc', type=T.Float, runtime=True),
+                 Attribute(name='opt', type=T.Enum, runtime=False,
+                           options='sgd;adam')]
+        frame = AttributeFrame.build(
+            ['u{}'.format(i) for i in range(len(self.ITEMS))], attrs,
+            {name: [i[name] for i in self.ITEMS] for name in ['acc', 'opt']})
+        self.assertEqual(list(frame.sort([('acc', 'desc')], 3).uids),
+                         ['u2', 'u4', 'u3'])
+        self.assertEqual(list(frame.sort(['opt', 'acc']).uids),
+                         ['u3', 'u4', 'u1', 'u0', 'u2'])
@@ -0,0 +1,59 @@
+import random
+from test_tensorlab.lib import TestCase
+from tensorlab.core.attributes import Attribute
+from tensorlab.core.attributeoptions import AttributeType as T
+from tensorlab.core.attribute_predicates import parse_expression
+from tensorlab.core.predicate_compiler import evaluate
+from tensorlab import exceptions
+
+
+class TestPredicateCompiler(TestCase):
+
+    def test_same_results_as_evaluation(self):
+        rnd = random.Random(0)
+        dicts = [
+            {'a': rnd.choice([None, 1, 2, 3, 4.5]),
+             'b': rnd.choice([None, 1, 2]),
+             's': rnd.choice([None, 'qwe', 'qwr', 'asd'])}
+            for _ in range(200)
+        ]
+        for string in ['a < 3 and b == 1',
+                       'not (a < 3 or b != 1)',
+                       'not a in (1, 2) or s startswith "qw"',
+                       'a between 2 and 4 and not s == "asd"',
+                       'a > 1 and a < 1 or b == 2',
+                       'a == b or 1 == 1 and s != "qwe"',
+                       'not not (a >= 2 and not b <= 1)',
+                       'not (a between 3 and 1)',
+                       'not (s between "z" and "a") and b == 1',
+                       'not (a > 3 and a < 1) or s == "qwe"',
+                       'not (b == 1 and b == 2)',
+                       'not (a in (1, 2) and a > 3)']:
+            expr = parse_expression(string)
+            func = expr.compile()
+            for d in dicts:
+                self.assertEqual(func(d), bool(evaluate(expr, d)),
+                                 (string, d))
+
+    def test_values_are_converted_by_attributes(self):
+        attrs = {
+            'lr': Attribute(name='lr', type=T.Float, runtime=False),
+            'opt': Attribute(name='opt', type=T.Enum, runtime=False,
+                             options='sgd;adam'),
+        }
+        func = parse_expression('lr < "0.5" and opt in ("sgd")').compile(attrs)
+        self.assertTrue(func({'lr': 0.1, 'opt': 'sgd'}))
+        self.assertFalse(func({'lr': 0.1, 'opt': 'adam'}))
+        self.assertFalse(func({'lr': None, 'opt': 'sgd'}))
+        with self.assertRaises(exceptions.IllegalArgumentError):
+            parse_expression('opt == "rmsprop"').compile(attrs)
+        with self.assertRaises(exceptions.IllegalArgumentError):
+            parse_expression('lr startswith "0"').compile(attrs)
+        with self.assertRaises(exceptions.LookupError):
+            parse_expression('epochs > 1').compile(attrs)
+
+    def test_functions_are_cached(self):
+        f1 = parse_expression('b == 2 and a == 1').compile()
+        f2 = parse_expression('not (a != 1 or 2 != b)').compile()
+        self.assertIs(f1, f2)
+        self.assertIsNot(f1, parse_expression('a == 1').compile())
@@ -0,0 +1,142 @@
+import random
+from test_tensorlab.lib import TestCase
+from tensorlab.core.attribute_predicates import parse_expression
+from tensorlab.core.predicate_compiler import evaluate
+from tensorlab.core.predicate_optimizer import (
+    optimize, canonical_hash, TRUE, FALSE
+)
+
+
+class TestPredicateOptimizer(TestCase):
+
+    def _optimized(self, string):
+        return optimize(parse_expression(string)).serialize()
+
+    def test_negations_are_pushed_down(self):
+        self.assertEqual(self._optimized('not (a < 5 and b == 2)'),
+                         'a >= 5 or b != 2')
+        self.assertEqual(self._optimized('not not (x > 2)'), 'x > 2')
+        self.assertEqual(self._optimized('not (x > 1 or y <= 1)'),
+                         'x <= 1 and y > 1')
+        self.assertEqual(self._optimized('not x'), 'not x')
+
+    def test_constants_are_folded(self):
+        self.assertEqual(self._optimized('1 < 2 and x == 1'), 'x == 1')
+        self.assertEqual(self._optimized('x == 1 and (y == 2 or 1 > 2)'),
+                         'x == 1 and y == 2')
+        self.assertEqual(optimize(parse_expression('x == 1 or 3 == 3')), TRUE)
+        self.assertEqual(optimize(parse_expression('x == 1 and "a" == "b"')),
+                         FALSE)
+        self.assertEqual(self._optimized('5 > a'), 'a < 5')
+
+    def test_ranges_are_merged(self):
+        self.assertEqual(self._optimized('a > 1 and a > 3 and a <= 10'),
+                         'a <= 10 and a > 3')
+        self.assertEqual(self._optimized('a >= 3 and a <= 3 and a != 4'),
+                         'a == 3')
+        self.assertEqual(self._optimized('a > 1 and a < 5 and a != 7'),
+                         'a < 5 and a > 1')
+        self.assertEqual(self._optimized('a > 1 or a > 3 or a == 0 or a == 5'),
+                         'a == 0 or a > 1')
+
+    def test_contradictions(self):
+        for string in ['a > 5 and a < 3',
+                       'a == 1 and a == 2',
+                       'a > 1 and a <= 1',
+                       's == "q" and not s != "w"',
+                       'a >= 2 and a <= 2 and a != 2',
+                       '(a < 0 and a > 0) or (b == 1 and b == 2)']:
+            self.assertEqual(optimize(parse_expression(string)), FALSE,
+                             string)
+        # a value can be missing, so this is not a tautology
+        self.assertEqual(self._optimized('a < 5 or a >= 5'),
+                         'a < 5 or a >= 5')
+
+    def test_duplicates_are_removed(self):
+        self.assertEqual(self._optimized('x == 1 or x == 1'), 'x == 1')
+        self.assertEqual(self._optimized('a == 1 and b == 2 or a == 1'),
+                         'a == 1')
+        self.assertEqual(
+            self._optimized('(a == 1 or b == 2) and (b == 2 or a == 1)'),
+            'a == 1 or b == 2')
+
+    def test_list_operations(self):
+        self.assertEqual(
+            self._optimized('s == 1 or s == 2 or s == 3 or s in (3, 4)'),
+            's in (1, 2, 3, 4)')
+        self.assertEqual(
+            self._optimized('s in (1, 2, 3) and s in (2, 3, 4) and s != 3'),
+            's == 2')
+        self.assertEqual(self._optimized('a >= 1 and a <= 5'),
+                         'a between 1 and 5')
+        self.assertEqual(
+            self._optimized('a between 1 and 10 and a < 5 and a >= 2'),
+            'a < 5 and a >= 2')
+        self.assertEqual(self._optimized('not a in (1)'), 'a != 1')
+        self.assertEqual(self._optimized('not a in (1, 2)'),
+                         'not (a in (1, 2))')
+        self.assertEqual(self._optimized('x > 5 or x in (1, 6, 7)'),
+                         'x == 1 or x > 5')
+        for string in ['s in (1, 2) and s > 5',
+                       'a between 3 and 1',
+                       'not "abc" startswith "ab"']:
+            self.assertEqual(optimize(parse_expression(string)), FALSE,
+                             string)
+
+    def test_canonical_hash(self):
+        def h(string):
+            return canonical_hash(parse_expression(string))
+        self.assertEqual(h('b == 2 and a == 1'), h('a == 1 and b == 2'))
+        self.assertEqual(h('not (a < 1 or b != 2)'), h('b == 2 and 1 <= a'))
+        self.assertNotEqual(h('a == 1'), h('a == 1.5'))
+
+    def _assert_same_results(self, string, dicts):
+        expr = parse_expression(string)
+        optimized = optimize(expr)
+        for d in dicts:
+            self.assertEqual(bool(evaluate(optimized, d)),
+                             bool(evaluate(expr, d)), (string, d))
+
+    def test_negated_contradictions(self):
+        dicts = [{'a': a, 's': s} for a in [None, 0, 2, 4]
+                 for s in [None, 'ab', 'b']]
+        for string in ['not (a between 3 and 1)',
+                       'not (a between 3 and 1) and s == "b"',
+                       'not (a > 5 and a < 3)',
+                       'not (a == 1 and a == 2)',
+                       'not (s in (1, 2) and s > 5)',
+                       'not not (a between 3 and 1)']:
+            self._assert_same_results(string, dicts)
+        self.assertEqual(self._optimized('not (a between 3 and 1)'),
+                         'not (a between 3 and 1)')
+
+    def test_same_results_as_evaluation(self):
+        rnd = random.Random(0)
+        dicts = [{'a': rnd.choice([None, 1, 2, 3]),
+                  'b': rnd.choice([None, 1, 2])} for _ in range(50)]
+
+        def comparison():
+            name = rnd.choice(['a', 'b'])
+            kind = rnd.randrange(3)
+            if kind == 0:
+                return '{} {} {}'.format(
+                    name, rnd.choice(['==', '!=', '<', '>', '<=', '>=']),
+                    rnd.randrange(4))
+            if kind == 1:
+                return '{} between {} and {}'.format(
+                    name, rnd.randrange(4), rnd.randrange(4))
+            return '{} in ({})'.format(name, ', '.join(
+                str(rnd.randrange(4)) for _ in range(rnd.randrange(1, 3))))
+
+        def expression(depth):
+            if depth == 0 or rnd.random() < 0.3:
+                return comparison()
+            kind = rnd.randrange(3)
+            if kind == 0:
+                return 'not ({})'.format(expression(depth - 1))
+            return '({}) {} ({})'.format(expression(depth - 1),
+                                         ['and', 'or'][kind - 1],
+                                         expression(depth - 1))
+
+        for _ in range(300):
+            self._assert_same_results(expression(4), dicts)
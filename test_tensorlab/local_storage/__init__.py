@@ -28,6 +28,7 @@ class _LocalStorageSetUp(TestCase):
 
     def tearDown(self):
         super(_LocalStorageSetUp, self).tearDown()
+        self.storage.Close()
         shutil.rmtree(self.storage_dir)
 
 
@@ -63,6 +64,8 @@ class ModelsLocalStorageTests(
         return yes
 
     def is_data_path_valid(self, data_dir):
+        # data directories of deleted objects are removed in background
+        self.storage.gc.join()
         return os.path.isdir(data_dir)
 
 
@@ -80,6 +83,8 @@ class RunsLocalStorageTests(
         raise NotImplementedError
 
     def is_data_path_valid(self, data_dir):
+        # data directories of deleted objects are removed in background
+        self.storage.gc.join()
         return os.path.isdir(data_dir)
 
     def reset_mocks(self):
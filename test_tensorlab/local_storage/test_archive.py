@@ -0,0 +1,89 @@
+import os
+import time
+from test_tensorlab.core.abstract._base import StorageTestCase
+from test_tensorlab.local_storage import _LocalStorageSetUp
+from tensorlab.local_storage import files
+
+
+class RunArchiveTests(_LocalStorageSetUp, StorageTestCase):
+
+    def _write(self, data_path, name, content):
+        path = os.path.join(data_path, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
+    def _read(self, path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def _fixture_archived_run(self):
+        m = self._fixture_model(None, 'mdl', {})
+        r = self._fixture_run(m, {}, started_at=5, finished_at=10)
+        path = self.storage.runs.get_data_path(r)
+        self._write(path, 'logs/events', b'event' * 1000)
+        self._write(path, 'ckpt', b'weights')
+        os.makedirs(os.path.join(path, 'empty'))
+        os.symlink('ckpt', os.path.join(path, 'latest'))
+
+        report = self.storage.archive.archive(self.storage.archive.select())
+        self.assertEqual(report.n_runs, 1)
+        self.assertEqual(report.n_files, 2)
+        self.assertEqual(report.n_bytes, 5007)
+        self.assertLess(report.bundle_bytes, report.n_bytes)
+        return r, path
+
+    def test_archived_run_is_restored_on_access(self):
+        r, path = self._fixture_archived_run()
+        self.assertFalse(os.path.exists(path))
+        self.assertTrue(self.storage.archive.is_archived(r))
+        self.assertEqual(self.storage.archive.select(), [])
+        self.assertEqual(sorted(self.storage.archive.list_files(r)),
+                         [('ckpt', 7), ('logs/events', 5000)])
+
+        self.assertEqual(self.storage.runs.get_data_path(r), path)
+        self.assertEqual(self._read(os.path.join(path, 'logs/events')),
+                         b'event' * 1000)
+        self.assertTrue(os.path.isdir(os.path.join(path, 'empty')))
+        self.assertEqual(os.readlink(os.path.join(path, 'latest')), 'ckpt')
+        self.assertFalse(self.storage.archive.is_archived(r))
+        self.assertEqual(os.listdir(files.get_archives_dir(self.storage_dir)),
+                         [])
+
+    def test_files_are_read_from_bundle(self):
+        r, path = self._fixture_archived_run()
+        with self.storage.runs.open_data_file(r, 'logs/events') as f:
+            self.assertEqual(f.read(), b'event' * 1000)
+        with self.assertRaises(FileNotFoundError):
+            self.storage.runs.open_data_file(r, 'missing')
+        self.assertFalse(os.path.exists(path))
+
+    def test_selection_by_age(self):
+        m = self._fixture_model(None, 'mdl', {})
+        old = self._fixture_run(m, {})
+        self.storage.runs.set_time(old, finished_at=10)
+        self._fixture_run(m, {})
+        self.assertEqual(self.storage.archive.select(older_than=60), [old])
+        self.assertEqual(len(self.storage.archive.select()), 2)
+
+    def test_bundle_is_collected_with_deleted_run(self):
+        r, _ = self._fixture_archived_run()
+        bundle_path = files.get_bundle_path(self.storage_dir, r.key['uid'])
+        self.assertTrue(os.path.isfile(bundle_path))
+        self.storage.runs.delete(r)
+        self.storage.gc.join()
+        self.assertFalse(os.path.exists(bundle_path))
+
+    def test_files_older_than_zip_timestamps(self):
+        src = os.path.join(self.storage_dir, 'src')
+        path = self._write(src, 'old', b'old' * 100)
+        os.utime(path, (0, 0))
+        bundle_path = os.path.join(self.storage_dir, 'bundles', 'old.zip')
+        self.assertEqual(files.pack_bundle(src, bundle_path), (1, 300))
+        dst = os.path.join(self.storage_dir, 'dst')
+        files.unpack_bundle(bundle_path, dst)
+        restored = os.path.join(dst, 'old')
+        self.assertEqual(self._read(restored), b'old' * 100)
+        self.assertEqual(time.localtime(os.stat(restored).st_mtime)[:6],
+                         (1980, 1, 1, 0, 0, 0))
@@ -0,0 +1,82 @@
+from test_tensorlab.core.abstract._base import StorageTestCase
+from test_tensorlab.local_storage import _LocalStorageSetUp
+from tensorlab.core.attributeoptions import AttributeType as T
+from tensorlab.core.attribute_predicates import parse_expression
+from tensorlab.local_storage.db import tables as _t
+from tensorlab import exceptions
+
+
+class BulkChangesTests(_LocalStorageSetUp, StorageTestCase):
+
+    def setUp(self):
+        super(BulkChangesTests, self).setUp()
+        self._fixture_attr(None, 'epochs', type=T.Integer)
+        self.status = self._fixture_attr(None, 'status', runtime=True,
+                                         type=T.Enum, options='ok;failed')
+        self.group = self._fixture_group('x')
+        self.models = [self._fixture_model(self.group, 'm{}'.format(i),
+                                           {'epochs': i * 5})
+                       for i in range(5)]
+        # models have no values of the attribute added after them
+        self.dataset = self._fixture_attr(None, 'dataset', type=T.Enum,
+                                          options='v1;v2', nullable=True)
+
+    def _set_status(self, run, status):
+        self.storage._get_impl().db.execute(
+            _t.RunValues.insert().values(
+                run_id=run.key['id'], attr_id=self.status.key['id'],
+                value=self.status.encode_value(status)))
+
+    def _datasets(self):
+        return [self.storage.models.get_attrs(model, ['dataset'])['dataset']
+                for model in self.models]
+
+    def test_update_attrs_where(self):
+        n_updated = self.storage.models.update_attrs_where(
+            self.group, parse_expression('epochs > 10'), {'dataset': 'v2'})
+        self.assertEqual(n_updated, 2)
+        self.assertEqual(self._datasets(), [None, None, None, 'v2', 'v2'])
+
+        # models keep matching as their values are changed
+        n_updated = self.storage.models.update_attrs_where(
+            self.group, parse_expression('epochs >= 10'),
+            {'epochs': 0, 'dataset': 'v1'})
+        self.assertEqual(n_updated, 3)
+        self.assertEqual(self._datasets(), [None, None, 'v1', 'v1', 'v1'])
+        stats = self.storage.stats.get(self.dataset)
+        self.assertEqual(stats.frequencies, {'v1': 3, 'v2': 0})
+        self.assertEqual(self.storage.models.update_attrs_where(
+            self.group, parse_expression('epochs > 0 and epochs < 0'),
+            {'epochs': 1}), 0)
+
+    def test_update_attrs_where_is_validated(self):
+        update = self.storage.models.update_attrs_where
+        with self.assertRaises(exceptions.IllegalArgumentError):
+            update(self.group, None, {'dataset': 'v3'})
+        with self.assertRaises(exceptions.IllegalArgumentError):
+            update(self.group, None, {'epochs': None})
+        with self.assertRaises(exceptions.LookupError):
+            update(self.group, None, {'status': 'ok'})
+        self.assertEqual(self._datasets(), [None] * 5)
+
+    def test_delete_where(self):
+        for model in self.models:
+            for i, status in enumerate(['ok', 'failed', 'ok']):
+                run = self._fixture_run(model, {}, started_at=i)
+                self._set_status(run, status)
+        failed = parse_expression('status == "failed"')
+        self.assertEqual(
+            self.storage.runs.delete_where(self.models[0], failed), 1)
+        self.assertEqual(
+            [r.started_at for r in self.storage.runs.list(self.models[0])],
+            [0, 2])
+        self.assertEqual(self.storage.runs.delete_where(
+            self.group, parse_expression('epochs > 10 and status == "ok"')), 4)
+        self.assertEqual(self.storage.runs.delete_where('x', failed), 4)
+        self.assertEqual(
+            [len(self.storage.runs.list(model)) for model in self.models],
+            [2, 2, 2, 0, 0])
+        values = self.storage._get_impl().db.execute(
+            _t.RunValues.select().where(
+                _t.RunValues.c.attr_id == self.status.key['id']))
+        self.assertEqual(len(values.fetchall()), 6)
@@ -0,0 +1,56 @@
+import os
+from test_tensorlab.core.abstract._base import StorageTestCase
+from test_tensorlab.local_storage import _LocalStorageSetUp
+
+
+class DeduplicationTests(_LocalStorageSetUp, StorageTestCase):
+
+    def _write(self, run, name, content):
+        path = os.path.join(self.storage.runs.get_data_path(run), name)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
+    def _read(self, path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def test_identical_files_are_deduplicated(self):
+        m = self._fixture_model(None, 'mdl', {})
+        r1, r2, r3 = [self._fixture_run(m, {}) for _ in range(3)]
+        vocab = b'vocabulary' * 1000
+        paths = [self._write(r, 'vocab', vocab) for r in (r1, r2, r3)]
+        unique = self._write(r3, 'weights', b'weights' * 1000)
+
+        report = self.storage.dedup.run()
+        self.assertEqual(report.n_files, 4)
+        self.assertEqual(report.n_hashed, 4)
+        self.assertEqual(report.n_linked, 2)
+        self.assertEqual(report.reclaimed_bytes, 2 * len(vocab))
+        for path in paths:
+            self.assertEqual(self._read(path), vocab)
+        self.assertEqual(self._read(unique), b'weights' * 1000)
+
+        report = self.storage.dedup.run()
+        self.assertEqual(report.n_files, 4)
+        self.assertEqual(report.n_hashed, 0)
+        self.assertEqual(report.n_linked, 0)
+
+    def test_unreferenced_blobs_are_collected(self):
+        m = self._fixture_model(None, 'mdl', {})
+        r1, r2 = self._fixture_run(m, {}), self._fixture_run(m, {})
+        self._write(r1, 'vocab', b'vocabulary')
+        self._write(r2, 'vocab', b'vocabulary')
+        self.storage.dedup.run()
+
+        self.storage.runs.delete(r1)
+        self.storage.gc.join()
+        self.assertEqual(self.storage.dedup.count_unreferenced(), 0)
+
+        self.storage.runs.delete(r2)
+        self.storage.gc.join()
+        self.assertEqual(self.storage.dedup.count_unreferenced(), 0)
+        blobs_dir = os.path.join(self.storage_dir, 'blobs')
+        self.assertEqual(
+            [name for _, _, names in os.walk(blobs_dir) for name in names],
+            [])
@@ -0,0 +1,73 @@
+import sqlalchemy as sa
+from test_tensorlab.core.abstract._base import StorageTestCase
+from test_tensorlab.local_storage import _LocalStorageSetUp
+from tensorlab.core.attributeoptions import AttributeType as T
+from tensorlab.core.attribute_predicates import parse_expression
+from tensorlab.local_storage.db import tables as _t
+from tensorlab.local_storage.api import planner
+from tensorlab import exceptions
+
+
+class EnumCodesTests(_LocalStorageSetUp, StorageTestCase):
+
+    def setUp(self):
+        super(EnumCodesTests, self).setUp()
+        self.opt = self._fixture_attr(None, 'opt', type=T.Enum,
+                                      options='sgd;adam;rmsprop')
+        for i, opt in enumerate(['rmsprop', 'adam', 'sgd', 'adam']):
+            self._fixture_model(None, 'm{}'.format(i), {'opt': opt})
+
+    def _stored_values(self):
+        mv = _t.ModelValues
+        q = sa.select([mv.c.value]).order_by(mv.c.id)
+        return [row[0] for row in self.storage._get_impl().db.execute(q)]
+
+    def _list(self, predicate=None, **kwargs):
+        if predicate is not None:
+            predicate = parse_expression(predicate)
+        models = self.storage.models.list(None, predicate=predicate, **kwargs)
+        return [m.name for m in models]
+
+    def test_values_are_stored_as_codes(self):
+        self.assertEqual(self._stored_values(), ['2', '1', '0', '1'])
+        [opt] = self.storage.attributes.list(None)
+        self.assertEqual(opt.decode_value('1'), 'adam')
+        self.assertEqual(self._list('opt == "adam"'), ['m1', 'm3'])
+        self.assertEqual(self._list('opt in ("sgd", "rmsprop")'),
+                         ['m0', 'm2'])
+        # choices are compared by their names
+        self.assertEqual(self._list('opt < "rmsprop"'), ['m1', 'm3'])
+        self.assertEqual(self._list('opt startswith "s"'), ['m2'])
+        self.assertEqual(self._list('not opt > "sgd"'),
+                         ['m0', 'm1', 'm2', 'm3'])
+        self.assertEqual(self._list(order_by=['opt']),
+                         ['m1', 'm3', 'm0', 'm2'])
+        facets = self.storage.facets.facets(
+            planner.MODELS, None, None, ['opt'])
+        self.assertEqual(list(facets['opt'].items()),
+                         [('adam', 2), ('rmsprop', 1), ('sgd', 1)])
+
+    def test_choices_change_without_values(self):
+        self.storage.attributes.rename_choice(self.opt, 'adam', 'adamw')
+        self.opt.options = 'sgd;adamw;rmsprop;nesterov'
+        self.storage.attributes.update(self.opt)
+        self.assertEqual(self._stored_values(), ['2', '1', '0', '1'])
+        self._fixture_model(None, 'm4', {'opt': 'nesterov'})
+        self.assertEqual(self._stored_values()[-1], '3')
+        self.assertEqual(self._list('opt == "adamw"'), ['m1', 'm3'])
+        with self.assertRaises(exceptions.IllegalArgumentError):
+            self._list('opt == "adam"')
+
+        # codes of removed choices are not reused
+        [model] = self.storage.models.list(None, 'm2')
+        model.delete()
+        self.opt.options = 'adamw;rmsprop;nesterov;sgd2'
+        self.storage.attributes.update(self.opt)
+        self._fixture_model(None, 'm5', {'opt': 'sgd2'})
+        self.assertEqual(self._stored_values()[-1], '4')
+        self.assertEqual(self.storage.stats.get(self.opt).frequencies,
+                         {'adamw': 2, 'rmsprop': 1, 'nesterov': 1,
+                          'sgd2': 1})
+        with self.assertRaises(exceptions.IllegalArgumentError):
+            self.opt.options = 'adamw;nesterov;sgd2'
+            self.storage.attributes.update(self.opt)
@@ -0,0 +1,89 @@
+from test_tensorlab.core.abstract._base import StorageTestCase
+from test_tensorlab.local_storage import _LocalStorageSetUp
+from tensorlab.core.attributeoptions import AttributeType as T
+from tensorlab.core.attribute_predicates import parse_expression
+from tensorlab.local_storage.api.facets import Bin
+from tensorlab.local_storage.api import planner
+from tensorlab.local_storage.db import tables as _t
+from tensorlab import exceptions
+
+
+class FacetsTests(_LocalStorageSetUp, StorageTestCase):
+
+    def setUp(self):
+        super(FacetsTests, self).setUp()
+        self.lr = self._fixture_attr(None, 'lr', type=T.Float, nullable=True)
+        self.opt = self._fixture_attr(None, 'opt', type=T.Enum,
+                                      options='sgd;adam;rmsprop',
+                                      default='sgd')
+        self._fixture_attr(None, 'note', type=T.String, nullable=True)
+        for i, (lr, opt) in enumerate([(0.1, 'sgd'), (0.2, 'adam'),
+                                       (None, 'adam'), (1.0, 'adam')]):
+            self._fixture_model(None, 'm{}'.format(i),
+                                {'lr': lr, 'opt': opt, 'note': None})
+
+    def test_facets(self):
+        facets = self.storage.facets.facets(
+            planner.MODELS, None, parse_expression('opt != "sgd"'),
+            ['opt', 'lr', 'note'], bins={'lr': 2})
+        self.assertEqual(list(facets), ['opt', 'lr', 'note'])
+        self.assertEqual(list(facets['opt'].items()),
+                         [('adam', 3), ('rmsprop', 0), ('sgd', 0)])
+        self.assertEqual(list(facets['lr'].items()), [
+            (Bin(0.1, 0.55), 1), (Bin(0.55, 1.0), 1), (None, 1)])
+        self.assertEqual(dict(facets['note']), {None: 3})
+
+        facets = self.storage.facets.facets(
+            planner.MODELS, None, None, ['lr'], bins={'lr': [0.15, 0.5]})
+        self.assertEqual(list(facets['lr'].items()), [
+            (Bin(None, 0.15), 1), (Bin(0.15, 0.5), 1), (Bin(0.5, None), 1),
+            (None, 1)])
+        facets = self.storage.facets.facets(
+            planner.MODELS, None, parse_expression('lr > 0.15'), ['lr'],
+            bins={'lr': 0})
+        self.assertEqual(list(facets['lr'].items()), [(0.2, 1), (1.0, 1)])
+        facets = self.storage.facets.facets(
+            planner.MODELS, None, parse_expression('lr > 1 and lr < 0'),
+            ['opt'])
+        self.assertEqual(set(facets['opt'].values()), {0})
+
+        with self.assertRaises(exceptions.LookupError):
+            self.storage.facets.facets(planner.MODELS, None, None, ['x'])
+        with self.assertRaises(exceptions.IllegalArgumentError):
+            self.storage.facets.facets(planner.MODELS, None, None, ['lr'],
+                                       bins={'lr': [0.5, 0.1]})
+
+    def test_facets_of_runs(self):
+        epochs = self._fixture_attr(None, 'epochs', type=T.Integer,
+                                    runtime=True, nullable=True)
+        model = self.storage.models.list(None, 'm1')[0]
+        for value in [1, 2, 2, None]:
+            run = self._fixture_run(model, {'epochs': value})
+            # values of runtime attributes are saved as runs report them
+            self.storage._get_impl().db.execute(_t.RunValues.insert().values(
+                run_id=run.key['id'], attr_id=epochs.key['id'],
+                value=epochs.encode_value(value)))
+        facets = self.storage.facets.facets(
+            planner.RUNS, model, None, ['opt', 'epochs'], bins={'epochs': 0})
+        self.assertEqual(facets['opt']['adam'], 4)
+        self.assertEqual(list(facets['epochs'].items()),
+                         [(2, 2), (1, 1), (None, 1)])
+        facets = self.storage.facets.facets(
+            planner.RUNS, model, parse_expression('epochs > 1'), ['epochs'],
+            bins={'epochs': 0})
+        self.assertEqual(list(facets['epochs'].items()), [(2, 2)])
+
+    def test_distinct_values(self):
+        self.assertEqual(self.storage.facets.distinct_values(self.lr),
+                         [0.1, 0.2, 1.0])
+        self.assertEqual(self.storage.facets.distinct_values(self.opt),
+                         ['adam', 'sgd'])
+
+    def test_distinct_values_of_large_integers(self):
+        seed = self._fixture_attr(None, 'seed', type=T.Integer,
+                                  nullable=True)
+        for i, value in enumerate([10 ** 20, 7]):
+            self._fixture_model(None, 'seeded{}'.format(i), {
+                'lr': None, 'opt': 'sgd', 'note': None, 'seed': value})
+        self.assertEqual(self.storage.facets.distinct_values(seed),
+                         [7, 10 ** 20])
@@ -0,0 +1,86 @@
+import os
+from test_tensorlab.core.abstract._base import StorageTestCase
+from test_tensorlab.local_storage import _LocalStorageSetUp
+from tensorlab.core.attributeoptions import AttributeType as T
+from tensorlab.local_storage.api import fsck
+from tensorlab.local_storage.db import tables as _t
+from tensorlab.local_storage import files
+
+
+class FsckTests(_LocalStorageSetUp, StorageTestCase):
+
+    def _check(self, repair=False):
+        report = self.storage.fsck.check(repair)
+        return sorted((i.check, i.table) for i in report.issues), report
+
+    def _db(self):
+        return self.storage._get_impl().db
+
+    def test_consistent_storage(self):
+        g = self._fixture_group('grp')
+        self._fixture_attr(g, 'lr', type=T.Float)
+        m = self._fixture_model(g, 'mdl', {'lr': 0.1})
+        self._fixture_run(m, {})
+        self.assertEqual(self._check()[0], [])
+
+    def test_half_created_objects_are_repaired(self):
+        m = self._fixture_model(None, 'mdl', {})
+        self._db().execute(_t.Models.insert().values(
+            uid='halfcreated', name='crashed',
+            group_id=self.storage.groups.get(None).key['id']))
+        self._db().execute(_t.Runs.insert().values(
+            uid='lostrun', model_id=999, started_at=1))
+        orphan = files.get_data_dir(self.storage_dir, files.RUNS, 'deadbeef')
+        os.makedirs(orphan)
+
+        expected = [
+            (fsck.BROKEN_REFERENCE, 'Runs'),
+            (fsck.MISSING_DIRECTORY, 'Models'),
+            (fsck.ORPHANED_DIRECTORY, None),
+        ]
+        self.assertEqual(self._check()[0], sorted(
+            expected + [(fsck.MISSING_DIRECTORY, 'Runs')]))
+        # the run referring to no model is deleted before its directory
+        # is checked
+        issues, report = self._check(repair=True)
+        self.assertEqual(issues, expected)
+        self.assertEqual(report.n_repaired, 3)
+
+        self.storage.gc.join()
+        self.assertEqual(self._check()[0], [])
+        self.assertFalse(os.path.exists(orphan))
+        self.assertEqual(self.storage.models.list(None), [m])
+
+    def test_attribute_values_are_validated(self):
+        g = self._fixture_group('grp')
+        epochs = self._fixture_attr(g, 'epochs', type=T.Integer,
+                                    options='positive')
+        m = self._fixture_model(g, 'mdl', {'epochs': 5})
+        self._fixture_attr(g, 'seed', type=T.Integer)
+        self._fixture_attr(g, 'opt', type=T.String, default='sgd')
+        self._db().execute(
+            _t.ModelValues.update()
+            .where(_t.ModelValues.c.attr_id == epochs.key['id'])
+            .values(value='-3'))
+
+        self.assertEqual(self._check()[0], [
+            (fsck.INVALID_VALUE, 'ModelValues'),
+            (fsck.MISSING_VALUE, 'Models'),
+        ])
+        issues, report = self._check(repair=True)
+        self.assertEqual(report.n_repaired, 1)
+        self.assertEqual(self._check()[0], [
+            (fsck.MISSING_VALUE, 'Models'),
+            (fsck.MISSING_VALUE, 'Models'),
+        ])
+        self.assertEqual(self.storage.models.list(g), [m])
+
+    def test_blob_refcounts_are_fixed(self):
+        self._db().execute(_t.Blobs.insert().values(
+            digest='0' * 64, size=10, refcount=3))
+        self.assertEqual(self._check()[0], [(fsck.WRONG_REFCOUNT, 'Blobs')])
+        self._check(repair=True)
+        self.assertEqual(self._check()[0], [])
+        # the blob is referenced by nothing, so it is collected
+        self.storage.gc.join()
+        self.assertEqual(self._db().execute(_t.Blobs.select()).fetchall(), [])
@@ -0,0 +1,68 @@
+import os
+from tensorlab.local_storage import files
+from test_tensorlab.core.abstract._base import StorageTestCase
+from test_tensorlab.local_storage import _LocalStorageSetUp
+
+
+class GarbageCollectorTests(_LocalStorageSetUp, StorageTestCase):
+
+    def test_run_directory_is_removed_after_delete(self):
+        m = self._fixture_model(None, 'mdl', {})
+        r = self._fixture_run(m, {})
+        data_path = self.storage.runs.get_data_path(r)
+        open(os.path.join(data_path, 'checkpoint'), 'w').close()
+
+        self.storage.runs.delete(r)
+        self.storage.gc.join()
+
+        self.assertFalse(os.path.exists(data_path))
+        self.assertEqual(self.storage.gc.count_pending(), 0)
+
+    def test_group_deletion_buries_whole_subtree(self):
+        g = self._fixture_group('grp')
+        sg = self._fixture_group('subgrp', g)
+        self._fixture_attr(sg, name='lr', runtime=True, nullable=True)
+        m1 = self._fixture_model(g, 'm1', {})
+        m2 = self._fixture_model(sg, 'm2', {})
+        r1 = self._fixture_run(m1, {})
+        r2 = self._fixture_run(m2, {'lr': 'fast'})
+        kept = self._fixture_model(None, 'kept', {})
+        paths = [
+            self.storage.models.get_data_path(m1),
+            self.storage.models.get_data_path(m2),
+            self.storage.runs.get_data_path(r1),
+            self.storage.runs.get_data_path(r2),
+        ]
+
+        self.storage.gc.close()
+        self.storage.groups.delete_with_content(g)
+
+        self.assertEqual(self.storage.gc.count_pending(), 4)
+        self.assertTrue(all(os.path.isdir(p) for p in paths))
+        self.assertEqual(self.storage.groups.list(None), [])
+        self.assertEqual(self.storage.models.list(None), [kept])
+
+        self.storage.Close()
+        self.storage.Open()
+        self.assertEqual(self.storage.gc.collect(), 4)
+        self.assertFalse(any(os.path.exists(p) for p in paths))
+        self.assertTrue(os.path.isdir(
+            self.storage.models.get_data_path(kept)))
+
+    def test_reconcile_finds_orphaned_directories(self):
+        m = self._fixture_model(None, 'mdl', {})
+        r = self._fixture_run(m, {})
+        orphan = files.get_data_dir(self.storage_dir, files.RUNS, 'deadbeef')
+        os.makedirs(os.path.join(orphan, 'nested'))
+
+        self.assertEqual(self.storage.gc.reconcile(dry_run=True),
+                         [(files.RUNS, 'deadbeef', files.DEFAULT_TIER)])
+        self.assertEqual(self.storage.gc.count_pending(), 0)
+
+        self.assertEqual(self.storage.gc.reconcile(),
+                         [(files.RUNS, 'deadbeef', files.DEFAULT_TIER)])
+        self.assertEqual(self.storage.gc.collect(), 1)
+        self.assertFalse(os.path.exists(orphan))
+        self.assertTrue(os.path.isdir(self.storage.runs.get_data_path(r)))
+        self.assertTrue(os.path.isdir(self.storage.models.get_data_path(m)))
+        self.assertEqual(self.storage.gc.reconcile(), [])
@@ -0,0 +1,99 @@
+from unittest import mock
+from test_tensorlab.core.abstract._base import StorageTestCase
+from test_tensorlab.local_storage import _LocalStorageSetUp
+from tensorlab.core.attributeoptions import AttributeType as T
+from tensorlab.local_storage import identity
+
+
+class IdentityMapTests(_LocalStorageSetUp, StorageTestCase):
+
+    def setUp(self):
+        super(IdentityMapTests, self).setUp()
+        self._fixture_attr(None, 'lr', type=T.Float)
+        self.a = self._fixture_group('a')
+        self.b = self._fixture_group('b', self.a)
+        self.c = self._fixture_group('c', self.b)
+        model = self._fixture_model(self.c, 'm', {'lr': 0.1})
+        for started_at in range(3):
+            self._fixture_run(model, {}, started_at=started_at)
+
+    def _count_queries(self, function):
+        db = self.storage._get_impl().db
+        with mock.patch.object(db, 'execute', wraps=db.execute) as execute:
+            result = function()
+        return result, execute.call_count
+
+    def test_same_instances(self):
+        group = self.storage.groups.get('a/b/c')
+        self.assertIs(self.storage.groups.get('a/b/c'), group)
+        [model] = self.storage.models.list(group)
+        self.assertIs(self.storage.models.get(group, 'm'), model)
+        self.assertIs(self.storage.models.get_group(model), group)
+        runs = self.storage.runs.list(model)
+        self.assertIs(self.storage.runs.get(model, 1), runs[1])
+        self.assertIs(self.storage.runs.get_model(runs[0]), model)
+
+        stats = self.storage.identity.stats()
+        self.assertEqual(list(stats), ['groups', 'models', 'runs'])
+        self.assertGreater(stats['groups'].hits, 0)
+        self.assertEqual(stats['runs'].size, 3)
+
+    def test_ancestors_are_not_queried_again(self):
+        group = self.storage.groups.get('a/b/c')
+        self.storage.identity.clear()
+        list_effective = lambda: self.storage.attributes.list_effective(group)
+        attrs, n_queries = self._count_queries(list_effective)
+        self.assertEqual([a.name for a in attrs], ['lr'])
+        _, n_more = self._count_queries(list_effective)
+        # only attributes of the group and its 3 ancestors are read
+        self.assertEqual(n_more, 4)
+        self.assertLess(n_more, n_queries)
+
+        model = self.storage.models.get(group, 'm')
+        _, n_queries = self._count_queries(
+            lambda: self.storage.models.get_group(model))
+        self.assertEqual(n_queries, 0)
+
+    def test_dirty_fields_are_kept(self):
+        group = self.storage.groups.get('a/b')
+        group.name = 'x'
+        self.assertIs(self.storage.groups.get('a/b'), group)
+        self.assertEqual(group.name, 'x')
+        self.assertEqual(self.storage.groups.get_dirty(group), {'name'})
+
+    def test_invalidation(self):
+        group = self.storage.groups.get('a/b/c')
+        model = self.storage.models.get(group, 'm')
+        run = self.storage.runs.get(model, 0)
+        self.assertEqual(self.storage.groups.get_path(group), 'a/b/c')
+
+        # another instance of the group is renamed
+        self.b.name = 'd'
+        self.storage.groups.rename(self.b)
+        self.assertIs(self.storage.groups.get('a/d'), self.b)
+        self.assertEqual(self.storage.groups.get_path(
+            self.storage.models.get_group(model)), 'a/d/c')
+        self.assertIsNot(self.storage.models.get(group, 'm'), model)
+
+        model = self.storage.models.get(group, 'm')
+        run = self.storage.runs.get(model, 0)
+        self.storage.runs.delete(run)
+        self.assertEqual(self.storage.runs.get(model, 0).started_at, 1)
+        model_id = model.key['id']
+        self.storage.models.delete_with_content(model)
+        self.assertIsNone(
+            self.storage.identity.get(identity.MODELS, model_id))
+        self.assertEqual(self.storage.models.list(group), [])
+
+    def test_eviction(self):
+        objects = identity.IdentityMap(maxsize=2)
+        groups = [self.storage.groups.get(name)
+                  for name in ['a', 'a/b', 'a/b/c']]
+        for group in groups:
+            objects.get_or_add(identity.GROUPS, group)
+        self.assertIsNone(objects.get(identity.GROUPS, groups[0].key['id']))
+        self.assertIs(objects.get(identity.GROUPS, groups[2].key['id']),
+                      groups[2])
+        objects.clear()
+        self.assertEqual(objects.stats()['groups'].size, 0)
+        self.assertEqual(objects.stats()['groups'].hits, 1)
@@ -0,0 +1,207 @@
+import io
+import shutil
+import tempfile
+from unittest import mock
+import sqlalchemy as sa
+from test_tensorlab.lib import TestCase
+from tensorlab.core.attribute_predicates import parse_expression
+from tensorlab import exceptions
+from tensorlab.local_storage import LocalStorage, files
+from tensorlab.local_storage.api import fsck
+from tensorlab.local_storage.db import connection, migrations, tables as _t
+
+
+# schema of stores created before their schema was versioned
+_LEGACY_SCHEMA = [
+    'CREATE TABLE "Groups" (id INTEGER PRIMARY KEY, uid VARCHAR(16) UNIQUE, '
+    'parent_id INTEGER, name VARCHAR(60), UNIQUE (parent_id, name))',
+    'CREATE TABLE "Models" (id INTEGER PRIMARY KEY, uid VARCHAR(16) UNIQUE, '
+    'group_id INTEGER, name VARCHAR(60), UNIQUE (group_id, name))',
+    'CREATE TABLE "Runs" (id INTEGER PRIMARY KEY, uid VARCHAR(16) UNIQUE, '
+    'model_id INTEGER, started_at DATETIME, finished_at DATETIME)',
+    'CREATE TABLE "Attributes" (id INTEGER PRIMARY KEY, group_id INTEGER, '
+    'name VARCHAR(60), type VARCHAR(7), options VARCHAR(100), '
+    '"default" VARCHAR(100), nullable BOOLEAN, runtime BOOLEAN, '
+    'UNIQUE (group_id, name))',
+    'CREATE TABLE "AttributeValues" (id INTEGER PRIMARY KEY, '
+    'target_uid VARCHAR(16), attr_id INTEGER, value VARCHAR(60), '
+    'UNIQUE (target_uid, attr_id))',
+    'CREATE TABLE "Tombstones" (id INTEGER PRIMARY KEY, kind VARCHAR(10), '
+    'uid VARCHAR(16), created_at FLOAT, UNIQUE (kind, uid))',
+]
+
+
+class MigrationsTests(TestCase):
+
+    def setUp(self):
+        super(MigrationsTests, self).setUp()
+        self.root = tempfile.mkdtemp()
+        files.create_storage_directory(self.root)
+        self.db = connection.init_db_engine(files.get_db_path(self.root))
+        for statement in _LEGACY_SCHEMA:
+            self.db.execute(statement)
+        self.db.execute('INSERT INTO "Groups" VALUES (1, \'root\', 1, \'\')')
+        self.db.execute('INSERT INTO "Attributes" '
+                        'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                        [(1, 1, 'opt', 'Enum', 'sgd;adam', None, 0, 0),
+                         (2, 1, 'epochs', 'Integer', '', None, 0, 0),
+                         (3, 1, 'loss', 'Float', '', None, 1, 1)])
+        for i, opt in enumerate(['adam', 'sgd', 'adam', 'adagrad', 'sgd']):
+            uid = 'm{}'.format(i)
+            self.db.execute('INSERT INTO "Models" VALUES (?, ?, 1, ?)',
+                            (i + 1, uid, uid))
+            self.db.execute('INSERT INTO "AttributeValues" '
+                            '(target_uid, attr_id, value) VALUES (?, ?, ?)',
+                            [(uid, 1, opt), (uid, 2, str(i))])
+        self.db.execute('INSERT INTO "Runs" VALUES '
+                        "(1, 'r0', 1, '2020-01-01 00:00:00.000000', NULL)")
+        # the value of a deleted run is left behind
+        self.db.execute('INSERT INTO "AttributeValues" '
+                        '(target_uid, attr_id, value) VALUES (?, ?, ?)',
+                        [('r0', 3, '0.5'), ('r1', 3, '0.25')])
+        self.db.execute('INSERT INTO "Tombstones" VALUES '
+                        "(1, 'runs', 'r1', 1.0)")
+
+    def tearDown(self):
+        self.db.dispose()
+        shutil.rmtree(self.root)
+        super(MigrationsTests, self).tearDown()
+
+    def _values(self, attr_id, values=_t.ModelValues, table=_t.Models):
+        q = sa.select([table.c.uid, values.c.value]).select_from(values.join(
+            table, table.c.id == _t.get_target_id(values)
+        )).where(values.c.attr_id == attr_id).order_by(table.c.uid)
+        return self.db.execute(q).fetchall()
+
+    def _legacy_values(self, attr_id):
+        av = migrations._AttributeValues
+        q = sa.select([av.c.target_uid, av.c.value]).where(
+            av.c.attr_id == attr_id).order_by(av.c.target_uid)
+        return self.db.execute(q).fetchall()
+
+    def test_legacy_store_is_upgraded(self):
+        progress, log = mock.Mock(), mock.Mock()
+        applied = migrations.upgrade(self.db, progress, chunk_size=3,
+                                     log=log)
+        self.assertEqual([step.version for step in applied],
+                         list(range(1, migrations.VERSION + 1)))
+        self.assertEqual(migrations.get_version(self.db), migrations.VERSION)
+        # attribute values are copied in chunks of 3 rows
+        self.assertIn(mock.call(migrations.STEPS[5], 9, 12),
+                      progress.call_args_list)
+        self.assertEqual(progress.call_args_list[-1],
+                         mock.call(migrations.STEPS[7], 11, 12))
+
+        # the value which is not a choice gets a code and is reported
+        self.assertEqual(self._values(1), [
+            ('m0', '1'), ('m1', '0'), ('m2', '1'), ('m3', '2'),
+            ('m4', '0')])
+        [(step, message)] = [c[0] for c in log.call_args_list]
+        self.assertEqual(step, migrations.STEPS[5])
+        self.assertIn("'adagrad'", message)
+        self.assertEqual(self._values(2)[-1], ('m4', '4'))
+        self.assertEqual(self._values(3, _t.RunValues, _t.Runs),
+                         [('r0', '0.5')])
+        self.assertEqual(self.db.execute(
+            sa.select([sa.func.count()]).select_from(_t.RunValues)).scalar(),
+            1)
+        run = self.db.execute(_t.Runs.select()).fetchone()
+        self.assertEqual(run['started_at'], 1577836800.0)
+        self.assertEqual(run['tier'], files.DEFAULT_TIER)
+        self.assertEqual(self.db.execute(_t.Tombstones.select()).fetchone()
+                         ['tier'], files.DEFAULT_TIER)
+        indexes = {row[0] for row in self.db.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index'")}
+        self.assertIn('ix_ModelValues_attr_id_value', indexes)
+        self.assertIn('ix_RunValues_attr_id_value', indexes)
+        self.assertNotIn('AttributeValues', migrations._get_table_names(self.db))
+        self.assertIn('ix_Runs_model_id', indexes)
+        self.assertEqual(migrations.upgrade(self.db), [])
+
+        storage = LocalStorage(self.root, mock.Mock(), io.StringIO()).Open()
+        try:
+            models = storage.models.list(
+                None, predicate=parse_expression('opt == "adam"'))
+            self.assertEqual([m.name for m in models], ['m0', 'm2'])
+            [opt] = [a for a in storage.attributes.list(None)
+                     if a.name == 'opt']
+            self.assertEqual(storage.stats.get(opt).frequencies,
+                             {'sgd': 2, 'adam': 2, 'adagrad': 1})
+            [m3] = [m for m in storage.models.list(None) if m.name == 'm3']
+            self.assertEqual(storage.models.get_attrs(m3, ['opt']),
+                             {'opt': 'adagrad'})
+            issues = storage.fsck.check().issues
+            self.assertEqual([(i.check, i.table) for i in issues
+                              if i.check == fsck.INVALID_VALUE],
+                             [(fsck.INVALID_VALUE, 'ModelValues')])
+        finally:
+            storage.Close()
+
+    def test_interrupted_rebuild_is_resumed(self):
+        def interrupt(step, n_done, n_total):
+            if step.version == 6:
+                raise KeyboardInterrupt()
+
+        with self.assertRaises(KeyboardInterrupt):
+            migrations.upgrade(self.db, interrupt, chunk_size=4)
+        self.assertEqual(migrations.get_version(self.db), 5)
+        # the original table is still read and written meanwhile
+        self.assertEqual(self._legacy_values(1)[0], ('m0', 'adam'))
+        av = migrations._AttributeValues
+        self.db.execute(av.update().where(sa.and_(
+            av.c.target_uid == 'm0', av.c.attr_id == 1)).values(value='sgd'))
+        self.db.execute(av.delete().where(av.c.target_uid == 'm4'))
+        self.db.execute(_t.Models.insert().values(
+            id=6, uid='m5', group_id=1, name='m5'))
+        self.db.execute(av.insert().values(
+            target_uid='m5', attr_id=1, value='adam'))
+
+        self.assertEqual(
+            [step.version for step in migrations.upgrade(self.db)],
+            [6, 7, 8, 9])
+        self.assertEqual(self._values(1), [
+            ('m0', '0'), ('m1', '0'), ('m2', '1'), ('m3', '2'),
+            ('m5', '1')])
+        shadows = self.db.execute("SELECT name FROM sqlite_master "
+                                  "WHERE name LIKE '_shadow_%'").fetchall()
+        self.assertEqual(shadows, [])
+
+    def test_values_which_cannot_be_choices_stop_upgrade(self):
+        self.db.execute(migrations._AttributeValues.update().where(
+            migrations._AttributeValues.c.target_uid == 'm3'
+        ).values(value='sgd;adam'))
+        with self.assertRaises(exceptions.InvalidStateError) as cm:
+            migrations.upgrade(self.db)
+        self.assertIn("attr_id 1 value 'sgd;adam'", str(cm.exception))
+        self.assertEqual(migrations.get_version(self.db), 5)
+        self.assertEqual(self._legacy_values(1)[3], ('m3', 'sgd;adam'))
+
+    def test_interrupted_split_is_resumed(self):
+        def interrupt(step, n_done, n_total):
+            if step.version == 8:
+                raise KeyboardInterrupt()
+
+        with self.assertRaises(KeyboardInterrupt):
+            migrations.upgrade(self.db, interrupt, chunk_size=4)
+        self.assertEqual(migrations.get_version(self.db), 7)
+        # rows changed meanwhile are copied by triggers
+        av = migrations._AttributeValues
+        self.db.execute(av.update().where(sa.and_(
+            av.c.target_uid == 'r0', av.c.attr_id == 3)).values(value='0.1'))
+        self.db.execute(av.delete().where(av.c.target_uid == 'm0'))
+
+        self.assertEqual(
+            [step.version for step in migrations.upgrade(self.db)], [8, 9])
+        self.assertEqual(self._values(3, _t.RunValues, _t.Runs),
+                         [('r0', '0.1')])
+        self.assertEqual([uid for uid, _ in self._values(2)],
+                         ['m1', 'm2', 'm3', 'm4'])
+
+    def test_new_store_is_up_to_date(self):
+        db = connection.init_db_engine(
+            files.get_db_path(tempfile.mkdtemp(dir=self.root)))
+        try:
+            self.assertEqual(migrations.upgrade(db), [])
+            self.assertEqual(migrations.get_version(db), migrations.VERSION)
+        finally:
+            db.dispose()
@@ -0,0 +1,54 @@
+from test_tensorlab.core.abstract._base import StorageTestCase
+from test_tensorlab.local_storage import _LocalStorageSetUp
+from tensorlab.core.attributeoptions import AttributeType as T
+from tensorlab.core.attribute_predicates import parse_expression
+from tensorlab import exceptions
+
+
+class OrderingTests(_LocalStorageSetUp, StorageTestCase):
+
+    def setUp(self):
+        super(OrderingTests, self).setUp()
+        self._fixture_attr(None, 'acc', type=T.Float, nullable=True)
+        # the first model has no value of the attribute added after it
+        self._fixture_model(None, 'm0', {'acc': 0.9})
+        self._fixture_attr(None, 'opt', type=T.Enum, options='sgd;adam',
+                           default='sgd')
+        for i, (acc, opt) in enumerate([(0.5, 'adam'), (None, 'adam'),
+                                        (0.7, 'adam'), (10.0, 'sgd')], 1):
+            self._fixture_model(None, 'm{}'.format(i),
+                                {'acc': acc, 'opt': opt})
+
+    def _list(self, predicate=None, **kwargs):
+        if predicate is not None:
+            predicate = parse_expression(predicate)
+        models = self.storage.models.list(None, predicate=predicate, **kwargs)
+        return [m.name for m in models]
+
+    def test_models(self):
+        self.assertEqual(self._list(), ['m0', 'm1', 'm2', 'm3', 'm4'])
+        # values are compared as numbers, missing ones go last
+        self.assertEqual(self._list(order_by=[('acc', 'desc')]),
+                         ['m4', 'm0', 'm3', 'm1', 'm2'])
+        self.assertEqual(self._list(order_by=['acc']),
+                         ['m1', 'm3', 'm0', 'm4', 'm2'])
+        # defaults are used for missing values
+        self.assertEqual(self._list(order_by=['opt', ('acc', 'desc')]),
+                         ['m3', 'm1', 'm2', 'm4', 'm0'])
+        self.assertEqual(
+            self._list('acc < 5', order_by=[('acc', 'desc')], limit=2),
+            ['m0', 'm3'])
+        self.assertEqual(self._list(limit=1), ['m0'])
+        self.assertEqual(self._list('opt == "sgd"', limit=0), [])
+        with self.assertRaises(exceptions.LookupError):
+            self._list(order_by=['loss'])
+        with self.assertRaises(exceptions.IllegalArgumentError):
+            self._list(limit=-1)
+
+    def test_runs(self):
+        model = self.storage.models.list(None, 'm1')[0]
+        for started_at in [3, 1, 2]:
+            self._fixture_run(model, {}, started_at=started_at)
+        runs = self.storage.runs.list(model, order_by=[('acc', 'desc')],
+                                      limit=2)
+        self.assertEqual([r.started_at for r in runs], [1, 2])
@@ -0,0 +1,62 @@
+from test_tensorlab.core.abstract._base import StorageTestCase
+from test_tensorlab.local_storage import _LocalStorageSetUp
+from tensorlab.core.attributeoptions import AttributeType as T
+from tensorlab.core.attribute_predicates import parse_expression
+from tensorlab.local_storage.api import planner
+from tensorlab import exceptions
+
+
+class QueryPlannerTests(_LocalStorageSetUp, StorageTestCase):
+
+    def setUp(self):
+        super(QueryPlannerTests, self).setUp()
+        self._fixture_attr(None, 'lr', type=T.Float)
+        self._fixture_attr(None, 'opt', type=T.Enum, options='sgd;adam',
+                           default='sgd')
+        for i, (lr, opt) in enumerate([(0.1, 'sgd'), (0.01, 'adam'),
+                                       (1.0, 'adam'), (0.5, 'sgd')]):
+            self._fixture_model(None, 'm{}'.format(i), {'lr': lr, 'opt': opt})
+
+    def test_explain(self):
+        plan = self.storage.planner.explain(
+            parse_expression('not (lr >= 0.5 or opt != "adam")'),
+            target=planner.MODELS)
+        self.assertEqual(plan.predicate.serialize(),
+                         "lr < 0.5 and opt == 'adam'")
+        self.assertEqual([c[:3] for c in plan.clauses], [
+            ('lr < 0.5', 2, 0.5),
+            ("opt == 'adam'", 2, 0.5),
+        ])
+        self.assertEqual(plan.clauses[1].estimated, 0.5)
+        self.assertIn('ModelValues', plan.sql)
+        self.assertTrue(plan.steps)
+        self.assertTrue(plan.used_indexes)
+        self.assertFalse(set(plan.used_indexes) & set(plan.unused_indexes))
+
+        plan = self.storage.planner.explain(
+            parse_expression('lr > 1 and lr < 0'), target=planner.MODELS)
+        self.assertIsNone(plan.sql)
+        self.assertEqual(plan.clauses, [])
+        with self.assertRaises(exceptions.IllegalArgumentError):
+            self.storage.planner.explain(parse_expression('lr > 1'))
+
+    def test_indexes_are_advised(self):
+        for i in range(3):
+            self.storage.models.list(
+                None, predicate=parse_expression('lr > 0.{}'.format(i)))
+        self.storage.models.list(
+            None, predicate=parse_expression('opt == "sgd"'))
+        self.assertEqual(self.storage.planner.advise(min_filters=4), [])
+        proposals = self.storage.planner.advise(min_filters=3)
+        self.assertEqual(
+            [(p.name, p.attrs, p.n_filters) for p in proposals],
+            [('ix_ModelValues_attr_id_float', ['lr'], 3)])
+
+        self.storage.planner.create_indexes(proposals)
+        self.assertEqual(self.storage.planner.advise(min_filters=1), [])
+        plan = self.storage.planner.explain(
+            parse_expression('lr < 0.05'), target=planner.MODELS)
+        self.assertIn('ix_ModelValues_attr_id_float', plan.used_indexes)
+        models = self.storage.models.list(
+            None, predicate=parse_expression('lr < 0.05'))
+        self.assertEqual([m.name for m in models], ['m1'])
@@ -0,0 +1,172 @@
+from unittest import mock
+from test_tensorlab.core.abstract._base import StorageTestCase
+from test_tensorlab.local_storage import _LocalStorageSetUp
+from tensorlab.core.attributeoptions import AttributeType as T
+from tensorlab.core.attribute_predicates import parse_expression
+from tensorlab.core import cache
+from tensorlab.local_storage.db import tables as _t
+from tensorlab import exceptions
+
+
+class PredicateCompilationTests(_LocalStorageSetUp, StorageTestCase):
+
+    def setUp(self):
+        super(PredicateCompilationTests, self).setUp()
+        self._fixture_attr(None, 'lr', type=T.Float)
+        self._fixture_attr(None, 'opt', type=T.Enum, options='sgd;adam',
+                           default='sgd')
+        self.models = [
+            self._fixture_model(None, 'm{}'.format(i), {'lr': lr, 'opt': opt})
+            for i, (lr, opt) in enumerate([(0.1, 'sgd'), (0.01, 'adam'),
+                                           (1.0, 'adam')])
+        ]
+
+    def _names(self, string):
+        models = self.storage.models.list(
+            None, predicate=parse_expression(string))
+        return sorted(m.name for m in models)
+
+    def test_models_are_filtered(self):
+        self.assertEqual(self._names('lr < 0.5'), ['m0', 'm1'])
+        self.assertEqual(self._names('not lr < 0.5'), ['m2'])
+        self.assertEqual(self._names('opt == "adam" and lr > 0.05'), ['m2'])
+        self.assertEqual(self._names('lr > 0.05 or lr > 0.5'), ['m0', 'm2'])
+        with self.assertRaises(exceptions.IllegalArgumentError):
+            self._names('opt == "rmsprop"')
+        with self.assertRaises(exceptions.LookupError):
+            self._names('epochs > 1')
+
+    def test_list_operations(self):
+        self.assertEqual(self._names('lr in (0.1, 1)'), ['m0', 'm2'])
+        self.assertEqual(self._names('lr between 0.05 and 1'), ['m0', 'm2'])
+        self.assertEqual(self._names('opt startswith "ad"'), ['m1', 'm2'])
+        self.assertEqual(self._names('opt startswith ""'), ['m0', 'm1', 'm2'])
+        self.assertEqual(
+            self._names('opt in ("sgd", "adam") and not lr in (0.1, 0.5)'),
+            ['m1', 'm2'])
+        with self.assertRaises(exceptions.IllegalArgumentError):
+            self._names('lr startswith "1"')
+        with self.assertRaises(exceptions.IllegalArgumentError):
+            self._names('opt in ("sgd", "rmsprop")')
+
+    def test_frames(self):
+        root = self.storage.groups.get(None)
+        frame = self.storage.models.get_frame(root)
+        self.assertEqual(len(frame), 3)
+        self.assertEqual(
+            list(self.storage.models.get_frame(root, ['lr']).columns), ['lr'])
+        for string in ['lr < 0.5', 'opt startswith "ad" and lr > 0.05',
+                       'not lr in (0.1, 0.5)']:
+            predicate = parse_expression(string)
+            models = self.storage.models.list(root, predicate=predicate)
+            self.assertEqual(sorted(frame.filter(predicate).uids),
+                             sorted(m.key['uid'] for m in models))
+
+        seed = self._fixture_attr(None, 'seed', runtime=True, type=T.Integer,
+                                  nullable=True)
+        model = self.models[1]
+        runs = [self._fixture_run(model, {}) for _ in range(3)]
+        self._set_value(runs[0], seed, '7')
+        self._set_value(runs[1], seed, '8')
+        frame = self.storage.runs.get_frame(model, ['seed', 'opt'])
+        self.assertEqual(sorted(frame.columns), ['opt', 'seed'])
+        self.assertEqual(frame.get_values('opt'), ['adam'] * 3)
+        self.assertEqual(sorted(frame.get_values('seed'), key=str),
+                         [7, 8, None])
+        self.assertEqual(
+            list(frame.filter(parse_expression(
+                'seed >= 7 and opt == "adam" and not seed == 8')).uids),
+            [runs[0].key['uid']])
+        # a negated empty range is unknown for missing values
+        predicate = parse_expression('not (seed between 9 and 1)')
+        self.assertEqual(sorted(frame.filter(predicate).uids),
+                         sorted(r.key['uid'] for r in runs[:2]))
+        self.assertEqual(
+            sorted(r.key['uid'] for r in self.storage.runs.list(
+                model, predicate=predicate)),
+            sorted(r.key['uid'] for r in runs[:2]))
+        # integers which do not fit int64
+        self._set_value(runs[2], seed, str(10 ** 20))
+        frame = self.storage.runs.get_frame(model, ['seed', 'opt'])
+        self.assertEqual(sorted(frame.get_values('seed')), [7, 8, 10 ** 20])
+
+    def test_runs_of_group(self):
+        sub = self._fixture_group('sub')
+        self._fixture_attr(sub, 'layers', type=T.Integer)
+        # identical override, so values of both definitions are matched
+        self._fixture_attr(sub, 'lr', type=T.Float)
+        sub_model = self._fixture_model(
+            sub, 'n0', {'lr': 0.02, 'opt': 'adam', 'layers': 4})
+        seed = self._fixture_attr(None, 'seed', runtime=True, type=T.Integer,
+                                  nullable=True)
+        runs = []
+        for model, value in [(self.models[1], '7'), (self.models[2], '7'),
+                             (sub_model, '7'), (sub_model, '8')]:
+            runs.append(self._fixture_run(model, {}))
+            self._set_value(runs[-1], seed, value)
+
+        def uids(string, group=None, **kwargs):
+            found = self.storage.runs.list_in_group(
+                group, parse_expression(string), **kwargs)
+            return [run.key['uid'] for run in found]
+
+        self.assertEqual(uids('layers >= 4 and seed == 7'),
+                         [runs[2].key['uid']])
+        self.assertEqual(uids('opt == "adam" and seed == 7'),
+                         [r.key['uid'] for r in runs[:3]])
+        self.assertEqual(uids('lr < 0.05', order_by=[('seed', 'desc')]),
+                         [r.key['uid'] for r in (runs[3], runs[0], runs[2])])
+        self.assertEqual(uids('opt == "adam"', recursive=False),
+                         [r.key['uid'] for r in runs[:2]])
+        self.assertEqual(uids('lr < 0.05', 'sub'),
+                         [r.key['uid'] for r in runs[2:]])
+
+        self._fixture_attr(sub, 'opt', type=T.Enum, options='adam;rmsprop')
+        with self.assertRaises(exceptions.IllegalArgumentError):
+            uids('opt == "adam"')
+        self.assertEqual(len(uids('lr < 0.05')), 3)
+
+    def _set_value(self, obj, attr, value):
+        values = _t.get_values(attr.runtime)
+        self.storage._get_impl().db.execute(values.insert().values({
+            _t.get_target_id(values).name: obj.key['id'],
+            'attr_id': attr.key['id'], 'value': value}))
+
+    def test_contradiction_is_not_queried(self):
+        db = self.storage._get_impl().db
+        with mock.patch.object(db, 'execute', wraps=db.execute) as execute:
+            self.assertEqual(self._names('lr > 1 and not lr >= 0'), [])
+        queries = [str(call[0][0]) for call in execute.call_args_list]
+        self.assertFalse(any('FROM "Models"' in q for q in queries))
+
+    def test_statistics_are_read_until_changed(self):
+        db = self.storage._get_impl().db
+
+        def read_stats(string):
+            with mock.patch.object(db, 'execute',
+                                   wraps=db.execute) as execute:
+                names = self._names(string)
+            return names, any('"AttributeStats"' in str(call[0][0])
+                              for call in execute.call_args_list)
+
+        self._names('opt == "adam" and lr > 0.05')
+        self.assertEqual(read_stats('opt == "adam" and lr > 0.5'),
+                         (['m2'], False))
+        self._fixture_model(None, 'm3', {'lr': 0.7, 'opt': 'adam'})
+        self.assertEqual(read_stats('opt == "adam" and lr > 0.5'),
+                         (['m2', 'm3'], True))
+
+    def test_statements_are_cached(self):
+        statements = cache.register('sql_statements', 256)
+        statements.clear()
+        self.assertEqual(self._names('lr < 0.5'), ['m0', 'm1'])
+        self.assertEqual(self._names('lr < 0.05'), ['m1'])
+        self.assertEqual(self._names('lr <  0.5 or opt == "sgd"'),
+                         ['m0', 'm1'])
+        self.assertEqual(self._names('lr < 1 or opt == "adam"'),
+                         ['m0', 'm1', 'm2'])
+        self.assertEqual(statements.stats()[:3], (2, 2, 2))
+        self.assertEqual(
+            len(self.storage.runs.list(self.models[0],
+                                       parse_expression('lr > 0'))), 0)
+        self.assertEqual(len(statements), 3)
@@ -0,0 +1,68 @@
+from unittest import mock
+from test_tensorlab.core.abstract._base import StorageTestCase
+from test_tensorlab.local_storage import _LocalStorageSetUp
+from tensorlab.core.attributeoptions import AttributeType as T
+from tensorlab.core.attribute_predicates import parse_expression
+
+
+class SelectRelatedTests(_LocalStorageSetUp, StorageTestCase):
+
+    def setUp(self):
+        super(SelectRelatedTests, self).setUp()
+        self._fixture_attr(None, 'lr', type=T.Float)
+        parent = self._fixture_group('a')
+        child = self._fixture_group('b', parent)
+        for group in [None, parent, child]:
+            for i in range(2):
+                model = self._fixture_model(
+                    group, '{}{}'.format(group.name if group else 'r', i),
+                    {'lr': 0.1 * i})
+                for started_at in range(3):
+                    self._fixture_run(model, {}, started_at=started_at)
+
+    def _count_queries(self, function):
+        db = self.storage._get_impl().db
+        with mock.patch.object(db, 'execute', wraps=db.execute) as execute:
+            result = function()
+        return result, execute.call_count
+
+    def test_runs(self):
+        def report():
+            runs = self.storage.runs.list_in_group(
+                None, parse_expression('lr > 0.05'), select_related=True)
+            return [(self.storage.groups.get_path(
+                         self.storage.runs.get_group(run)),
+                     self.storage.runs.get_model(run).name,
+                     run.started_at)
+                    for run in runs]
+
+        lines, n_queries = self._count_queries(report)
+        self.assertEqual(len(lines), 9)
+        self.assertEqual(sorted(set(line[:2] for line in lines)),
+                         [('', 'r1'), ('a', 'a1'), ('a/b', 'b1')])
+
+        # the number of queries does not depend on the number of runs
+        model = self.storage.models.list(self.storage.groups.get('a'))[1]
+        for started_at in range(3):
+            self._fixture_run(model, {}, started_at=started_at)
+        lines, n_more = self._count_queries(report)
+        self.assertEqual(len(lines), 12)
+        self.assertEqual(n_more, n_queries)
+
+        runs = self.storage.runs.list_in_group(None, select_related=True)
+        models = {id(self.storage.runs.get_model(run)) for run in runs}
+        self.assertEqual(len(models), 6)
+
+    def test_models(self):
+        group = self.storage.groups.get('a/b')
+        models, n_queries = self._count_queries(
+            lambda: self.storage.models.list(group, select_related=True))
+        self.assertEqual([m.name for m in models], ['b0', 'b1'])
+        _, n_more = self._count_queries(lambda: [
+            self.storage.groups.get_path(self.storage.models.get_group(m))
+            for m in models])
+        self.assertEqual(n_more, 0)
+        self.assertEqual(self.storage.groups.get_path(group), 'a/b')
+
+        runs = self.storage.runs.list(models[0], select_related=True)
+        self.assertEqual(self.storage.runs.get_group(runs[0]).name, 'b')
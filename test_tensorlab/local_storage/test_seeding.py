@@ -0,0 +1,77 @@
+import os
+from tensorlab.core import runs
+from tensorlab.local_storage import files
+from test_tensorlab.core.abstract._base import StorageTestCase
+from test_tensorlab.local_storage import _LocalStorageSetUp
+
+
+class RunSeedingTests(_LocalStorageSetUp, StorageTestCase):
+
+    def _write(self, data_path, name, content):
+        path = os.path.join(data_path, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
+    def _read(self, path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def _seeded_run(self, model, seed=True):
+        r = runs.Run(started_at=5, finished_at=10)
+        self.storage.runs.create(model, r, {}, seed=seed)
+        return r
+
+    def test_run_directory_is_seeded_from_model(self):
+        m = self._fixture_model(None, 'mdl', {})
+        model_path = self.storage.models.get_data_path(m)
+        self._write(model_path, 'vocab', b'vocabulary' * 100)
+        self._write(model_path, 'graph/weights', b'weights' * 100)
+
+        r = self._seeded_run(m)
+        run_path = self.storage.runs.get_data_path(r)
+        self.assertEqual(self._read(os.path.join(run_path, 'graph/weights')),
+                         b'weights' * 100)
+        self._write(run_path, 'vocab', b'changed')
+        self.assertEqual(self._read(os.path.join(model_path, 'vocab')),
+                         b'vocabulary' * 100)
+
+        costs = self.storage.runs.get_seed_costs(r)
+        self.assertEqual(sum(c.n_files for c in costs), 2)
+        self.assertEqual(sum(c.n_bytes for c in costs), 1700)
+        self.assertEqual(self.storage.runs.get_seed_costs(model=m), costs)
+
+        plain = self._fixture_run(m, {})
+        self.assertEqual(self.storage.runs.get_seed_costs(plain), [])
+        self.assertEqual(
+            os.listdir(self.storage.runs.get_data_path(plain)), [])
+
+        self.storage.runs.delete(r)
+        self.assertEqual(self.storage.runs.get_seed_costs(), [])
+
+    def test_hardlinks_are_used_only_on_request(self):
+        m = self._fixture_model(None, 'mdl', {})
+        model_path = self.storage.models.get_data_path(m)
+        src = self._write(model_path, 'vocab', b'vocabulary')
+
+        r = self._seeded_run(m, seed=(files.HARDLINK,))
+        dst = os.path.join(self.storage.runs.get_data_path(r), 'vocab')
+        self.assertTrue(os.path.samefile(src, dst))
+        costs = self.storage.runs.get_seed_costs(r)
+        self.assertEqual([c.method for c in costs], [files.HARDLINK])
+
+    def test_large_files_are_copied_in_chunks(self):
+        src_dir = os.path.join(self.storage_dir, 'src')
+        dst_dir = os.path.join(self.storage_dir, 'dst')
+        os.makedirs(dst_dir)
+        content = bytes(range(256)) * 40
+        self._write(src_dir, 'a/big', content)
+        self._write(src_dir, 'empty', b'')
+
+        stats = files.clone_tree(src_dir, dst_dir, (files.COPY,),
+                                 chunk_size=1000)
+        self.assertEqual(self._read(os.path.join(dst_dir, 'a/big')), content)
+        self.assertEqual(self._read(os.path.join(dst_dir, 'empty')), b'')
+        self.assertEqual([(s.method, s.n_files, s.n_bytes) for s in stats],
+                         [(files.COPY, 2, len(content))])
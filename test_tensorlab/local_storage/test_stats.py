@@ -0,0 +1,57 @@
+from test_tensorlab.core.abstract._base import StorageTestCase
+from test_tensorlab.local_storage import _LocalStorageSetUp
+from tensorlab.core.attributeoptions import AttributeType as T
+from tensorlab.core.attribute_predicates import parse_expression
+
+
+class AttributeStatisticsTests(_LocalStorageSetUp, StorageTestCase):
+
+    def setUp(self):
+        super(AttributeStatisticsTests, self).setUp()
+        self.lr = self._fixture_attr(None, 'lr', type=T.Float, nullable=True)
+        self.opt = self._fixture_attr(None, 'opt', type=T.Enum,
+                                      options='sgd;adam', default='sgd')
+        self.models = [
+            self._fixture_model(None, 'm{}'.format(i), {'lr': lr, 'opt': opt})
+            for i, (lr, opt) in enumerate([(0.1, 'sgd'), (0.01, 'adam'),
+                                           (None, 'adam'), (0.5, 'adam')])
+        ]
+
+    def test_maintained_incrementally(self):
+        stats = self.storage.stats.get(self.lr)
+        self.assertEqual((stats.n_values, stats.n_nulls), (4, 1))
+        self.assertEqual((stats.min_value, stats.max_value), (0.01, 0.5))
+        self.assertEqual(stats.n_distinct, 3)
+        self.assertEqual(stats.n_changed, 4)
+        self.assertEqual(stats.histogram, [])
+        self.assertEqual(self.storage.stats.get(self.opt).frequencies,
+                         {'sgd': 1, 'adam': 3})
+
+        self.storage.models.delete_with_content(self.models[1])
+        self.storage.models.delete_with_content(self.models[2])
+        stats = self.storage.stats.get(self.lr)
+        self.assertEqual((stats.n_values, stats.n_nulls), (2, 0))
+        self.assertEqual(self.storage.stats.get(self.opt).frequencies,
+                         {'sgd': 1, 'adam': 1})
+
+        self.storage.attributes.delete_with_values(self.lr)
+        self.assertIsNone(self.storage.stats.get(self.lr))
+
+    def test_analyze(self):
+        self.storage.models.delete_with_content(self.models[1])
+        analyzed = {s.attr.name: s for s in self.storage.stats.analyze()}
+        stats = self.storage.stats.get(self.lr)
+        self.assertEqual(stats, analyzed['lr']._replace(attr=self.lr))
+        self.assertEqual((stats.n_values, stats.n_nulls), (3, 1))
+        self.assertEqual((stats.min_value, stats.max_value), (0.1, 0.5))
+        self.assertEqual(stats.histogram, [0.1, 0.5, 0.5])
+        self.assertEqual(stats.n_changed, 0)
+
+    def test_filtering_by_several_attributes(self):
+        self.storage.stats.analyze()
+        for string, names in [
+                ('opt == "adam" and lr > 0.05', ['m3']),
+                ('lr > 0.05 and opt == "sgd" or lr < 0.05', ['m0', 'm1'])]:
+            models = self.storage.models.list(
+                None, predicate=parse_expression(string))
+            self.assertEqual(sorted(m.name for m in models), names)
@@ -0,0 +1,90 @@
+import os
+import shutil
+import tempfile
+from test_tensorlab.core.abstract._base import StorageTestCase
+from test_tensorlab.local_storage import _LocalStorageSetUp
+from tensorlab.local_storage import files
+from tensorlab import exceptions
+
+
+class StorageTiersTests(_LocalStorageSetUp, StorageTestCase):
+
+    def setUp(self):
+        super(StorageTiersTests, self).setUp()
+        self.cold_dir = tempfile.mkdtemp()
+        self.storage.tiers.add('cold', self.cold_dir)
+        # tiers are read by the collector when the storage is opened
+        self.storage.Close()
+        self.storage.Open()
+
+    def tearDown(self):
+        super(StorageTiersTests, self).tearDown()
+        shutil.rmtree(self.cold_dir)
+
+    def _write(self, data_path, name, content):
+        path = os.path.join(data_path, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
+    def _read(self, path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def test_runs_are_moved_between_tiers(self):
+        m = self._fixture_model(None, 'mdl', {})
+        r1, r2 = self._fixture_run(m, {}), self._fixture_run(m, {})
+        hot_path = self.storage.runs.get_data_path(r1)
+        self._write(hot_path, 'logs/events', b'event' * 100)
+
+        report = self.storage.tiers.move_runs([r1, r2], 'cold')
+        self.assertEqual(report.n_moved, 2)
+        self.assertEqual(report.n_files, 1)
+        self.assertEqual(report.n_bytes, 500)
+        self.assertEqual(report.n_failed, 0)
+        self.assertEqual(self.storage.tiers.get_run_tier(r1), 'cold')
+
+        cold_path = self.storage.runs.get_data_path(r1)
+        self.assertEqual(
+            cold_path, files.get_data_dir(self.cold_dir, files.RUNS,
+                                          r1.key['uid']))
+        self.assertEqual(self._read(os.path.join(cold_path, 'logs/events')),
+                         b'event' * 100)
+        self.storage.gc.join()
+        self.assertFalse(os.path.exists(hot_path))
+        self.assertEqual(self.storage.gc.reconcile(), [])
+
+        self.assertEqual(
+            self.storage.tiers.move_runs([r1], 'cold').n_moved, 0)
+        self.storage.tiers.move_runs([r1], files.DEFAULT_TIER)
+        self.assertEqual(self.storage.runs.get_data_path(r1), hot_path)
+        self.assertTrue(os.path.isfile(os.path.join(hot_path, 'logs/events')))
+
+    def test_deleted_model_is_collected_on_its_tier(self):
+        m = self._fixture_model(None, 'mdl', {})
+        self.storage.tiers.move_models([m], 'cold')
+        path = self.storage.models.get_data_path(m)
+        self.assertTrue(path.startswith(self.cold_dir))
+        self.storage.usage.refresh()
+
+        self.storage.models.delete_with_content(m)
+        self.storage.gc.join()
+        self.assertFalse(os.path.exists(path))
+
+    def test_unknown_tier(self):
+        m = self._fixture_model(None, 'mdl', {})
+        with self.assertRaises(exceptions.IllegalArgumentError):
+            self.storage.tiers.move_models([m], 'nvme')
+        with self.assertRaises(exceptions.IllegalArgumentError):
+            self.storage.tiers.add('cold', self.cold_dir)
+
+    def test_copies_are_verified(self):
+        src = os.path.join(self.storage_dir, 'src')
+        dst = os.path.join(self.storage_dir, 'dst')
+        self._write(src, 'a', b'same')
+        self._write(src, 'b/c', b'source')
+        self._write(dst, 'a', b'same')
+        self._write(dst, 'b/c', b'target')
+        self._write(dst, 'd', b'')
+        self.assertEqual(files.compare_trees(src, dst), ['b/c', 'd'])
@@ -0,0 +1,58 @@
+import os
+from test_tensorlab.core.abstract._base import StorageTestCase
+from test_tensorlab.local_storage import _LocalStorageSetUp
+
+
+class DiskUsageTests(_LocalStorageSetUp, StorageTestCase):
+
+    def _write(self, data_path, name, n_bytes):
+        path = os.path.join(data_path, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(b'x' * n_bytes)
+
+    def test_group_totals_include_subgroups_and_runs(self):
+        g = self._fixture_group('grp')
+        sg = self._fixture_group('subgrp', g)
+        m1 = self._fixture_model(g, 'm1', {})
+        m2 = self._fixture_model(sg, 'm2', {})
+        r = self._fixture_run(m2, {})
+        self._write(self.storage.models.get_data_path(m1), 'vocab', 10000)
+        self._write(self.storage.models.get_data_path(m2), 'a/b/c', 10000)
+        self._write(self.storage.runs.get_data_path(r), 'ckpt', 10000)
+
+        usage = self.storage.usage
+        self.assertEqual(usage.get_for_group(g).n_files, 0)
+        self.assertEqual(usage.refresh(), 3)
+
+        self.assertEqual(usage.get_for_model(m2).n_files, 1)
+        self.assertEqual(usage.get_for_run(r).n_files, 1)
+        self.assertEqual(usage.get_for_group(g).n_files, 3)
+        self.assertEqual(usage.get_for_group(g, recursive=False).n_files, 1)
+        self.assertEqual(usage.get_for_group(sg).n_files, 2)
+        self.assertGreaterEqual(usage.get_for_group(g).n_bytes, 30000)
+        self.assertEqual(usage.get_for_group(None), usage.get_for_group(g))
+
+    def test_refresh_skips_unmodified_directories(self):
+        m1 = self._fixture_model(None, 'm1', {})
+        m2 = self._fixture_model(None, 'm2', {})
+        path = self.storage.models.get_data_path(m2)
+        self._write(path, 'old', 100)
+        self.assertEqual(self.storage.usage.refresh(), 2)
+        self.assertEqual(self.storage.usage.refresh(), 0)
+
+        self._write(path, 'nested/new', 100)
+        os.utime(os.path.join(path, 'nested'), (1e10, 1e10))
+        self.assertEqual(self.storage.usage.refresh(), 1)
+        self.assertEqual(self.storage.usage.get_for_model(m2).n_files, 2)
+        self.assertEqual(self.storage.usage.get_for_model(m1).n_files, 0)
+        self.assertEqual(self.storage.usage.refresh(full=True), 2)
+
+    def test_deleted_objects_are_not_counted(self):
+        m = self._fixture_model(None, 'm', {})
+        r = self._fixture_run(m, {})
+        self._write(self.storage.runs.get_data_path(r), 'ckpt', 100)
+        self.storage.usage.refresh()
+
+        self.storage.runs.delete(r)
+        self.assertEqual(self.storage.usage.get_for_group(None).n_files, 0)